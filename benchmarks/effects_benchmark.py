@@ -0,0 +1,99 @@
+"""Porównanie łańcucha efektów pydub z drumpatterns_core.dsp na domyślnych samplach.
+
+Uruchomienie: python benchmarks/effects_benchmark.py [powtórzenia]
+
+Punktem odniesienia jest łańcuch pydub ze stylu 'classic' sampler/sampler2
+(reverb jako fade_out).  Przykładowe wyniki, najlepszy z 5 serii po 20
+przebiegów, sześć uruchomień na tej samej maszynie (wyniki się wahają):
+
+    Talerz   x11.1 .. x16.7
+    Stopa    x13.6 .. x18.3
+    Werbel   x10.4 .. x18.2
+    TomTom   x15.6 .. x25.5
+    razem    x14.1 .. x18.6   (pydub 12.3-17.8 ms, numpy 0.77-1.03 ms)
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.effects import normalize
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from drumpatterns_core.dsp import apply_effect_chain, to_float32, to_int16
+from drumpatterns_core.synth import default_sample
+
+SAMPLE_RATE = 44100
+EFFECTS = {'volume': 0.3, 'pitch': 2.0, 'echo': 0.5, 'reverb': 0.6, 'pan': 0.4}
+
+
+def default_samples(duration=0.5):
+    """Domyślny zestaw z generate_default_samples w drumpatterns_sampler.py (stereo int16)."""
+    rng = np.random.default_rng(0)
+    samples = {}
+    for inst in ('Talerz', 'Stopa', 'Werbel', 'TomTom'):
+        mono = (default_sample(inst, SAMPLE_RATE, duration, rng) * 32767).astype(np.int16)
+        samples[inst] = np.ascontiguousarray(np.column_stack([mono, mono]))
+    return samples
+
+
+def pydub_chain(sound_array, effects):
+    """Dotychczasowa ścieżka apply_effects stylu 'classic' z drumpatterns_sampler.py."""
+    audio_segment = AudioSegment(sound_array.tobytes(), frame_rate=SAMPLE_RATE,
+                                 sample_width=sound_array.dtype.itemsize, channels=2)
+    if effects['volume'] != 0:
+        audio_segment = audio_segment + (effects['volume'] * 10)
+    if effects['pitch'] != 0:
+        new_rate = int(audio_segment.frame_rate * (2 ** (effects['pitch'] / 12)))
+        audio_segment = audio_segment._spawn(audio_segment.raw_data, overrides={'frame_rate': new_rate})
+        audio_segment = audio_segment.set_frame_rate(SAMPLE_RATE)
+    if effects['echo'] > 0:
+        echo_segment = audio_segment - 10
+        audio_segment = audio_segment.overlay(echo_segment, position=int(200 * effects['echo']))
+    if effects['reverb'] > 0:
+        # 'reverb' sampler/sampler2 to tylko wyciszenie końcówki
+        audio_segment = audio_segment.fade_in(50).fade_out(int(effects['reverb'] * 300))
+    if effects['pan'] != 0:
+        audio_segment = audio_segment.pan(effects['pan'])
+    audio_segment = normalize(audio_segment)
+    return np.array(audio_segment.get_array_of_samples()).reshape((-1, 2))
+
+
+def numpy_chain(sound_array, effects):
+    return to_int16(apply_effect_chain(to_float32(sound_array), effects, SAMPLE_RATE))
+
+
+def best_times(funcs, *args, repeats=20, rounds=5):
+    """Najlepszy czas każdej funkcji.
+
+    Pomiary idą na zmianę seriami po ``repeats`` przebiegów, ``rounds`` razy,
+    żeby wolniejsze okresy maszyny nie trafiały tylko w jedną stronę; pojedyncze
+    przeplatanie wywołań wypłukuje cache i mierzy głównie alokacje.
+    """
+    best = [float('inf')] * len(funcs)
+    for _ in range(rounds):
+        for i, func in enumerate(funcs):
+            for _ in range(repeats):
+                start = time.perf_counter()
+                func(*args)
+                best[i] = min(best[i], time.perf_counter() - start)
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    total_pydub = total_numpy = 0.0
+    for inst, sound_array in default_samples().items():
+        numpy_chain(sound_array, EFFECTS)
+        t_pydub, t_numpy = best_times((pydub_chain, numpy_chain), sound_array, EFFECTS, repeats=repeats)
+        total_pydub += t_pydub
+        total_numpy += t_numpy
+        print(f"{inst:8s} pydub {t_pydub * 1000:7.2f} ms  numpy {t_numpy * 1000:7.2f} ms  x{t_pydub / t_numpy:5.1f}")
+    print(f"{'razem':8s} pydub {total_pydub * 1000:7.2f} ms  numpy {total_numpy * 1000:7.2f} ms  x{total_pydub / total_numpy:5.1f}")
+
+
+if __name__ == "__main__":
+    main()
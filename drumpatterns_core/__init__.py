@@ -0,0 +1,11 @@
+"""GUI-independent audio core shared by the drumpatterns sampler front-ends."""
+
+from drumpatterns_core.engine import (
+    DEFAULT_BLOCK_SIZE,
+    DEFAULT_SAMPLE_RATE,
+    RHYTHM_TYPES,
+    PatternEngine,
+    pattern_step_events,
+    rhythm_offsets,
+)
+from drumpatterns_core.pattern import Pattern
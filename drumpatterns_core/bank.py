@@ -0,0 +1,158 @@
+"""Sample banks: one zip holding a FLAC (or WAV) file per instrument and a JSON manifest.
+
+The manifest keeps each instrument's ADSR and ``sample_params`` next to
+the SHA-256 of its audio file, and a bank hash over all of it.  Banks are
+decoded straight from the archive into memory (no temp directory), the
+member hashes are checked while decoding, and a bank whose hash was
+already decoded in this process is not decoded again.
+"""
+
+import hashlib
+import io
+import json
+import threading
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+from drumpatterns_core.projectfile import atomic_write
+
+MANIFEST_NAME = 'bank.json'
+FORMAT_VERSION = 1
+AUDIO_FORMATS = {'FLAC': '.flac', 'WAV': '.wav'}
+DECODED_BANKS = 4
+
+
+class BankError(ValueError):
+    pass
+
+
+class SampleBank:
+    """Decoded bank: ``samples`` {inst: read-only (frames, channels) float32}, ``adsr``, ``sample_params``."""
+
+    def __init__(self, bank_hash, sample_rate, samples, adsr, sample_params):
+        self.hash = bank_hash
+        self.sample_rate = sample_rate
+        self.samples = samples
+        self.adsr = adsr
+        self.sample_params = sample_params
+
+
+def write_bank(path, samples, sample_rate=44100, adsr=None, sample_params=None,
+               audio_format='FLAC', compression_level=None):
+    """Write ``samples`` ({inst: (frames[, channels]) int16 or float array}) as a bank; returns its hash.
+
+    ``compression_level`` (0..1) is the FLAC compression level, or the
+    zip deflate level for WAV banks; WAV members are stored uncompressed
+    when it is None.
+    """
+    if audio_format not in AUDIO_FORMATS:
+        raise BankError(f"unsupported bank audio format: {audio_format}")
+    adsr = adsr or {}
+    sample_params = sample_params or {}
+    files = {}
+    instruments = {}
+    for inst, data in samples.items():
+        data = np.asarray(data)
+        if data.ndim == 1:
+            data = data.reshape(-1, 1)
+        subtype = 'PCM_16' if data.dtype == np.int16 else 'PCM_24'
+        buffer = io.BytesIO()
+        options = {'compression_level': compression_level} if audio_format == 'FLAC' and compression_level is not None else {}
+        sf.write(buffer, data, sample_rate, format=audio_format, subtype=subtype, **options)
+        member = inst + AUDIO_FORMATS[audio_format]
+        files[member] = buffer.getvalue()
+        instruments[inst] = {
+            'file': member,
+            'sha256': hashlib.sha256(files[member]).hexdigest(),
+            'frames': int(data.shape[0]),
+            'channels': int(data.shape[1]),
+            'adsr': adsr.get(inst),
+            'sample_params': sample_params.get(inst),
+        }
+    manifest = {'format_version': FORMAT_VERSION, 'sample_rate': int(sample_rate), 'instruments': instruments}
+    manifest['hash'] = bank_hash(manifest)
+
+    compression, level = zipfile.ZIP_STORED, None
+    if audio_format == 'WAV' and compression_level is not None:
+        compression, level = zipfile.ZIP_DEFLATED, int(round(9 * compression_level))
+
+    def write_zip(f):
+        with zipfile.ZipFile(f, 'w', compression, compresslevel=level) as archive:
+            archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2), zipfile.ZIP_DEFLATED)
+            for member, data in files.items():
+                archive.writestr(member, data)
+    atomic_write(path, write_zip)
+    return manifest['hash']
+
+
+def bank_hash(manifest):
+    """SHA-256 over the sample rate and every instrument entry (audio hashes, ADSR, params)."""
+    content = {'sample_rate': manifest['sample_rate'], 'instruments': manifest['instruments']}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def read_manifest(path):
+    """Manifest of the bank at ``path`` without touching the audio members."""
+    with zipfile.ZipFile(path) as archive:
+        return _manifest(archive)
+
+
+def is_bank(path):
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return MANIFEST_NAME in archive.namelist()
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+
+_decoded = OrderedDict()
+_decoded_lock = threading.Lock()
+
+
+def load_bank(path, sample_rate=None):
+    """SampleBank of ``path``, resampled to ``sample_rate`` when given; identical banks are decoded once."""
+    with zipfile.ZipFile(path) as archive:
+        manifest = _manifest(archive)
+        key = (manifest['hash'], sample_rate)
+        with _decoded_lock:
+            if key in _decoded:
+                _decoded.move_to_end(key)
+                return _decoded[key]
+
+        if bank_hash(manifest) != manifest['hash']:
+            raise BankError(f"{path}: manifest does not match its hash")
+        rate = sample_rate or manifest['sample_rate']
+        samples = {}
+        for inst, entry in manifest['instruments'].items():
+            data = archive.read(entry['file'])
+            if hashlib.sha256(data).hexdigest() != entry['sha256']:
+                raise BankError(f"{path}: {entry['file']} is corrupted (hash mismatch)")
+            audio, file_rate = sf.read(io.BytesIO(data), dtype='float32', always_2d=True)
+            if file_rate != rate and len(audio):
+                audio = soxr.resample(audio, file_rate, rate).astype(np.float32, copy=False)
+            audio.flags.writeable = False
+            samples[inst] = audio
+
+    bank = SampleBank(manifest['hash'], rate, samples,
+                      {inst: entry['adsr'] for inst, entry in manifest['instruments'].items() if entry.get('adsr')},
+                      {inst: entry['sample_params'] for inst, entry in manifest['instruments'].items()
+                       if entry.get('sample_params')})
+    with _decoded_lock:
+        _decoded[key] = bank
+        while len(_decoded) > DECODED_BANKS:
+            _decoded.popitem(last=False)
+    return bank
+
+
+def _manifest(archive):
+    try:
+        manifest = json.loads(archive.read(MANIFEST_NAME))
+    except KeyError:
+        raise BankError(f"{archive.filename}: not a sample bank (no {MANIFEST_NAME})")
+    if manifest.get('format_version', 0) > FORMAT_VERSION:
+        raise BankError(f"{archive.filename}: bank format {manifest['format_version']} is newer than supported")
+    return manifest
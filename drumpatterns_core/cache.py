@@ -0,0 +1,135 @@
+"""LRU caches for pre-rendered (effected) samples and decoded preview files."""
+
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def freeze(value):
+    """Hashable snapshot of effect/ADSR parameters (dicts become sorted tuples)."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def render_key(instrument, sample, effects, adsr=None, attack_curve=None, variant=None):
+    """Cache key of one rendered sample.
+
+    ``sample`` is a file path or the sample object itself; objects are keyed
+    by identity and kept alive by the cache entry, so a freed sample can
+    never be confused with a new one that reuses its id.
+    """
+    identity = sample if isinstance(sample, str) else id(sample)
+    return (instrument, variant, identity, freeze(effects), freeze(adsr), attack_curve)
+
+
+class RenderCache:
+    """Thread-safe LRU of rendered numpy arrays limited by total ``nbytes``."""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, keep=None):
+        size = getattr(value, 'nbytes', 0)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size, keep)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+        return value
+
+    def get_or_render(self, key, render, keep=None):
+        """Cached value for ``key``; ``render()`` builds it on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, render(), keep)
+        return value
+
+    def invalidate(self, instrument=None):
+        """Drop every entry of ``instrument`` (all entries when omitted)."""
+        with self._lock:
+            if instrument is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for key in [key for key in self._entries if key[0] == instrument]:
+                self._bytes -= self._entries.pop(key)[1]
+
+
+class PreviewCache:
+    """Decoded sample files shared by browser preview and sample assignment.
+
+    ``decode(path)`` -> array; results are kept in a RenderCache keyed by
+    path, mtime and size, so an edited file is decoded again.  ``prefetch``
+    decodes upcoming rows on a background thread.
+    """
+
+    def __init__(self, decode, max_bytes=DEFAULT_CACHE_BYTES):
+        self.decode = decode
+        self.cache = RenderCache(max_bytes)
+        self._pending = []
+        self._wakeup = threading.Condition()
+        self._thread = None
+
+    def get(self, path):
+        """Decoded (read-only) array of ``path``; decodes on a miss."""
+        stat = os.stat(path)
+        return self.cache.get_or_render((path, stat.st_mtime_ns, stat.st_size), lambda: self._decode(path))
+
+    def prefetch(self, paths):
+        """Decode ``paths`` in the background; replaces the previous, unfinished request."""
+        with self._wakeup:
+            self._pending = list(paths)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._prefetch_loop, daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+
+    def _decode(self, path):
+        value = self.decode(path)
+        value.flags.writeable = False
+        return value
+
+    def _prefetch_loop(self):
+        while True:
+            with self._wakeup:
+                while not self._pending:
+                    self._wakeup.wait()
+                path = self._pending.pop(0)
+            try:
+                self.get(path)
+            except Exception:
+                # błąd pokaże się dopiero, gdy użytkownik wybierze ten plik
+                pass
@@ -0,0 +1,91 @@
+"""Headless rendering of project files: ``python -m drumpatterns_core render ...``.
+
+Needs neither GTK nor an audio device, so patterns can be rendered on
+servers and CI machines.  A directory argument renders every project in
+it on a process pool.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from drumpatterns_core.engine import DEFAULT_SAMPLE_RATE
+from drumpatterns_core.project import read_project, write_audio, write_midi
+from drumpatterns_core.projectfile import is_project_file
+
+
+def render_project(path, output, midi=None, loops=1, sample_rate=DEFAULT_SAMPLE_RATE, seed=0):
+    """Render one project to ``output`` (and ``midi`` when given); returns the seconds it took."""
+    start = time.perf_counter()
+    project = read_project(path)
+    if output:
+        write_audio(project, output, loops, sample_rate, seed=seed)
+    if midi:
+        write_midi(project, midi, loops)
+    return time.perf_counter() - start
+
+
+def find_projects(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if is_project_file(name))
+
+
+def render_directory(directory, output_dir, midi=False, loops=1, sample_rate=DEFAULT_SAMPLE_RATE,
+                     seed=0, jobs=None, audio_format='wav'):
+    """Render every project of ``directory`` into ``output_dir`` in parallel; returns the failures."""
+    os.makedirs(output_dir, exist_ok=True)
+    failures = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for path in find_projects(directory):
+            base = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0])
+            future = pool.submit(render_project, path, f"{base}.{audio_format}", base + ".mid" if midi else None,
+                                 loops, sample_rate, seed)
+            futures[future] = path
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                print(f"{path}: {future.result():.2f} s")
+            except Exception as e:
+                failures.append(path)
+                print(f"{path}: {e}", file=sys.stderr)
+    return failures
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m drumpatterns_core",
+                                     description="Render drumpatterns projects without the GUI.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    render = commands.add_parser("render", help="render a project file or a directory of projects")
+    render.add_argument("project", help="project file (.json/.drsmp/.dpz) or directory of projects")
+    render.add_argument("-o", "--output", help="audio file, or output directory for a project directory")
+    render.add_argument("--midi", nargs="?", const=True,
+                        help="MIDI file to write (for directories: flag, one .mid per project)")
+    render.add_argument("--loops", type=int, default=1, help="pattern repetitions (default 1)")
+    render.add_argument("--sample-rate", type=int, default=DEFAULT_SAMPLE_RATE)
+    render.add_argument("--seed", type=int, default=0, help="seed of synthesized noise samples")
+    render.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    render.add_argument("--format", default="wav", help="audio extension for directory renders (default wav)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if os.path.isdir(args.project):
+        output_dir = args.output or args.project
+        failures = render_directory(args.project, output_dir, bool(args.midi), args.loops, args.sample_rate,
+                                    args.seed, args.jobs, args.format)
+        return 1 if failures else 0
+
+    if not args.output and args.midi in (None, True):
+        args.output = os.path.splitext(args.project)[0] + ".wav"
+    midi = os.path.splitext(args.output or args.project)[0] + ".mid" if args.midi is True else args.midi
+    try:
+        seconds = render_project(args.project, args.output, midi, args.loops, args.sample_rate, args.seed)
+    except (OSError, ValueError) as e:
+        print(f"{args.project}: {e}", file=sys.stderr)
+        return 1
+    print(f"{args.project}: {seconds:.2f} s")
+    return 0
@@ -0,0 +1,211 @@
+"""Vectorized float32 effects chain replacing the pydub round-trips.
+
+Buffers are (frames, channels) float32 arrays in [-1, 1].  Every effect
+works in place on the buffer it gets; only the pitch shift returns a new
+array because it changes the length.
+"""
+
+import math
+from functools import lru_cache
+
+import numpy as np
+
+# Parameter semantics of the two apply_effects flavours found in the front-ends.
+EFFECT_STYLES = {
+    # sampler..sampler4: volume*10 dB, echo every 200 ms*echo at -10 dB, peak normalize
+    'classic': {'volume_db': 10.0, 'echo_delay': 0.2, 'echo_delay_scaled': True, 'echo_db': -10.0,
+                'echo_feedback': True, 'normalize': True},
+    # sampler5_1: volume in dB, single echo after 100 ms at +echo dB, no normalize
+    'direct': {'volume_db': 1.0, 'echo_delay': 0.1, 'echo_delay_scaled': False, 'echo_db': None,
+               'echo_feedback': False, 'normalize': False},
+}
+
+NORMALIZE_HEADROOM_DB = 0.1
+REVERB_SECONDS_PER_UNIT = 0.3
+
+
+def db_to_gain(db):
+    return 10.0 ** (db / 20.0)
+
+
+def to_float32(samples):
+    """int16/int32/float samples -> new (frames, channels) float32 buffer."""
+    samples = np.asarray(samples)
+    if samples.ndim == 1:
+        samples = samples.reshape(-1, 1)
+    if np.issubdtype(samples.dtype, np.integer):
+        scale = np.float32(1.0 / (float(np.iinfo(samples.dtype).max) + 1.0))
+        return np.multiply(samples, scale, dtype=np.float32)
+    return samples.astype(np.float32)
+
+
+def to_int16(buffer):
+    """float32 buffer -> clipped int16 array ready for pygame.sndarray.make_sound."""
+    pcm = np.multiply(buffer, np.float32(32767.0))
+    np.clip(pcm, -32767.0, 32767.0, out=pcm)
+    return pcm.astype(np.int16)
+
+
+def match_channels(buffer, channels):
+    if buffer.shape[1] == channels:
+        return buffer
+    return np.ascontiguousarray(np.repeat(buffer[:, :1], channels, axis=1))
+
+
+def apply_gain(buffer, db):
+    if db:
+        buffer *= np.float32(db_to_gain(db))
+    return buffer
+
+
+@lru_cache(maxsize=64)
+def _resample_positions(frames, ratio):
+    positions = np.arange(0.0, frames - 1, ratio)
+    index = positions.astype(np.intp)
+    frac = (positions - index).astype(np.float32)
+    return index, index + 1, frac
+
+
+def resample(buffer, ratio):
+    """Linear-interpolation resample reading ``ratio`` input frames per output frame."""
+    if ratio == 1.0 or len(buffer) < 2:
+        return buffer
+    index, following, frac = _resample_positions(len(buffer), float(ratio))
+    if buffer.shape[1] == 2 and buffer.flags.c_contiguous:
+        # a stereo frame viewed as one complex64 value is gathered in one go
+        frames = buffer.view(np.complex64)[:, 0]
+    elif buffer.shape[1] == 1:
+        frames = buffer[:, 0]
+    else:
+        frames = buffer
+        frac = frac[:, None]
+    out = frames[following]
+    start = frames[index]
+    out -= start
+    out *= frac
+    out += start
+    return out.view(np.float32).reshape(-1, buffer.shape[1])
+
+
+def pitch_shift(buffer, semitones):
+    """Resample so the sample plays ``semitones`` higher (and shorter), like pydub's frame-rate trick."""
+    if not semitones:
+        return buffer
+    return resample(buffer, 2.0 ** (semitones / 12.0))
+
+
+def echo(buffer, delay, gain, feedback=True):
+    """Add an echo ``delay`` frames later; with feedback every repeat is echoed again."""
+    frames = len(buffer)
+    if delay <= 0 or delay >= frames or not gain:
+        return buffer
+    if not feedback:
+        buffer[delay:] += gain * buffer[:-delay]
+        return buffer
+    for start in range(delay, frames, delay):
+        end = min(start + delay, frames)
+        buffer[start:end] += gain * buffer[start - delay:end - delay]
+    return buffer
+
+
+# Tap positions (fraction of the tail) of the sparse reverb impulse response.
+REVERB_TAPS = (0.05, 0.12, 0.22, 0.36, 0.55)
+
+
+@lru_cache(maxsize=64)
+def reverb_taps(amount, sample_rate):
+    """(delay_frames, gain) taps decaying to -60 dB over ``amount`` * 300 ms, alternating sign."""
+    tail = sample_rate * REVERB_SECONDS_PER_UNIT * amount
+    wet = min(amount, 1.0)
+    return tuple((int(tail * position), np.float32((-1) ** i * wet * 10.0 ** (-3.0 * position)))
+                 for i, position in enumerate(REVERB_TAPS) if int(tail * position) > 0)
+
+
+def reverb(buffer, amount, sample_rate):
+    """Sparse convolution reverb: the dry signal convolved with a handful of decaying taps."""
+    if amount <= 0 or not len(buffer):
+        return buffer
+    frames = len(buffer)
+    dry = buffer.copy()
+    scratch = np.empty_like(buffer)
+    for delay, gain in reverb_taps(float(amount), sample_rate):
+        if delay >= frames:
+            break
+        np.multiply(dry[:frames - delay], gain, out=scratch[:frames - delay])
+        buffer[delay:] += scratch[:frames - delay]
+    return buffer
+
+
+def pan_gains(amount):
+    """Constant-power (left, right) gains for pan -1 (left) .. 1 (right), unity in the centre."""
+    angle = (max(-1.0, min(amount, 1.0)) + 1.0) * math.pi / 4
+    return math.cos(angle) * math.sqrt(2.0), math.sin(angle) * math.sqrt(2.0)
+
+
+def pan(buffer, amount):
+    """Constant-power pan; mono buffers are left alone."""
+    if not amount or buffer.shape[1] < 2:
+        return buffer
+    left, right = pan_gains(amount)
+    buffer[:, 0] *= np.float32(left)
+    buffer[:, 1] *= np.float32(right)
+    return buffer
+
+
+def normalize_peak(buffer, headroom_db=NORMALIZE_HEADROOM_DB):
+    peak = max(float(buffer.max()), -float(buffer.min())) if len(buffer) else 0.0
+    if peak > 0:
+        buffer *= np.float32(db_to_gain(-headroom_db) / peak)
+    return buffer
+
+
+def is_dual_mono(buffer):
+    """True for a stereo buffer whose two channels hold the same samples."""
+    return buffer.ndim == 2 and buffer.shape[1] == 2 and np.array_equal(buffer[:, 0], buffer[:, 1])
+
+
+def apply_effect_chain(buffer, effects, sample_rate=44100, style='classic'):
+    """Run the ``self.effects[inst]`` dict over ``buffer`` and return the result.
+
+    The buffer is modified in place; a new array is returned when the pitch
+    shift changes its length or when both channels are identical (the usual
+    mono sample duplicated to stereo), in which case pitch, echo and reverb
+    run on a single channel and the final gain pass writes both.
+    """
+    options = EFFECT_STYLES[style]
+    dual_mono = is_dual_mono(buffer)
+    if dual_mono:
+        buffer = np.ascontiguousarray(buffer[:, :1])
+    buffer = pitch_shift(buffer, effects.get('pitch', 0))
+
+    amount = effects.get('echo', 0)
+    if amount > 0:
+        seconds = options['echo_delay'] * amount if options['echo_delay_scaled'] else options['echo_delay']
+        echo_db = options['echo_db'] if options['echo_db'] is not None else amount
+        echo(buffer, int(sample_rate * seconds), np.float32(db_to_gain(echo_db)), options['echo_feedback'])
+
+    reverb(buffer, effects.get('reverb', 0), sample_rate)
+
+    # Volume, pan and normalization are all plain scalings, so they are merged
+    # into one pass over the quieter channel and one over the whole buffer.
+    scale = db_to_gain(effects.get('volume', 0) * options['volume_db'])
+    channel_gains = [1.0, 1.0]
+    if effects.get('pan', 0) and (dual_mono or buffer.shape[1] == 2):
+        left, right = pan_gains(effects['pan'])
+        loud = max(left, right)
+        quiet = 0 if left < right else 1
+        channel_gains[quiet] = min(left, right) / loud
+        if not dual_mono:
+            buffer[:, quiet] *= np.float32(channel_gains[quiet])
+        scale *= loud
+    if options['normalize'] and len(buffer):
+        peak = max(float(buffer.max()), -float(buffer.min()))
+        scale = db_to_gain(-NORMALIZE_HEADROOM_DB) / peak if peak > 0 else 1.0
+    if dual_mono:
+        # (left, right) as one complex64 gain writes both channels in a single pass
+        out = np.empty(len(buffer), dtype=np.complex64)
+        np.multiply(buffer[:, 0], np.complex64(complex(channel_gains[0] * scale, channel_gains[1] * scale)), out=out)
+        return out.view(np.float32).reshape(-1, 2)
+    if scale != 1.0:
+        buffer *= np.float32(scale)
+    return buffer
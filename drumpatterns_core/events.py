@@ -0,0 +1,159 @@
+"""Pattern -> event list compiler shared by playback, MIDI export and audio export.
+
+``compile_pattern`` turns one loop of a pattern into a NumPy array of
+note events sorted by time, with every rhythm type expanded by
+``rhythm_offsets``.  Live playback (``step_events``), offline renders
+and MIDI files all read the same array, so what is heard is what gets
+exported.  Times are kept in steps and converted to frames or MIDI
+ticks for a given tempo.
+"""
+
+import numpy as np
+
+from drumpatterns_core.engine import RHYTHM_TYPES, rhythm_offsets
+from drumpatterns_core.pattern import DEFAULT_VELOCITY, TIMING_RESOLUTION, Pattern
+
+EVENT_DTYPE = np.dtype([
+    ('step', np.int32),         # step of the loop the note belongs to
+    ('offset', np.float64),     # note start in steps from the start of its step
+    ('position', np.float64),   # note start in steps from the start of the loop
+    ('duration', np.float64),   # in steps (MIDI note length)
+    ('instrument', np.uint8),   # index into CompiledPattern.instruments
+    ('rhythm', np.uint8),       # index into CompiledPattern.rhythm_names
+    ('velocity', np.uint8),     # MIDI velocity
+    ('gain', np.float64),       # playback gain
+])
+TICKS_PER_BEAT = 960
+STEPS_PER_BEAT = 4
+
+
+class CompiledPattern:
+    """``events`` (EVENT_DTYPE, sorted by position) of one loop of ``length`` steps."""
+
+    def __init__(self, events, instruments, rhythm_names, length):
+        self.events = events
+        self.instruments = list(instruments)
+        self.rhythm_names = list(rhythm_names)
+        self.length = length
+        names = [self.instruments[row] for row in events['instrument'].tolist()]
+        self._steps = [[] for _ in range(length)]
+        for step, offset, name, gain in zip(events['step'].tolist(), events['offset'].tolist(), names,
+                                            events['gain'].tolist()):
+            self._steps[step].append((offset, name, gain))
+
+    def __len__(self):
+        return len(self.events)
+
+    def step_events(self, step):
+        """Hits of one step as (offset_in_steps, instrument, gain), for PatternEngine."""
+        return self._steps[step % self.length] if self.length else []
+
+    def positions(self, loops=1):
+        """Note starts in steps over ``loops`` repetitions."""
+        return (self.events['position'][None, :] + self.length * np.arange(loops)[:, None]).ravel()
+
+    def frames(self, bpm, sample_rate, loops=1):
+        """Note starts in frames at a constant ``bpm``, rounded like PatternEngine."""
+        step_frames = sample_rate * 60.0 / (bpm * STEPS_PER_BEAT)
+        return np.round(self.positions(loops) * step_frames).astype(np.int64)
+
+    def ticks(self, loops=1, ticks_per_beat=TICKS_PER_BEAT):
+        """Note starts in MIDI ticks (tempo independent)."""
+        return np.round(self.positions(loops) * (ticks_per_beat / STEPS_PER_BEAT)).astype(np.int64)
+
+    def loop_events(self, loops=1):
+        """``events`` repeated ``loops`` times with positions and steps moved to each repetition."""
+        events = np.tile(self.events, loops)
+        shift = np.repeat(np.arange(loops) * self.length, len(self.events))
+        events['position'] += shift
+        events['step'] += shift
+        return events
+
+
+def compile_pattern(pattern, instruments, advanced=True, rhythm_types=RHYTHM_TYPES, spacing='subdivided',
+                    accent_gain=1.0, velocity=100, accent_velocity=None, length=None):
+    """CompiledPattern of a legacy pattern dict (simple or advanced) or a Pattern.
+
+    ``velocity`` and ``accent_velocity`` are numbers or per-instrument
+    dicts, as pattern_midi takes them; without an accent velocity accents
+    use the normal one.  ``length`` cuts or pads the loop to that many steps.
+    """
+    if not isinstance(pattern, Pattern):
+        pattern = Pattern.from_dict(pattern, instruments, advanced, rhythm_types, length)
+    elif length is not None and length != len(pattern):
+        pattern = pattern.resized(length)
+    names = pattern.rhythm_names
+    rows, steps = pattern.hits()
+    codes = pattern.rhythm[rows, steps].astype(np.intp)
+    offsets = [rhythm_offsets(pattern.rhythm_types[name], spacing) for name in names]
+    notes = np.array([len(offset) for offset in offsets], dtype=np.intp)[codes]
+
+    durations = np.array([pattern.rhythm_types[name]['speed'] / (pattern.rhythm_types[name]['notes']
+                                                                 if spacing == 'split' else 1)
+                          for name in names], dtype=np.float64)
+    accent = pattern._codes.get('accent', -1)
+    normal = np.array([_per_instrument(velocity, inst) for inst in pattern.instruments], dtype=np.float64)
+    accented = normal if accent_velocity is None else np.array(
+        [_per_instrument(accent_velocity, inst) for inst in pattern.instruments], dtype=np.float64)
+    cells = pattern.steps[rows, steps]
+    scale = cells['velocity'] / float(DEFAULT_VELOCITY)
+    hit_velocity = np.where(codes == accent, accented[rows], normal[rows]) * scale
+    hit_gain = np.where(codes == accent, accent_gain, 1.0) * scale
+    shift = cells['timing'] / float(TIMING_RESOLUTION)
+
+    # every hit expands into its rhythm's notes
+    events = np.zeros(int(notes.sum()), dtype=EVENT_DTYPE)
+    hit = np.repeat(np.arange(len(rows)), notes)
+    note = np.arange(len(events)) - np.repeat(np.cumsum(notes) - notes, notes)
+    flat_offsets = np.array([offset for row in offsets for offset in row] or [0.0], dtype=np.float64)
+    first = np.concatenate(([0], np.cumsum([len(offset) for offset in offsets])[:-1])).astype(np.intp)
+    events['step'] = steps[hit]
+    events['offset'] = flat_offsets[first[codes[hit]] + note] + shift[hit]
+    events['position'] = steps[hit] + events['offset']
+    events['duration'] = durations[codes[hit]]
+    events['instrument'] = rows[hit]
+    events['rhythm'] = codes[hit]
+    events['velocity'] = np.clip(np.round(hit_velocity[hit]), 1, 127)
+    events['gain'] = hit_gain[hit]
+    # stabilnie po czasie: przy równym czasie zostaje kolejność instrumentów
+    events = events[np.argsort(events['position'], kind='stable')]
+    return CompiledPattern(events, pattern.instruments, names, len(pattern))
+
+
+class EventCompiler:
+    """Keeps the last CompiledPattern; it is recompiled only after ``invalidate``.
+
+    Front-ends call ``invalidate`` whenever they edit the pattern (edit
+    history, button refresh), so ``compile`` on every playback step is a
+    cheap key comparison returning the shared CompiledPattern.  Switching
+    to another pattern dict or changing the settings recompiles as well.
+    """
+
+    def __init__(self, rhythm_types=RHYTHM_TYPES, spacing='subdivided', accent_gain=1.0):
+        self.rhythm_types = rhythm_types
+        self.spacing = spacing
+        self.accent_gain = accent_gain
+        self._generation = 0
+        self._key = None
+        self._compiled = None
+
+    def invalidate(self):
+        """The pattern was edited; the next ``compile`` compiles it again."""
+        self._generation += 1
+
+    def compile(self, patterns, instruments, advanced, velocity=100, accent_velocity=None, length=None):
+        key = (self._generation, id(patterns), tuple(instruments), advanced, length,
+               _freeze(velocity), _freeze(accent_velocity))
+        if key != self._key:
+            self._compiled = compile_pattern(patterns, instruments, advanced, self.rhythm_types, self.spacing,
+                                             self.accent_gain, velocity, accent_velocity, length)
+            self._key = key
+        return self._compiled
+
+
+def _per_instrument(value, instrument):
+    return value[instrument] if isinstance(value, dict) else value
+
+
+def _freeze(value):
+    return tuple(sorted(value.items())) if isinstance(value, dict) else value
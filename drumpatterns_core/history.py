@@ -0,0 +1,207 @@
+"""Undo/redo of waveform and pattern edits as compact deltas.
+
+Every edit keeps only what it changed: a ``SampleEdit`` the one slice of
+samples it overwrote, a ``PatternEdit`` the cells that differ before and
+after.  Undo and redo swap the kept values with the current ones, so an
+edit costs its own size once, whatever the length of the sample.  The
+history drops its oldest edits when the total goes over ``budget`` bytes.
+"""
+
+import contextlib
+import functools
+
+HISTORY_BUDGET = 16 * 1024 * 1024
+# przybliżony koszt jednej komórki wzorca (krotka, słownik kroku) w bajtach
+CELL_BYTES = 256
+
+
+class SampleEdit:
+    """Samples ``start:end`` of ``data``; create it before writing to that range."""
+
+    def __init__(self, data, start, end):
+        self.data = data
+        self.start = start
+        self.end = end
+        self.saved = data[start:end].copy()
+        self.nbytes = self.saved.nbytes
+
+    def swap(self):
+        current = self.data[self.start:self.end].copy()
+        self.data[self.start:self.end] = self.saved
+        self.saved = current
+
+    undo = redo = swap
+
+
+class PatternEdit:
+    """Cells of a pattern dict (instrument -> list of steps) changed since ``before``.
+
+    Rows that changed length keep both lengths, so generators that
+    rebuild the lists are undone too.  Steps may be 0/1 or step dicts.
+    When the pattern length changed, ``set_length`` (the front-end length
+    setting) is called with the old or new length before the cells are
+    written back.
+    """
+
+    def __init__(self, patterns, before, set_length=None):
+        self.patterns = patterns
+        self.set_length = set_length
+        self.changes = []
+        after = snapshot_cells(patterns)
+        self.lengths = (_length(before), _length(after))
+        for instrument in list(before) + [inst for inst in after if inst not in before]:
+            old, new = before.get(instrument, []), after.get(instrument, [])
+            cells = [(step, _cell(old, step), _cell(new, step)) for step in range(max(len(old), len(new)))
+                     if _cell(old, step) != _cell(new, step)]
+            if cells:
+                self.changes.append((instrument, len(old), len(new), _blank(old + new), cells))
+        self.nbytes = CELL_BYTES * sum(len(cells) for _, _, _, _, cells in self.changes)
+
+    def __bool__(self):
+        return bool(self.changes) or self.lengths[0] != self.lengths[1]
+
+    def undo(self):
+        self._resize(self.lengths[0])
+        for instrument, length, _, blank, cells in self.changes:
+            self._write(instrument, length, blank, [(step, old) for step, old, _ in cells])
+
+    def redo(self):
+        self._resize(self.lengths[1])
+        for instrument, _, length, blank, cells in self.changes:
+            self._write(instrument, length, blank, [(step, new) for step, _, new in cells])
+
+    def _resize(self, length):
+        # najpierw długość (przyciski, wiersze), potem komórki sprzed/po edycji
+        if self.set_length is not None and self.lengths[0] != self.lengths[1]:
+            self.set_length(length)
+
+    def _write(self, instrument, length, blank, cells):
+        row = self.patterns.setdefault(instrument, [])
+        del row[length:]
+        row.extend(_copy(blank) for _ in range(length - len(row)))
+        for step, value in cells:
+            if step < length:
+                row[step] = _copy(value)
+
+
+class EditHistory:
+    """Undo and redo stacks of edits (anything with ``undo``, ``redo`` and ``nbytes``).
+
+    ``set_length`` sets the pattern length setting of a front-end, so
+    pattern edits also undo length changes.  ``on_change`` is called
+    after every recorded, undone or redone edit and after ``clear``
+    (e.g. EventCompiler.invalidate).
+    """
+
+    def __init__(self, budget=HISTORY_BUDGET, set_length=None, on_change=None):
+        self.budget = budget
+        self.set_length = set_length
+        self.on_change = on_change
+        self.nbytes = 0
+        self._undo = []
+        self._redo = []
+        self._depth = 0
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def push(self, edit):
+        """Record an edit that has just been applied; clears the redo stack."""
+        self.nbytes -= sum(old.nbytes for old in self._redo)
+        self._redo = []
+        self._undo.append(edit)
+        self.nbytes += edit.nbytes
+        # najstarsze zmiany wypadają pierwsze; zbyt duża zmiana nie zostaje wcale
+        while self.nbytes > self.budget and self._undo:
+            self.nbytes -= self._undo.pop(0).nbytes
+        self._changed()
+
+    def undo(self):
+        """Undo the last edit and return it (None when there is nothing to undo)."""
+        return self._move(self._undo, self._redo, 'undo')
+
+    def redo(self):
+        return self._move(self._redo, self._undo, 'redo')
+
+    def clear(self):
+        self._undo, self._redo = [], []
+        self.nbytes = 0
+        self._changed()
+
+    @contextlib.contextmanager
+    def edit(self, patterns):
+        """Record the cells of ``patterns`` changed inside the block as one edit.
+
+        Nested blocks (e.g. toggle handlers fired while a generator updates
+        the buttons) belong to the outermost one.
+        """
+        if self._depth:
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            return
+        before = snapshot_cells(patterns)
+        self._depth = 1
+        try:
+            yield
+        finally:
+            self._depth = 0
+        edit = PatternEdit(patterns, before, self.set_length)
+        if edit:
+            self.push(edit)
+
+    def _move(self, source, target, action):
+        if not source:
+            return None
+        edit = source.pop()
+        # zmiany wzorca wywołane przy odświeżaniu przycisków nie trafiają do historii
+        self._depth += 1
+        try:
+            getattr(edit, action)()
+        finally:
+            self._depth -= 1
+        target.append(edit)
+        self._changed()
+        return edit
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+
+def pattern_edit(method):
+    """Makes a front-end handler record its changes to ``self.patterns`` as one edit of ``self.history``."""
+    @functools.wraps(method)
+    def recorded(self, *args, **kwargs):
+        with self.history.edit(self.patterns):
+            return method(self, *args, **kwargs)
+    return recorded
+
+
+def snapshot_cells(patterns):
+    """Copy of the cells of a pattern dict, compared by PatternEdit."""
+    return {instrument: [_copy(cell) for cell in steps] for instrument, steps in patterns.items()}
+
+
+def _length(cells):
+    # wiersze wzorca idą za ustawieniem długości we wszystkich front-endach
+    return max((len(steps) for steps in cells.values()), default=0)
+
+
+def _cell(steps, step):
+    return steps[step] if step < len(steps) else None
+
+
+def _copy(cell):
+    return dict(cell) if isinstance(cell, dict) else cell
+
+
+def _blank(cells):
+    if any(isinstance(cell, dict) for cell in cells):
+        return {'active': False, 'rhythm_type': 'single'}
+    return 0
@@ -0,0 +1,63 @@
+"""Per-instrument re-rendering of edited samples off the GUI thread.
+
+Editors call ``mark(instrument)`` after every change.  A worker thread
+waits one frame to collect the burst of edits a spin button or scroll
+produces, renders each dirty instrument once with the settings current
+at that moment and hands the result back through ``schedule`` (e.g.
+``GLib.idle_add``).  Results overtaken by a newer edit are dropped, so
+only the latest render of an instrument is ever published.
+"""
+
+import threading
+import time
+
+FRAME_SECONDS = 1 / 60.0
+
+
+class IncrementalRenderer:
+    """``render(instrument)`` runs on the worker; ``publish(instrument, result)`` via ``schedule``."""
+
+    def __init__(self, render, publish, schedule, frame=FRAME_SECONDS):
+        self.render = render
+        self.publish = publish
+        self.schedule = schedule
+        self.frame = frame
+        self._generation = {}
+        self._dirty = set()
+        self._wakeup = threading.Condition()
+        self._thread = None
+
+    def mark(self, instrument):
+        """Request a re-render of ``instrument``; cheap enough to call on every keystroke."""
+        with self._wakeup:
+            self._generation[instrument] = self._generation.get(instrument, 0) + 1
+            self._dirty.add(instrument)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+
+    def _loop(self):
+        while True:
+            with self._wakeup:
+                while not self._dirty:
+                    self._wakeup.wait()
+            # zbieramy serię zmian z jednej klatki (spin, scroll) w jeden render
+            time.sleep(self.frame)
+            with self._wakeup:
+                dirty = [(instrument, self._generation[instrument]) for instrument in self._dirty]
+                self._dirty.clear()
+            for instrument, generation in dirty:
+                try:
+                    result = self.render(instrument)
+                except Exception as e:
+                    print(f"Error rendering {instrument}: {e}")
+                    continue
+                self.schedule(self._publish, instrument, generation, result)
+
+    def _publish(self, instrument, generation, result):
+        with self._wakeup:
+            current = self._generation.get(instrument) == generation
+        if current:
+            self.publish(instrument, result)
+        return False
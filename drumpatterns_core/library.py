@@ -0,0 +1,330 @@
+"""Persistent sample library index (SQLite).
+
+Each audio file under a scanned directory has one row: path, mtime,
+size, duration, sample rate, peak/RMS, the instrument its name points
+to and a small peak thumbnail.  ``update`` only stats unchanged files
+and decodes the ones whose mtime or size changed, so rescanning a big
+library costs O(changed files) decodes; the browser and sample
+auto-assignment query the index instead of decoding files.
+
+``DirectoryScanner`` lists directories for the sample browser with
+``os.scandir``, caching each directory's listing until its mtime changes.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import soundfile as sf
+
+SAMPLE_EXTENSIONS = ('.wav', '.mp3', '.ogg', '.flac', '.aiff', '.aif')
+THUMBNAIL_SIZE = 64
+SCHEMA_VERSION = 1
+# wiersze zapisywane w jednej transakcji podczas skanowania
+UPDATE_BATCH = 256
+
+# opcjonalne słowa kluczowe w nazwach plików -> instrument (SampleLibrary(keywords=INSTRUMENT_KEYWORDS))
+INSTRUMENT_KEYWORDS = {
+    'Talerz': ('cymbal', 'crash', 'ride', 'hihat', 'hi-hat', 'splash'),
+    'Stopa': ('kick', 'bassdrum', 'bass_drum'),
+    'Werbel': ('snare', 'clap'),
+    'TomTom': ('tom',),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    duration REAL,
+    sample_rate INTEGER,
+    channels INTEGER,
+    peak REAL,
+    rms REAL,
+    instrument TEXT,
+    thumbnail BLOB
+);
+CREATE INDEX IF NOT EXISTS samples_directory ON samples (directory);
+CREATE INDEX IF NOT EXISTS samples_instrument ON samples (instrument);
+CREATE TABLE IF NOT EXISTS roots (
+    path TEXT PRIMARY KEY,
+    scanned REAL NOT NULL
+);
+"""
+_INSERT_SAMPLE = "INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+def default_library_path():
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache, 'drumpatterns', 'library.sqlite')
+
+
+def matching_instruments(name, instruments=tuple(INSTRUMENT_KEYWORDS), keywords=None):
+    """Instruments whose name the file name contains, as the sampler always matched them.
+
+    Only when none does and ``keywords`` ({inst: words}) is given, the
+    first instrument one of its keywords points to.
+    """
+    name = name.lower()
+    found = [inst for inst in instruments if inst.lower() in name]
+    if not found and keywords:
+        found = [inst for inst in instruments if any(keyword in name for keyword in keywords.get(inst, ()))][:1]
+    return found
+
+
+def classify_instrument(name, instruments=tuple(INSTRUMENT_KEYWORDS), keywords=None):
+    """First instrument of matching_instruments, or None."""
+    found = matching_instruments(name, instruments, keywords)
+    return found[0] if found else None
+
+
+def choose_kit(paths, instruments, keywords=None):
+    """{inst: path} of the files whose names match an instrument (matching_instruments).
+
+    Like the old directory walk, a file can serve several instruments and
+    a later file (by path) wins.  Only names are looked at, nothing is decoded.
+    """
+    found = {}
+    for path in sorted(paths):
+        for inst in matching_instruments(os.path.basename(path), instruments, keywords):
+            found[inst] = path
+    return found
+
+
+def analyze_file(path, fallback=None):
+    """(duration, sample_rate, channels, peak, rms, thumbnail bytes) of an audio file.
+
+    ``fallback(path)`` -> (array, rate) decodes what soundfile cannot.
+    """
+    try:
+        data, rate = sf.read(path, dtype='float32', always_2d=True)
+    except RuntimeError:
+        if fallback is None:
+            raise
+        data, rate = fallback(path)
+        data = np.asarray(data)
+        if np.issubdtype(data.dtype, np.integer):
+            data = data / float(np.iinfo(data.dtype).max + 1)
+        data = data.reshape(len(data), -1).astype(np.float32)
+    magnitude = np.abs(data).max(axis=1) if data.size else np.zeros(0, dtype=np.float32)
+    peak = float(magnitude.max()) if len(magnitude) else 0.0
+    rms = float(np.sqrt(np.mean(np.square(data, dtype=np.float64)))) if data.size else 0.0
+    thumbnail = np.zeros(THUMBNAIL_SIZE, dtype=np.uint8)
+    if len(magnitude):
+        edges = np.linspace(0, len(magnitude), THUMBNAIL_SIZE + 1).astype(int)
+        buckets = np.maximum.reduceat(magnitude, np.minimum(edges[:-1], len(magnitude) - 1))
+        thumbnail = np.round(np.clip(buckets, 0, 1) * 255).astype(np.uint8)
+    return len(data) / float(rate), int(rate), int(data.shape[1]), peak, rms, thumbnail.tobytes()
+
+
+class SampleLibrary:
+    """Index stored in ``path``; one connection shared by all threads behind a lock."""
+
+    def __init__(self, path=None, fallback=None, extensions=SAMPLE_EXTENSIONS, keywords=None):
+        self.path = path or default_library_path()
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.fallback = fallback
+        self.extensions = tuple(extensions)
+        self.keywords = keywords
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def update(self, root, cancelled=None):
+        """Bring the rows under ``root`` up to date; returns (added or changed, removed).
+
+        Files are only decoded when new or their mtime/size changed.
+        ``cancelled()`` returning True stops the scan early (rows done so
+        far are kept, removals are skipped).  Rows are written in
+        transactions of ``UPDATE_BATCH`` files.
+        """
+        root = os.path.abspath(root)
+        with self._lock:
+            known = {path: (mtime, size) for path, mtime, size in self._db.execute(
+                "SELECT path, mtime, size FROM samples WHERE path LIKE ? ESCAPE '\\'", (_like_prefix(root),))}
+        seen = set()
+        changed = 0
+        rows = []
+        for path, stat in self._files(root):
+            if cancelled is not None and cancelled():
+                self._write_rows(rows)
+                return changed, 0
+            seen.add(path)
+            if known.get(path) == (stat.st_mtime, stat.st_size):
+                continue
+            try:
+                info = analyze_file(path, self.fallback)
+            except Exception:
+                # nieczytelny plik też zapisujemy, żeby nie dekodować go przy każdym starcie
+                info = (None, None, None, None, None, None)
+            name = os.path.basename(path)
+            rows.append((path, os.path.dirname(path), name, stat.st_mtime, stat.st_size, *info[:5],
+                         classify_instrument(name, keywords=self.keywords), info[5]))
+            changed += 1
+            if len(rows) >= UPDATE_BATCH:
+                self._write_rows(rows)
+                rows = []
+        removed = [(path,) for path in known if path not in seen]
+        with self._lock, self._db:
+            self._db.executemany(_INSERT_SAMPLE, rows)
+            self._db.executemany("DELETE FROM samples WHERE path = ?", removed)
+            self._db.execute("INSERT OR REPLACE INTO roots VALUES (?, ?)", (root, time.time()))
+        return changed, len(removed)
+
+    def is_scanned(self, root):
+        """True when ``root`` or a directory above it was scanned before."""
+        root = os.path.abspath(root)
+        with self._lock:
+            for (scanned,) in self._db.execute("SELECT path FROM roots"):
+                if root == scanned or root.startswith(scanned.rstrip(os.sep) + os.sep):
+                    return True
+        return False
+
+    def files(self, root, recursive=True):
+        """[(name, path)] of indexed files under ``root`` (or directly in it), ordered by path."""
+        root = os.path.abspath(root)
+        with self._lock:
+            if recursive:
+                rows = self._db.execute(
+                    "SELECT name, path FROM samples WHERE path LIKE ? ESCAPE '\\' ORDER BY path",
+                    (_like_prefix(root),))
+            else:
+                rows = self._db.execute("SELECT name, path FROM samples WHERE directory = ? ORDER BY path", (root,))
+            return rows.fetchall()
+
+    def instrument_samples(self, root, instruments):
+        """{inst: path} of the readable indexed files under ``root``, chosen by choose_kit."""
+        root = os.path.abspath(root)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path FROM samples WHERE path LIKE ? ESCAPE '\\' AND duration IS NOT NULL",
+                (_like_prefix(root),)).fetchall()
+        return choose_kit([path for path, in rows], instruments, self.keywords)
+
+    def info(self, path):
+        """Row of ``path`` as a dict (thumbnail as a float array 0..1), or None."""
+        with self._lock:
+            cursor = self._db.execute("SELECT * FROM samples WHERE path = ?", (os.path.abspath(path),))
+            row = cursor.fetchone()
+            names = [column[0] for column in cursor.description]
+        if row is None:
+            return None
+        info = dict(zip(names, row))
+        if info['thumbnail'] is not None:
+            info['thumbnail'] = np.frombuffer(info['thumbnail'], dtype=np.uint8) / 255.0
+        return info
+
+    def _write_rows(self, rows):
+        if rows:
+            with self._lock, self._db:
+                self._db.executemany(_INSERT_SAMPLE, rows)
+
+    def _files(self, root):
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(self.extensions):
+                        yield entry.path, entry.stat()
+                except OSError:
+                    continue
+
+
+class DirectoryScanner:
+    """Browser listing of a directory tree in batches; listings are cached per directory.
+
+    A cached listing is reused as long as the directory's mtime is the
+    same (adding, removing or renaming entries changes it), so revisiting
+    a folder costs one ``stat`` per directory instead of a scandir.
+    """
+
+    def __init__(self, extensions=SAMPLE_EXTENSIONS, batch_size=500):
+        self.extensions = tuple(extensions)
+        self.batch_size = batch_size
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def listing(self, directory):
+        """(subdirectory paths, audio file paths) of ``directory``, both sorted."""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return [], []
+        with self._lock:
+            cached = self._cache.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], cached[2]
+        subdirs, files = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.name.lower().endswith(self.extensions):
+                            files.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            return [], []
+        subdirs.sort()
+        files.sort()
+        with self._lock:
+            self._cache[directory] = (mtime, subdirs, files)
+        return subdirs, files
+
+    def invalidate(self, directory=None):
+        """Forget the cached listings of ``directory`` and everything below it (all when None)."""
+        with self._lock:
+            if directory is None:
+                self._cache.clear()
+                return
+            prefix = directory.rstrip(os.sep) + os.sep
+            for cached in [path for path in self._cache if path == directory or path.startswith(prefix)]:
+                del self._cache[cached]
+
+    def scan(self, root, cancelled=None):
+        """Yield lists of (name, path, is_dir): the subdirectories of ``root``, then audio files of the whole tree.
+
+        Stops between directories once ``cancelled()`` returns True.
+        """
+        subdirs, files = self.listing(root)
+        batch = [(os.path.basename(path) + os.sep, path, True) for path in subdirs]
+        stack = [root]
+        while stack:
+            if cancelled is not None and cancelled():
+                return
+            directory = stack.pop()
+            subdirs, files = self.listing(directory)
+            # odwrotnie, żeby podkatalogi były odwiedzane alfabetycznie
+            stack.extend(reversed(subdirs))
+            for path in files:
+                batch.append((os.path.basename(path), path, False))
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+
+def _like_prefix(directory):
+    prefix = directory.rstrip(os.sep) + os.sep
+    return prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
@@ -0,0 +1,53 @@
+"""Standard MIDI export of step patterns (General MIDI drums, channel 10)."""
+
+from drumpatterns_core.engine import RHYTHM_TYPES
+from drumpatterns_core.events import compile_pattern
+from drumpatterns_core.startup import lazy_import
+from drumpatterns_core.tempo import TempoMap
+
+# imported on the first export, not when a front-end starts
+midiutil = lazy_import('midiutil')
+
+DRUM_CHANNEL = 9
+STEP_BEATS = 0.25
+
+
+def pattern_midi(patterns, instruments, midi_notes, pattern_length, tempo, advanced,
+                 rhythm_types=RHYTHM_TYPES, spacing='subdivided', velocity=100, accent_velocity=None,
+                 loops=1, track_name="Drum Pattern"):
+    """MIDIFile with ``loops`` repetitions of the pattern, one 16th note per step.
+
+    ``tempo`` is a BPM, a list of per-step BPMs or a TempoMap (written as
+    tempo events, so note times stay on the beat grid; a ramp gets one
+    event per step with the step's average BPM).  ``velocity`` and
+    ``accent_velocity`` are numbers or per-instrument dicts; without an
+    accent velocity accents use the normal one.
+    """
+    compiled = compile_pattern(patterns, instruments, advanced, rhythm_types, spacing,
+                               velocity=velocity, accent_velocity=accent_velocity, length=pattern_length)
+    midi = midiutil.MIDIFile(1)
+    midi.addTrackName(0, 0, track_name)
+    if isinstance(tempo, TempoMap):
+        tempos = tempo.step_bpms(loops * pattern_length).tolist()
+    else:
+        tempos = list(tempo) if isinstance(tempo, (list, tuple)) else [tempo]
+    previous = None
+    for step in range(loops * pattern_length):
+        bpm = tempos[step % len(tempos)]
+        if bpm != previous:
+            midi.addTempo(0, step * STEP_BEATS, bpm)
+            previous = bpm
+    events = compiled.loop_events(loops)
+    notes = [midi_notes[inst] for inst in compiled.instruments]
+    for step, offset, duration, row, hit_velocity in zip(events['step'].tolist(), events['offset'].tolist(),
+                                                         events['duration'].tolist(), events['instrument'].tolist(),
+                                                         events['velocity'].tolist()):
+        # midiutil obcina czas do ticków, więc liczymy go tak samo jak siatkę kroków
+        midi.addNote(0, DRUM_CHANNEL, notes[row], step * STEP_BEATS + offset * STEP_BEATS,
+                     duration * STEP_BEATS, hit_velocity)
+    return midi
+
+
+def write_midi_file(midi, path):
+    with open(path, 'wb') as f:
+        midi.writeFile(f)
@@ -0,0 +1,62 @@
+"""Offline rendering of a looped pattern into one float32 timeline."""
+
+import numpy as np
+import soundfile as sf
+
+from drumpatterns_core.dsp import match_channels, normalize_peak, resample
+from drumpatterns_core.engine import DEFAULT_SAMPLE_RATE, PatternEngine
+
+OFFLINE_CHUNK_FRAMES = 1 << 16
+
+
+def pattern_frames(bpm, pattern_length, sample_rate=DEFAULT_SAMPLE_RATE, loops=1, tempo_map=None):
+    if tempo_map is not None:
+        return tempo_map.frames(loops * pattern_length, sample_rate)
+    return int(round(loops * pattern_length * sample_rate * 60.0 / (bpm * 4)))
+
+
+def render_timeline(step_events, sample_source, bpm, frames, pattern_length=16,
+                    sample_rate=DEFAULT_SAMPLE_RATE, channels=2, source_rate=DEFAULT_SAMPLE_RATE,
+                    tempo_map=None):
+    """Render ``frames`` frames of the looped pattern at a fixed ``bpm`` or along ``tempo_map``.
+
+    ``sample_source(key)`` is asked once per key; its arrays (at
+    ``source_rate``) are resampled and matched to ``channels`` once and then
+    slice-added at every hit, so the cost is linear in the output length.
+    """
+    prepared = {}
+
+    def source(key):
+        if key not in prepared:
+            data = sample_source(key)
+            if data is not None:
+                data = match_channels(resample(data, source_rate / float(sample_rate)), channels)
+            prepared[key] = data
+        return prepared[key]
+
+    tempo = bpm if tempo_map is None else tempo_map
+    engine = PatternEngine(step_events, source, lambda: tempo, pattern_length=pattern_length,
+                           sample_rate=sample_rate, block_size=OFFLINE_CHUNK_FRAMES, channels=channels)
+    timeline = np.zeros((frames, channels), dtype=np.float32)
+    for start in range(0, frames, OFFLINE_CHUNK_FRAMES):
+        engine.render_block(timeline[start:start + OFFLINE_CHUNK_FRAMES])
+    return timeline
+
+
+def export_pattern(path, step_events, sample_source, bpm, pattern_length, loops=1,
+                   sample_rate=DEFAULT_SAMPLE_RATE, channels=2, tempo_map=None):
+    """Write ``loops`` repetitions of the pattern, peak-normalized, to ``path``."""
+    frames = pattern_frames(bpm, pattern_length, sample_rate, loops, tempo_map)
+    timeline = render_timeline(step_events, sample_source, bpm, frames, pattern_length,
+                               sample_rate, channels, source_rate=sample_rate, tempo_map=tempo_map)
+    sf.write(path, normalize_peak(timeline), sample_rate)
+
+
+def add_drums_to_file(audio_path, output_path, step_events, sample_source, bpm, pattern_length,
+                      source_rate=DEFAULT_SAMPLE_RATE, tempo_map=None):
+    """Mix the looped pattern under the whole of ``audio_path`` and write ``output_path``."""
+    audio, sample_rate = sf.read(audio_path, dtype='float32', always_2d=True)
+    audio += render_timeline(step_events, sample_source, bpm, len(audio), pattern_length,
+                             sample_rate, audio.shape[1], source_rate, tempo_map)
+    np.clip(audio, -1.0, 1.0, out=audio)
+    sf.write(output_path, audio, sample_rate)
@@ -0,0 +1,89 @@
+"""pygame mixer output for PatternEngine."""
+
+import threading
+import time
+
+import numpy as np
+import pygame
+
+from drumpatterns_core.dsp import match_channels, to_float32, to_int16
+
+
+def sound_to_array(sound, channels=2):
+    """Convert a pygame Sound into a (frames, channels) float32 array in [-1, 1]."""
+    return match_channels(to_float32(pygame.sndarray.array(sound)), channels)
+
+
+def array_to_sound(buffer):
+    """float32 (frames, channels) buffer -> pygame Sound."""
+    pcm = to_int16(buffer)
+    if pcm.shape[1] == 1:
+        pcm = pcm[:, 0]
+    return pygame.sndarray.make_sound(np.ascontiguousarray(pcm))
+
+
+def mixer_format():
+    """(sample_rate, channels) of the initialized mixer, CD quality if it is not running."""
+    init = pygame.mixer.get_init()
+    if not init:
+        return 44100, 2
+    return init[0], init[2]
+
+
+class PygameBlockOutput:
+    """Streams engine blocks through a reserved pygame mixer channel.
+
+    The engine callback renders ``blocks_per_buffer`` blocks at a time; one
+    buffer plays while the next one waits in the channel queue, so playback
+    is gapless and hit placement is decided by the engine, not by sleeps.
+    """
+
+    def __init__(self, engine, blocks_per_buffer=8):
+        self.engine = engine
+        self.blocks_per_buffer = blocks_per_buffer
+        self._running = False
+        self._thread = None
+        self._channel = None
+        frames = engine.block_size * blocks_per_buffer
+        self._buffer = np.zeros((frames, engine.channels), dtype=np.float32)
+
+    @property
+    def buffer_seconds(self):
+        return len(self._buffer) / float(self.engine.sample_rate)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        if self._channel is not None:
+            self._channel.stop()
+            self._channel = None
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _next_sound(self):
+        block_size = self.engine.block_size
+        for start in range(0, len(self._buffer), block_size):
+            self.engine.render_block(self._buffer[start:start + block_size])
+        return array_to_sound(self._buffer)
+
+    def _run(self):
+        pygame.mixer.set_reserved(1)
+        self._channel = pygame.mixer.Channel(0)
+        self._channel.play(self._next_sound())
+        self._channel.queue(self._next_sound())
+        poll = self.buffer_seconds / 4
+        while self._running:
+            if self._channel.get_queue() is None:
+                self._channel.queue(self._next_sound())
+            else:
+                time.sleep(poll)
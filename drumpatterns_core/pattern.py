@@ -0,0 +1,137 @@
+"""Compact step patterns: one structured NumPy array of instruments x steps.
+
+The front-ends keep ``{inst: [{'active': bool, 'rhythm_type': str}, ...]}``
+(advanced mode) or ``{inst: [0/1, ...]}`` (simple mode) for the editor;
+``Pattern.from_dict``/``to_dict`` convert between that and a Pattern, which
+stores a step in 4 bytes instead of a dict, so long generated tracks are
+cheap to keep and to query.
+"""
+
+import numpy as np
+
+from drumpatterns_core.engine import RHYTHM_TYPES, rhythm_offsets
+
+STEP_DTYPE = np.dtype([
+    ('active', np.uint8),
+    ('rhythm', np.uint8),    # index into Pattern.rhythm_names
+    ('velocity', np.uint8),  # MIDI velocity, 1..127
+    ('timing', np.int8),     # micro-timing in 1/TIMING_RESOLUTION of a step
+])
+DEFAULT_VELOCITY = 100
+TIMING_RESOLUTION = 96
+
+
+class Pattern:
+    """``steps`` is an (instruments, steps) STEP_DTYPE array.
+
+    ``row``, ``column`` and the field properties return views, so reading
+    or writing them never copies the pattern.
+    """
+
+    def __init__(self, instruments, length, rhythm_types=RHYTHM_TYPES):
+        self.instruments = list(instruments)
+        self.rhythm_types = rhythm_types
+        self.rhythm_names = list(rhythm_types)
+        self.steps = np.zeros((len(self.instruments), length), dtype=STEP_DTYPE)
+        self.steps['velocity'] = DEFAULT_VELOCITY
+        self._rows = {inst: row for row, inst in enumerate(self.instruments)}
+        self._codes = {name: code for code, name in enumerate(self.rhythm_names)}
+        self._notes = np.array([rhythm_types[name]['notes'] for name in self.rhythm_names], dtype=np.int32)
+        self._offsets = {}
+
+    @classmethod
+    def from_dict(cls, patterns, instruments, advanced=True, rhythm_types=RHYTHM_TYPES, length=None):
+        """Pattern from the legacy dict format; shorter rows are padded with inactive steps."""
+        if length is None:
+            length = max([len(patterns.get(inst, ())) for inst in instruments] + [0])
+        pattern = cls(instruments, length, rhythm_types)
+        for row, inst in enumerate(pattern.instruments):
+            steps = list(patterns.get(inst, ()))[:length]
+            if advanced:
+                pattern.steps['active'][row, :len(steps)] = [bool(step['active']) for step in steps]
+                pattern.steps['rhythm'][row, :len(steps)] = [pattern._codes[step['rhythm_type']] for step in steps]
+            else:
+                pattern.steps['active'][row, :len(steps)] = [bool(step) for step in steps]
+        return pattern
+
+    def to_dict(self, advanced=True):
+        """The legacy dict format (advanced step dicts, or 0/1 lists when ``advanced`` is False)."""
+        if not advanced:
+            return {inst: self.steps['active'][row].astype(int).tolist() for row, inst in enumerate(self.instruments)}
+        names = self.rhythm_names
+        return {inst: [{'active': bool(active), 'rhythm_type': names[code]}
+                       for active, code in zip(self.steps['active'][row].tolist(), self.steps['rhythm'][row].tolist())]
+                for row, inst in enumerate(self.instruments)}
+
+    def __len__(self):
+        return self.steps.shape[1]
+
+    def copy(self):
+        pattern = Pattern(self.instruments, len(self), self.rhythm_types)
+        pattern.steps[...] = self.steps
+        return pattern
+
+    def resized(self, length):
+        """Copy cut or padded (with inactive steps) to ``length`` steps."""
+        pattern = Pattern(self.instruments, length, self.rhythm_types)
+        count = min(length, len(self))
+        pattern.steps[:, :count] = self.steps[:, :count]
+        return pattern
+
+    @property
+    def active(self):
+        return self.steps['active']
+
+    @property
+    def rhythm(self):
+        return self.steps['rhythm']
+
+    def row(self, instrument):
+        return self.steps[self._rows[instrument]]
+
+    def column(self, step):
+        return self.steps[:, step]
+
+    def rhythm_code(self, rhythm_type):
+        return self._codes[rhythm_type]
+
+    def set_hits(self, instrument, steps, rhythm_type='single', only_empty=False):
+        """Activate ``steps`` (indices or a mask) of one instrument; ``only_empty`` keeps active steps as they are."""
+        row = self.row(instrument)
+        steps = np.asarray(steps)
+        if steps.dtype == bool:
+            steps = np.flatnonzero(steps)
+        steps = steps[(steps >= 0) & (steps < len(self))]
+        if only_empty:
+            steps = steps[row['active'][steps] == 0]
+        row['active'][steps] = 1
+        row['rhythm'][steps] = self._codes[rhythm_type]
+
+    def note_counts(self):
+        """(instruments, steps) number of notes each step plays (0 for inactive steps)."""
+        return np.where(self.active != 0, self._notes[self.rhythm], 0)
+
+    def density(self):
+        """Played notes per step slot, like calculate_pattern_density."""
+        return float(self.note_counts().sum()) / self.steps.size if self.steps.size else 0
+
+    def hits(self):
+        """(instrument rows, steps) of all active steps, ordered by instrument then step."""
+        return np.nonzero(self.active)
+
+    def step_events(self, step, spacing='subdivided', accent_gain=1.0):
+        """Hits of one step as (offset_in_steps, instrument, gain), like engine.pattern_step_events."""
+        offsets = self._offsets.get(spacing)
+        if offsets is None:
+            offsets = self._offsets[spacing] = [rhythm_offsets(self.rhythm_types[name], spacing)
+                                                for name in self.rhythm_names]
+        accent = self._codes.get('accent')
+        column = self.steps[:, step]
+        events = []
+        for row in np.flatnonzero(column['active']).tolist():
+            code = int(column['rhythm'][row])
+            shift = float(column['timing'][row]) / TIMING_RESOLUTION
+            gain = (accent_gain if code == accent else 1.0) * float(column['velocity'][row]) / DEFAULT_VELOCITY
+            for offset in offsets[code]:
+                events.append((offset + shift, self.instruments[row], gain))
+        return events
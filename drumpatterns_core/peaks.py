@@ -0,0 +1,78 @@
+"""Min/max peak pyramid of a mono buffer for fast waveform drawing.
+
+Level 0 holds the minimum and maximum of every ``block`` samples, each
+next level halves the previous one, so any zoom reads about two peaks
+per pixel column no matter how long the sample is.  After an in-place
+edit of the buffer only the blocks over the edited range are recomputed
+(``update``), level by level, in O(edited samples + log n).
+"""
+
+import math
+
+import numpy as np
+
+PEAK_BLOCK = 16
+
+
+class PeakPyramid:
+    """Peaks of ``data``; the array is referenced, call ``update`` after editing it."""
+
+    def __init__(self, data, block=PEAK_BLOCK):
+        self.block = block
+        self.rebuild(data)
+
+    def rebuild(self, data=None):
+        if data is not None:
+            self.data = data
+        mins, maxs = _reduce(self.data, self.data, self.block)
+        self.levels = [(mins, maxs)]
+        while len(mins) > 1:
+            mins, maxs = _reduce(mins, maxs, 2)
+            self.levels.append((mins, maxs))
+
+    def update(self, start, end):
+        """Recompute the peaks over samples ``start:end`` of ``data``."""
+        start = max(0, int(start))
+        end = min(len(self.data), int(end))
+        if end <= start:
+            return
+        first, last = start // self.block, -(-end // self.block)
+        mins, maxs = self.levels[0]
+        lo, hi = first * self.block, min(last * self.block, len(self.data))
+        mins[first:last], maxs[first:last] = _reduce(self.data[lo:hi], self.data[lo:hi], self.block)
+        for level in range(1, len(self.levels)):
+            below_mins, below_maxs = self.levels[level - 1]
+            mins, maxs = self.levels[level]
+            lo, hi = first - first % 2, min(last + last % 2, len(below_mins))
+            first, last = first // 2, -(-last // 2)
+            mins[first:last], maxs[first:last] = _reduce(below_mins[lo:hi], below_maxs[lo:hi], 2)
+
+    def envelope(self, start, end, columns):
+        """(mins, maxs) of ``columns`` equal slices of samples ``start:end``."""
+        start = max(0, int(start))
+        end = min(len(self.data), int(end))
+        if end <= start or columns <= 0:
+            empty = np.zeros(0, dtype=np.float32)
+            return empty, empty
+        per_column = (end - start) / float(columns)
+        if per_column < self.block:
+            # przy dużym powiększeniu wprost z próbek
+            source_mins = source_maxs = self.data
+            unit = 1
+        else:
+            level = min(int(math.log2(per_column / self.block)), len(self.levels) - 1)
+            source_mins, source_maxs = self.levels[level]
+            unit = self.block << level
+        lo, hi = start // unit, -(-end // unit)
+        edges = ((start + np.arange(columns) * per_column) // unit).astype(np.intp) - lo
+        edges = np.minimum(edges, hi - lo - 1)
+        return (np.minimum.reduceat(source_mins[lo:hi], edges),
+                np.maximum.reduceat(source_maxs[lo:hi], edges))
+
+
+def _reduce(mins, maxs, size):
+    if not len(mins):
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+    starts = np.arange(0, len(mins), size)
+    return (np.minimum.reduceat(mins, starts).astype(np.float32, copy=False),
+            np.maximum.reduceat(maxs, starts).astype(np.float32, copy=False))
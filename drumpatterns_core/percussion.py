@@ -0,0 +1,107 @@
+"""Detection of existing percussion hits, classified by per-band energy.
+
+One power spectrogram serves both the onset envelope and the
+classification: every onset is labelled with the band that takes the
+largest share of the energy rise at that onset.  ``mix_percussion_track``
+renders the arranged track back into audio.
+"""
+
+from functools import lru_cache
+
+import librosa
+import numpy as np
+
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# (instrument, low Hz, high Hz); the last band reaches Nyquist
+PERCUSSION_BANDS = (
+    ('Stopa', 0.0, 90.0),
+    ('TomTom', 90.0, 250.0),
+    ('Werbel', 250.0, 5000.0),
+    ('Talerz', 5000.0, None),
+)
+# Frames from the onset frame on that are averaged (~70 ms at 22050 Hz)
+ONSET_FRAMES = 3
+
+
+@lru_cache(maxsize=8)
+def band_matrix(sample_rate, n_fft=N_FFT):
+    """(bins, bands) 0/1 float32 matrix summing STFT power bins into PERCUSSION_BANDS."""
+    freqs = librosa.fft_frequencies(sr=sample_rate, n_fft=n_fft)
+    matrix = np.zeros((len(freqs), len(PERCUSSION_BANDS)), dtype=np.float32)
+    for band, (_, low, high) in enumerate(PERCUSSION_BANDS):
+        matrix[(freqs >= low) & ((freqs < high) if high else True), band] = 1.0
+    return matrix
+
+
+def band_energies(power, sample_rate, n_fft=N_FFT):
+    """(frames, bins) power spectrogram -> (frames, bands) energy per band."""
+    return np.asarray(power, dtype=np.float32) @ band_matrix(sample_rate, n_fft)
+
+
+def classify_onsets(energies, onset_frames):
+    """Band index of every onset frame (deterministic, one vectorized pass).
+
+    Each band's share of the energy rise between the frame just before
+    the onset and the ONSET_FRAMES after it decides the instrument, so a
+    sustained pad or bass line under the hit does not count.
+    """
+    onset_frames = np.asarray(onset_frames, dtype=np.intp)
+    if not len(onset_frames) or not len(energies):
+        return np.zeros(0, dtype=np.intp)
+    window = np.minimum(onset_frames[:, None] + np.arange(ONSET_FRAMES), len(energies) - 1)
+    onset_energy = energies[window].mean(axis=1)
+    rise = np.maximum(onset_energy - energies[np.maximum(onset_frames - 2, 0)], 0.0)
+    # no rise at all (onset at the very start, limiter...): fall back to the plain energy
+    flat = rise.sum(axis=1) <= 0
+    rise[flat] = onset_energy[flat]
+    # the largest share of the rise is simply the largest rise
+    return np.argmax(rise, axis=1)
+
+
+def events_from_labels(onset_times, labels):
+    """{'Stopa': [...], 'Werbel': [...], 'Talerz': [...], 'TomTom': [...]} from onset times and band indices."""
+    events = {'Stopa': [], 'Werbel': [], 'Talerz': [], 'TomTom': []}
+    for onset_time, label in zip(np.asarray(onset_times).tolist(), np.asarray(labels).tolist()):
+        events[PERCUSSION_BANDS[label][0]].append(onset_time)
+    return events
+
+
+def detect_percussion_events(y, sr):
+    """Onsets of ``y`` (mono float) split by instrument, from a single STFT of the whole signal."""
+    power = np.abs(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)) ** 2
+    # same envelope as librosa.onset.onset_strength(y=y, sr=sr), without a second STFT
+    mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=power, sr=sr))
+    onset_env = librosa.onset.onset_strength(S=mel_db, sr=sr)
+    onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr, hop_length=HOP_LENGTH)
+    labels = classify_onsets(band_energies(power.T, sr), onsets)
+    return events_from_labels(librosa.frames_to_time(onsets, sr=sr, hop_length=HOP_LENGTH), labels)
+
+
+def mix_percussion_track(percussion_track, note, rhythm_types, note_lengths, step_duration, gain=0.5):
+    """Overlay-add every note of ``percussion_track`` (a Pattern) into one mono float32 track.
+
+    ``note(instrument, frames)`` returns the instrument's sample cut or
+    padded to ``frames``; note i of a hit starts i * ``note_lengths[rhythm]``
+    frames after its step.  Notes running past the end are clipped.
+    """
+    audio = np.zeros(len(percussion_track) * step_duration, dtype=np.float32)
+    rows, steps = percussion_track.hits()
+    codes = percussion_track.rhythm[rows, steps]
+    lengths = np.array([note_lengths[name] for name in percussion_track.rhythm_names], dtype=np.int64)[codes]
+    counts = np.array([rhythm_types[name]['notes'] for name in percussion_track.rhythm_names], dtype=np.int64)[codes]
+    # one entry per note: the hit it belongs to and its index within the hit
+    hit = np.repeat(np.arange(len(rows)), counts)
+    index = np.arange(len(hit)) - np.repeat(np.cumsum(counts) - counts, counts)
+    starts = steps[hit].astype(np.int64) * step_duration + index * lengths[hit]
+    notes = {}
+    for start, row, frames in zip(starts.tolist(), rows[hit].tolist(), lengths[hit].tolist()):
+        end = min(start + frames, len(audio))
+        if start >= end:
+            continue
+        key = (row, frames)
+        if key not in notes:
+            notes[key] = note(percussion_track.instruments[row], frames) * np.float32(gain)
+        audio[start:end] += notes[key][:end - start]
+    return audio
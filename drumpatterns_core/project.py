@@ -0,0 +1,164 @@
+"""Project files of all sampler front-ends, read and rendered without GTK or pygame.
+
+Every front-end saves a slightly different JSON document; ``read_project``
+turns any of them into one plain dict and ``variants.VARIANTS`` records
+how the front-end that wrote it plays the pattern back.
+"""
+
+import os
+
+import numpy as np
+
+from drumpatterns_core.dsp import apply_effect_chain
+from drumpatterns_core.engine import DEFAULT_SAMPLE_RATE, RHYTHM_TYPES
+from drumpatterns_core.events import compile_pattern
+from drumpatterns_core.midi import pattern_midi, write_midi_file
+from drumpatterns_core.offline import export_pattern
+from drumpatterns_core.projectfile import load_project_file
+from drumpatterns_core.samples import load_mono
+from drumpatterns_core.synth import DEFAULT_ADSR, DEFAULT_SAMPLE_PARAMS, apply_adsr, default_sample, parametric_sample
+from drumpatterns_core.tempo import TempoMap
+from drumpatterns_core.variants import VARIANTS, midi_velocities
+
+INSTRUMENTS = ['Talerz', 'Stopa', 'Werbel', 'TomTom']
+MIDI_NOTES = {'Talerz': 49, 'Stopa': 36, 'Werbel': 38, 'TomTom': 45}
+DEFAULT_EFFECTS = {'volume': 0, 'pitch': 0, 'echo': 0, 'reverb': 0, 'pan': 0}
+STEPS_PER_BPM = 4  # kroków na jedno BPM z listy dynamicznego tempa, jak w front-endach
+
+def detect_variant(data):
+    """Name of the front-end that saved the project dict ``data``."""
+    if 'simple_patterns' in data or 'absolute_bpm' in data:
+        return 'sampler'
+    if 'waveforms' in data:
+        return 'sampler5_1'
+    if 'pattern_length' in data:
+        return 'sampler4'
+    if 'sample_params' in data:
+        return 'sampler3'
+    return 'sampler2'
+
+
+def advanced_steps(pattern):
+    """A simple (0/1) or advanced pattern row as a list of advanced step dicts."""
+    return [dict(step) if isinstance(step, dict) else {'active': bool(step), 'rhythm_type': 'single'}
+            for step in pattern]
+
+
+def dynamic_bpms(data, variant, bpm):
+    """The dynamic BPM list the front-end restores from ``data`` (empty when it has none).
+
+    sampler saves the absolute BPMs, sampler4/5_1 the percentages of the
+    base BPM as typed in the entry.
+    """
+    if variant == 'sampler':
+        bpms = data.get('dynamic_bpm_list') or []
+    else:
+        try:
+            bpms = [bpm * float(p.strip()) / 100 for p in str(data.get('dynamic_bpm') or '').split(',') if p.strip()]
+        except ValueError:
+            bpms = []
+    return [float(value) for value in bpms if float(value) > 0]
+
+
+def read_project(path):
+    """Load a .json/.drsmp/.dpz project of any front-end into one normalized dict."""
+    data = load_project_file(path)
+    variant = detect_variant(data)
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    if variant == 'sampler':
+        advanced = data.get('advanced_sequencer_mode', False)
+        patterns = data.get('advanced_patterns' if advanced else 'simple_patterns', {})
+        bpm = data.get('absolute_bpm', 120)
+    else:
+        patterns = data.get('patterns', {})
+        bpm = data.get('bpm', 120)
+    dynamic = dynamic_bpms(data, variant, float(bpm))
+    patterns = {inst: advanced_steps(patterns.get(inst, [])) for inst in INSTRUMENTS}
+    pattern_length = data.get('pattern_length') or max([len(row) for row in patterns.values()] + [16])
+    for row in patterns.values():
+        row.extend({'active': False, 'rhythm_type': 'single'} for _ in range(pattern_length - len(row)))
+
+    samples = {}
+    for inst, sample in (data.get('samples') or {}).items():
+        if isinstance(sample, str):
+            samples[inst] = sample if os.path.isabs(sample) else os.path.join(base_dir, sample)
+
+    return {
+        'path': path,
+        'variant': variant,
+        'patterns': patterns,
+        'pattern_length': int(pattern_length),
+        'bpm': float(bpm),
+        'dynamic_bpm': dynamic,
+        'tempo_map': TempoMap.from_list(dynamic or [float(bpm)], STEPS_PER_BPM),
+        'samples': samples,
+        'waveforms': data.get('waveforms', {}),
+        'sample_params': data.get('sample_params'),
+        'effects': {inst: dict(DEFAULT_EFFECTS, **(data.get('effects') or {}).get(inst, {})) for inst in INSTRUMENTS},
+        'adsr': {inst: dict(DEFAULT_ADSR[inst], **(data.get('adsr') or data.get('current_adsr') or {}).get(inst, {}))
+                 for inst in INSTRUMENTS},
+    }
+
+
+def raw_sample(project, instrument, sample_rate=DEFAULT_SAMPLE_RATE, seed=0):
+    """Mono float32 sample of ``instrument`` before ADSR/effects, the way its front-end gets it.
+
+    Sample files win, then saved waveforms, then ``sample_params`` synthesis,
+    then the built-in default kit.  Noise uses a fixed ``seed`` so batch
+    renders are reproducible.
+    """
+    rng = np.random.default_rng([seed, INSTRUMENTS.index(instrument)])
+    path = project['samples'].get(instrument)
+    if path and os.path.exists(path):
+        return load_mono(path, sample_rate)
+    if instrument in project['waveforms']:
+        return project['waveforms'][instrument]
+    if project['sample_params'] is not None or project['variant'] in ('sampler3', 'sampler4', 'sampler5_1'):
+        params = dict(DEFAULT_SAMPLE_PARAMS[instrument])
+        params.update(VARIANTS[project['variant']]['sample_params'].get(instrument, {}))
+        params.update((project['sample_params'] or {}).get(instrument, {}))
+        return parametric_sample(params, project['adsr'][instrument], sample_rate, rng)
+    return default_sample(instrument, sample_rate, rng=rng, kit=project['variant'])
+
+
+def rendered_sample(project, instrument, sample_rate=DEFAULT_SAMPLE_RATE, channels=2, seed=0):
+    """(frames, channels) float32 sample with ADSR and the instrument's effects, like effects_array."""
+    variant = VARIANTS[project['variant']]
+    mono = raw_sample(project, instrument, sample_rate, seed)
+    buffer = np.ascontiguousarray(np.repeat(mono.reshape(-1, 1), channels, axis=1), dtype=np.float32)
+    if variant['adsr_on_play']:
+        curve = 'linear'
+        if variant['adsr_curves']:
+            curve = ((project['sample_params'] or {}).get(instrument) or {}).get('attack_curve', 'linear')
+        apply_adsr(buffer, project['adsr'][instrument], sample_rate, curve)
+    return apply_effect_chain(buffer, project['effects'][instrument], sample_rate, variant['effect_style'])
+
+
+def project_step_events(project):
+    """``step_events(step)`` callable for PatternEngine, with the project's own playback rules."""
+    variant = VARIANTS[project['variant']]
+    return compile_pattern(project['patterns'], INSTRUMENTS, True, RHYTHM_TYPES, variant['spacing'],
+                           variant['accent_gain'], length=project['pattern_length']).step_events
+
+
+def write_midi(project, path, loops=1):
+    """Write the pattern as a General MIDI drum track (channel 10), one 16th per step."""
+    variant = VARIANTS[project['variant']]
+    velocity, accent_velocity = midi_velocities(project['variant'], project['effects'], INSTRUMENTS)
+    midi = pattern_midi(project['patterns'], INSTRUMENTS, MIDI_NOTES, project['pattern_length'], project['tempo_map'],
+                        True, RHYTHM_TYPES, variant['spacing'], velocity, accent_velocity, loops)
+    write_midi_file(midi, path)
+
+
+def write_audio(project, path, loops=1, sample_rate=DEFAULT_SAMPLE_RATE, channels=2, seed=0):
+    """Render ``loops`` repetitions of the pattern to ``path`` (format from the extension)."""
+    samples = {}
+
+    def sample_source(instrument):
+        if instrument not in samples:
+            samples[instrument] = rendered_sample(project, instrument, sample_rate, channels, seed)
+        return samples[instrument]
+
+    export_pattern(path, project_step_events(project), sample_source, project['bpm'],
+                   project['pattern_length'], loops, sample_rate, channels, project['tempo_map'])
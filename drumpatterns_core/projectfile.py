@@ -0,0 +1,127 @@
+"""Binary project container: a JSON manifest plus one ``.npy`` file per waveform.
+
+A project is a zip archive (``.dpz``, members stored uncompressed) or a
+plain directory holding ``project.json`` and ``waveforms/<inst>.npy``.
+Waveforms are memory-mapped on load instead of parsed from JSON number
+lists, so opening a project takes milliseconds whatever the sample
+lengths.  Old ``.json``/``.drsmp`` projects are still read.
+"""
+
+import json
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+PROJECT_EXTENSION = '.dpz'
+MANIFEST_NAME = 'project.json'
+FORMAT_VERSION = 1
+
+# size of the fixed part of a zip local file header
+_LOCAL_HEADER_SIZE = 30
+
+# umask jest wspólny dla całego procesu - czytamy go raz przy imporcie, a nie
+# przestawiamy przy każdym zapisie, gdy inne wątki mogą akurat tworzyć pliki
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def save_project_file(path, data, waveforms=None):
+    """Write ``data`` (JSON-able dict) and ``waveforms`` ({name: 1-D array}) to ``path``.
+
+    ``path`` ending in ``.json`` writes the old single-JSON format; an
+    existing directory gets the manifest and .npy files; anything else
+    becomes a zip container.  Files are replaced atomically, so waveforms
+    still mapped from the previous version stay valid.
+    """
+    waveforms = waveforms or {}
+    if path.lower().endswith('.json'):
+        legacy = dict(data, waveforms={name: np.asarray(wave).tolist() for name, wave in waveforms.items()})
+        atomic_write(path, lambda f: f.write(json.dumps(legacy, indent=4).encode('utf-8')))
+        return
+
+    members = {name: f"waveforms/{name}.npy" for name in waveforms}
+    manifest = dict(data, format_version=FORMAT_VERSION, waveforms=members)
+    if os.path.isdir(path):
+        os.makedirs(os.path.join(path, 'waveforms'), exist_ok=True)
+        for name, member in members.items():
+            atomic_write(os.path.join(path, member),
+                         lambda f, name=name: np.save(f, np.asarray(waveforms[name], dtype=np.float32)))
+        atomic_write(os.path.join(path, MANIFEST_NAME), lambda f: f.write(json.dumps(manifest, indent=2).encode('utf-8')))
+        return
+
+    def write_zip(f):
+        # ZIP_STORED keeps every array contiguous in the file, so it can be memory-mapped
+        with zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED) as archive:
+            archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2))
+            for name, member in members.items():
+                with archive.open(member, 'w', force_zip64=True) as out:
+                    np.save(out, np.asarray(waveforms[name], dtype=np.float32))
+    atomic_write(path, write_zip)
+
+
+def load_project_file(path, mmap=True):
+    """Project dict of a container, directory or old JSON project; ``'waveforms'`` (if any) hold arrays.
+
+    Container waveforms are read-only memory maps when ``mmap`` is True.
+    """
+    if os.path.isdir(path):
+        with open(os.path.join(path, MANIFEST_NAME), 'r') as f:
+            data = json.load(f)
+        if 'waveforms' in data:
+            data['waveforms'] = {name: np.load(os.path.join(path, member), mmap_mode='r' if mmap else None)
+                                 for name, member in data['waveforms'].items()}
+        return data
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            data = json.loads(archive.read(MANIFEST_NAME))
+            if 'waveforms' in data:
+                data['waveforms'] = {name: _zip_array(path, archive, member, mmap)
+                                     for name, member in data['waveforms'].items()}
+        return data
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if 'waveforms' in data:
+        data['waveforms'] = {name: np.asarray(wave, dtype=np.float32) for name, wave in data['waveforms'].items()}
+    return data
+
+
+def is_project_file(path):
+    return path.lower().endswith(('.json', '.drsmp', PROJECT_EXTENSION))
+
+
+def _zip_array(path, archive, member, mmap):
+    info = archive.getinfo(member)
+    if not mmap or info.compress_type != zipfile.ZIP_STORED:
+        with archive.open(info) as f:
+            return np.load(f)
+    with open(path, 'rb') as f:
+        f.seek(info.header_offset)
+        header = f.read(_LOCAL_HEADER_SIZE)
+        name_length = int.from_bytes(header[26:28], 'little')
+        extra_length = int.from_bytes(header[28:30], 'little')
+        f.seek(info.header_offset + _LOCAL_HEADER_SIZE + name_length + extra_length)
+        if np.lib.format.read_magic(f) == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if 0 in shape:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape, order='F' if fortran_order else 'C')
+
+
+def atomic_write(path, write):
+    """Write ``path`` through ``write(file)`` into a temp file renamed over it, so readers never see half a file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        # mkstemp creates 0600 files, give the project the usual permissions
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -0,0 +1,103 @@
+"""Decode-once pool of mono float32 samples at a fixed sample rate, and parallel file decoding."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import soundfile as sf
+import soxr
+
+
+def load_mono(path, sample_rate):
+    """Decode ``path`` to mono float32 at ``sample_rate`` (soxr resampling, not a rate reinterpretation)."""
+    data, rate = sf.read(path, dtype='float32', always_2d=True)
+    return resample_mono(data, rate, sample_rate)
+
+
+def resample_mono(data, rate, sample_rate):
+    """(frames[, channels]) int/float array at ``rate`` -> new mono float32 array at ``sample_rate``."""
+    source = data = np.asarray(data)
+    if np.issubdtype(data.dtype, np.integer):
+        data = data / float(np.iinfo(data.dtype).max + 1)
+    mono = np.ascontiguousarray(data.mean(axis=1) if data.ndim > 1 else data, dtype=np.float32)
+    if rate != sample_rate and len(mono):
+        mono = soxr.resample(mono, rate, sample_rate).astype(np.float32, copy=False)
+    elif np.may_share_memory(mono, source):
+        # SamplePool zamraża wynik - tablica wywołującego (np. z banku) musi zostać zapisywalna
+        mono = mono.copy()
+    return mono
+
+
+def decode_files(paths, decode, progress=None, max_workers=4):
+    """{key: decode(path) or the exception it raised} for ``paths`` ({key: path}), decoded on a thread pool.
+
+    Decoders mostly wait on soundfile/ffmpeg, so threads overlap well.
+    ``progress(done, total, key)`` is called from the pool threads.
+    """
+    results = {}
+    if not paths:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        futures = {pool.submit(decode, path): key for key, path in paths.items()}
+        for done, future in enumerate(as_completed(futures), 1):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = e
+            if progress is not None:
+                progress(done, len(paths), key)
+    return results
+
+
+class SamplePool:
+    """Samples decoded once per file and their note-length variants, for one render.
+
+    ``fallback(path)`` -> (array, rate) is used for files soundfile cannot
+    read (e.g. anything only pygame can decode), and for samples that are
+    already decoded arrays (e.g. from a sample bank) instead of paths.
+    Arrays are keyed by identity; the caller keeps them alive meanwhile.
+    """
+
+    def __init__(self, sample_rate, fallback=None):
+        self.sample_rate = sample_rate
+        self.fallback = fallback
+        self._samples = {}
+        self._notes = {}
+        self._lock = threading.Lock()
+
+    def sample(self, path):
+        key = _key(path)
+        with self._lock:
+            mono = self._samples.get(key)
+        if mono is None:
+            if isinstance(path, str):
+                try:
+                    mono = load_mono(path, self.sample_rate)
+                except RuntimeError:
+                    if self.fallback is None:
+                        raise
+            if mono is None:
+                mono = resample_mono(*self.fallback(path), self.sample_rate)
+            mono.flags.writeable = False
+            with self._lock:
+                mono = self._samples.setdefault(key, mono)
+        return mono
+
+    def note(self, path, frames):
+        """The sample cut or zero-padded to exactly ``frames`` frames (read-only, shared)."""
+        key = (_key(path), frames)
+        with self._lock:
+            note = self._notes.get(key)
+        if note is None:
+            mono = self.sample(path)
+            note = np.zeros(frames, dtype=np.float32)
+            note[:min(frames, len(mono))] = mono[:frames]
+            note.flags.writeable = False
+            with self._lock:
+                note = self._notes.setdefault(key, note)
+        return note
+
+
+def _key(path):
+    return path if isinstance(path, str) else id(path)
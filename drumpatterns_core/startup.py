@@ -0,0 +1,95 @@
+"""Startup helpers of the GUI front-ends: lazy imports and ``--profile-startup``.
+
+``lazy_import`` returns a stand-in that imports the real module on first
+attribute access, so heavy packages (librosa/numba, scipy, midiutil) are
+only paid for by the features that use them.  With ``--profile-startup``
+on the command line ``STARTUP`` collects a timing breakdown of imports
+and initialization and prints it to stderr.
+"""
+
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PROFILE_FLAG = '--profile-startup'
+
+
+class StartupProfile:
+    """Timing breakdown; ``mark(label)`` closes the phase started by the previous mark.
+
+    Work running next to the main sequence (the audio thread, lazy
+    imports) is timed with ``phase(label)`` instead.
+    """
+
+    def __init__(self, enabled=None):
+        self.enabled = PROFILE_FLAG in sys.argv if enabled is None else enabled
+        # CPU time spent before this module was imported (interpreter, numpy, drumpatterns_core)
+        self.before = time.process_time()
+        self.start = self._last = time.perf_counter()
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def mark(self, label):
+        now = time.perf_counter()
+        with self._lock:
+            self.entries.append((label, now - self._last, now - self.start))
+            self._last = now
+
+    @contextmanager
+    def phase(self, label):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.entries.append((label, end - start, end - self.start))
+
+    def report(self, file=None):
+        if not self.enabled:
+            return
+        file = file or sys.stderr
+        with self._lock:
+            entries = sorted(self.entries, key=lambda entry: entry[2])
+        print("startup profile:", file=file)
+        print(f"  {'python + numpy + drumpatterns_core (cpu)':<44}{self.before * 1000:9.1f} ms", file=file)
+        for label, seconds, at in entries:
+            print(f"  {label:<44}{seconds * 1000:9.1f} ms   (at {at * 1000:.0f} ms)", file=file)
+
+
+STARTUP = StartupProfile()
+
+
+class LazyModule:
+    """Stand-in for module ``name``; the first attribute access imports it (thread-safe)."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    # packages like librosa load their submodules on attribute access, count that too
+                    value = getattr(module, attr)
+                    self._module = module
+                    if STARTUP.enabled:
+                        print(f"lazy import {self._name} (first use: {attr}): "
+                              f"{(time.perf_counter() - start) * 1000:.1f} ms", file=sys.stderr)
+                    return value
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name):
+    """The module if it is already imported, else a LazyModule for it."""
+    return sys.modules.get(name) or LazyModule(name)
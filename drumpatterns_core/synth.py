@@ -0,0 +1,209 @@
+"""Sample synthesis without pygame: parametric oscillators, default kit, ADSR envelopes."""
+
+from functools import lru_cache
+
+import numpy as np
+
+from drumpatterns_core.dsp import normalize_peak
+
+
+ENVELOPE_CACHE_SIZE = 32
+
+
+def adsr_envelope(total_samples, adsr, sample_rate=44100, curve='linear'):
+    """Read-only float32 ADSR envelope of ``total_samples`` frames, as apply_adsr_to_signal builds it.
+
+    When attack+decay+release is longer than the sound they are scaled
+    down proportionally; the release starts from the sustain level.
+    Envelopes are cached per (length, rate, ADSR, curve), so re-applying
+    unchanged settings does not build a new one.
+    """
+    return _envelope(int(total_samples), int(sample_rate),
+                     (adsr['attack'], adsr['decay'], adsr['sustain'], adsr['release']), curve)
+
+
+def apply_adsr(buffer, adsr, sample_rate=44100, curve='linear'):
+    """Multiply a (frames[, channels]) float or int16 buffer by its envelope in place and return it.
+
+    The envelope is broadcast over the channels, nothing is tiled to stereo.
+    """
+    envelope = adsr_envelope(len(buffer), adsr, sample_rate, curve)
+    if buffer.ndim > 1:
+        envelope = envelope[:, None]
+    if np.issubdtype(buffer.dtype, np.integer):
+        np.multiply(buffer, envelope, out=buffer, casting='unsafe')
+    else:
+        buffer *= envelope
+    return buffer
+
+
+@lru_cache(maxsize=ENVELOPE_CACHE_SIZE)
+def _envelope(total_samples, sample_rate, adsr, curve):
+    attack_time, decay_time, level, release_time = adsr
+    attack = int(attack_time * sample_rate)
+    decay = int(decay_time * sample_rate)
+    release = int(release_time * sample_rate)
+    sustain = total_samples - attack - decay - release
+    if sustain < 0:
+        scale = (total_samples + sustain) / float(attack + decay + release)
+        attack, decay, release = int(attack * scale), int(decay * scale), int(release * scale)
+        sustain = total_samples - attack - decay - release
+    log9 = np.log1p(9)
+
+    envelope = np.zeros(total_samples, dtype=np.float32)
+    if attack > 0:
+        if curve == 'exponential':
+            envelope[:attack] = np.power(np.linspace(0, 1, attack), 2)
+        elif curve == 'logarithmic':
+            envelope[:attack] = np.log1p(np.linspace(0, 9, attack)) / log9
+        else:
+            envelope[:attack] = np.linspace(0, 1, attack)
+    if decay > 0 and attack < total_samples:
+        count = min(attack + decay, total_samples) - attack
+        if curve == 'exponential':
+            envelope[attack:attack + count] = np.power(np.linspace(1, level, count), 2)
+        elif curve == 'logarithmic':
+            envelope[attack:attack + count] = level + (1 - level) * np.log1p(np.linspace(9, 0, count)) / log9
+        else:
+            envelope[attack:attack + count] = np.linspace(1, level, count)
+    if sustain > 0 and attack + decay < total_samples:
+        envelope[attack + decay:min(attack + decay + sustain, total_samples)] = level
+    if release > 0 and total_samples - release > 0:
+        if curve == 'exponential':
+            envelope[total_samples - release:] = level * np.power(np.linspace(1, 0, release), 2)
+        elif curve == 'logarithmic':
+            envelope[total_samples - release:] = level * np.log1p(np.linspace(9, 0, release)) / log9
+        else:
+            envelope[total_samples - release:] = np.linspace(level, 0, release)
+    envelope.flags.writeable = False
+    return envelope
+
+
+WAVETABLE_SIZE = 2048
+WAVETABLE_BASE_FREQUENCY = 20.0
+
+
+def oscillator(waveform, frequency, amplitude, duration, sample_rate=44100, rng=None):
+    """``duration`` seconds of ``waveform``; square and sawtooth are band-limited (no aliasing above Nyquist)."""
+    frames = int(sample_rate * duration)
+    if waveform == 'noise':
+        rng = rng if rng is not None else np.random.default_rng()
+        return amplitude * rng.normal(0, 1, frames)
+    if waveform not in ('sine', 'square', 'sawtooth'):
+        return np.zeros(frames)
+    if float(frequency).is_integer():
+        # przy całkowitej częstotliwości sygnał powtarza się co sekundę - liczymy ją raz
+        second = _oscillator_second(waveform, frequency, int(sample_rate))
+        return amplitude * np.resize(second, frames)
+    return amplitude * _table_lookup(wavetable(waveform, frequency, sample_rate), frequency, frames, sample_rate)
+
+
+def _table_lookup(table, frequency, frames, sample_rate):
+    # faza w float64, żeby długie próbki nie rozjeżdżały się w czasie
+    position = np.arange(frames, dtype=np.float64)
+    position *= frequency * WAVETABLE_SIZE / float(sample_rate)
+    np.mod(position, WAVETABLE_SIZE, out=position)
+    index = position.astype(np.int64)
+    position -= index
+    left = table[index]
+    return left + (table[index + 1] - left) * position.astype(np.float32)
+
+
+@lru_cache(maxsize=32)
+def _oscillator_second(waveform, frequency, sample_rate):
+    second = _table_lookup(wavetable(waveform, frequency, sample_rate), frequency, sample_rate, sample_rate)
+    second.flags.writeable = False
+    return second
+
+
+def wavetable(waveform, frequency, sample_rate=44100):
+    """One cycle of ``waveform`` (plus a wrap-around point) holding only harmonics below Nyquist at ``frequency``.
+
+    Tables come in octave mip levels from WAVETABLE_BASE_FREQUENCY up, each
+    with the harmonics the top of its octave can carry.
+    """
+    if waveform == 'sine':
+        return _wavetable_levels('sine', sample_rate)[0]
+    levels = _wavetable_levels(waveform, sample_rate)
+    level = int(np.clip(np.floor(np.log2(max(frequency, 1e-9) / WAVETABLE_BASE_FREQUENCY)), 0, len(levels) - 1))
+    return levels[level]
+
+
+@lru_cache(maxsize=None)
+def _wavetable_levels(waveform, sample_rate):
+    phase = np.arange(WAVETABLE_SIZE + 1) * (2 * np.pi / WAVETABLE_SIZE)
+    if waveform == 'sine':
+        tables = np.sin(phase).reshape(1, -1)
+    else:
+        nyquist = sample_rate / 2.0
+        count = max(1, int(np.ceil(np.log2(nyquist / WAVETABLE_BASE_FREQUENCY))))
+        tables = np.zeros((count, WAVETABLE_SIZE + 1))
+        for level in range(count):
+            top = WAVETABLE_BASE_FREQUENCY * 2 ** (level + 1)
+            harmonics = max(1, min(int(nyquist / top), WAVETABLE_SIZE // 2 - 1))
+            n = np.arange(1, harmonics + 1)
+            if waveform == 'square':
+                # sign(sin): tylko nieparzyste harmoniczne, 4/pi * sin(n x) / n
+                n = n[n % 2 == 1]
+                weights = 4 / (np.pi * n)
+            else:
+                # piła 2 * (x - floor(0.5 + x)): 2/pi * (-1)^(n+1) * sin(n x) / n
+                weights = 2 / np.pi * np.where(n % 2 == 1, 1.0, -1.0) / n
+            tables[level] = weights @ np.sin(np.outer(n, phase))
+    tables = tables.astype(np.float32)
+    tables.flags.writeable = False
+    return tables
+
+
+def parametric_sample(params, adsr, sample_rate=44100, rng=None):
+    """Mono float32 sample from a ``sample_params`` entry, shaped and peak-normalized like generate_parametric_samples."""
+    signal = oscillator(params['waveform'], params['frequency'], params['amplitude'], params['duration'],
+                        sample_rate, rng)
+    signal = apply_adsr(signal.astype(np.float32), adsr, sample_rate, params.get('attack_curve', 'linear'))
+    return normalize_peak(signal.reshape(-1, 1))[:, 0]
+
+
+# ustawienia startowe front-endów (sampler3/sampler4; różnice innych wersji w variants.VARIANTS)
+DEFAULT_ADSR = {
+    'Talerz': {'attack': 0.01, 'decay': 0.1, 'sustain': 0.8, 'release': 0.6},
+    'Stopa': {'attack': 0.01, 'decay': 0.2, 'sustain': 0.3, 'release': 0.1},
+    'Werbel': {'attack': 0.02, 'decay': 0.2, 'sustain': 0.4, 'release': 0.3},
+    'TomTom': {'attack': 0.03, 'decay': 0.3, 'sustain': 0.5, 'release': 0.4},
+}
+DEFAULT_SAMPLE_PARAMS = {
+    'Talerz': {'waveform': 'sine', 'frequency': 8000, 'amplitude': 0.8, 'duration': 1.0, 'attack_curve': 'exponential'},
+    'Stopa': {'waveform': 'sine', 'frequency': 100, 'amplitude': 1.0, 'duration': 0.3, 'attack_curve': 'linear'},
+    'Werbel': {'waveform': 'noise', 'frequency': 4000, 'amplitude': 0.9, 'duration': 0.4, 'attack_curve': 'exponential'},
+    'TomTom': {'waveform': 'sine', 'frequency': 200, 'amplitude': 0.9, 'duration': 0.5, 'attack_curve': 'linear'},
+}
+
+
+def default_sample(instrument, sample_rate=44100, duration=0.5, rng=None, kit='sampler'):
+    """The built-in kit of generate_default_samples, mono float32; ``kit`` is 'sampler' or 'sampler2'."""
+    rng = rng if rng is not None else np.random.default_rng()
+    t = np.linspace(0, duration, int(sample_rate * duration), False)
+    if kit == 'sampler2':
+        return _sampler2_sample(instrument, t, duration, rng)
+    if instrument == 'Talerz':
+        sound = np.sin(2 * np.pi * 2000 * t) * np.exp(-3 * t) + rng.normal(0, 0.3, len(t)) * np.exp(-2 * t)
+    elif instrument == 'Stopa':
+        sound = np.sin(2 * np.pi * 60 * t) * np.exp(-10 * t)
+    elif instrument == 'Werbel':
+        sound = np.sin(2 * np.pi * 300 * t) * np.exp(-6 * t) * 0.7 + rng.normal(0, 0.1, len(t)) * np.exp(-4 * t) * 0.3
+    else:
+        echo = np.sin(2 * np.pi * 100 * t) * np.exp(-6 * t) * 0.4
+        sound = np.sin(2 * np.pi * 100 * t) * np.exp(-4 * t) + np.pad(echo, (int(sample_rate * 0.1), 0))[:len(t)]
+    return (sound / np.max(np.abs(sound))).astype(np.float32)
+
+
+def _sampler2_sample(instrument, t, duration, rng):
+    if instrument == 'Talerz':
+        sound = rng.normal(0, 0.5, len(t)) * np.exp(-5 * t / duration)
+    elif instrument == 'Stopa':
+        sound = np.sin(2 * np.pi * 60 * t) * np.exp(-10 * t / duration)
+    elif instrument == 'Werbel':
+        sound = (rng.normal(0, 0.5, len(t)) * 0.5 + np.sin(2 * np.pi * 200 * t) * 0.5) * np.exp(-15 * t / duration)
+    else:
+        sound = np.sin(2 * np.pi * 100 * t) * np.exp(-8 * t / duration)
+    return (sound / np.max(np.abs(sound))).astype(np.float32)
+
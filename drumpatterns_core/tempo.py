@@ -0,0 +1,122 @@
+"""Tempo maps: step start times for held and linearly ramped tempo segments.
+
+A ``TempoMap`` is built once when the tempo settings change.  It stores
+the cumulative start time (seconds) of every step of one tempo cycle, so
+the time of a step is one lookup, the step playing at a given time is a
+binary search, and playback, audio export and MIDI export all place the
+steps at the same times.  The cycle repeats forever.
+"""
+
+import math
+
+import numpy as np
+
+STEPS_PER_BEAT = 4
+# sekundy kroku = SECONDS_PER_STEP / bpm
+SECONDS_PER_STEP = 60.0 / STEPS_PER_BEAT
+
+
+class TempoMap:
+    """``segments`` is a list of (steps, start_bpm, end_bpm).
+
+    A segment with equal BPMs holds its tempo; otherwise the tempo moves
+    linearly (per step, continuously) from ``start_bpm`` to ``end_bpm``
+    over the segment.  ``starts`` holds the start time of each step of the
+    cycle plus the end of the cycle.
+    """
+
+    def __init__(self, segments):
+        bpm, slope = [], []
+        for steps, start_bpm, end_bpm in segments:
+            steps = int(steps)
+            if steps <= 0:
+                continue
+            rate = (float(end_bpm) - float(start_bpm)) / steps
+            bpm.append(float(start_bpm) + rate * np.arange(steps))
+            slope.append(np.full(steps, rate))
+        if not bpm:
+            raise ValueError("Tempo map needs at least one step")
+        self.bpm = np.concatenate(bpm)
+        self.slope = np.concatenate(slope)
+        if np.any(self.bpm <= 0) or np.any(self.bpm + self.slope <= 0):
+            raise ValueError("Tempo must be positive")
+        self.durations = _seconds(self.bpm, self.slope, 1.0)
+        self.starts = np.concatenate(([0.0], np.cumsum(self.durations)))
+        self.steps = len(self.bpm)
+        self.cycle_seconds = float(self.starts[-1])
+        # listy dla pojedynczych zapytań z wątku audio (bez narzutu numpy)
+        self._table = list(zip(self.starts.tolist(), self.bpm.tolist(), self.slope.tolist()))
+
+    @classmethod
+    def from_list(cls, bpms, steps_per_bpm=4, ramp=False):
+        """Dynamic BPM: each BPM of ``bpms`` for ``steps_per_bpm`` steps, in a cycle.
+
+        With ``ramp`` each segment glides to the next BPM of the list
+        instead of jumping to it at the segment boundary.
+        """
+        bpms = [float(bpm) for bpm in bpms]
+        if not bpms:
+            raise ValueError("Tempo map needs at least one BPM")
+        return cls([(steps_per_bpm, bpm, bpms[(i + 1) % len(bpms)] if ramp else bpm)
+                    for i, bpm in enumerate(bpms)])
+
+    def time_at(self, position):
+        """Seconds from step 0 to ``position`` (steps, fractional and past the cycle allowed)."""
+        if np.ndim(position) == 0:
+            whole = math.floor(position)
+            cycles, step = divmod(whole, self.steps)
+            start, bpm, slope = self._table[step]
+            return cycles * self.cycle_seconds + start + _step_seconds(bpm, slope, position - whole)
+        position = np.asarray(position, dtype=np.float64)
+        whole = np.floor(position)
+        cycles, step = np.divmod(whole.astype(np.int64), self.steps)
+        seconds = (cycles * self.cycle_seconds + self.starts[step]
+                   + _seconds(self.bpm[step], self.slope[step], position - whole))
+        return seconds
+
+    def step_at(self, seconds):
+        """Position in steps reached after ``seconds`` (inverse of ``time_at``)."""
+        seconds = np.asarray(seconds, dtype=np.float64)
+        cycles, rest = np.divmod(seconds, self.cycle_seconds)
+        step = np.clip(np.searchsorted(self.starts, rest, side='right') - 1, 0, self.steps - 1)
+        position = (cycles * self.steps + step
+                    + _fraction(self.bpm[step], self.slope[step], rest - self.starts[step]))
+        return float(position) if position.ndim == 0 else position
+
+    def step_duration(self, step):
+        """Seconds of step ``step`` (any integer, wrapped to the cycle)."""
+        return float(self.durations[int(step) % self.steps])
+
+    def step_bpms(self, count, start=0):
+        """Average BPM of each of ``count`` steps from ``start``; MIDI tempo events use these."""
+        return SECONDS_PER_STEP / self.durations[(start + np.arange(count)) % self.steps]
+
+    def average_bpm(self, steps=None):
+        """The constant BPM that plays the first ``steps`` steps (default: the cycle) in the same time."""
+        steps = self.steps if steps is None else steps
+        return SECONDS_PER_STEP * steps / self.time_at(steps)
+
+    def frames(self, steps, sample_rate):
+        """Length in frames of the first ``steps`` steps."""
+        return int(round(self.time_at(steps) * sample_rate))
+
+
+def _step_seconds(bpm, slope, fraction):
+    if slope == 0:
+        return SECONDS_PER_STEP * fraction / bpm
+    return SECONDS_PER_STEP * math.log1p(slope * fraction / bpm) / slope
+
+
+def _seconds(bpm, slope, fraction):
+    # całka z 15/bpm(s) ds dla bpm liniowego w kroku: 15/slope * ln(1 + slope*f/bpm)
+    flat = slope == 0
+    safe = np.where(flat, 1.0, slope)
+    return np.where(flat, SECONDS_PER_STEP * fraction / bpm,
+                    SECONDS_PER_STEP * np.log1p(slope * fraction / bpm) / safe)
+
+
+def _fraction(bpm, slope, seconds):
+    flat = slope == 0
+    safe = np.where(flat, 1.0, slope)
+    return np.where(flat, seconds * bpm / SECONDS_PER_STEP,
+                    bpm / safe * np.expm1(safe * seconds / SECONDS_PER_STEP))
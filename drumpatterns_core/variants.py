@@ -0,0 +1,56 @@
+"""Behaviour-compatibility profiles of the legacy front-ends.
+
+The core has one implementation of every hot path; where the five
+scripts historically disagreed, the difference is a flag here and each
+front-end passes its own profile (``VARIANTS[VARIANT]``) to the core.
+"""
+
+VARIANTS = {
+    'sampler': {
+        'spacing': 'split',         # engine.rhythm_offsets
+        'effect_style': 'classic',  # dsp.EFFECT_STYLES
+        'accent_gain': 1.2,         # playback gain of 'accent' steps
+        'adsr_on_play': True,       # effects_array shapes the sample with the ADSR
+        'adsr_curves': False,       # attack_curve of sample_params is honoured
+        'midi_velocity': 100,
+        'midi_accent_velocity': 120,
+        'sample_params': {},        # zmiany względem synth.DEFAULT_SAMPLE_PARAMS
+    },
+    'sampler2': {
+        'spacing': 'split', 'effect_style': 'classic', 'accent_gain': 1.0,
+        'adsr_on_play': True, 'adsr_curves': False,
+        'midi_velocity': 100, 'midi_accent_velocity': None, 'sample_params': {},
+    },
+    'sampler3': {
+        'spacing': 'subdivided', 'effect_style': 'classic', 'accent_gain': 1.0,
+        'adsr_on_play': True, 'adsr_curves': True,
+        'midi_velocity': 100, 'midi_accent_velocity': None, 'sample_params': {},
+    },
+    'sampler4': {
+        'spacing': 'stretched', 'effect_style': 'classic', 'accent_gain': 1.0,
+        'adsr_on_play': True, 'adsr_curves': True,
+        'midi_velocity': 'volume', 'midi_accent_velocity': '+20', 'sample_params': {},
+    },
+    'sampler5_1': {
+        'spacing': 'stretched', 'effect_style': 'direct', 'accent_gain': 1.0,
+        'adsr_on_play': False, 'adsr_curves': True,
+        'midi_velocity': 100, 'midi_accent_velocity': 127,
+        'sample_params': {'Talerz': {'waveform': 'noise'}},
+    },
+}
+
+
+def midi_velocities(variant, effects, instruments):
+    """(velocity per instrument, accent velocity per instrument) for pattern_midi."""
+    profile = VARIANTS[variant]
+    if profile['midi_velocity'] == 'volume':
+        # sampler4: louder instruments get harder hits
+        velocity = {inst: max(1, min(127, int(127 * (1 + effects[inst]['volume'] / 5)))) for inst in instruments}
+    else:
+        velocity = {inst: profile['midi_velocity'] for inst in instruments}
+    accent = profile['midi_accent_velocity']
+    if accent == '+20':
+        accent = {inst: min(127, velocity[inst] + 20) for inst in instruments}
+    elif accent is not None:
+        accent = {inst: accent for inst in instruments}
+    return velocity, accent
@@ -1,21 +1,41 @@
 import gi
 import random
-import time
 import threading
+from drumpatterns_core.startup import STARTUP, lazy_import
 import pygame
+STARTUP.mark("import pygame")
 import json
 import os
-from midiutil import MIDIFile
 from pydub import AudioSegment
-from pydub.effects import normalize
 import numpy as np
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk
+STARTUP.mark("import pydub, Gtk")
 import warnings
 warnings.filterwarnings("ignore", category=SyntaxWarning)
-import sqlite3
-import librosa
 import soundfile as sf
+from drumpatterns_core import Pattern, PatternEngine, rhythm_offsets
+from drumpatterns_core.bank import is_bank, load_bank, write_bank
+from drumpatterns_core.cache import RenderCache, render_key
+from drumpatterns_core.dsp import apply_effect_chain, match_channels, to_float32
+from drumpatterns_core.history import EditHistory, pattern_edit
+from drumpatterns_core.midi import pattern_midi, write_midi_file
+from drumpatterns_core.output import PygameBlockOutput, array_to_sound, mixer_format, sound_to_array
+from drumpatterns_core.samples import SamplePool
+from drumpatterns_core.synth import apply_adsr, default_sample
+from drumpatterns_core.tempo import TempoMap
+from drumpatterns_core.variants import VARIANTS, midi_velocities
+STARTUP.mark("import soundfile, drumpatterns_core")
+
+# Ładowane dopiero przy pierwszym użyciu (analiza audio, eksport MIDI)
+librosa = lazy_import('librosa')
+midiutil = lazy_import('midiutil')
+percussion = lazy_import('drumpatterns_core.percussion')
+streaming = lazy_import('drumpatterns_core.streaming')
+
+VARIANT = 'sampler'  # profil zgodności, patrz drumpatterns_core.variants
+BANK_COMPRESSION = 0.6  # poziom kompresji FLAC eksportowanych banków (0..1)
+HISTORY_BUDGET_MB = 16  # pamięć historii cofania (MB)
 
 class DrumSamplerApp(Gtk.Window):
     def __init__(self):
@@ -25,7 +45,8 @@ class DrumSamplerApp(Gtk.Window):
         self.is_fullscreen = False
         self.scale_factor = 1.0
 
-        pygame.mixer.init()
+        self.render_cache = RenderCache()
+        self.sample_bank_path = None  # plik banku, z którego pochodzą sample trzymane w pamięci
 
         # Main container
         scroll_window = Gtk.ScrolledWindow()
@@ -47,6 +68,8 @@ class DrumSamplerApp(Gtk.Window):
             for inst in self.instruments
         }
         self.patterns = self.simple_patterns
+        self.history = EditHistory(HISTORY_BUDGET_MB * 1024 * 1024,
+                                   set_length=lambda length: self.length_spinbutton.set_value(length))
         self.colors = ['red', 'green', 'blue', 'orange']
         self.midi_notes = {'Talerz': 49, 'Stopa': 36, 'Werbel': 38, 'TomTom': 45}
         self.buttons = {}
@@ -92,12 +115,15 @@ class DrumSamplerApp(Gtk.Window):
 
         self.loop_playing = False
         self.play_thread = None
+        self.engine = None
         self.dynamic_bpm_list = []
-        self.current_bpm_index = 0
         self.steps_per_bpm = 4
+        self.ramp_bpm = False
+        self.tempo_map_cache = None
 
         # Connect scaling
         self.connect("size-allocate", self.scale_interface)
+        self.connect("key-press-event", self.on_key_press)
 
         self.effect_sliders = {}
         self.groove_type = 'simple'
@@ -117,6 +143,27 @@ class DrumSamplerApp(Gtk.Window):
         self.create_effect_controls()
         self.create_sample_manipulation_area()
 
+        # Urządzenie audio (i sample) otwierane w tle dopiero po pokazaniu okna
+        self.main_box.set_sensitive(False)
+        GLib.idle_add(self.start_audio)
+        STARTUP.mark("build window")
+
+    def start_audio(self):
+        STARTUP.mark("show window")
+        threading.Thread(target=self.open_audio, daemon=True).start()
+        return False
+
+    def open_audio(self):
+        with STARTUP.phase("audio device (thread)"):
+            pygame.mixer.init()
+        GLib.idle_add(self.on_audio_ready)
+
+    def on_audio_ready(self):
+        self.main_box.set_sensitive(True)
+        STARTUP.mark("audio ready")
+        STARTUP.report()
+        return False
+
     def create_toolbar(self):
         toolbar = Gtk.Toolbar()
         self.main_box.pack_start(toolbar, False, False, 0)
@@ -129,7 +176,9 @@ class DrumSamplerApp(Gtk.Window):
             ("document-save", self.save_project, "Save Project"),
             ("document-open", self.load_project, "Load Project"),
             ("document-export", self.export_to_midi, "Export MIDI"),
-            ("document-export", self.export_advanced_midi, "Export Advanced MIDI")
+            ("document-export", self.export_advanced_midi, "Export Advanced MIDI"),
+            ("edit-undo", self.undo_edit, "Undo"),
+            ("edit-redo", self.redo_edit, "Redo")
         ]
 
         for icon_name, callback, tooltip in button_info:
@@ -265,6 +314,11 @@ class DrumSamplerApp(Gtk.Window):
         apply_button.connect("clicked", self.apply_dynamic_bpm)
         dynamic_bpm_box.pack_start(apply_button, False, False, 0)
 
+        ramp_check = Gtk.CheckButton(label="Ramp")
+        ramp_check.set_tooltip_text("Glide between the dynamic BPM values")
+        ramp_check.connect("toggled", self.on_ramp_bpm_toggled)
+        dynamic_bpm_box.pack_start(ramp_check, False, False, 0)
+
     def create_pattern_controls(self):
         genre_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
         self.main_box.pack_start(genre_box, False, False, 0)
@@ -570,6 +624,7 @@ class DrumSamplerApp(Gtk.Window):
                                 subchild.set_size_request(int(20 * self.scale_factor), int(20 * self.scale_factor))
 
     # Event Handlers and Helper Methods
+    @pattern_edit
     def on_button_toggled(self, button, instrument, step):
         if self.advanced_sequencer_mode:
             is_active = button.get_active()
@@ -581,6 +636,27 @@ class DrumSamplerApp(Gtk.Window):
         else:
             self.patterns[instrument][step] = int(button.get_active())
 
+    def undo_edit(self, widget):
+        if self.history.undo() is not None:
+            self.update_buttons()
+
+    def redo_edit(self, widget):
+        if self.history.redo() is not None:
+            self.update_buttons()
+
+    def on_key_press(self, widget, event):
+        # Ctrl+Z cofa, Ctrl+Shift+Z / Ctrl+Y ponawia; pola tekstowe zostają przy swoich skrótach
+        if not event.state & Gdk.ModifierType.CONTROL_MASK or isinstance(self.get_focus(), Gtk.Editable):
+            return False
+        key = Gdk.keyval_to_lower(event.keyval)
+        if key == Gdk.KEY_z and not event.state & Gdk.ModifierType.SHIFT_MASK:
+            self.undo_edit(widget)
+        elif key in (Gdk.KEY_z, Gdk.KEY_y):
+            self.redo_edit(widget)
+        else:
+            return False
+        return True
+
     def update_buttons(self):
         pattern_length = int(self.length_spinbutton.get_value())
         for inst in self.instruments:
@@ -642,6 +718,7 @@ class DrumSamplerApp(Gtk.Window):
     def on_button_press(self, widget, event, instrument, step):
         self.last_button_pressed = event.button
 
+    @pattern_edit
     def on_scroll(self, widget, event, instrument, step):
         if not self.advanced_sequencer_mode or not self.patterns[instrument][step]['active']:
             return
@@ -661,6 +738,8 @@ class DrumSamplerApp(Gtk.Window):
     def on_sequencer_mode_switch(self, switch, gparam):
         self.advanced_sequencer_mode = switch.get_active()
         self.patterns = self.advanced_patterns if self.advanced_sequencer_mode else self.simple_patterns
+        # zapisane zmiany dotyczą wzorca drugiego trybu - cofnięcie nadpisałoby nie ten wzorzec
+        self.history.clear()
         self.update_buttons()
 
     def on_performer_mode_switch(self, switch, gparam):
@@ -678,17 +757,8 @@ class DrumSamplerApp(Gtk.Window):
         self.update_dynamic_bpm()
 
     def calculate_pattern_density(self):
-        total_active_steps = 0
-        total_steps = len(self.instruments) * len(self.patterns[self.instruments[0]])
-        if self.advanced_sequencer_mode:
-            for inst in self.instruments:
-                for step in self.patterns[inst]:
-                    if step['active']:
-                        total_active_steps += self.rhythm_types[step['rhythm_type']]['notes']
-        else:
-            for inst in self.instruments:
-                total_active_steps += sum(self.patterns[inst])
-        return total_active_steps / total_steps if total_steps > 0 else 0
+        return Pattern.from_dict(self.patterns, self.instruments, self.advanced_sequencer_mode,
+                                 self.rhythm_types).density()
 
     def matched_bpm(self, widget):
         density = self.calculate_pattern_density()
@@ -708,7 +778,6 @@ class DrumSamplerApp(Gtk.Window):
         try:
             percentages = [float(bpm.strip()) for bpm in bpm_string.split(',')]
             self.dynamic_bpm_list = [self.absolute_bpm * (p / 100) for p in percentages]
-            self.current_bpm_index = 0
         except ValueError:
             print("Invalid BPM input.")
 
@@ -717,16 +786,21 @@ class DrumSamplerApp(Gtk.Window):
             percentages = [float(bpm.strip()) for bpm in self.dynamic_bpm_entry.get_text().split(',')]
             self.dynamic_bpm_list = [self.absolute_bpm * (p / 100) for p in percentages]
 
-    def get_next_bpm(self):
-        if not self.dynamic_bpm_list:
-            return self.absolute_bpm
-        current_bpm = self.dynamic_bpm_list[self.current_bpm_index]
-        return current_bpm
-
-    def advance_bpm(self):
-        if self.dynamic_bpm_list:
-            self.current_bpm_index = (self.current_bpm_index + 1) % len(self.dynamic_bpm_list)
-
+    def current_tempo_map(self):
+        """TempoMap of the BPM and dynamic BPM settings, rebuilt only when they change."""
+        key = (self.absolute_bpm, tuple(self.dynamic_bpm_list), self.steps_per_bpm, self.ramp_bpm)
+        cached = self.tempo_map_cache
+        if cached is None or cached[0] != key:
+            bpms = [bpm for bpm in self.dynamic_bpm_list if bpm > 0] or [self.absolute_bpm]
+            # jedno przypisanie krotki, bo wątek audio czyta ją równolegle
+            cached = (key, TempoMap.from_list(bpms, self.steps_per_bpm, self.ramp_bpm))
+            self.tempo_map_cache = cached
+        return cached[1]
+
+    def on_ramp_bpm_toggled(self, button):
+        self.ramp_bpm = button.get_active()
+
+    @pattern_edit
     def generate_custom_pattern(self, widget):
         genre = self.custom_genre_entry.get_text() or "Generic"
         progression = self.progression_combo.get_active_text()
@@ -813,6 +887,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.update_buttons()
 
+    @pattern_edit
     def on_pattern_length_changed(self, spinbutton):
         new_length = int(spinbutton.get_value())
         current_length = len(self.patterns[self.instruments[0]])
@@ -854,6 +929,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.grid.show_all()
 
+    @pattern_edit
     def randomize_instruments(self, widget):
         probability = self.randomize_probability_spin.get_value() / 100
         pattern_length = int(self.length_spinbutton.get_value())
@@ -865,6 +941,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.update_buttons()
 
+    @pattern_edit
     def autofill_pattern(self):
         pattern_length = int(self.length_spinbutton.get_value())
         genre = self.custom_genre_entry.get_text() or self.preset_genre_combo.get_active_text() or "Generic"
@@ -889,6 +966,7 @@ class DrumSamplerApp(Gtk.Window):
     
         self.update_buttons()
 
+    @pattern_edit
     def apply_preset(self, widget):
         preset = self.preset_combo.get_active_text()
         if preset == "Basic Techno":
@@ -956,6 +1034,7 @@ class DrumSamplerApp(Gtk.Window):
     def on_effect_changed(self, slider, instrument, effect):
         value = slider.get_value()
         self.effects[instrument][effect] = value
+        self.render_cache.invalidate(instrument)
 
     def reset_effect(self, button, slider, instrument, effect):
         slider.set_value(0)
@@ -976,95 +1055,14 @@ class DrumSamplerApp(Gtk.Window):
                     self.effect_sliders[instrument][effect].set_value(0)
 
     def apply_effects(self, sound, instrument):
-        sound = self.apply_adsr_to_sound(sound, instrument)
-        effects = self.effects[instrument]
-        sound_array = pygame.sndarray.array(sound)
-        sample_width = sound_array.dtype.itemsize
-        channels = 1 if sound_array.ndim == 1 else 2
-
-        audio_segment = AudioSegment(
-            sound_array.tobytes(),
-            frame_rate=44100,
-            sample_width=sample_width,
-            channels=channels
-        )
-
-        if effects['volume'] != 0:
-            audio_segment = audio_segment + (effects['volume'] * 10)
-
-        if effects['pitch'] != 0:
-            new_rate = int(audio_segment.frame_rate * (2 ** (effects['pitch'] / 12)))
-            audio_segment = audio_segment._spawn(audio_segment.raw_data, overrides={'frame_rate': new_rate})
-            audio_segment = audio_segment.set_frame_rate(44100)
-
-        if effects['echo'] > 0:
-            delay_ms = int(200 * effects['echo'])
-            echo_segment = audio_segment - 10
-            audio_segment = audio_segment.overlay(echo_segment, position=delay_ms)
-
-        if effects['reverb'] > 0:
-            reverb_amount = effects['reverb'] * 300
-            audio_segment = audio_segment.fade_in(50).fade_out(int(reverb_amount))
+        return array_to_sound(self.effects_array(sound, instrument))
 
-        if effects['pan'] != 0:
-            audio_segment = audio_segment.pan(effects['pan'])
-
-        audio_segment = normalize(audio_segment)
-
-        samples = np.array(audio_segment.get_array_of_samples())
-        if channels == 2:
-            samples = samples.reshape((-1, 2))
-
-        return pygame.sndarray.make_sound(samples)
-
-    def apply_adsr_to_sound(self, sound, instrument):
-        sound_array = pygame.sndarray.array(sound)
-        sample_rate = 44100
-        total_samples = len(sound_array)
-        adsr = self.current_adsr[instrument]
-        is_stereo = sound_array.ndim == 2
-    
-        if is_stereo:
-            channels = sound_array.shape[1]
-        else:
-            channels = 1
-            sound_array = sound_array.reshape(-1, 1)
-    
-        attack_samples = int(adsr['attack'] * sample_rate)
-        decay_samples = int(adsr['decay'] * sample_rate)
-        release_samples = int(adsr['release'] * sample_rate)
-        sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-    
-        if sustain_samples < 0:
-            excess = -sustain_samples
-            total_adsr = attack_samples + decay_samples + release_samples
-            scale_factor = (total_samples - excess) / total_adsr
-            attack_samples = int(attack_samples * scale_factor)
-            decay_samples = int(decay_samples * scale_factor)
-            release_samples = int(release_samples * scale_factor)
-            sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-    
-        envelope = np.zeros(total_samples, dtype=np.float32)
-        if attack_samples > 0:
-            envelope[:attack_samples] = np.linspace(0, 1, min(attack_samples, total_samples))
-        if decay_samples > 0 and attack_samples < total_samples:
-            decay_end = min(attack_samples + decay_samples, total_samples)
-            envelope[attack_samples:decay_end] = np.linspace(1, adsr['sustain'], decay_end - attack_samples)
-        if sustain_samples > 0 and attack_samples + decay_samples < total_samples:
-            sustain_end = min(attack_samples + decay_samples + sustain_samples, total_samples)
-            envelope[attack_samples + decay_samples:sustain_end] = adsr['sustain']
-        if release_samples > 0 and total_samples - release_samples > 0:
-            release_start = max(0, total_samples - release_samples)
-            envelope[release_start:] = np.linspace(adsr['sustain'], 0, total_samples - release_start)
-    
-        if is_stereo:
-            sound_array[:, 0] = sound_array[:, 0] * envelope
-            sound_array[:, 1] = sound_array[:, 1] * envelope
-        else:
-            sound_array[:, 0] = sound_array[:, 0] * envelope
-            sound_array = np.hstack((sound_array, sound_array))
-    
-        return pygame.sndarray.make_sound(sound_array.astype(np.int16))
+    def effects_array(self, sound, instrument, sample_rate=None):
+        # Sound ma częstotliwość miksera, chyba że wywołujący poda inną
+        sample_rate = sample_rate or mixer_format()[0]
+        buffer = to_float32(pygame.sndarray.array(sound))
+        apply_adsr(buffer, self.current_adsr[instrument], sample_rate, 'linear')
+        return apply_effect_chain(buffer, self.effects[instrument], sample_rate, VARIANTS[VARIANT]['effect_style'])
 
     def apply_auto_fx_for_style(self, style):
         fx_settings = {
@@ -1097,45 +1095,44 @@ class DrumSamplerApp(Gtk.Window):
         self.groove_type = 'simple'
         self.groove_combo.set_active(0)
 
-    def apply_groove_effects(self, sound, instrument, step):
+    def apply_groove_effects(self, instrument, step, offsets=(0.0,)):
+        """Zwraca trafienia (offset, sample, głośność) kroku z nałożonym groovem."""
         if self.groove_type == "simple":
-            return self.apply_simple_groove(sound, instrument, step)
+            return self.apply_simple_groove(instrument, step, offsets)
         elif self.groove_type == "stretch":
-            return self.apply_stretch_groove(sound, instrument, step)
+            return self.apply_stretch_groove(instrument, step, offsets)
         elif self.groove_type == "echoes":
-            return self.apply_echoes_groove(sound, instrument, step)
+            return self.apply_echoes_groove(instrument, step, offsets)
         elif self.groove_type == "bouncy":
-            return self.apply_bouncy_groove(sound, instrument, step)
+            return self.apply_bouncy_groove(instrument, step, offsets)
         elif self.groove_type == "relax":
-            return self.apply_relax_groove(sound, instrument, step)
-        return sound
+            return self.apply_relax_groove(instrument, step, offsets)
+        return [(offset, instrument, 1.0) for offset in offsets]
 
-    def apply_simple_groove(self, sound, instrument, step):
+    def apply_simple_groove(self, instrument, step, offsets):
         repeat_chance = random.randint(1, 3)
-        if repeat_chance == 2:
-            sound.play()
-        return sound
+        gain = 2.0 if repeat_chance == 2 else 1.0
+        return [(offset, instrument, gain) for offset in offsets]
 
-    def apply_stretch_groove(self, sound, instrument, step):
-        stretched_bpm = self.get_next_bpm() * random.uniform(0.9, 1.1)
-        self.advance_bpm()
-        return sound
+    def apply_stretch_groove(self, instrument, step, offsets):
+        if self.engine is not None:
+            self.engine.skip_tempo(self.steps_per_bpm)
+        return [(offset, instrument, 1.0) for offset in offsets]
 
-    def apply_echoes_groove(self, sound, instrument, step):
-        return self.apply_effects_with_echo(sound, instrument)
+    def apply_echoes_groove(self, instrument, step, offsets):
+        return self.apply_effects_with_echo(instrument, offsets)
 
-    def apply_bouncy_groove(self, sound, instrument, step):
+    def apply_bouncy_groove(self, instrument, step, offsets):
         volume_factor = random.choice([0.8, 1.2])
-        sound.set_volume(volume_factor)
-        return sound
+        return [(offset, instrument, volume_factor) for offset in offsets]
 
-    def apply_relax_groove(self, sound, instrument, step):
-        return self.apply_effects_with_echo(sound, instrument)
+    def apply_relax_groove(self, instrument, step, offsets):
+        return self.apply_effects_with_echo(instrument, offsets)
 
-    def apply_effects_with_echo(self, sound, instrument):
-        effect_sound = pygame.mixer.Sound(self.samples[instrument])
-        effect_sound.play(maxtime=500)
-        return sound
+    def apply_effects_with_echo(self, instrument, offsets):
+        events = [(offset, instrument, 1.0) for offset in offsets]
+        events.append((offsets[0], (instrument, 'echo'), 1.0))
+        return events
 
     def advanced_generate_drum_track(self, audio_path, tempo, beat_frames):
         y, sr = librosa.load(audio_path, sr=22050)
@@ -1181,6 +1178,13 @@ class DrumSamplerApp(Gtk.Window):
     
         def enhance_drums_thread(audio_path):
             try:
+                if streaming.should_stream(audio_path):
+                    update_progress(0.05, "Analyzing audio stream...")
+                    self.enhance_drums_streaming(audio_path, update_progress)
+                    GLib.idle_add(progress_dialog.destroy)
+                    GLib.idle_add(self.show_save_confirmation, *self.enhanced_track_paths(audio_path))
+                    return
+
                 update_progress(0.1, "Loading and analyzing audio...")
                 y, sr = librosa.load(audio_path, sr=22050)
                 tempo, beat_frames = librosa.beat.beat_track(y=y, sr=sr)
@@ -1199,9 +1203,7 @@ class DrumSamplerApp(Gtk.Window):
                 self.save_generated_tracks(audio_path, percussion_track, y, sr, percussion_audio)
     
                 GLib.idle_add(progress_dialog.destroy)
-                GLib.idle_add(self.show_save_confirmation,
-                              audio_path.replace(".mp3", "_enhanced_drums.wav"),
-                              audio_path.replace(".mp3", "_combined.wav"))
+                GLib.idle_add(self.show_save_confirmation, *self.enhanced_track_paths(audio_path))
             except Exception as e:
                 GLib.idle_add(progress_dialog.destroy)
                 GLib.idle_add(self.show_error_dialog, str(e))
@@ -1216,96 +1218,66 @@ class DrumSamplerApp(Gtk.Window):
     
     def detect_existing_percussion(self, y, sr, beat_frames):
         """Wykrywa istniejące elementy perkusyjne w audio."""
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)
-        onset_times = librosa.frames_to_time(onsets, sr=sr)
-    
-        percussion_events = {'Stopa': [], 'Werbel': [], 'Talerz': [], 'TomTom': []}
-        for onset_time in onset_times:
-            start_sample = int(max(0, onset_time * sr - 0.05 * sr))
-            end_sample = int(min(len(y), onset_time * sr + 0.05 * sr))
-            segment = y[start_sample:end_sample]
-            freqs = np.abs(librosa.stft(segment))
-            mean_freq = np.mean(np.argmax(freqs, axis=0))
-    
-            if mean_freq < 100:
-                percussion_events['Stopa'].append(onset_time)
-            elif 100 <= mean_freq < 500:
-                percussion_events['Werbel'].append(onset_time) if random.random() < 0.7 else percussion_events['TomTom'].append(onset_time)
-            else:
-                percussion_events['Talerz'].append(onset_time)
-    
-        return percussion_events
+        return percussion.detect_percussion_events(y, sr)
     
     def enhance_percussion_track(self, percussion_events, tempo, total_duration, audio_path, y, sr):
         """Wzbogaca perkusję z wykrywaniem complexity_factor i mniej gęstym rytmem."""
-        beats_per_second = tempo / 60
-        steps_per_beat = 4
-        total_steps = int(total_duration * beats_per_second * steps_per_beat)
-        percussion_track = {inst: [{'active': False, 'rhythm_type': 'single'} for _ in range(total_steps)] for inst in self.instruments}
-    
-        # Mapuj istniejące zdarzenia na kroki
-        for inst, times in percussion_events.items():
-            for t in times:
-                step = int(t * beats_per_second * steps_per_beat)
-                if step < total_steps:
-                    percussion_track[inst][step]['active'] = True
-                    percussion_track[inst][step]['rhythm_type'] = 'single'
-    
         # Analiza audio do wykrycia complexity_factor
         if not audio_path or not os.path.exists(audio_path):
             raise ValueError("Brak poprawnej ścieżki audio (audio_path)")
     
         beats_per_measure = 4
-        measures = total_steps // (beats_per_measure * steps_per_beat)
-        samples_per_measure = int(sr * beats_per_measure / beats_per_second)
+        samples_per_measure = int(sr * beats_per_measure / (tempo / 60))
     
         rms = librosa.feature.rms(y=y, frame_length=samples_per_measure, hop_length=samples_per_measure)
         onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=samples_per_measure)
         onset_density = [np.sum(onset_env[i:i+1]) for i in range(0, len(onset_env), 1)]
+        return self.arrange_percussion_track(percussion_events, tempo, total_duration, rms[0], onset_density)
+
+    def arrange_percussion_track(self, percussion_events, tempo, total_duration, rms, onset_density):
+        """Układa ścieżkę perkusji z wykrytych zdarzeń i cech (RMS, onsety) kolejnych taktów."""
+        beats_per_second = tempo / 60
+        steps_per_beat = 4
+        total_steps = int(total_duration * beats_per_second * steps_per_beat)
+        percussion_track = Pattern(self.instruments, total_steps, self.rhythm_types)
     
-        rms_normalized = (rms[0] - np.min(rms)) / (np.max(rms) - np.min(rms) + 1e-6)
-        onset_normalized = [(d - min(onset_density)) / (max(onset_density) - min(onset_density) + 1e-6) for d in onset_density]
-    
-        style = self.preset_genre_combo.get_active_text() or "Techno"
-        for measure in range(measures):
-            measure_start = measure * beats_per_measure * steps_per_beat
-            measure_end = min((measure + 1) * beats_per_measure * steps_per_beat, total_steps)
-    
-            # Oblicz complexity_factor
-            rms_factor = rms_normalized[min(measure, len(rms_normalized) - 1)]
-            onset_factor = onset_normalized[min(measure, len(onset_normalized) - 1)]
-            complexity_factor = min(0.7, (rms_factor + onset_factor) / 2)
-    
-            # Stabilna podstawa rytmiczna z większymi odstępami
-            for step in range(measure_start, measure_end, steps_per_beat):  # Krok co beat, nie co step
-                beat_in_measure = (step % (beats_per_measure * steps_per_beat)) // steps_per_beat
-                if beat_in_measure == 0 and not percussion_track['Stopa'][step]['active']:
-                    percussion_track['Stopa'][step]['active'] = True
-                    percussion_track['Stopa'][step]['rhythm_type'] = 'single'
-                if beat_in_measure == 2 and not percussion_track['Werbel'][step]['active'] and random.random() < 0.5 * (1 + complexity_factor):
-                    percussion_track['Werbel'][step]['active'] = True
-                    percussion_track['Werbel'][step]['rhythm_type'] = 'single'
+        # Mapuj istniejące zdarzenia na kroki
+        for inst, times in percussion_events.items():
+            percussion_track.set_hits(inst, (np.asarray(times) * beats_per_second * steps_per_beat).astype(int))
     
-            # Subtelna ewolucja z mniejszą gęstością
-            if complexity_factor > 0.3:  # Dodajemy elementy tylko w bardziej intensywnych sekcjach
-                for step in range(measure_start, measure_end, steps_per_beat * 2):  # Co 2 beaty
-                    offbeat = step % (steps_per_beat * 2) != 0
-                    if style == "Techno":
-                        if measure % 4 == 0 and random.random() < complexity_factor * 0.08 and not percussion_track['Talerz'][step]['active']:
-                            percussion_track['Talerz'][step]['active'] = True
-                            percussion_track['Talerz'][step]['rhythm_type'] = 'double'
-                        if measure % 8 == 7 and random.random() < complexity_factor * 0.1 and not percussion_track['TomTom'][step]['active']:
-                            percussion_track['TomTom'][step]['active'] = True
-                            percussion_track['TomTom'][step]['rhythm_type'] = 'accent'
-                    elif style == "House":
-                        if measure % 4 == 2 and random.random() < complexity_factor * 0.08 and not percussion_track['Talerz'][step]['active']:
-                            percussion_track['Talerz'][step]['active'] = True
-                            percussion_track['Talerz'][step]['rhythm_type'] = 'swing'
-                        if measure % 8 == 4 and random.random() < complexity_factor * 0.05 and not percussion_track['Stopa'][step]['active']:
-                            percussion_track['Stopa'][step]['active'] = True
-                            percussion_track['Stopa'][step]['rhythm_type'] = 'single'
+        beats_per_measure = 4
+        steps_per_measure = beats_per_measure * steps_per_beat
+        measures = total_steps // steps_per_measure
     
+        rms_normalized = (rms - np.min(rms)) / (np.max(rms) - np.min(rms) + 1e-6)
+        onset_density = np.asarray(onset_density)
+        onset_normalized = (onset_density - np.min(onset_density)) / (np.max(onset_density) - np.min(onset_density) + 1e-6)
+
+        # complexity_factor wszystkich taktów naraz
+        measure = np.arange(measures)
+        rms_factor = rms_normalized[np.minimum(measure, len(rms_normalized) - 1)]
+        onset_factor = onset_normalized[np.minimum(measure, len(onset_normalized) - 1)]
+        complexity_factor = np.minimum(0.7, (rms_factor + onset_factor) / 2)
+        measure_start = measure * steps_per_measure
+
+        # Stabilna podstawa rytmiczna: stopa na 1, werbel (losowo) na 3
+        percussion_track.set_hits('Stopa', measure_start, only_empty=True)
+        snare = np.random.random(measures) < 0.5 * (1 + complexity_factor)
+        percussion_track.set_hits('Werbel', (measure_start + 2 * steps_per_beat)[snare], only_empty=True)
+
+        # Subtelna ewolucja, co 2 beaty, tylko w bardziej intensywnych sekcjach
+        # (instrument, typ rytmu, co ile taktów, który takt, prawdopodobieństwo)
+        style = self.preset_genre_combo.get_active_text() or "Techno"
+        fills = {
+            "Techno": [('Talerz', 'double', 4, 0, 0.08), ('TomTom', 'accent', 8, 7, 0.1)],
+            "House": [('Talerz', 'swing', 4, 2, 0.08), ('Stopa', 'single', 8, 4, 0.05)],
+        }.get(style, [])
+        for beat in (0, 2):
+            for inst, rhythm_type, every, which, chance in fills:
+                hit = ((complexity_factor > 0.3) & (measure % every == which)
+                       & (np.random.random(measures) < complexity_factor * chance))
+                percussion_track.set_hits(inst, (measure_start + beat * steps_per_beat)[hit], rhythm_type, only_empty=True)
+
         return percussion_track
     
     def synthesize_enhanced_audio(self, percussion_track, sr, original_audio, tempo):
@@ -1313,32 +1285,13 @@ class DrumSamplerApp(Gtk.Window):
         beats_per_second = tempo / 60
         steps_per_beat = 4
         step_duration = int(sr / (beats_per_second * steps_per_beat))
-        total_length = len(percussion_track['Stopa'])
-        audio = np.zeros(total_length * step_duration, dtype=np.float32)
+        # Każdy sample dekodowany raz (w sr), długości nut liczone raz na typ rytmu
+        pool = self.percussion_pool(sr)
+        note_lengths = {name: self.percussion_note_length(rhythm, step_duration, sr, beats_per_second)
+                        for name, rhythm in self.rhythm_types.items()}
     
-        for inst in self.instruments:
-            for step in range(total_length):
-                step_data = percussion_track[inst][step]
-                if step_data['active']:
-                    rhythm = self.rhythm_types[step_data['rhythm_type']]
-                    sample = pygame.mixer.Sound(self.samples[inst])
-                    sample_array = pygame.sndarray.array(sample)
-                    if sample_array.ndim > 1:
-                        sample_array = sample_array.mean(axis=1)
-                    
-                    # Dłuższe trwanie nuty, minimum połowa beatu
-                    note_duration = max(int(step_duration * 2 * rhythm['speed'] / rhythm['notes']), int(sr / beats_per_second / 2))
-                    for i in range(rhythm['notes']):
-                        start = int(step * step_duration + i * note_duration)
-                        end = min(start + note_duration, len(audio))
-                        if len(sample_array) > note_duration:
-                            sample_array_adj = sample_array[:note_duration]
-                        else:
-                            sample_array_adj = np.pad(sample_array, (0, note_duration - len(sample_array)))
-                        if end <= len(audio):
-                            audio[start:end] += sample_array_adj * 0.5
-                        else:
-                            audio[start:] += sample_array_adj[:len(audio) - start] * 0.5
+        audio = percussion.mix_percussion_track(percussion_track, lambda inst, frames: pool.note(self.samples[inst], frames),
+                                                self.rhythm_types, note_lengths, step_duration)
     
         original_rms = np.sqrt(np.mean(original_audio**2))
         percussion_rms = np.sqrt(np.mean(audio**2))
@@ -1347,6 +1300,55 @@ class DrumSamplerApp(Gtk.Window):
     
         return audio
     
+    def percussion_note_length(self, rhythm, step_duration, sr, beats_per_second):
+        # Dłuższe trwanie nuty, minimum połowa beatu
+        return max(int(step_duration * 2 * rhythm['speed'] / rhythm['notes']), int(sr / beats_per_second / 2))
+
+    def percussion_pool(self, sr):
+        return SamplePool(sr, fallback=self.decode_with_pygame)
+
+    def decode_with_pygame(self, sample):
+        """Dla formatów, których nie czyta soundfile, i sampli z banku: (tablica, częstotliwość miksera)."""
+        if not isinstance(sample, str):
+            return sample, mixer_format()[0]
+        return pygame.sndarray.array(pygame.mixer.Sound(sample)), pygame.mixer.get_init()[0]
+
+    def enhanced_track_paths(self, audio_path):
+        base = os.path.splitext(audio_path)[0]
+        return base + "_enhanced_drums.wav", base + "_combined.wav"
+
+    def enhance_drums_streaming(self, audio_path, update_progress):
+        """Wersja strumieniowa dla długich nagrań: zużycie pamięci nie zależy od długości pliku."""
+        analyzer = streaming.analyze_file(audio_path, progress=lambda fraction: update_progress(
+            0.05 + 0.35 * fraction, "Analyzing audio stream..."))
+        tempo = analyzer.tempo()
+
+        update_progress(0.4, "Detecting existing percussion...")
+        percussion_events = analyzer.percussion_events()
+
+        update_progress(0.45, "Enhancing percussion track...")
+        rms, onset_density = analyzer.measure_features(tempo)
+        percussion_track = self.arrange_percussion_track(percussion_events, tempo, analyzer.duration, rms, onset_density)
+
+        beats_per_second = tempo / 60
+        step_duration = analyzer.sample_rate / (beats_per_second * 4)
+
+        def step_events(step):
+            events = []
+            column = percussion_track.column(step)
+            for row in np.flatnonzero(column['active']).tolist():
+                rhythm = self.rhythm_types[percussion_track.rhythm_names[column['rhythm'][row]]]
+                note_duration = self.percussion_note_length(rhythm, int(step_duration), analyzer.sample_rate, beats_per_second)
+                for i in range(rhythm['notes']):
+                    events.append((i * note_duration / step_duration, (percussion_track.instruments[row], note_duration), 0.5))
+            return events
+
+        pool = self.percussion_pool(analyzer.sample_rate)
+        percussion_path, combined_path = self.enhanced_track_paths(audio_path)
+        streaming.write_enhanced_tracks(audio_path, percussion_path, combined_path, analyzer, step_events,
+                                        lambda key: pool.note(self.samples[key[0]], key[1]), tempo, len(percussion_track),
+                                        progress=lambda fraction: update_progress(0.5 + 0.45 * fraction, "Writing tracks..."))
+
     def save_generated_tracks(self, audio_path, percussion_track, original_audio, sr, percussion_audio):
         """Zapisuje wzbogacone ścieżki."""
         max_length = len(original_audio)
@@ -1354,8 +1356,7 @@ class DrumSamplerApp(Gtk.Window):
         combined_audio = original_audio * 0.4 + percussion_audio * 0.5
         combined_audio = librosa.util.normalize(combined_audio)
     
-        percussion_path = audio_path.replace(".mp3", "_enhanced_drums.wav")
-        combined_path = audio_path.replace(".mp3", "_combined.wav")
+        percussion_path, combined_path = self.enhanced_track_paths(audio_path)
         sf.write(percussion_path, percussion_audio, sr)
         sf.write(combined_path, combined_audio, sr)
 
@@ -1393,6 +1394,7 @@ class DrumSamplerApp(Gtk.Window):
             file_path = os.path.join(sample_dir, f"{instrument}.wav")
             if os.path.isfile(file_path):
                 self.samples[instrument] = file_path
+                self.render_cache.invalidate(instrument)
                 print(f"Załadowano sample dla {instrument}: {file_path}")
 
     def toggle_fullscreen(self, button):
@@ -1421,61 +1423,46 @@ class DrumSamplerApp(Gtk.Window):
             return self.patterns
 
         pattern_length = int(self.length_spinbutton.get_value())
-        performance_patterns = {
-            inst: [{'active': False, 'rhythm_type': 'single'} for _ in range(pattern_length)]
-            for inst in self.instruments
-        }
-
-        # Priorytety instrumentów: Stopa i Werbel jako podstawa rytmu, potem Talerz i TomTom
-        priority_order = ['Stopa', 'Werbel', 'Talerz', 'TomTom']
-
-        for step in range(pattern_length):
-            active_instruments = [
-                inst for inst in self.instruments if self.patterns[inst][step]['active']
-            ]
-            
-            # Ograniczamy do maksymalnie 4 instrumentów jednocześnie
-            if len(active_instruments) > 4:
-                active_instruments = active_instruments[:4]
-            elif len(active_instruments) == 0:
-                continue
-
-            # Przypisanie instrumentów do "rąk" i "nóg"
-            hands = 2
-            feet = 2
-            assigned = []
-
-            # Najpierw przypisujemy Stopę i TomTom do nóg
-            for inst in ['Stopa', 'TomTom']:
-                if inst in active_instruments and feet > 0:
-                    performance_patterns[inst][step] = self.patterns[inst][step].copy()
-                    assigned.append(inst)
-                    feet -= 1
-
-            # Następnie przypisujemy Werbel i Talerz do rąk
-            for inst in ['Werbel', 'Talerz']:
-                if inst in active_instruments and inst not in assigned and hands > 0:
-                    performance_patterns[inst][step] = self.patterns[inst][step].copy()
-                    assigned.append(inst)
-                    hands -= 1
-
-            # Jeśli zostały miejsca, przypisujemy pozostałe instrumenty
-            for inst in active_instruments:
-                if inst not in assigned and (hands > 0 or feet > 0):
-                    performance_patterns[inst][step] = self.patterns[inst][step].copy()
-                    if hands > 0:
-                        hands -= 1
-                    else:
-                        feet -= 1
-
-        return performance_patterns
+        performance = Pattern.from_dict(self.patterns, self.instruments, True, self.rhythm_types, pattern_length)
+        active = performance.active != 0
+        # Ograniczamy do maksymalnie 4 instrumentów jednocześnie
+        active &= np.cumsum(active, axis=0) <= 4
+
+        # Przypisanie instrumentów do "rąk" i "nóg", wszystkie kroki naraz
+        hands = np.full(pattern_length, 2)
+        feet = np.full(pattern_length, 2)
+        assigned = np.zeros_like(active)
+        # Najpierw Stopa i TomTom na nogi, potem Werbel i Talerz na ręce
+        for limbs, group in ((feet, ['Stopa', 'TomTom']), (hands, ['Werbel', 'Talerz'])):
+            for inst in group:
+                if inst in self.instruments:
+                    row = self.instruments.index(inst)
+                    assigned[row] = active[row] & (limbs > 0)
+                    limbs -= assigned[row]
+
+        # Jeśli zostały miejsca, przypisujemy pozostałe instrumenty
+        for row, inst in enumerate(self.instruments):
+            if inst not in ('Stopa', 'TomTom', 'Werbel', 'Talerz'):
+                assigned[row] = active[row] & ((hands > 0) | (feet > 0))
+                hand = assigned[row] & (hands > 0)
+                hands -= hand
+                feet -= assigned[row] & ~hand
+
+        performance.rhythm[~assigned] = performance.rhythm_code('single')
+        performance.active[...] = assigned
+        return performance.to_dict()
 
     def play_pattern(self, widget):
         self.init_audio()
         if not self.loop_playing:
             self.loop_playing = True
             self.performance_patterns = self.prepare_performance_play()
-            self.play_thread = threading.Thread(target=self.loop_play)
+            self.intensity_tracker = 0
+            sample_rate, channels = mixer_format()
+            self.engine = PatternEngine(self.loop_step_events, self.engine_sample, self.current_tempo_map,
+                                        pattern_length=int(self.length_spinbutton.get_value()),
+                                        sample_rate=sample_rate, channels=channels)
+            self.play_thread = PygameBlockOutput(self.engine)
             self.play_thread.start()
 
     def blink_button(self, instrument, step):
@@ -1484,71 +1471,70 @@ class DrumSamplerApp(Gtk.Window):
         context.add_class("blink")
         GLib.timeout_add(500, lambda: context.remove_class("blink"))
 
-    def loop_play(self):
-        pattern_length = int(self.length_spinbutton.get_value())
-        step_counter = 0
-        intensity_tracker = 0
-
+    def engine_sample(self, key):
+        """Sample z efektami dla instrumentu, (inst, 'dry') bez efektów, (inst, 'echo') pierwsze 500 ms."""
+        instrument, variant = key if isinstance(key, tuple) else (key, None)
+        if instrument not in self.samples:
+            return None
+        cache_key = render_key(instrument, self.samples[instrument], self.effects[instrument],
+                               self.current_adsr[instrument], variant=variant)
+        return self.render_cache.get_or_render(cache_key, lambda: self.render_engine_sample(instrument, variant),
+                                               keep=self.samples[instrument])
+
+    def sample_sound(self, instrument):
+        """Sound instrumentu: z pliku albo z tablicy załadowanej z banku (w częstotliwości miksera)."""
+        sample = self.samples[instrument]
+        if isinstance(sample, str):
+            return pygame.mixer.Sound(sample)
+        return array_to_sound(match_channels(sample, mixer_format()[1]))
+
+    def render_engine_sample(self, instrument, variant):
+        sound = self.sample_sound(instrument)
+        if variant is None:
+            data = match_channels(self.effects_array(sound, instrument, self.engine.sample_rate), self.engine.channels)
+        else:
+            data = sound_to_array(sound, self.engine.channels)
+        if variant == 'echo':
+            data = data[:int(self.engine.sample_rate * 0.5)]
+        return data
+
+    def loop_step_events(self, step_counter):
+        if step_counter == 0:
+            self.intensity_tracker = 0
+        step_seconds = self.engine.step_seconds
         active_patterns = self.performance_patterns if self.performer_mode and self.advanced_sequencer_mode else self.patterns
+        events = []
 
-        while self.loop_playing:
-            current_bpm = self.get_next_bpm()
-            base_step_duration = 60 / current_bpm / 4
+        for inst in self.instruments:
+            if self.advanced_sequencer_mode:
+                step_data = active_patterns[inst][step_counter]
+                if step_data['active'] and inst in self.samples:
+                    rhythm = self.rhythm_types[step_data['rhythm_type']]
+                    volume = VARIANTS[VARIANT]['accent_gain'] if step_data['rhythm_type'] == 'accent' else 1.0
+                    self.intensity_tracker += rhythm['notes']
 
-            for _ in range(self.steps_per_bpm):
-                if step_counter >= pattern_length:
-                    step_counter = 0
-                    intensity_tracker = 0
+                    for offset in rhythm_offsets(rhythm, VARIANTS[VARIANT]['spacing']):
+                        if self.performer_mode:
+                            offset += random.uniform(0, 0.01) / step_seconds
+                        events.append((offset, inst, volume))
 
-                start_time = time.time()
+                    if inst != 'TomTom' and self.intensity_tracker > 3 and step_counter % 4 == 3:
+                        events.append((0.0, ('TomTom', 'dry'), 1.2))
+                        self.intensity_tracker = 0
 
-                for inst in self.instruments:
-                    if self.advanced_sequencer_mode:
-                        step_data = active_patterns[inst][step_counter]
-                        if step_data['active'] and inst in self.samples:
-                            rhythm = self.rhythm_types[step_data['rhythm_type']]
-                            original_sound = pygame.mixer.Sound(self.samples[inst])
-                            modified_sound = self.apply_effects(original_sound, inst)
-                            
-                            intensity_tracker += rhythm['notes']
-                            note_duration = base_step_duration * rhythm['speed'] / rhythm['notes']
-                            
-                            for i in range(rhythm['notes']):
-                                swing_offset = note_duration * rhythm['swing'] if i % 2 == 1 else 0
-                                volume = 1.2 if step_data['rhythm_type'] == 'accent' else 1.0
-                                modified_sound.set_volume(volume)
-                                if self.performer_mode:
-                                    human_delay = random.uniform(0, 0.01)
-                                    time.sleep(human_delay)
-                                modified_sound.play()
-                                time.sleep(note_duration + swing_offset)
-                            
-                            if inst != 'TomTom' and intensity_tracker > 3 and step_counter % 4 == 3:
-                                tomtom_sound = pygame.mixer.Sound(self.samples['TomTom'])
-                                tomtom_sound.set_volume(1.2)
-                                tomtom_sound.play()
-                                intensity_tracker = 0
-                            
-                            GLib.idle_add(self.blink_button, inst, step_counter)
-                    else:
-                        if active_patterns[inst][step_counter] == 1 and inst in self.samples:
-                            original_sound = pygame.mixer.Sound(self.samples[inst])
-                            modified_sound = self.apply_effects(original_sound, inst)
-                            modified_sound = self.apply_groove_effects(modified_sound, inst, step_counter)
-                            modified_sound.play()
-                            GLib.idle_add(self.blink_button, inst, step_counter)
-
-                elapsed_time = time.time() - start_time
-                sleep_time = max(0, base_step_duration - elapsed_time)
-                time.sleep(sleep_time)
+                    GLib.idle_add(self.blink_button, inst, step_counter)
+            else:
+                if active_patterns[inst][step_counter] == 1 and inst in self.samples:
+                    events.extend(self.apply_groove_effects(inst, step_counter))
+                    GLib.idle_add(self.blink_button, inst, step_counter)
 
-                step_counter += 1
-            self.advance_bpm()
+        return events
 
     def stop_pattern(self, widget):
         self.loop_playing = False
         if self.play_thread is not None:
-            self.play_thread.join()
+            self.play_thread.stop()
+            self.play_thread = None
 
     def load_samples(self, widget):
         for inst in self.instruments:
@@ -1569,12 +1555,19 @@ class DrumSamplerApp(Gtk.Window):
         total_volume = 0
         sample_count = 0
 
-        for instrument, sample_path in self.samples.items():
-            if sample_path:
-                audio = AudioSegment.from_file(sample_path)
-                volume = audio.dBFS
-                total_volume += volume
-                sample_count += 1
+        for instrument, sample in self.samples.items():
+            if isinstance(sample, str):
+                if not sample:
+                    continue
+                volume = AudioSegment.from_file(sample).dBFS
+            else:
+                # sample z banku: tablica float32 w [-1, 1], dBFS jak w pydub
+                rms = np.sqrt(np.mean(np.square(sample)))
+                if not rms:
+                    continue
+                volume = 20 * np.log10(rms)
+            total_volume += volume
+            sample_count += 1
 
         avg_volume = total_volume / sample_count if sample_count > 0 else 0
         return avg_volume
@@ -1607,7 +1600,9 @@ class DrumSamplerApp(Gtk.Window):
                 "advanced_patterns": self.advanced_patterns,
                 "advanced_sequencer_mode": self.advanced_sequencer_mode,
                 "performer_mode": self.performer_mode,
-                "samples": self.samples,
+                # sample z banku są tylko w pamięci - zapisywany jest plik banku
+                "samples": {inst: sample for inst, sample in self.samples.items() if isinstance(sample, str)},
+                "sample_bank": self.sample_bank_path,
                 "absolute_bpm": self.absolute_bpm,
                 "dynamic_bpm_list": self.dynamic_bpm_list
             }
@@ -1637,9 +1632,14 @@ class DrumSamplerApp(Gtk.Window):
             self.advanced_sequencer_mode = project_data.get("advanced_sequencer_mode", False)
             self.performer_mode = project_data.get("performer_mode", False)
             self.patterns = self.advanced_patterns if self.advanced_sequencer_mode else self.simple_patterns
+            self.history.clear()
             self.sequencer_mode_switch.set_active(self.advanced_sequencer_mode)
             self.performer_mode_switch.set_active(self.performer_mode)
             self.samples = project_data["samples"]
+            self.sample_bank_path = None
+            bank_path = project_data.get("sample_bank")
+            if bank_path and os.path.exists(bank_path):
+                self.apply_sample_bank(load_bank(bank_path, mixer_format()[0]), bank_path)
             self.absolute_bpm = project_data.get("absolute_bpm", 120)
             self.dynamic_bpm_list = project_data.get("dynamic_bpm_list", [])
             self.bpm_entry.set_text(str(self.absolute_bpm))
@@ -1649,33 +1649,12 @@ class DrumSamplerApp(Gtk.Window):
         dialog.destroy()
 
     def export_to_midi(self, widget):
-        midi = MIDIFile(1)
-        track = 0
-        time = 0
-        midi.addTrackName(track, time, "Drum Pattern")
-        midi.addTempo(track, time, self.absolute_bpm)
-
         pattern_length = int(self.length_spinbutton.get_value())
         active_patterns = self.prepare_performance_play() if self.performer_mode and self.advanced_sequencer_mode else self.patterns
-
-        for step in range(pattern_length):
-            current_bpm = self.get_next_bpm()
-            step_duration = 60 / current_bpm / 4
-
-            for inst in self.instruments:
-                if self.advanced_sequencer_mode:
-                    step_data = active_patterns[inst][step]
-                    if step_data['active']:
-                        rhythm = self.rhythm_types[step_data['rhythm_type']]
-                        note_duration = step_duration * rhythm['speed'] / rhythm['notes']
-                        for _ in range(rhythm['notes']):
-                            midi.addNote(track, 9, self.midi_notes[inst], time, note_duration, 100 if step_data['rhythm_type'] != 'accent' else 120)
-                            time += note_duration
-                else:
-                    if active_patterns[inst][step] == 1:
-                        midi.addNote(track, 9, self.midi_notes[inst], time, 0.25, 100)
-            if not self.advanced_sequencer_mode:
-                time += step_duration
+        velocity, accent_velocity = midi_velocities(VARIANT, self.effects, self.instruments)
+        midi = pattern_midi(active_patterns, self.instruments, self.midi_notes, pattern_length, self.current_tempo_map(),
+                            self.advanced_sequencer_mode, self.rhythm_types, VARIANTS[VARIANT]['spacing'],
+                            velocity, accent_velocity)
 
         file_dialog = Gtk.FileChooserDialog(
             title="Export MIDI",
@@ -1685,9 +1664,7 @@ class DrumSamplerApp(Gtk.Window):
 
         response = file_dialog.run()
         if response == Gtk.ResponseType.OK:
-            filename = file_dialog.get_filename()
-            with open(filename, "wb") as output_file:
-                midi.writeFile(output_file)
+            write_midi_file(midi, file_dialog.get_filename())
         file_dialog.destroy()
 
     def export_advanced_midi(self, widget):
@@ -1732,7 +1709,7 @@ class DrumSamplerApp(Gtk.Window):
             target_bpm = float(bpm_entry.get_text())
             dynamic_bpm = [float(x) for x in dynamic_bpm_entry.get_text().split(',')]
 
-            midi = MIDIFile(3)
+            midi = midiutil.MIDIFile(3)
             for i, name in enumerate(["Drums", "Bass", "Lead"]):
                 midi.addTrackName(i, 0, name)
             midi.addTempo(0, 0, target_bpm)
@@ -1888,6 +1865,7 @@ class DrumSamplerApp(Gtk.Window):
 
                 time += step_duration
 
+    @pattern_edit
     def randomize_pattern(self, widget):
         pattern_length = int(self.length_spinbutton.get_value())
         for inst in self.instruments:
@@ -1935,6 +1913,7 @@ class DrumSamplerApp(Gtk.Window):
         current_value = self.current_adsr[instrument][param]
         new_value = max(0.0, min(current_value + step, 1.0 if param == 'sustain' else 5.0))
         self.current_adsr[instrument][param] = new_value
+        self.render_cache.invalidate(instrument)
         self.adsr_entries[instrument][param].set_text(f"{new_value:.2f}")
         if self.preview_active[instrument]:
             self.preview_sample(instrument)
@@ -1963,7 +1942,7 @@ class DrumSamplerApp(Gtk.Window):
 
     def preview_sample(self, instrument):
         if instrument in self.samples:
-            sound = pygame.mixer.Sound(self.samples[instrument])
+            sound = self.sample_sound(instrument)
             sound = self.apply_effects(sound, instrument)
             sound.play()
 
@@ -1972,23 +1951,7 @@ class DrumSamplerApp(Gtk.Window):
         duration = 0.5
         for inst in self.instruments:
             if inst not in self.samples:
-                t = np.linspace(0, duration, int(sample_rate * duration), False)
-                if inst == 'Talerz':
-                    base = np.sin(2 * np.pi * 2000 * t) * np.exp(-3 * t)
-                    noise = np.random.normal(0, 0.3, len(t)) * np.exp(-2 * t)
-                    sound = base + noise
-                elif inst == 'Stopa':
-                    sound = np.sin(2 * np.pi * 60 * t) * np.exp(-10 * t)
-                elif inst == 'Werbel':
-                    base = np.sin(2 * np.pi * 300 * t) * np.exp(-6 * t)
-                    noise = np.random.normal(0, 0.1, len(t)) * np.exp(-4 * t)
-                    sound = base * 0.7 + noise * 0.3
-                elif inst == 'TomTom':
-                    base = np.sin(2 * np.pi * 100 * t) * np.exp(-4 * t)
-                    echo = np.sin(2 * np.pi * 100 * t) * np.exp(-6 * t) * 0.4
-                    sound = base + np.pad(echo, (int(sample_rate * 0.1), 0))[:len(t)]
-                
-                sound = (sound / np.max(np.abs(sound)) * 32767).astype(np.int16)
+                sound = (default_sample(inst, sample_rate, duration) * 32767).astype(np.int16)
                 self.samples[inst] = f"{inst}_default.wav"
                 sf.write(self.samples[inst], sound, sample_rate)
 
@@ -2001,15 +1964,20 @@ class DrumSamplerApp(Gtk.Window):
 
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
-            import zipfile
             filename = dialog.get_filename()
-            with zipfile.ZipFile(filename, 'w') as zipf:
+            try:
+                samples, sample_rate = {}, 44100
                 for inst in self.instruments:
-                    if inst in self.samples:
-                        zipf.write(self.samples[inst], os.path.basename(self.samples[inst]))
-                adsr_data = json.dumps(self.current_adsr)
-                zipf.writestr("adsr_settings.json", adsr_data)
-            self.bank_combo.append_text(os.path.basename(filename).replace(".zip", ""))
+                    if inst not in self.samples:
+                        continue
+                    if isinstance(self.samples[inst], str):
+                        samples[inst], sample_rate = sf.read(self.samples[inst], dtype='int16')
+                    else:
+                        samples[inst], sample_rate = self.samples[inst], mixer_format()[0]
+                write_bank(filename, samples, sample_rate, self.current_adsr, compression_level=BANK_COMPRESSION)
+                self.bank_combo.append_text(os.path.basename(filename).replace(".zip", ""))
+            except Exception as e:
+                self.show_error_dialog(f"Error exporting bank: {str(e)}")
         dialog.destroy()
 
     def load_sample_bank(self, widget):
@@ -2020,26 +1988,49 @@ class DrumSamplerApp(Gtk.Window):
         response = dialog.run()
     
         if response == Gtk.ResponseType.OK:
-            import zipfile
             filename = dialog.get_filename()
             try:
-                with zipfile.ZipFile(filename, 'r') as zipf:
-                    zipf.extractall("sample_bank_temp")
-                    for inst in self.instruments:
-                        sample_path = f"sample_bank_temp/{inst}.wav"
-                        if os.path.exists(sample_path):
-                            self.samples[inst] = sample_path
-                    adsr_file = "sample_bank_temp/adsr_settings.json"
-                    if os.path.exists(adsr_file):
-                        with open(adsr_file, 'r') as f:
-                            self.current_adsr = json.load(f)
-                        for inst in self.instruments:
-                            for param, entry in self.adsr_entries[inst].items():
-                                entry.set_text(str(self.current_adsr[inst][param]))
+                if is_bank(filename):
+                    # sample od razu w częstotliwości miksera, trzymane w pamięci
+                    self.apply_sample_bank(load_bank(filename, mixer_format()[0]), filename)
+                else:
+                    self.load_legacy_sample_bank(filename)
             except Exception as e:
                 self.show_error_dialog(f"Error loading bank: {str(e)}")
         dialog.destroy()
 
+    def apply_sample_bank(self, bank, path):
+        # zawsze podmieniamy sample - ponowne dekodowanie tego samego banku omija cache w load_bank
+        self.sample_bank_path = path
+        for inst in self.instruments:
+            if inst in bank.samples:
+                # zdekodowana tablica (frames, channels) zamiast pliku
+                self.samples[inst] = bank.samples[inst]
+                self.render_cache.invalidate(inst)
+            if inst in bank.adsr:
+                self.current_adsr[inst] = bank.adsr[inst]
+                for param, entry in self.adsr_entries[inst].items():
+                    entry.set_text(str(self.current_adsr[inst][param]))
+
+    def load_legacy_sample_bank(self, filename):
+        # stary format: zip z plikami wav i adsr_settings.json, bez bank.json
+        import zipfile
+        with zipfile.ZipFile(filename, 'r') as zipf:
+            zipf.extractall("sample_bank_temp")
+            for inst in self.instruments:
+                sample_path = f"sample_bank_temp/{inst}.wav"
+                if os.path.exists(sample_path):
+                    self.samples[inst] = sample_path
+                    self.render_cache.invalidate(inst)
+            adsr_file = "sample_bank_temp/adsr_settings.json"
+            if os.path.exists(adsr_file):
+                with open(adsr_file, 'r') as f:
+                    self.current_adsr = json.load(f)
+                for inst in self.instruments:
+                    for param, entry in self.adsr_entries[inst].items():
+                        entry.set_text(str(self.current_adsr[inst][param]))
+        self.sample_bank_path = None
+
 # Main execution
 if __name__ == "__main__":
     win = DrumSamplerApp()
@@ -1,21 +1,36 @@
 import gi
 import random
-import time
 import threading
+from drumpatterns_core.startup import STARTUP, lazy_import
 import pygame
+STARTUP.mark("import pygame")
 import json
 import os
-from midiutil import MIDIFile
-from pydub import AudioSegment
-from pydub.effects import normalize
 import numpy as np
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk
+STARTUP.mark("import Gtk")
 import warnings
 warnings.filterwarnings("ignore", category=SyntaxWarning)
-import sqlite3
-import librosa
 import soundfile as sf
+from drumpatterns_core import Pattern, PatternEngine, rhythm_offsets
+from drumpatterns_core.cache import RenderCache, render_key
+from drumpatterns_core.dsp import apply_effect_chain, match_channels, to_float32
+from drumpatterns_core.history import EditHistory, pattern_edit
+from drumpatterns_core.midi import pattern_midi, write_midi_file
+from drumpatterns_core.output import PygameBlockOutput, array_to_sound, mixer_format, sound_to_array
+from drumpatterns_core.samples import SamplePool
+from drumpatterns_core.synth import apply_adsr, default_sample
+from drumpatterns_core.tempo import TempoMap
+from drumpatterns_core.variants import VARIANTS, midi_velocities
+STARTUP.mark("import soundfile, drumpatterns_core")
+
+# Ładowane dopiero przy pierwszym użyciu (analiza audio)
+librosa = lazy_import('librosa')
+percussion = lazy_import('drumpatterns_core.percussion')
+
+VARIANT = 'sampler2'  # profil zgodności, patrz drumpatterns_core.variants
+HISTORY_BUDGET_MB = 16  # pamięć historii cofania (MB)
 
 class DrumSamplerApp(Gtk.Window):
     def __init__(self):
@@ -25,7 +40,7 @@ class DrumSamplerApp(Gtk.Window):
         self.is_fullscreen = False
         self.scale_factor = 1.0
 
-        pygame.mixer.init()
+        self.render_cache = RenderCache()
 
         # Main container
         scroll_window = Gtk.ScrolledWindow()
@@ -47,6 +62,8 @@ class DrumSamplerApp(Gtk.Window):
             for inst in self.instruments
         }
         self.patterns = self.simple_patterns
+        self.history = EditHistory(HISTORY_BUDGET_MB * 1024 * 1024,
+                                   set_length=lambda length: self.length_spinbutton.set_value(length))
         self.colors = ['red', 'green', 'blue', 'orange']
         self.midi_notes = {'Talerz': 49, 'Stopa': 36, 'Werbel': 38, 'TomTom': 45}
         self.buttons = {}
@@ -92,12 +109,15 @@ class DrumSamplerApp(Gtk.Window):
 
         self.loop_playing = False
         self.play_thread = None
+        self.engine = None
         self.dynamic_bpm_list = []
-        self.current_bpm_index = 0
         self.steps_per_bpm = 4
+        self.ramp_bpm = False
+        self.tempo_map_cache = None
 
         # Connect scaling
         self.connect("size-allocate", self.scale_interface)
+        self.connect("key-press-event", self.on_key_press)
 
         self.effect_sliders = {}
         self.groove_type = 'simple'
@@ -117,6 +137,27 @@ class DrumSamplerApp(Gtk.Window):
         self.create_effect_controls()
         self.create_sample_manipulation_area()
 
+        # Urządzenie audio (i sample) otwierane w tle dopiero po pokazaniu okna
+        self.main_box.set_sensitive(False)
+        GLib.idle_add(self.start_audio)
+        STARTUP.mark("build window")
+
+    def start_audio(self):
+        STARTUP.mark("show window")
+        threading.Thread(target=self.open_audio, daemon=True).start()
+        return False
+
+    def open_audio(self):
+        with STARTUP.phase("audio device (thread)"):
+            pygame.mixer.init()
+        GLib.idle_add(self.on_audio_ready)
+
+    def on_audio_ready(self):
+        self.main_box.set_sensitive(True)
+        STARTUP.mark("audio ready")
+        STARTUP.report()
+        return False
+
     def create_toolbar(self):
         toolbar = Gtk.Toolbar()
         self.main_box.pack_start(toolbar, False, False, 0)
@@ -129,7 +170,9 @@ class DrumSamplerApp(Gtk.Window):
             ("document-save", self.save_project, "Save Project"),
             ("document-open", self.load_project, "Load Project"),
             ("document-export", self.export_to_midi, "Export MIDI"),
-            ("document-export", self.export_advanced_midi, "Export Advanced MIDI")
+            ("document-export", self.export_advanced_midi, "Export Advanced MIDI"),
+            ("edit-undo", self.undo_edit, "Undo"),
+            ("edit-redo", self.redo_edit, "Redo")
         ]
 
         for icon_name, callback, tooltip in button_info:
@@ -265,6 +308,11 @@ class DrumSamplerApp(Gtk.Window):
         apply_button.connect("clicked", self.apply_dynamic_bpm)
         dynamic_bpm_box.pack_start(apply_button, False, False, 0)
 
+        ramp_check = Gtk.CheckButton(label="Ramp")
+        ramp_check.set_tooltip_text("Glide between the dynamic BPM values")
+        ramp_check.connect("toggled", self.on_ramp_bpm_toggled)
+        dynamic_bpm_box.pack_start(ramp_check, False, False, 0)
+
     def create_pattern_controls(self):
         genre_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
         self.main_box.pack_start(genre_box, False, False, 0)
@@ -626,6 +674,7 @@ class DrumSamplerApp(Gtk.Window):
                             if isinstance(subchild, Gtk.Button):
                                 subchild.set_size_request(int(20 * self.scale_factor), int(20 * self.scale_factor))
 
+    @pattern_edit
     def on_button_toggled(self, button, instrument, step):
         if self.advanced_sequencer_mode:
             is_active = button.get_active()
@@ -637,6 +686,27 @@ class DrumSamplerApp(Gtk.Window):
         else:
             self.patterns[instrument][step] = int(button.get_active())
 
+    def undo_edit(self, widget):
+        if self.history.undo() is not None:
+            self.update_buttons()
+
+    def redo_edit(self, widget):
+        if self.history.redo() is not None:
+            self.update_buttons()
+
+    def on_key_press(self, widget, event):
+        # Ctrl+Z cofa, Ctrl+Shift+Z / Ctrl+Y ponawia; pola tekstowe zostają przy swoich skrótach
+        if not event.state & Gdk.ModifierType.CONTROL_MASK or isinstance(self.get_focus(), Gtk.Editable):
+            return False
+        key = Gdk.keyval_to_lower(event.keyval)
+        if key == Gdk.KEY_z and not event.state & Gdk.ModifierType.SHIFT_MASK:
+            self.undo_edit(widget)
+        elif key in (Gdk.KEY_z, Gdk.KEY_y):
+            self.redo_edit(widget)
+        else:
+            return False
+        return True
+
     def update_buttons(self):
         pattern_length = int(self.length_spinbutton.get_value())
         for inst in self.instruments:
@@ -698,6 +768,7 @@ class DrumSamplerApp(Gtk.Window):
     def on_button_press(self, widget, event, instrument, step):
         self.last_button_pressed = event.button
 
+    @pattern_edit
     def on_scroll(self, widget, event, instrument, step):
         if not self.advanced_sequencer_mode or not self.patterns[instrument][step]['active']:
             return
@@ -717,6 +788,8 @@ class DrumSamplerApp(Gtk.Window):
     def on_sequencer_mode_switch(self, switch, gparam):
         self.advanced_sequencer_mode = switch.get_active()
         self.patterns = self.advanced_patterns if self.advanced_sequencer_mode else self.simple_patterns
+        # zapisane zmiany dotyczą wzorca drugiego trybu - cofnięcie nadpisałoby nie ten wzorzec
+        self.history.clear()
         self.update_buttons()
 
     def on_performer_mode_switch(self, switch, gparam):
@@ -734,17 +807,8 @@ class DrumSamplerApp(Gtk.Window):
         self.update_dynamic_bpm()
 
     def calculate_pattern_density(self):
-        total_active_steps = 0
-        total_steps = len(self.instruments) * len(self.patterns[self.instruments[0]])
-        if self.advanced_sequencer_mode:
-            for inst in self.instruments:
-                for step in self.patterns[inst]:
-                    if step['active']:
-                        total_active_steps += self.rhythm_types[step['rhythm_type']]['notes']
-        else:
-            for inst in self.instruments:
-                total_active_steps += sum(self.patterns[inst])
-        return total_active_steps / total_steps if total_steps > 0 else 0
+        return Pattern.from_dict(self.patterns, self.instruments, self.advanced_sequencer_mode,
+                                 self.rhythm_types).density()
 
     def matched_bpm(self, widget):
         density = self.calculate_pattern_density()
@@ -764,7 +828,6 @@ class DrumSamplerApp(Gtk.Window):
         try:
             percentages = [float(bpm.strip()) for bpm in bpm_string.split(',')]
             self.dynamic_bpm_list = [self.absolute_bpm * (p / 100) for p in percentages]
-            self.current_bpm_index = 0
         except ValueError:
             print("Invalid BPM input.")
 
@@ -773,16 +836,21 @@ class DrumSamplerApp(Gtk.Window):
             percentages = [float(bpm.strip()) for bpm in self.dynamic_bpm_entry.get_text().split(',')]
             self.dynamic_bpm_list = [self.absolute_bpm * (p / 100) for p in percentages]
 
-    def get_next_bpm(self):
-        if not self.dynamic_bpm_list:
-            return self.absolute_bpm
-        current_bpm = self.dynamic_bpm_list[self.current_bpm_index]
-        return current_bpm
-
-    def advance_bpm(self):
-        if self.dynamic_bpm_list:
-            self.current_bpm_index = (self.current_bpm_index + 1) % len(self.dynamic_bpm_list)
-
+    def current_tempo_map(self):
+        """TempoMap of the BPM and dynamic BPM settings, rebuilt only when they change."""
+        key = (self.absolute_bpm, tuple(self.dynamic_bpm_list), self.steps_per_bpm, self.ramp_bpm)
+        cached = self.tempo_map_cache
+        if cached is None or cached[0] != key:
+            bpms = [bpm for bpm in self.dynamic_bpm_list if bpm > 0] or [self.absolute_bpm]
+            # jedno przypisanie krotki, bo wątek audio czyta ją równolegle
+            cached = (key, TempoMap.from_list(bpms, self.steps_per_bpm, self.ramp_bpm))
+            self.tempo_map_cache = cached
+        return cached[1]
+
+    def on_ramp_bpm_toggled(self, button):
+        self.ramp_bpm = button.get_active()
+
+    @pattern_edit
     def generate_custom_pattern(self, widget):
         genre = self.custom_genre_entry.get_text() or "Generic"
         progression = self.progression_combo.get_active_text()
@@ -869,6 +937,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.update_buttons()
 
+    @pattern_edit
     def on_pattern_length_changed(self, spinbutton):
         new_length = int(spinbutton.get_value())
         current_length = len(self.patterns[self.instruments[0]])
@@ -910,6 +979,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.grid.show_all()
 
+    @pattern_edit
     def randomize_instruments(self, widget):
         probability = self.randomize_probability_spin.get_value() / 100
         pattern_length = int(self.length_spinbutton.get_value())
@@ -921,6 +991,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.update_buttons()
 
+    @pattern_edit
     def autofill_pattern(self):
         pattern_length = int(self.length_spinbutton.get_value())
         genre = self.custom_genre_entry.get_text() or self.preset_genre_combo.get_active_text() or "Generic"
@@ -945,6 +1016,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.update_buttons()
 
+    @pattern_edit
     def apply_preset(self, widget):
         preset = self.preset_combo.get_active_text()
         if preset == "Basic Techno":
@@ -1012,6 +1084,7 @@ class DrumSamplerApp(Gtk.Window):
     def on_effect_changed(self, slider, instrument, effect):
         value = slider.get_value()
         self.effects[instrument][effect] = value
+        self.render_cache.invalidate(instrument)
 
     def reset_effect(self, button, slider, instrument, effect):
         slider.set_value(0)
@@ -1032,95 +1105,14 @@ class DrumSamplerApp(Gtk.Window):
                     self.effect_sliders[instrument][effect].set_value(0)
 
     def apply_effects(self, sound, instrument):
-        sound = self.apply_adsr_to_sound(sound, instrument)
-        effects = self.effects[instrument]
-        sound_array = pygame.sndarray.array(sound)
-        sample_width = sound_array.dtype.itemsize
-        channels = 1 if sound_array.ndim == 1 else 2
-
-        audio_segment = AudioSegment(
-            sound_array.tobytes(),
-            frame_rate=44100,
-            sample_width=sample_width,
-            channels=channels
-        )
-
-        if effects['volume'] != 0:
-            audio_segment = audio_segment + (effects['volume'] * 10)
-
-        if effects['pitch'] != 0:
-            new_rate = int(audio_segment.frame_rate * (2 ** (effects['pitch'] / 12)))
-            audio_segment = audio_segment._spawn(audio_segment.raw_data, overrides={'frame_rate': new_rate})
-            audio_segment = audio_segment.set_frame_rate(44100)
-
-        if effects['echo'] > 0:
-            delay_ms = int(200 * effects['echo'])
-            echo_segment = audio_segment - 10
-            audio_segment = audio_segment.overlay(echo_segment, position=delay_ms)
-
-        if effects['reverb'] > 0:
-            reverb_amount = effects['reverb'] * 300
-            audio_segment = audio_segment.fade_in(50).fade_out(int(reverb_amount))
-
-        if effects['pan'] != 0:
-            audio_segment = audio_segment.pan(effects['pan'])
-
-        audio_segment = normalize(audio_segment)
+        return array_to_sound(self.effects_array(sound, instrument))
 
-        samples = np.array(audio_segment.get_array_of_samples())
-        if channels == 2:
-            samples = samples.reshape((-1, 2))
-
-        return pygame.sndarray.make_sound(samples)
-
-    def apply_adsr_to_sound(self, sound, instrument):
-        sound_array = pygame.sndarray.array(sound)
-        sample_rate = 44100
-        total_samples = len(sound_array)
-        adsr = self.current_adsr[instrument]
-        is_stereo = sound_array.ndim == 2
-
-        if is_stereo:
-            channels = sound_array.shape[1]
-        else:
-            channels = 1
-            sound_array = sound_array.reshape(-1, 1)
-
-        attack_samples = int(adsr['attack'] * sample_rate)
-        decay_samples = int(adsr['decay'] * sample_rate)
-        release_samples = int(adsr['release'] * sample_rate)
-        sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        if sustain_samples < 0:
-            excess = -sustain_samples
-            total_adsr = attack_samples + decay_samples + release_samples
-            scale_factor = (total_samples - excess) / total_adsr
-            attack_samples = int(attack_samples * scale_factor)
-            decay_samples = int(decay_samples * scale_factor)
-            release_samples = int(release_samples * scale_factor)
-            sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        envelope = np.zeros(total_samples, dtype=np.float32)
-        if attack_samples > 0:
-            envelope[:attack_samples] = np.linspace(0, 1, min(attack_samples, total_samples))
-        if decay_samples > 0 and attack_samples < total_samples:
-            decay_end = min(attack_samples + decay_samples, total_samples)
-            envelope[attack_samples:decay_end] = np.linspace(1, adsr['sustain'], decay_end - attack_samples)
-        if sustain_samples > 0 and attack_samples + decay_samples < total_samples:
-            sustain_end = min(attack_samples + decay_samples + sustain_samples, total_samples)
-            envelope[attack_samples + decay_samples:sustain_end] = adsr['sustain']
-        if release_samples > 0 and total_samples - release_samples > 0:
-            release_start = max(0, total_samples - release_samples)
-            envelope[release_start:] = np.linspace(adsr['sustain'], 0, total_samples - release_start)
-
-        if is_stereo:
-            sound_array[:, 0] = sound_array[:, 0] * envelope
-            sound_array[:, 1] = sound_array[:, 1] * envelope
-        else:
-            sound_array[:, 0] = sound_array[:, 0] * envelope
-            sound_array = np.hstack((sound_array, sound_array))
-
-        return pygame.sndarray.make_sound(sound_array.astype(np.int16))
+    def effects_array(self, sound, instrument, sample_rate=None):
+        # Sound ma częstotliwość miksera, chyba że wywołujący poda inną
+        sample_rate = sample_rate or mixer_format()[0]
+        buffer = to_float32(pygame.sndarray.array(sound))
+        apply_adsr(buffer, self.current_adsr[instrument], sample_rate, 'linear')
+        return apply_effect_chain(buffer, self.effects[instrument], sample_rate, VARIANTS[VARIANT]['effect_style'])
 
     def apply_auto_fx_for_style(self, style):
         fx_settings = {
@@ -1153,45 +1145,44 @@ class DrumSamplerApp(Gtk.Window):
         self.groove_type = 'simple'
         self.groove_combo.set_active(0)
 
-    def apply_groove_effects(self, sound, instrument, step):
+    def apply_groove_effects(self, instrument, step, offsets=(0.0,)):
+        """Zwraca trafienia (offset, sample, głośność) kroku z nałożonym groovem."""
         if self.groove_type == "simple":
-            return self.apply_simple_groove(sound, instrument, step)
+            return self.apply_simple_groove(instrument, step, offsets)
         elif self.groove_type == "stretch":
-            return self.apply_stretch_groove(sound, instrument, step)
+            return self.apply_stretch_groove(instrument, step, offsets)
         elif self.groove_type == "echoes":
-            return self.apply_echoes_groove(sound, instrument, step)
+            return self.apply_echoes_groove(instrument, step, offsets)
         elif self.groove_type == "bouncy":
-            return self.apply_bouncy_groove(sound, instrument, step)
+            return self.apply_bouncy_groove(instrument, step, offsets)
         elif self.groove_type == "relax":
-            return self.apply_relax_groove(sound, instrument, step)
-        return sound
+            return self.apply_relax_groove(instrument, step, offsets)
+        return [(offset, instrument, 1.0) for offset in offsets]
 
-    def apply_simple_groove(self, sound, instrument, step):
+    def apply_simple_groove(self, instrument, step, offsets):
         repeat_chance = random.randint(1, 3)
-        if repeat_chance == 2:
-            sound.play()
-        return sound
+        gain = 2.0 if repeat_chance == 2 else 1.0
+        return [(offset, instrument, gain) for offset in offsets]
 
-    def apply_stretch_groove(self, sound, instrument, step):
-        stretched_bpm = self.get_next_bpm() * random.uniform(0.9, 1.1)
-        self.advance_bpm()
-        return sound
+    def apply_stretch_groove(self, instrument, step, offsets):
+        if self.engine is not None:
+            self.engine.skip_tempo(self.steps_per_bpm)
+        return [(offset, instrument, 1.0) for offset in offsets]
 
-    def apply_echoes_groove(self, sound, instrument, step):
-        return self.apply_effects_with_echo(sound, instrument)
+    def apply_echoes_groove(self, instrument, step, offsets):
+        return self.apply_effects_with_echo(instrument, offsets)
 
-    def apply_bouncy_groove(self, sound, instrument, step):
+    def apply_bouncy_groove(self, instrument, step, offsets):
         volume_factor = random.choice([0.8, 1.2])
-        sound.set_volume(volume_factor)
-        return sound
+        return [(offset, instrument, volume_factor) for offset in offsets]
 
-    def apply_relax_groove(self, sound, instrument, step):
-        return self.apply_effects_with_echo(sound, instrument)
+    def apply_relax_groove(self, instrument, step, offsets):
+        return self.apply_effects_with_echo(instrument, offsets)
 
-    def apply_effects_with_echo(self, sound, instrument):
-        effect_sound = pygame.mixer.Sound(self.samples[instrument])
-        effect_sound.play(maxtime=500)
-        return sound
+    def apply_effects_with_echo(self, instrument, offsets):
+        events = [(offset, instrument, 1.0) for offset in offsets]
+        events.append((offsets[0], (instrument, 'echo'), 1.0))
+        return events
 
     def advanced_generate_drum_track(self, audio_path, tempo, beat_frames):
         y, sr = librosa.load(audio_path, sr=22050)
@@ -1270,89 +1261,51 @@ class DrumSamplerApp(Gtk.Window):
             file_dialog.destroy()
 
     def detect_existing_percussion(self, y, sr, beat_frames):
-        onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-        onsets = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr)
-        onset_times = librosa.frames_to_time(onsets, sr=sr)
-
-        percussion_events = {'Stopa': [], 'Werbel': [], 'Talerz': [], 'TomTom': []}
-        for onset_time in onset_times:
-            start_sample = int(max(0, onset_time * sr - 0.05 * sr))
-            end_sample = int(min(len(y), onset_time * sr + 0.05 * sr))
-            segment = y[start_sample:end_sample]
-            freqs = np.abs(librosa.stft(segment))
-            mean_freq = np.mean(np.argmax(freqs, axis=0))
-
-            if mean_freq < 100:
-                percussion_events['Stopa'].append(onset_time)
-            elif 100 <= mean_freq < 500:
-                percussion_events['Werbel'].append(onset_time) if random.random() < 0.7 else percussion_events['TomTom'].append(onset_time)
-            else:
-                percussion_events['Talerz'].append(onset_time)
-
-        return percussion_events
+        return percussion.detect_percussion_events(y, sr)
 
     def enhance_percussion_track(self, percussion_events, tempo, total_duration, audio_path, y, sr):
         beats_per_second = tempo / 60
         steps_per_beat = 4
         total_steps = int(total_duration * beats_per_second * steps_per_beat)
-        percussion_track = {inst: [{'active': False, 'rhythm_type': 'single'} for _ in range(total_steps)] for inst in self.instruments}
+        percussion_track = Pattern(self.instruments, total_steps, self.rhythm_types)
 
         for inst, times in percussion_events.items():
-            for t in times:
-                step = int(t * beats_per_second * steps_per_beat)
-                if step < total_steps:
-                    percussion_track[inst][step]['active'] = True
-                    percussion_track[inst][step]['rhythm_type'] = 'single'
+            percussion_track.set_hits(inst, (np.asarray(times) * beats_per_second * steps_per_beat).astype(int))
 
         if not audio_path or not os.path.exists(audio_path):
             raise ValueError("Brak poprawnej ścieżki audio (audio_path)")
 
         beats_per_measure = 4
-        measures = total_steps // (beats_per_measure * steps_per_beat)
+        steps_per_measure = beats_per_measure * steps_per_beat
+        measures = total_steps // steps_per_measure
         samples_per_measure = int(sr * beats_per_measure / beats_per_second)
 
         rms = librosa.feature.rms(y=y, frame_length=samples_per_measure, hop_length=samples_per_measure)
         onset_env = librosa.onset.onset_strength(y=y, sr=sr, hop_length=samples_per_measure)
-        onset_density = [np.sum(onset_env[i:i+1]) for i in range(0, len(onset_env), 1)]
 
         rms_normalized = (rms[0] - np.min(rms)) / (np.max(rms) - np.min(rms) + 1e-6)
-        onset_normalized = [(d - min(onset_density)) / (max(onset_density) - min(onset_density) + 1e-6) for d in onset_density]
+        onset_normalized = (onset_env - np.min(onset_env)) / (np.max(onset_env) - np.min(onset_env) + 1e-6)
+
+        measure = np.arange(measures)
+        rms_factor = rms_normalized[np.minimum(measure, len(rms_normalized) - 1)]
+        onset_factor = onset_normalized[np.minimum(measure, len(onset_normalized) - 1)]
+        complexity_factor = np.minimum(0.7, (rms_factor + onset_factor) / 2)
+        measure_start = measure * steps_per_measure
+
+        percussion_track.set_hits('Stopa', measure_start, only_empty=True)
+        snare = np.random.random(measures) < 0.5 * (1 + complexity_factor)
+        percussion_track.set_hits('Werbel', (measure_start + 2 * steps_per_beat)[snare], only_empty=True)
 
         style = self.preset_genre_combo.get_active_text() or "Techno"
-        for measure in range(measures):
-            measure_start = measure * beats_per_measure * steps_per_beat
-            measure_end = min((measure + 1) * beats_per_measure * steps_per_beat, total_steps)
-
-            rms_factor = rms_normalized[min(measure, len(rms_normalized) - 1)]
-            onset_factor = onset_normalized[min(measure, len(onset_normalized) - 1)]
-            complexity_factor = min(0.7, (rms_factor + onset_factor) / 2)
-
-            for step in range(measure_start, measure_end, steps_per_beat):
-                beat_in_measure = (step % (beats_per_measure * steps_per_beat)) // steps_per_beat
-                if beat_in_measure == 0 and not percussion_track['Stopa'][step]['active']:
-                    percussion_track['Stopa'][step]['active'] = True
-                    percussion_track['Stopa'][step]['rhythm_type'] = 'single'
-                if beat_in_measure == 2 and not percussion_track['Werbel'][step]['active'] and random.random() < 0.5 * (1 + complexity_factor):
-                    percussion_track['Werbel'][step]['active'] = True
-                    percussion_track['Werbel'][step]['rhythm_type'] = 'single'
-
-            if complexity_factor > 0.3:
-                for step in range(measure_start, measure_end, steps_per_beat * 2):
-                    offbeat = step % (steps_per_beat * 2) != 0
-                    if style == "Techno":
-                        if measure % 4 == 0 and random.random() < complexity_factor * 0.08 and not percussion_track['Talerz'][step]['active']:
-                            percussion_track['Talerz'][step]['active'] = True
-                            percussion_track['Talerz'][step]['rhythm_type'] = 'double'
-                        if measure % 8 == 7 and random.random() < complexity_factor * 0.1 and not percussion_track['TomTom'][step]['active']:
-                            percussion_track['TomTom'][step]['active'] = True
-                            percussion_track['TomTom'][step]['rhythm_type'] = 'accent'
-                    elif style == "House":
-                        if measure % 4 == 2 and random.random() < complexity_factor * 0.08 and not percussion_track['Talerz'][step]['active']:
-                            percussion_track['Talerz'][step]['active'] = True
-                            percussion_track['Talerz'][step]['rhythm_type'] = 'swing'
-                        if measure % 8 == 4 and random.random() < complexity_factor * 0.05 and not percussion_track['Stopa'][step]['active']:
-                            percussion_track['Stopa'][step]['active'] = True
-                            percussion_track['Stopa'][step]['rhythm_type'] = 'single'
+        fills = {
+            "Techno": [('Talerz', 'double', 4, 0, 0.08), ('TomTom', 'accent', 8, 7, 0.1)],
+            "House": [('Talerz', 'swing', 4, 2, 0.08), ('Stopa', 'single', 8, 4, 0.05)],
+        }.get(style, [])
+        for beat in (0, 2):
+            for inst, rhythm_type, every, which, chance in fills:
+                hit = ((complexity_factor > 0.3) & (measure % every == which)
+                       & (np.random.random(measures) < complexity_factor * chance))
+                percussion_track.set_hits(inst, (measure_start + beat * steps_per_beat)[hit], rhythm_type, only_empty=True)
 
         return percussion_track
 
@@ -1360,31 +1313,12 @@ class DrumSamplerApp(Gtk.Window):
         beats_per_second = tempo / 60
         steps_per_beat = 4
         step_duration = int(sr / (beats_per_second * steps_per_beat))
-        total_length = len(percussion_track['Stopa'])
-        audio = np.zeros(total_length * step_duration, dtype=np.float32)
+        pool = SamplePool(sr, fallback=self.decode_with_pygame)
+        note_lengths = {name: max(int(step_duration * 2 * rhythm['speed'] / rhythm['notes']), int(sr / beats_per_second / 2))
+                        for name, rhythm in self.rhythm_types.items()}
 
-        for inst in self.instruments:
-            for step in range(total_length):
-                step_data = percussion_track[inst][step]
-                if step_data['active']:
-                    rhythm = self.rhythm_types[step_data['rhythm_type']]
-                    sample = pygame.mixer.Sound(self.samples[inst])
-                    sample_array = pygame.sndarray.array(sample)
-                    if sample_array.ndim > 1:
-                        sample_array = sample_array.mean(axis=1)
-
-                    note_duration = max(int(step_duration * 2 * rhythm['speed'] / rhythm['notes']), int(sr / beats_per_second / 2))
-                    for i in range(rhythm['notes']):
-                        start = int(step * step_duration + i * note_duration)
-                        end = min(start + note_duration, len(audio))
-                        if len(sample_array) > note_duration:
-                            sample_array_adj = sample_array[:note_duration]
-                        else:
-                            sample_array_adj = np.pad(sample_array, (0, note_duration - len(sample_array)))
-                        if end <= len(audio):
-                            audio[start:end] += sample_array_adj * 0.5
-                        else:
-                            audio[start:] += sample_array_adj[:len(audio) - start] * 0.5
+        audio = percussion.mix_percussion_track(percussion_track, lambda inst, frames: pool.note(self.samples[inst], frames),
+                                                self.rhythm_types, note_lengths, step_duration)
 
         original_rms = np.sqrt(np.mean(original_audio**2))
         percussion_rms = np.sqrt(np.mean(audio**2))
@@ -1393,6 +1327,9 @@ class DrumSamplerApp(Gtk.Window):
 
         return audio
 
+    def decode_with_pygame(self, path):
+        return pygame.sndarray.array(pygame.mixer.Sound(path)), pygame.mixer.get_init()[0]
+
     def save_generated_tracks(self, audio_path, percussion_track, original_audio, sr, percussion_audio):
         max_length = len(original_audio)
         percussion_audio = librosa.util.fix_length(percussion_audio, size=max_length)
@@ -1438,6 +1375,7 @@ class DrumSamplerApp(Gtk.Window):
             file_path = os.path.join(sample_dir, f"{instrument}.wav")
             if os.path.isfile(file_path):
                 self.samples[instrument] = file_path
+                self.render_cache.invalidate(instrument)
                 print(f"Załadowano sample dla {instrument}: {file_path}")
 
     def toggle_fullscreen(self, button):
@@ -1454,50 +1392,54 @@ class DrumSamplerApp(Gtk.Window):
         if self.loop_playing:
             return
         self.loop_playing = True
-        self.play_thread = threading.Thread(target=self.play_loop)
-        self.play_thread.daemon = True
+        sample_rate, channels = mixer_format()
+        self.engine = PatternEngine(self.play_step_events, self.engine_sample, self.current_tempo_map,
+                                    pattern_length=int(self.length_spinbutton.get_value()),
+                                    sample_rate=sample_rate, channels=channels)
+        self.play_thread = PygameBlockOutput(self.engine)
         self.play_thread.start()
 
-    def play_loop(self):
-        pattern_length = int(self.length_spinbutton.get_value())
-        step_duration = 60 / (self.get_bpm() * 4)
+    def engine_sample(self, key):
+        """Sample z efektami dla instrumentu, (inst, 'echo') to pierwsze 500 ms bez efektów."""
+        instrument, variant = key if isinstance(key, tuple) else (key, None)
+        if instrument not in self.samples:
+            return None
+        cache_key = render_key(instrument, self.samples[instrument], self.effects[instrument],
+                               self.current_adsr[instrument], variant=variant)
+        return self.render_cache.get_or_render(cache_key, lambda: self.render_engine_sample(instrument, variant),
+                                               keep=self.samples[instrument])
+
+    def render_engine_sample(self, instrument, variant):
+        sound = pygame.mixer.Sound(self.samples[instrument])
+        if variant is None:
+            data = match_channels(self.effects_array(sound, instrument, self.engine.sample_rate), self.engine.channels)
+        else:
+            data = sound_to_array(sound, self.engine.channels)
+        if variant == 'echo':
+            data = data[:int(self.engine.sample_rate * 0.5)]
+        return data
 
-        while self.loop_playing:
-            for step in range(pattern_length):
-                if not self.loop_playing:
-                    break
-                for instrument in self.instruments:
-                    if self.advanced_sequencer_mode:
-                        step_data = self.patterns[instrument][step]
-                        if step_data['active']:
-                            rhythm = self.rhythm_types[step_data['rhythm_type']]
-                            sound = pygame.mixer.Sound(self.samples[instrument])
-                            sound = self.apply_effects(sound, instrument)
-                            sound = self.apply_groove_effects(sound, instrument, step)
-                            for i in range(rhythm['notes']):
-                                if not self.loop_playing:
-                                    break
-                                sound.play()
-                                time.sleep(step_duration * rhythm['speed'] / rhythm['notes'])
-                    else:
-                        if self.patterns[instrument][step]:
-                            sound = pygame.mixer.Sound(self.samples[instrument])
-                            sound = self.apply_effects(sound, instrument)
-                            sound = self.apply_groove_effects(sound, instrument, step)
-                            sound.play()
-                time.sleep(step_duration)
-                if (step + 1) % self.steps_per_bpm == 0:
-                    self.advance_bpm()
+    def play_step_events(self, step):
+        events = []
+        for instrument in self.instruments:
+            if self.advanced_sequencer_mode:
+                step_data = self.patterns[instrument][step]
+                if step_data['active']:
+                    rhythm = self.rhythm_types[step_data['rhythm_type']]
+                    offsets = rhythm_offsets(rhythm, VARIANTS[VARIANT]['spacing'])
+                    events.extend(self.apply_groove_effects(instrument, step, offsets))
+            else:
+                if self.patterns[instrument][step]:
+                    events.extend(self.apply_groove_effects(instrument, step))
+        return events
 
     def stop_pattern(self, widget):
         self.loop_playing = False
         if self.play_thread:
-            self.play_thread.join()
+            self.play_thread.stop()
             self.play_thread = None
 
-    def get_bpm(self):
-        return self.get_next_bpm()
-
+    @pattern_edit
     def randomize_pattern(self, widget):
         pattern_length = int(self.length_spinbutton.get_value())
         for instrument in self.instruments:
@@ -1574,6 +1516,7 @@ class DrumSamplerApp(Gtk.Window):
             with open(dialog.get_filename(), 'r') as f:
                 project_data = json.load(f)
                 self.patterns = project_data.get('patterns', self.patterns)
+                self.history.clear()
                 self.samples = project_data.get('samples', self.samples)
                 self.effects = project_data.get('effects', self.effects)
                 self.absolute_bpm = project_data.get('bpm', self.absolute_bpm)
@@ -1602,29 +1545,12 @@ class DrumSamplerApp(Gtk.Window):
 
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
-            midi = MIDIFile(1)
-            track = 0
-            time = 0
-            midi.addTrackName(track, time, "Drum Pattern")
-            midi.addTempo(track, time, self.absolute_bpm)
-
             pattern_length = int(self.length_spinbutton.get_value())
-            beat_duration = 1
-
-            for instrument in self.instruments:
-                for step in range(pattern_length):
-                    if self.patterns[instrument][step]:
-                        midi.addNote(
-                            track,
-                            9,
-                            self.midi_notes[instrument],
-                            time + step * beat_duration,
-                            beat_duration,
-                            100
-                        )
-
-            with open(dialog.get_filename(), 'wb') as f:
-                midi.writeFile(f)
+            velocity, accent_velocity = midi_velocities(VARIANT, self.effects, self.instruments)
+            midi = pattern_midi(self.patterns, self.instruments, self.midi_notes, pattern_length, self.current_tempo_map(),
+                                self.advanced_sequencer_mode, self.rhythm_types, VARIANTS[VARIANT]['spacing'],
+                                velocity, accent_velocity)
+            write_midi_file(midi, dialog.get_filename())
         dialog.destroy()
 
     def export_advanced_midi(self, widget):
@@ -1638,33 +1564,12 @@ class DrumSamplerApp(Gtk.Window):
 
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
-            midi = MIDIFile(1)
-            track = 0
-            time = 0
-            midi.addTrackName(track, time, "Advanced Drum Pattern")
-            midi.addTempo(track, time, self.absolute_bpm)
-
             pattern_length = int(self.length_spinbutton.get_value())
-            beat_duration = 1
-
-            for instrument in self.instruments:
-                for step in range(pattern_length):
-                    step_data = self.patterns[instrument][step]
-                    if step_data['active']:
-                        rhythm = self.rhythm_types[step_data['rhythm_type']]
-                        note_duration = beat_duration * rhythm['speed'] / rhythm['notes']
-                        for i in range(rhythm['notes']):
-                            midi.addNote(
-                                track,
-                                9,
-                                self.midi_notes[instrument],
-                                time + step * beat_duration + i * note_duration,
-                                note_duration,
-                                100
-                            )
-
-            with open(dialog.get_filename(), 'wb') as f:
-                midi.writeFile(f)
+            velocity, accent_velocity = midi_velocities(VARIANT, self.effects, self.instruments)
+            midi = pattern_midi(self.patterns, self.instruments, self.midi_notes, pattern_length, self.current_tempo_map(),
+                                True, self.rhythm_types, VARIANTS[VARIANT]['spacing'],
+                                velocity, accent_velocity)
+            write_midi_file(midi, dialog.get_filename())
         dialog.destroy()
 
     def autolevel_samples(self, widget):
@@ -1689,30 +1594,9 @@ class DrumSamplerApp(Gtk.Window):
     def generate_default_samples(self):
         sample_rate = 44100
         duration = 0.5
-        t = np.linspace(0, duration, int(sample_rate * duration), False)
 
         for instrument in self.instruments:
-            if instrument == 'Talerz':
-                noise = np.random.normal(0, 0.5, len(t))
-                envelope = np.exp(-5 * t / duration)
-                sample = noise * envelope
-            elif instrument == 'Stopa':
-                freq = 60
-                sine = np.sin(2 * np.pi * freq * t)
-                envelope = np.exp(-10 * t / duration)
-                sample = sine * envelope
-            elif instrument == 'Werbel':
-                noise = np.random.normal(0, 0.5, len(t))
-                sine = np.sin(2 * np.pi * 200 * t)
-                envelope = np.exp(-15 * t / duration)
-                sample = (noise * 0.5 + sine * 0.5) * envelope
-            elif instrument == 'TomTom':
-                freq = 100
-                sine = np.sin(2 * np.pi * freq * t)
-                envelope = np.exp(-8 * t / duration)
-                sample = sine * envelope
-
-            sample = np.int16(sample / np.max(np.abs(sample)) * 32767)
+            sample = np.int16(default_sample(instrument, sample_rate, duration, kit='sampler2') * 32767)
             temp_wav = f"temp_{instrument}.wav"
             sf.write(temp_wav, sample, sample_rate)
             self.samples[instrument] = temp_wav
@@ -1721,6 +1605,7 @@ class DrumSamplerApp(Gtk.Window):
         current_value = self.current_adsr[instrument][param]
         new_value = max(0, min(1, current_value + delta))
         self.current_adsr[instrument][param] = new_value
+        self.render_cache.invalidate(instrument)
         self.adsr_entries[instrument][param].set_text(f"{new_value:.2f}")
 
     def on_adsr_entry_changed(self, entry, instrument, param):
@@ -1752,6 +1637,7 @@ class DrumSamplerApp(Gtk.Window):
     def swap_sample(self, button, instrument):
         if self.selected_sample and os.path.splitext(self.selected_sample)[1].lower() == '.wav':
             self.samples[instrument] = self.selected_sample
+            self.render_cache.invalidate(instrument)
             print(f"Przypisano próbkę {self.selected_sample} do instrumentu {instrument}")
             if self.preview_active[instrument]:
                 sound = pygame.mixer.Sound(self.samples[instrument])
@@ -1,22 +1,37 @@
 import gi
 import random
-import time
 import threading
+from drumpatterns_core.startup import STARTUP
 import pygame
+STARTUP.mark("import pygame")
 import platform
 import json
 import os
-from midiutil import MIDIFile
-from pydub import AudioSegment
-from pydub.effects import normalize
 import numpy as np
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk
+STARTUP.mark("import Gtk")
 import warnings
 warnings.filterwarnings("ignore", category=SyntaxWarning)
-import sqlite3
-import librosa
 import soundfile as sf
+from drumpatterns_core import Pattern, PatternEngine
+from drumpatterns_core.cache import PreviewCache, RenderCache, render_key
+from drumpatterns_core.dsp import apply_effect_chain, match_channels, to_float32
+from drumpatterns_core.events import EventCompiler
+from drumpatterns_core.history import EditHistory, pattern_edit
+from drumpatterns_core.incremental import IncrementalRenderer
+from drumpatterns_core.midi import pattern_midi, write_midi_file
+from drumpatterns_core.offline import add_drums_to_file
+from drumpatterns_core.output import PygameBlockOutput, array_to_sound, mixer_format
+from drumpatterns_core.synth import apply_adsr, parametric_sample
+from drumpatterns_core.tempo import TempoMap
+from drumpatterns_core.variants import VARIANTS, midi_velocities
+STARTUP.mark("import soundfile, drumpatterns_core")
+
+VARIANT = 'sampler3'  # profil zgodności, patrz drumpatterns_core.variants
+PREVIEW_CACHE_MB = 64  # rozmiar cache zdekodowanych plików przeglądarki
+PREVIEW_PREFETCH = 4  # ile kolejnych wierszy dekodować z wyprzedzeniem
+HISTORY_BUDGET_MB = 16  # pamięć historii cofania (MB)
 
 class DrumSamplerApp(Gtk.Window):
     def __init__(self):
@@ -26,7 +41,11 @@ class DrumSamplerApp(Gtk.Window):
         self.is_fullscreen = False
         self.scale_factor = 1.0
 
-        pygame.mixer.init()
+        self.render_cache = RenderCache()
+        # edycja parametrów/ADSR renderuje ponownie tylko zmieniony instrument, w tle
+        self.sample_renderer = IncrementalRenderer(self.render_parametric_sample, self.publish_parametric_sample,
+                                                   GLib.idle_add)
+        self.preview_cache = PreviewCache(self.decode_preview, PREVIEW_CACHE_MB * 1024 * 1024)
 
         # Main container
         scroll_window = Gtk.ScrolledWindow()
@@ -49,6 +68,9 @@ class DrumSamplerApp(Gtk.Window):
             for inst in self.instruments
         }
         self.patterns = self.simple_patterns
+        self.history = EditHistory(HISTORY_BUDGET_MB * 1024 * 1024,
+                                   set_length=lambda length: self.length_spinbutton.set_value(length),
+                                   on_change=lambda: self.event_compiler.invalidate())
         self.base_colors = {'Talerz': '#FF5555', 'Stopa': '#55FF55', 'Werbel': '#5555FF', 'TomTom': '#FFAA00'}
         self.midi_notes = {'Talerz': 49, 'Stopa': 36, 'Werbel': 38, 'TomTom': 45}
         self.buttons = {}
@@ -62,6 +84,7 @@ class DrumSamplerApp(Gtk.Window):
             'swing': {'notes': 2, 'speed': 0.5, 'swing': 0.2},
             'accent': {'notes': 1, 'speed': 1.0, 'swing': 0.0}
         }
+        self.event_compiler = EventCompiler(self.rhythm_types, VARIANTS[VARIANT]['spacing'])
         # Sample generation parameters
         self.sample_params = {
             'Talerz': {'waveform': 'sine', 'frequency': 8000, 'amplitude': 0.8, 'duration': 1.0, 'attack_curve': 'exponential'},
@@ -80,11 +103,6 @@ class DrumSamplerApp(Gtk.Window):
         self.preview_active = {inst: False for inst in self.instruments}
         self.swap_buttons = {}
 
-        # Load or generate samples
-        self.load_samples_from_directory()
-        if not self.samples:
-            self.generate_parametric_samples()
-
         # UI setup
         self.create_toolbar()
         self.grid = Gtk.Grid()
@@ -117,12 +135,15 @@ class DrumSamplerApp(Gtk.Window):
 
         self.loop_playing = False
         self.play_thread = None
+        self.engine = None
         self.dynamic_bpm_list = []
-        self.current_bpm_index = 0
         self.steps_per_bpm = 4
+        self.ramp_bpm = False
+        self.tempo_map_cache = None
 
         # Connect scaling
         self.connect("size-allocate", self.scale_interface)
+        self.connect("key-press-event", self.on_key_press)
 
         self.effect_sliders = {}
         self.groove_type = 'simple'
@@ -142,92 +163,48 @@ class DrumSamplerApp(Gtk.Window):
         self.create_effect_controls()
         self.create_sample_manipulation_area()
 
+        # Urządzenie audio (i sample) otwierane w tle dopiero po pokazaniu okna
+        self.main_box.set_sensitive(False)
+        GLib.idle_add(self.start_audio)
+        STARTUP.mark("build window")
+
+    def start_audio(self):
+        STARTUP.mark("show window")
+        threading.Thread(target=self.open_audio, daemon=True).start()
+        return False
+
+    def open_audio(self):
+        with STARTUP.phase("audio device (thread)"):
+            pygame.mixer.init()
+        with STARTUP.phase("load/generate samples (thread)"):
+            self.load_samples_from_directory()
+            if not self.samples:
+                self.generate_parametric_samples()
+        GLib.idle_add(self.on_audio_ready)
+
+    def on_audio_ready(self):
+        self.main_box.set_sensitive(True)
+        STARTUP.mark("audio ready")
+        STARTUP.report()
+        return False
+
     # The following methods are unchanged from the provided drumpatterns_sampler.py
     def generate_parametric_samples(self):
-        sample_rate = 44100
+        self.render_cache.invalidate()
         for inst in self.instruments:
-            params = self.sample_params[inst]
-            duration = params['duration']
-            t = np.linspace(0, duration, int(sample_rate * duration), False)
-
-            # Generate waveform based on type
-            if params['waveform'] == 'sine':
-                signal = params['amplitude'] * np.sin(2 * np.pi * params['frequency'] * t)
-            elif params['waveform'] == 'square':
-                signal = params['amplitude'] * np.sign(np.sin(2 * np.pi * params['frequency'] * t))
-            elif params['waveform'] == 'sawtooth':
-                signal = params['amplitude'] * (2 * (t * params['frequency'] - np.floor(0.5 + t * params['frequency'])))
-            elif params['waveform'] == 'noise':
-                signal = params['amplitude'] * np.random.normal(0, 1, len(t))
-            else:
-                signal = np.zeros(len(t))
-
-            # Apply ADSR envelope with curve
-            signal = self.apply_adsr_to_signal(signal, inst, sample_rate)
-            
-            # Normalize and convert to stereo
-            signal = normalize(AudioSegment(
-                (signal * 32767).astype(np.int16).tobytes(),
-                frame_rate=sample_rate,
-                sample_width=2,
-                channels=1
-            ))
-            signal = np.array(signal.get_array_of_samples()).reshape(-1, 1)
-            signal = np.hstack((signal, signal))  # Stereo
-            self.samples[inst] = pygame.sndarray.make_sound(signal.astype(np.int16))
-
-    def apply_adsr_to_signal(self, signal, instrument, sample_rate):
-        adsr = self.current_adsr[instrument]
-        total_samples = len(signal)
-        attack_samples = int(adsr['attack'] * sample_rate)
-        decay_samples = int(adsr['decay'] * sample_rate)
-        release_samples = int(adsr['release'] * sample_rate)
-        sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        if sustain_samples < 0:
-            excess = -sustain_samples
-            total_adsr = attack_samples + decay_samples + release_samples
-            scale_factor = (total_samples - excess) / total_adsr
-            attack_samples = int(attack_samples * scale_factor)
-            decay_samples = int(decay_samples * scale_factor)
-            release_samples = int(release_samples * scale_factor)
-            sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        envelope = np.zeros(total_samples, dtype=np.float32)
-        curve_type = self.sample_params[instrument]['attack_curve']
-
-        # Apply curved envelopes
-        if attack_samples > 0:
-            if curve_type == 'exponential':
-                envelope[:attack_samples] = np.power(np.linspace(0, 1, attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[:attack_samples] = np.log1p(np.linspace(0, 9, attack_samples)) / np.log1p(9)
-            else:  # linear
-                envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
-
-        if decay_samples > 0 and attack_samples < total_samples:
-            decay_end = min(attack_samples + decay_samples, total_samples)
-            if curve_type == 'exponential':
-                envelope[attack_samples:decay_end] = np.power(np.linspace(1, adsr['sustain'], decay_end - attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[attack_samples:decay_end] = adsr['sustain'] + (1 - adsr['sustain']) * np.log1p(np.linspace(9, 0, decay_end - attack_samples)) / np.log1p(9)
-            else:
-                envelope[attack_samples:decay_end] = np.linspace(1, adsr['sustain'], decay_end - attack_samples)
-
-        if sustain_samples > 0 and attack_samples + decay_samples < total_samples:
-            sustain_end = min(attack_samples + decay_samples + sustain_samples, total_samples)
-            envelope[attack_samples + decay_samples:sustain_end] = adsr['sustain']
-
-        if release_samples > 0 and total_samples - release_samples > 0:
-            release_start = max(0, total_samples - release_samples)
-            if curve_type == 'exponential':
-                envelope[release_start:] = adsr['sustain'] * np.power(np.linspace(1, 0, total_samples - release_start), 2)
-            elif curve_type == 'logarithmic':
-                envelope[release_start:] = adsr['sustain'] * np.log1p(np.linspace(9, 0, total_samples - release_start)) / np.log1p(9)
-            else:
-                envelope[release_start:] = np.linspace(adsr['sustain'], 0, total_samples - release_start)
+            signal = parametric_sample(self.sample_params[inst], self.current_adsr[inst], 44100)
+            self.samples[inst] = array_to_sound(match_channels(signal.reshape(-1, 1), 2))
 
-        return signal * envelope
+    def render_parametric_sample(self, instrument):
+        signal = parametric_sample(self.sample_params[instrument], self.current_adsr[instrument], 44100)
+        return signal, array_to_sound(match_channels(signal.reshape(-1, 1), 2))
+
+    def publish_parametric_sample(self, instrument, rendered):
+        signal, sound = rendered
+        self.samples[instrument] = sound
+        self.render_cache.invalidate(instrument)
+        if self.preview_active[instrument]:
+            sound.play()
 
     def create_sample_manipulation_area(self):
         sample_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=int(10 * self.scale_factor))
@@ -459,9 +436,7 @@ class DrumSamplerApp(Gtk.Window):
                 self.sample_params[instrument][param] = float(widget.get_text())
             elif param == 'attack_curve':
                 self.sample_params[instrument][param] = widget.get_active_text()
-            self.generate_parametric_samples()
-            if self.preview_active[instrument]:
-                self.samples[instrument].play()
+            self.sample_renderer.mark(instrument)
         except ValueError:
             print(f"Invalid input for {param}")
 
@@ -478,6 +453,8 @@ class DrumSamplerApp(Gtk.Window):
             ("document-open", self.load_project, "Load Project"),
             ("document-export", self.export_to_midi, "Export MIDI"),
             ("document-export", self.export_advanced_midi, "Export Advanced MIDI"),
+            ("edit-undo", self.undo_edit, "Undo"),
+            ("edit-redo", self.redo_edit, "Redo"),
             ("view-fullscreen", self.toggle_fullscreen, "Toggle Fullscreen")
         ]
 
@@ -669,6 +646,11 @@ class DrumSamplerApp(Gtk.Window):
         apply_button.connect("clicked", self.apply_dynamic_bpm)
         dynamic_bpm_box.pack_start(apply_button, False, False, 0)
 
+        ramp_check = Gtk.CheckButton(label="Ramp")
+        ramp_check.set_tooltip_text("Glide between the dynamic BPM values")
+        ramp_check.connect("toggled", self.on_ramp_bpm_toggled)
+        dynamic_bpm_box.pack_start(ramp_check, False, False, 0)
+
     def create_pattern_controls(self):
         genre_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
         self.main_box.pack_start(genre_box, False, False, 0)
@@ -912,6 +894,7 @@ class DrumSamplerApp(Gtk.Window):
                             if isinstance(subchild, Gtk.Button):
                                 subchild.set_size_request(int(20 * self.scale_factor), int(20 * self.scale_factor))
 
+    @pattern_edit
     def on_button_toggled(self, button, instrument, step):
         if self.advanced_sequencer_mode:
             is_active = button.get_active()
@@ -923,6 +906,27 @@ class DrumSamplerApp(Gtk.Window):
         else:
             self.patterns[instrument][step] = int(button.get_active())
 
+    def undo_edit(self, widget):
+        if self.history.undo() is not None:
+            self.update_buttons()
+
+    def redo_edit(self, widget):
+        if self.history.redo() is not None:
+            self.update_buttons()
+
+    def on_key_press(self, widget, event):
+        # Ctrl+Z cofa, Ctrl+Shift+Z / Ctrl+Y ponawia; pola tekstowe zostają przy swoich skrótach
+        if not event.state & Gdk.ModifierType.CONTROL_MASK or isinstance(self.get_focus(), Gtk.Editable):
+            return False
+        key = Gdk.keyval_to_lower(event.keyval)
+        if key == Gdk.KEY_z and not event.state & Gdk.ModifierType.SHIFT_MASK:
+            self.undo_edit(widget)
+        elif key in (Gdk.KEY_z, Gdk.KEY_y):
+            self.redo_edit(widget)
+        else:
+            return False
+        return True
+
     def update_buttons(self):
         pattern_length = int(self.length_spinbutton.get_value())
         for inst in self.instruments:
@@ -937,6 +941,8 @@ class DrumSamplerApp(Gtk.Window):
                 elif len(self.patterns[inst]) > pattern_length:
                     self.patterns[inst] = self.patterns[inst][:pattern_length]
 
+        # wiersze mogły zmienić długość
+        self.event_compiler.invalidate()
         for inst in self.instruments:
             for i in range(pattern_length):
                 try:
@@ -984,6 +990,7 @@ class DrumSamplerApp(Gtk.Window):
     def on_button_press(self, widget, event, instrument, step):
         self.last_button_pressed = event.button
 
+    @pattern_edit
     def on_scroll(self, widget, event, instrument, step):
         if not self.advanced_sequencer_mode or not self.patterns[instrument][step]['active']:
             return
@@ -1003,6 +1010,8 @@ class DrumSamplerApp(Gtk.Window):
     def on_sequencer_mode_switch(self, switch, gparam):
         self.advanced_sequencer_mode = switch.get_active()
         self.patterns = self.advanced_patterns if self.advanced_sequencer_mode else self.simple_patterns
+        # zapisane zmiany dotyczą wzorca drugiego trybu - cofnięcie nadpisałoby nie ten wzorzec
+        self.history.clear()
         self.update_buttons()
 
     def on_performer_mode_switch(self, switch, gparam):
@@ -1020,17 +1029,8 @@ class DrumSamplerApp(Gtk.Window):
         self.update_dynamic_bpm()
 
     def calculate_pattern_density(self):
-        total_active_steps = 0
-        total_steps = len(self.instruments) * len(self.patterns[self.instruments[0]])
-        if self.advanced_sequencer_mode:
-            for inst in self.instruments:
-                for step in self.patterns[inst]:
-                    if step['active']:
-                        total_active_steps += self.rhythm_types[step['rhythm_type']]['notes']
-        else:
-            for inst in self.instruments:
-                total_active_steps += sum(self.patterns[inst])
-        return total_active_steps / total_steps if total_steps > 0 else 0
+        return Pattern.from_dict(self.patterns, self.instruments, self.advanced_sequencer_mode,
+                                 self.rhythm_types).density()
 
     def matched_bpm(self, widget):
         density = self.calculate_pattern_density()
@@ -1050,7 +1050,6 @@ class DrumSamplerApp(Gtk.Window):
         try:
             percentages = [float(bpm.strip()) for bpm in bpm_string.split(',')]
             self.dynamic_bpm_list = [self.absolute_bpm * (p / 100) for p in percentages]
-            self.current_bpm_index = 0
         except ValueError:
             print("Invalid BPM input.")
 
@@ -1059,16 +1058,21 @@ class DrumSamplerApp(Gtk.Window):
             percentages = [float(bpm.strip()) for bpm in self.dynamic_bpm_entry.get_text().split(',')]
             self.dynamic_bpm_list = [self.absolute_bpm * (p / 100) for p in percentages]
 
-    def get_next_bpm(self):
-        if not self.dynamic_bpm_list:
-            return self.absolute_bpm
-        current_bpm = self.dynamic_bpm_list[self.current_bpm_index]
-        return current_bpm
-
-    def advance_bpm(self):
-        if self.dynamic_bpm_list:
-            self.current_bpm_index = (self.current_bpm_index + 1) % len(self.dynamic_bpm_list)
-
+    def current_tempo_map(self):
+        """TempoMap of the BPM and dynamic BPM settings, rebuilt only when they change."""
+        key = (self.absolute_bpm, tuple(self.dynamic_bpm_list), self.steps_per_bpm, self.ramp_bpm)
+        cached = self.tempo_map_cache
+        if cached is None or cached[0] != key:
+            bpms = [bpm for bpm in self.dynamic_bpm_list if bpm > 0] or [self.absolute_bpm]
+            # jedno przypisanie krotki, bo wątek audio czyta ją równolegle
+            cached = (key, TempoMap.from_list(bpms, self.steps_per_bpm, self.ramp_bpm))
+            self.tempo_map_cache = cached
+        return cached[1]
+
+    def on_ramp_bpm_toggled(self, button):
+        self.ramp_bpm = button.get_active()
+
+    @pattern_edit
     def generate_custom_pattern(self, widget):
         genre = self.custom_genre_entry.get_text() or "Generic"
         progression = self.progression_combo.get_active_text()
@@ -1155,6 +1159,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.update_buttons()
 
+    @pattern_edit
     def on_pattern_length_changed(self, spinbutton):
         new_length = int(spinbutton.get_value())
         current_length = len(self.patterns[self.instruments[0]])
@@ -1196,6 +1201,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.grid.show_all()
 
+    @pattern_edit
     def randomize_instruments(self, widget):
         probability = self.randomize_probability_spin.get_value() / 100
         pattern_length = int(self.length_spinbutton.get_value())
@@ -1207,6 +1213,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.update_buttons()
 
+    @pattern_edit
     def autofill_pattern(self):
         pattern_length = int(self.length_spinbutton.get_value())
         genre = self.custom_genre_entry.get_text() or self.preset_genre_combo.get_active_text() or "Generic"
@@ -1231,6 +1238,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.update_buttons()
 
+    @pattern_edit
     def apply_preset(self, widget):
         preset = self.preset_combo.get_active_text()
         if preset == "Basic Techno":
@@ -1298,6 +1306,7 @@ class DrumSamplerApp(Gtk.Window):
     def on_effect_changed(self, slider, instrument, effect):
         value = slider.get_value()
         self.effects[instrument][effect] = value
+        self.render_cache.invalidate(instrument)
         self.update_effect_colors()
 
     def reset_effect(self, button, slider, instrument, effect):
@@ -1322,133 +1331,27 @@ class DrumSamplerApp(Gtk.Window):
         self.update_effect_colors()
 
     def apply_effects(self, sound, instrument, export=False):
-        sound = self.apply_adsr_to_sound(sound, instrument)
-        effects = self.effects[instrument]
-        sound_array = pygame.sndarray.array(sound)
-        sample_width = sound_array.dtype.itemsize
-        channels = 2 if sound_array.ndim == 2 else 1
-
-        audio_segment = AudioSegment(
-            sound_array.tobytes(),
-            frame_rate=44100,
-            sample_width=sample_width,
-            channels=channels
-        )
-
-        if effects['volume'] != 0:
-            audio_segment = audio_segment + (effects['volume'] * 10)
-
-        if effects['pitch'] != 0:
-            new_rate = int(audio_segment.frame_rate * (2 ** (effects['pitch'] / 12)))
-            audio_segment = audio_segment._spawn(audio_segment.raw_data, overrides={'frame_rate': new_rate})
-            audio_segment = audio_segment.set_frame_rate(44100)
-
-        if effects['echo'] > 0:
-            delay_ms = int(200 * effects['echo'])
-            echo_segment = audio_segment - 10
-            audio_segment = audio_segment.overlay(echo_segment, position=delay_ms)
-
-        if effects['reverb'] > 0:
-            reverb_amount = effects['reverb'] * 300
-            reverb_segment = audio_segment.reverse().fade_in(int(reverb_amount)).reverse()
-            audio_segment = audio_segment.overlay(reverb_segment, position=0)
-
-        if effects['pan'] != 0:
-            audio_segment = audio_segment.pan(effects['pan'])
+        return array_to_sound(self.effects_array(sound, instrument))
 
-        audio_segment = normalize(audio_segment)
-
-        samples = np.array(audio_segment.get_array_of_samples())
-        if channels == 2:
-            samples = samples.reshape((-1, 2))
-
-        return pygame.sndarray.make_sound(samples)
-
-    def apply_adsr_to_sound(self, sound, instrument):
-        sound_array = pygame.sndarray.array(sound)
-        sample_rate = 44100
-        total_samples = len(sound_array)
-        adsr = self.current_adsr[instrument]
-        is_stereo = sound_array.ndim == 2
-        curve_type = self.sample_params[instrument]['attack_curve']
-
-        if is_stereo:
-            channels = sound_array.shape[1]
-        else:
-            channels = 1
-            sound_array = sound_array.reshape(-1, 1)
-
-        attack_samples = int(adsr['attack'] * sample_rate)
-        decay_samples = int(adsr['decay'] * sample_rate)
-        release_samples = int(adsr['release'] * sample_rate)
-        sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        if sustain_samples < 0:
-            excess = -sustain_samples
-            total_adsr = attack_samples + decay_samples + release_samples
-            scale_factor = (total_samples - excess) / total_adsr
-            attack_samples = int(attack_samples * scale_factor)
-            decay_samples = int(decay_samples * scale_factor)
-            release_samples = int(release_samples * scale_factor)
-            sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        envelope = np.zeros(total_samples, dtype=np.float32)
-        curve_type = self.sample_params[instrument]['attack_curve']
-
-        # Apply curved envelopes
-        if attack_samples > 0:
-            if curve_type == 'exponential':
-                envelope[:attack_samples] = np.power(np.linspace(0, 1, attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[:attack_samples] = np.log1p(np.linspace(0, 9, attack_samples)) / np.log1p(9)
-            else:  # linear
-                envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
-
-        if decay_samples > 0 and attack_samples < total_samples:
-            decay_end = min(attack_samples + decay_samples, total_samples)
-            if curve_type == 'exponential':
-                envelope[attack_samples:decay_end] = np.power(np.linspace(1, adsr['sustain'], decay_end - attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[attack_samples:decay_end] = adsr['sustain'] + (1 - adsr['sustain']) * np.log1p(np.linspace(9, 0, decay_end - attack_samples)) / np.log1p(9)
-            else:
-                envelope[attack_samples:decay_end] = np.linspace(1, adsr['sustain'], decay_end - attack_samples)
-
-        if sustain_samples > 0 and attack_samples + decay_samples < total_samples:
-            sustain_end = min(attack_samples + decay_samples + sustain_samples, total_samples)
-            envelope[attack_samples + decay_samples:sustain_end] = adsr['sustain']
-
-        if release_samples > 0 and total_samples - release_samples > 0:
-            release_start = max(0, total_samples - release_samples)
-            if curve_type == 'exponential':
-                envelope[release_start:] = adsr['sustain'] * np.power(np.linspace(1, 0, total_samples - release_start), 2)
-            elif curve_type == 'logarithmic':
-                envelope[release_start:] = adsr['sustain'] * np.log1p(np.linspace(9, 0, total_samples - release_start)) / np.log1p(9)
-            else:
-                envelope[release_start:] = np.linspace(adsr['sustain'], 0, total_samples - release_start)
-
-        if is_stereo:
-            envelope = np.tile(envelope, (channels, 1)).T
-        else:
-            envelope = envelope.reshape(-1, 1)
-
-        processed_array = sound_array * envelope
-        return pygame.sndarray.make_sound(processed_array.astype(np.int16))
+    def effects_array(self, sound, instrument, sample_rate=None):
+        # Sound ma częstotliwość miksera, chyba że wywołujący poda inną
+        sample_rate = sample_rate or mixer_format()[0]
+        buffer = to_float32(pygame.sndarray.array(sound))
+        apply_adsr(buffer, self.current_adsr[instrument], sample_rate, self.sample_params[instrument]['attack_curve'])
+        return apply_effect_chain(buffer, self.effects[instrument], sample_rate, VARIANTS[VARIANT]['effect_style'])
 
     def adjust_adsr(self, button, instrument, param, delta):
         self.current_adsr[instrument][param] = max(0.01, min(self.current_adsr[instrument][param] + delta, 1.0))
+        self.render_cache.invalidate(instrument)
         self.adsr_entries[instrument][param].set_text(f"{self.current_adsr[instrument][param]:.2f}")
-        self.generate_parametric_samples()
-        if self.preview_active[instrument]:
-            self.samples[instrument].play()
+        self.sample_renderer.mark(instrument)
 
     def on_adsr_entry_changed(self, entry, instrument, param):
         try:
             value = float(entry.get_text())
             self.current_adsr[instrument][param] = max(0.01, min(value, 1.0))
             entry.set_text(f"{self.current_adsr[instrument][param]:.2f}")
-            self.generate_parametric_samples()
-            if self.preview_active[instrument]:
-                self.samples[instrument].play()
+            self.sample_renderer.mark(instrument)
         except ValueError:
             entry.set_text(f"{self.current_adsr[instrument][param]:.2f}")
 
@@ -1456,17 +1359,13 @@ class DrumSamplerApp(Gtk.Window):
         self.current_adsr[instrument] = self.nominal_adsr[instrument].copy()
         for param in ['attack', 'decay', 'sustain', 'release']:
             self.adsr_entries[instrument][param].set_text(f"{self.current_adsr[instrument][param]:.2f}")
-        self.generate_parametric_samples()
-        if self.preview_active[instrument]:
-            self.samples[instrument].play()
+        self.sample_renderer.mark(instrument)
 
     def randomize_adsr(self, button, instrument):
         for param in ['attack', 'decay', 'sustain', 'release']:
             self.current_adsr[instrument][param] = random.uniform(0.01, 1.0)
             self.adsr_entries[instrument][param].set_text(f"{self.current_adsr[instrument][param]:.2f}")
-        self.generate_parametric_samples()
-        if self.preview_active[instrument]:
-            self.samples[instrument].play()
+        self.sample_renderer.mark(instrument)
 
     def toggle_preview(self, button, instrument):
         self.preview_active[instrument] = button.get_active()
@@ -1490,6 +1389,7 @@ class DrumSamplerApp(Gtk.Window):
             try:
                 sound = pygame.mixer.Sound(file_path)
                 self.samples[instrument] = sound
+                self.render_cache.invalidate(instrument)
                 if self.preview_active[instrument]:
                     sound.play()
             except Exception as e:
@@ -1521,7 +1421,7 @@ class DrumSamplerApp(Gtk.Window):
         name, full_path = model.get(iter, 0, 1)
         if os.path.isfile(full_path) and name.lower().endswith(('.wav', '.mp3')):
             try:
-                sound = pygame.mixer.Sound(full_path)
+                sound = pygame.sndarray.make_sound(self.preview_cache.get(full_path))
                 for inst in self.instruments:
                     if self.swap_buttons[inst].get_state_flags() & Gtk.StateFlags.ACTIVE:
                         self.samples[inst] = sound
@@ -1540,10 +1440,22 @@ class DrumSamplerApp(Gtk.Window):
             name, full_path = model.get(iter, 0, 1)
             if os.path.isfile(full_path) and name.lower().endswith(('.wav', '.mp3')):
                 try:
-                    sound = pygame.mixer.Sound(full_path)
-                    sound.play()
+                    pygame.sndarray.make_sound(self.preview_cache.get(full_path)).play()
                 except Exception as e:
                     print(f"Error playing sample: {e}")
+                # kolejne pliki na liście dekodujemy w tle, żeby odsłuch strzałkami był natychmiastowy
+                upcoming = []
+                iter = model.iter_next(iter)
+                while iter is not None and len(upcoming) < PREVIEW_PREFETCH:
+                    name, full_path = model.get(iter, 0, 1)
+                    if name.lower().endswith(('.wav', '.mp3')) and not name.startswith("[DIR] "):
+                        upcoming.append(full_path)
+                    iter = model.iter_next(iter)
+                self.preview_cache.prefetch(upcoming)
+
+    def decode_preview(self, path):
+        """Plik jako tablica w formacie miksera (wpis cache odsłuchu)."""
+        return pygame.sndarray.array(pygame.mixer.Sound(path))
 
     def load_sample_bank(self, button):
         dialog = Gtk.FileChooserDialog(
@@ -1690,6 +1602,7 @@ class DrumSamplerApp(Gtk.Window):
                 with open(file_path, 'r') as f:
                     project_data = json.load(f)
                 self.patterns = project_data.get('patterns', self.patterns)
+                self.history.clear()
                 self.absolute_bpm = project_data.get('bpm', self.absolute_bpm)
                 self.bpm_entry.set_text(str(self.absolute_bpm))
                 self.advanced_sequencer_mode = project_data.get('advanced_sequencer_mode', self.advanced_sequencer_mode)
@@ -1732,16 +1645,13 @@ class DrumSamplerApp(Gtk.Window):
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             file_path = dialog.get_filename()
-            midi = MIDIFile(1)
-            midi.addTempo(0, 0, self.absolute_bpm)
-            for inst in self.instruments:
-                for step, active in enumerate(self.patterns[inst]):
-                    if active:
-                        time = step * (60 / self.absolute_bpm / 4)
-                        midi.addNote(0, 0, self.midi_notes[inst], time, 0.25, 100)
+            pattern_length = int(self.length_spinbutton.get_value())
+            velocity, accent_velocity = midi_velocities(VARIANT, self.effects, self.instruments)
+            midi = pattern_midi(self.patterns, self.instruments, self.midi_notes, pattern_length, self.current_tempo_map(),
+                                self.advanced_sequencer_mode, self.rhythm_types, VARIANTS[VARIANT]['spacing'],
+                                velocity, accent_velocity)
             try:
-                with open(file_path, 'wb') as f:
-                    midi.write(f)
+                write_midi_file(midi, file_path)
             except Exception as e:
                 print(f"Error exporting MIDI: {e}")
         dialog.destroy()
@@ -1761,27 +1671,13 @@ class DrumSamplerApp(Gtk.Window):
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             file_path = dialog.get_filename()
-            midi = MIDIFile(1)
-            midi.addTempo(0, 0, self.absolute_bpm)
-            for inst in self.instruments:
-                for step, step_data in enumerate(self.patterns[inst]):
-                    if self.advanced_sequencer_mode and step_data['active']:
-                        rhythm = self.rhythm_types[step_data['rhythm_type']]
-                        notes = rhythm['notes']
-                        speed = rhythm['speed']
-                        swing = rhythm['swing']
-                        for i in range(notes):
-                            offset = i * (60 / self.absolute_bpm / 4) * speed
-                            if swing and i % 2 == 1:
-                                offset += swing * (60 / self.absolute_bpm / 4)
-                            time = step * (60 / self.absolute_bpm / 4) + offset
-                            midi.addNote(0, 0, self.midi_notes[inst], time, 0.25 * speed, 100)
-                    elif not self.advanced_sequencer_mode and step_data:
-                        time = step * (60 / self.absolute_bpm / 4)
-                        midi.addNote(0, 0, self.midi_notes[inst], time, 0.25, 100)
+            pattern_length = int(self.length_spinbutton.get_value())
+            velocity, accent_velocity = midi_velocities(VARIANT, self.effects, self.instruments)
+            midi = pattern_midi(self.patterns, self.instruments, self.midi_notes, pattern_length, self.current_tempo_map(),
+                                self.advanced_sequencer_mode, self.rhythm_types, VARIANTS[VARIANT]['spacing'],
+                                velocity, accent_velocity)
             try:
-                with open(file_path, 'wb') as f:
-                    midi.write(f)
+                write_midi_file(midi, file_path)
             except Exception as e:
                 print(f"Error exporting advanced MIDI: {e}")
         dialog.destroy()
@@ -1802,36 +1698,6 @@ class DrumSamplerApp(Gtk.Window):
         if response == Gtk.ResponseType.OK:
             audio_path = dialog.get_filename()
             try:
-                audio = AudioSegment.from_file(audio_path)
-                pattern_length = len(self.patterns[self.instruments[0]])
-                step_duration = 60 / self.absolute_bpm / 4 * 1000
-                total_duration = pattern_length * step_duration
-                drum_track = AudioSegment.silent(duration=total_duration)
-                for inst in self.instruments:
-                    sound = self.apply_effects(self.samples[inst], inst, export=True)
-                    sound_array = pygame.sndarray.array(sound)
-                    sound_segment = AudioSegment(
-                        sound_array.tobytes(),
-                        frame_rate=44100,
-                        sample_width=sound_array.dtype.itemsize,
-                        channels=2 if sound_array.ndim == 2 else 1
-                    )
-                    if self.advanced_sequencer_mode:
-                        for step, step_data in enumerate(self.patterns[inst]):
-                            if step_data['active']:
-                                rhythm = self.rhythm_types[step_data['rhythm_type']]
-                                for i in range(rhythm['notes']):
-                                    offset = i * step_duration * rhythm['speed']
-                                    if rhythm['swing'] and i % 2 == 1:
-                                        offset += rhythm['swing'] * step_duration
-                                    position = step * step_duration + offset
-                                    drum_track = drum_track.overlay(sound_segment, position=position)
-                    else:
-                        for step, active in enumerate(self.patterns[inst]):
-                            if active:
-                                position = step * step_duration
-                                drum_track = drum_track.overlay(sound_segment, position=position)
-                audio = audio.overlay(drum_track)
                 output_dialog = Gtk.FileChooserDialog(
                     title="Save Mixed Audio",
                     parent=self,
@@ -1846,12 +1712,25 @@ class DrumSamplerApp(Gtk.Window):
                 response = output_dialog.run()
                 if response == Gtk.ResponseType.OK:
                     output_path = output_dialog.get_filename()
-                    audio.export(output_path, format="wav")
+                    add_drums_to_file(audio_path, output_path, self.offline_step_events, self.offline_sample,
+                                      self.absolute_bpm, len(self.patterns[self.instruments[0]]),
+                                      tempo_map=self.current_tempo_map())
                 output_dialog.destroy()
             except Exception as e:
                 print(f"Error adding drummer to audio: {e}")
         dialog.destroy()
 
+    def compiled_pattern(self):
+        return self.event_compiler.compile(self.patterns, self.instruments, self.advanced_sequencer_mode)
+
+    def offline_step_events(self, step):
+        return self.compiled_pattern().step_events(step)
+
+    def offline_sample(self, instrument):
+        if instrument not in self.samples:
+            return None
+        return self.effects_array(self.samples[instrument], instrument)
+
     def autolevel_samples(self, button):
         max_amplitude = 0
         for inst in self.instruments:
@@ -1863,6 +1742,7 @@ class DrumSamplerApp(Gtk.Window):
                 sound_array = (sound_array / max_amplitude * 0.8).astype(np.int16)
             self.samples[inst] = pygame.sndarray.make_sound(sound_array)
 
+    @pattern_edit
     def apply_groove(self, button):
         self.groove_type = self.groove_combo.get_active_text()
         if self.groove_type == "stretch":
@@ -1908,6 +1788,7 @@ class DrumSamplerApp(Gtk.Window):
                             self.patterns[inst][i] = 0
         self.update_buttons()
 
+    @pattern_edit
     def reset_groove(self, button):
         self.groove_type = "simple"
         self.groove_combo.set_active(0)
@@ -1960,41 +1841,32 @@ class DrumSamplerApp(Gtk.Window):
     def play_pattern(self, button):
         if not self.loop_playing:
             self.loop_playing = True
-            self.play_thread = threading.Thread(target=self.play_loop)
+            sample_rate, channels = mixer_format()
+            self.engine = PatternEngine(self.play_step_events, self.engine_sample, self.current_tempo_map,
+                                        pattern_length=len(self.patterns[self.instruments[0]]),
+                                        sample_rate=sample_rate, channels=channels)
+            self.play_thread = PygameBlockOutput(self.engine)
             self.play_thread.start()
 
-    def play_loop(self):
-        pattern_length = len(self.patterns[self.instruments[0]])
-        step_duration = 60 / self.get_next_bpm() / 4
-        steps_per_bpm = self.steps_per_bpm
-        current_step = 0
-
-        while self.loop_playing:
-            for inst in self.instruments:
-                if self.performer_mode:
-                    if random.random() < 0.1:
-                        continue
-                if self.advanced_sequencer_mode:
-                    step_data = self.patterns[inst][current_step]
-                    if step_data['active']:
-                        rhythm = self.rhythm_types[step_data['rhythm_type']]
-                        for i in range(rhythm['notes']):
-                            offset = i * step_duration * rhythm['speed']
-                            if rhythm['swing'] and i % 2 == 1:
-                                offset += rhythm['swing'] * step_duration
-                            GLib.idle_add(self.play_sample_with_effects, inst, offset, current_step)
-                else:
-                    if self.patterns[inst][current_step]:
-                        GLib.idle_add(self.play_sample_with_effects, inst, 0, current_step)
-            time.sleep(step_duration)
-            current_step = (current_step + 1) % pattern_length
-            if current_step % steps_per_bpm == 0:
-                self.advance_bpm()
-                step_duration = 60 / self.get_next_bpm() / 4
-
-    def play_sample_with_effects(self, instrument, offset, current_step):
-        sound = self.apply_effects(self.samples[instrument], instrument)
-        sound.play()
+    def engine_sample(self, instrument):
+        if instrument not in self.samples:
+            return None
+        sound = self.samples[instrument]
+        cache_key = render_key(instrument, sound, self.effects[instrument], self.current_adsr[instrument],
+                               self.sample_params[instrument]['attack_curve'])
+        return self.render_cache.get_or_render(
+            cache_key, lambda: match_channels(self.effects_array(sound, instrument, self.engine.sample_rate), self.engine.channels), keep=sound)
+
+    def play_step_events(self, current_step):
+        events = self.compiled_pattern().step_events(current_step)
+        if self.performer_mode:
+            skipped = {inst for inst in self.instruments if random.random() < 0.1}
+            events = [event for event in events if event[1] not in skipped]
+        for inst in dict.fromkeys(event[1] for event in events):
+            GLib.idle_add(self.blink_step, inst, current_step)
+        return events
+
+    def blink_step(self, instrument, current_step):
         button = self.buttons[instrument][current_step % len(self.patterns[instrument])]
         context = button.get_style_context()
         context.add_class("blink")
@@ -2004,9 +1876,10 @@ class DrumSamplerApp(Gtk.Window):
     def stop_pattern(self, button):
         self.loop_playing = False
         if self.play_thread:
-            self.play_thread.join()
+            self.play_thread.stop()
             self.play_thread = None
 
+    @pattern_edit
     def randomize_pattern(self, button):
         pattern_length = len(self.patterns[self.instruments[0]])
         for inst in self.instruments:
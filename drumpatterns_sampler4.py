@@ -2,21 +2,39 @@ import gi
 import random
 import time
 import threading
+from drumpatterns_core.startup import STARTUP, lazy_import
 import pygame
+STARTUP.mark("import pygame")
 import platform
 import json
 import os
-from midiutil import MIDIFile
-from pydub import AudioSegment
-from pydub.effects import normalize
 import numpy as np
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk
+STARTUP.mark("import Gtk")
 import warnings
 warnings.filterwarnings("ignore", category=SyntaxWarning)
-import sqlite3
-import librosa
 import soundfile as sf
+from drumpatterns_core import Pattern, PatternEngine
+from drumpatterns_core.cache import RenderCache, render_key
+from drumpatterns_core.dsp import apply_effect_chain, match_channels, to_float32
+from drumpatterns_core.events import EventCompiler
+from drumpatterns_core.history import EditHistory, pattern_edit
+from drumpatterns_core.incremental import IncrementalRenderer
+from drumpatterns_core.midi import pattern_midi, write_midi_file
+from drumpatterns_core.offline import export_pattern
+from drumpatterns_core.output import PygameBlockOutput, array_to_sound, mixer_format
+from drumpatterns_core.synth import apply_adsr, parametric_sample
+from drumpatterns_core.tempo import TempoMap
+from drumpatterns_core.variants import VARIANTS, midi_velocities
+STARTUP.mark("import soundfile, drumpatterns_core")
+
+# Ładowane dopiero przy pierwszym użyciu (wczytywanie sampli, autolevel)
+pydub = lazy_import('pydub')
+pydub_effects = lazy_import('pydub.effects')
+
+VARIANT = 'sampler4'  # profil zgodności, patrz drumpatterns_core.variants
+HISTORY_BUDGET_MB = 16  # pamięć historii cofania (MB)
 
 class DrumSamplerApp(Gtk.Window):
     def __init__(self):
@@ -26,7 +44,10 @@ class DrumSamplerApp(Gtk.Window):
         self.is_fullscreen = False
         self.scale_factor = 1.0
 
-        pygame.mixer.init()
+        self.render_cache = RenderCache()
+        # edycja parametrów/ADSR renderuje ponownie tylko zmieniony instrument, w tle
+        self.sample_renderer = IncrementalRenderer(self.render_parametric_sample, self.publish_parametric_sample,
+                                                   GLib.idle_add)
 
         # Main container
         scroll_window = Gtk.ScrolledWindow()
@@ -50,6 +71,9 @@ class DrumSamplerApp(Gtk.Window):
             for inst in self.instruments
         }
         self.patterns = self.simple_patterns
+        self.history = EditHistory(HISTORY_BUDGET_MB * 1024 * 1024,
+                                   set_length=lambda length: self.length_spinbutton.set_value(length),
+                                   on_change=lambda: self.event_compiler.invalidate())
         self.base_colors = {'Talerz': '#FF5555', 'Stopa': '#55FF55', 'Werbel': '#5555FF', 'TomTom': '#FFAA00'}
         self.midi_notes = {'Talerz': 49, 'Stopa': 36, 'Werbel': 38, 'TomTom': 45}
         self.buttons = {}
@@ -63,6 +87,7 @@ class DrumSamplerApp(Gtk.Window):
             'swing': {'notes': 2, 'speed': 0.5, 'swing': 0.2},
             'accent': {'notes': 1, 'speed': 1.0, 'swing': 0.0}
         }
+        self.event_compiler = EventCompiler(self.rhythm_types, VARIANTS[VARIANT]['spacing'])
         # Sample generation parameters
         self.sample_params = {
             'Talerz': {'waveform': 'sine', 'frequency': 8000, 'amplitude': 0.8, 'duration': 1.0, 'attack_curve': 'exponential'},
@@ -81,11 +106,6 @@ class DrumSamplerApp(Gtk.Window):
         self.preview_active = {inst: False for inst in self.instruments}
         self.swap_buttons = {}
 
-        # Load or generate samples
-        self.load_samples_from_directory()
-        if not self.samples:
-            self.generate_parametric_samples()
-
         # UI setup
         self.create_toolbar()
         self.grid = Gtk.Grid()
@@ -118,12 +138,16 @@ class DrumSamplerApp(Gtk.Window):
 
         self.loop_playing = False
         self.play_thread = None
+        self.engine = None
+        self.audio_output = None
         self.dynamic_bpm_list = []
-        self.current_bpm_index = 0
         self.steps_per_bpm = 4
+        self.ramp_bpm = False
+        self.tempo_map_cache = None
 
         # Connect scaling
         self.connect("size-allocate", self.scale_interface)
+        self.connect("key-press-event", self.on_key_press)
 
         self.effect_sliders = {}
         self.groove_type = 'simple'
@@ -144,86 +168,47 @@ class DrumSamplerApp(Gtk.Window):
         self.create_sample_manipulation_area()
         self.create_virtual_drummer_mode_button()  # New button for virtual drummer mode
 
+        # Urządzenie audio (i sample) otwierane w tle dopiero po pokazaniu okna
+        self.main_box.set_sensitive(False)
+        GLib.idle_add(self.start_audio)
+        STARTUP.mark("build window")
+
+    def start_audio(self):
+        STARTUP.mark("show window")
+        threading.Thread(target=self.open_audio, daemon=True).start()
+        return False
+
+    def open_audio(self):
+        with STARTUP.phase("audio device (thread)"):
+            pygame.mixer.init()
+        with STARTUP.phase("load/generate samples (thread)"):
+            self.load_samples_from_directory()
+            if not self.samples:
+                self.generate_parametric_samples()
+        GLib.idle_add(self.on_audio_ready)
+
+    def on_audio_ready(self):
+        self.main_box.set_sensitive(True)
+        STARTUP.mark("audio ready")
+        STARTUP.report()
+        return False
+
     def generate_parametric_samples(self):
-        sample_rate = 44100
+        self.render_cache.invalidate()
         for inst in self.instruments:
-            params = self.sample_params[inst]
-            duration = params['duration']
-            t = np.linspace(0, duration, int(sample_rate * duration), False)
-
-            if params['waveform'] == 'sine':
-                signal = params['amplitude'] * np.sin(2 * np.pi * params['frequency'] * t)
-            elif params['waveform'] == 'square':
-                signal = params['amplitude'] * np.sign(np.sin(2 * np.pi * params['frequency'] * t))
-            elif params['waveform'] == 'sawtooth':
-                signal = params['amplitude'] * (2 * (t * params['frequency'] - np.floor(0.5 + t * params['frequency'])))
-            elif params['waveform'] == 'noise':
-                signal = params['amplitude'] * np.random.normal(0, 1, len(t))
-            else:
-                signal = np.zeros(len(t))
-
-            signal = self.apply_adsr_to_signal(signal, inst, sample_rate)
-            signal = normalize(AudioSegment(
-                (signal * 32767).astype(np.int16).tobytes(),
-                frame_rate=sample_rate,
-                sample_width=2,
-                channels=1
-            ))
-            signal = np.array(signal.get_array_of_samples()).reshape(-1, 1)
-            signal = np.hstack((signal, signal))
-            self.samples[inst] = pygame.sndarray.make_sound(signal.astype(np.int16))
-
-    def apply_adsr_to_signal(self, signal, instrument, sample_rate):
-        adsr = self.current_adsr[instrument]
-        total_samples = len(signal)
-        attack_samples = int(adsr['attack'] * sample_rate)
-        decay_samples = int(adsr['decay'] * sample_rate)
-        release_samples = int(adsr['release'] * sample_rate)
-        sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        if sustain_samples < 0:
-            excess = -sustain_samples
-            total_adsr = attack_samples + decay_samples + release_samples
-            scale_factor = (total_samples - excess) / total_adsr
-            attack_samples = int(attack_samples * scale_factor)
-            decay_samples = int(decay_samples * scale_factor)
-            release_samples = int(release_samples * scale_factor)
-            sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        envelope = np.zeros(total_samples, dtype=np.float32)
-        curve_type = self.sample_params[instrument]['attack_curve']
-
-        if attack_samples > 0:
-            if curve_type == 'exponential':
-                envelope[:attack_samples] = np.power(np.linspace(0, 1, attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[:attack_samples] = np.log1p(np.linspace(0, 9, attack_samples)) / np.log1p(9)
-            else:
-                envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
-
-        if decay_samples > 0 and attack_samples < total_samples:
-            decay_end = min(attack_samples + decay_samples, total_samples)
-            if curve_type == 'exponential':
-                envelope[attack_samples:decay_end] = np.power(np.linspace(1, adsr['sustain'], decay_end - attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[attack_samples:decay_end] = adsr['sustain'] + (1 - adsr['sustain']) * np.log1p(np.linspace(9, 0, decay_end - attack_samples)) / np.log1p(9)
-            else:
-                envelope[attack_samples:decay_end] = np.linspace(1, adsr['sustain'], decay_end - attack_samples)
-
-        if sustain_samples > 0 and attack_samples + decay_samples < total_samples:
-            sustain_end = min(attack_samples + decay_samples + sustain_samples, total_samples)
-            envelope[attack_samples + decay_samples:sustain_end] = adsr['sustain']
-
-        if release_samples > 0 and total_samples - release_samples > 0:
-            release_start = max(0, total_samples - release_samples)
-            if curve_type == 'exponential':
-                envelope[release_start:] = adsr['sustain'] * np.power(np.linspace(1, 0, total_samples - release_start), 2)
-            elif curve_type == 'logarithmic':
-                envelope[release_start:] = adsr['sustain'] * np.log1p(np.linspace(9, 0, total_samples - release_start)) / np.log1p(9)
-            else:
-                envelope[release_start:] = np.linspace(adsr['sustain'], 0, total_samples - release_start)
+            signal = parametric_sample(self.sample_params[inst], self.current_adsr[inst], 44100)
+            self.samples[inst] = array_to_sound(match_channels(signal.reshape(-1, 1), 2))
 
-        return signal * envelope
+    def render_parametric_sample(self, instrument):
+        signal = parametric_sample(self.sample_params[instrument], self.current_adsr[instrument], 44100)
+        return signal, array_to_sound(match_channels(signal.reshape(-1, 1), 2))
+
+    def publish_parametric_sample(self, instrument, rendered):
+        signal, sound = rendered
+        self.samples[instrument] = sound
+        self.render_cache.invalidate(instrument)
+        if self.preview_active[instrument]:
+            sound.play()
 
     def create_sample_manipulation_area(self):
         sample_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=int(10 * self.scale_factor))
@@ -447,9 +432,7 @@ class DrumSamplerApp(Gtk.Window):
                 self.sample_params[instrument][param] = float(widget.get_text())
             elif param == 'attack_curve':
                 self.sample_params[instrument][param] = widget.get_active_text()
-            self.generate_parametric_samples()
-            if self.preview_active[instrument]:
-                self.samples[instrument].play()
+            self.sample_renderer.mark(instrument)
         except ValueError:
             print(f"Invalid input for {param}")
 
@@ -466,6 +449,8 @@ class DrumSamplerApp(Gtk.Window):
             ("document-open", self.load_project, "Load Project"),
             ("document-export", self.export_to_midi, "Export MIDI"),
             ("document-export", self.export_advanced_midi, "Export Advanced MIDI"),
+            ("edit-undo", self.undo_edit, "Undo"),
+            ("edit-redo", self.redo_edit, "Redo"),
             ("view-fullscreen", self.toggle_fullscreen, "Toggle Fullscreen")
         ]
 
@@ -670,6 +655,11 @@ class DrumSamplerApp(Gtk.Window):
         apply_button.connect("clicked", self.apply_dynamic_bpm)
         dynamic_bpm_box.pack_start(apply_button, False, False, 0)
 
+        ramp_check = Gtk.CheckButton(label="Ramp")
+        ramp_check.set_tooltip_text("Glide between the dynamic BPM values")
+        ramp_check.connect("toggled", self.on_ramp_bpm_toggled)
+        dynamic_bpm_box.pack_start(ramp_check, False, False, 0)
+
     def create_pattern_controls(self):
         genre_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
         self.main_box.pack_start(genre_box, False, False, 0)
@@ -920,6 +910,7 @@ class DrumSamplerApp(Gtk.Window):
                             if isinstance(subchild, Gtk.Button):
                                 subchild.set_size_request(int(20 * self.scale_factor), int(20 * self.scale_factor))
 
+    @pattern_edit
     def on_button_toggled(self, button, instrument, step):
         if self.advanced_sequencer_mode:
             is_active = button.get_active()
@@ -931,6 +922,27 @@ class DrumSamplerApp(Gtk.Window):
         else:
             self.patterns[instrument][step] = int(button.get_active())
 
+    def undo_edit(self, widget):
+        if self.history.undo() is not None:
+            self.update_buttons()
+
+    def redo_edit(self, widget):
+        if self.history.redo() is not None:
+            self.update_buttons()
+
+    def on_key_press(self, widget, event):
+        # Ctrl+Z cofa, Ctrl+Shift+Z / Ctrl+Y ponawia; pola tekstowe zostają przy swoich skrótach
+        if not event.state & Gdk.ModifierType.CONTROL_MASK or isinstance(self.get_focus(), Gtk.Editable):
+            return False
+        key = Gdk.keyval_to_lower(event.keyval)
+        if key == Gdk.KEY_z and not event.state & Gdk.ModifierType.SHIFT_MASK:
+            self.undo_edit(widget)
+        elif key in (Gdk.KEY_z, Gdk.KEY_y):
+            self.redo_edit(widget)
+        else:
+            return False
+        return True
+
     def update_buttons(self):
         pattern_length = int(self.length_spinbutton.get_value())
         for inst in self.instruments:
@@ -945,6 +957,8 @@ class DrumSamplerApp(Gtk.Window):
                 elif len(self.patterns[inst]) > pattern_length:
                     self.patterns[inst] = self.patterns[inst][:pattern_length]
 
+        # wiersze mogły zmienić długość
+        self.event_compiler.invalidate()
         for inst in self.instruments:
             for i in range(pattern_length):
                 try:
@@ -992,6 +1006,7 @@ class DrumSamplerApp(Gtk.Window):
     def on_button_press(self, widget, event, instrument, step):
         self.last_button_pressed = event.button
 
+    @pattern_edit
     def on_scroll(self, widget, event, instrument, step):
         if not self.advanced_sequencer_mode or not self.patterns[instrument][step]['active']:
             return
@@ -1011,6 +1026,8 @@ class DrumSamplerApp(Gtk.Window):
     def on_sequencer_mode_switch(self, switch, gparam):
         self.advanced_sequencer_mode = switch.get_active()
         self.patterns = self.advanced_patterns if self.advanced_sequencer_mode else self.simple_patterns
+        # zapisane zmiany dotyczą wzorca drugiego trybu - cofnięcie nadpisałoby nie ten wzorzec
+        self.history.clear()
         self.update_buttons()
 
     def on_performer_mode_switch(self, switch, gparam):
@@ -1039,17 +1056,8 @@ class DrumSamplerApp(Gtk.Window):
         self.update_dynamic_bpm()
 
     def calculate_pattern_density(self):
-        total_active_steps = 0
-        total_steps = len(self.instruments) * len(self.patterns[self.instruments[0]])
-        if self.advanced_sequencer_mode:
-            for inst in self.instruments:
-                for step in self.patterns[inst]:
-                    if step['active']:
-                        total_active_steps += self.rhythm_types[step['rhythm_type']]['notes']
-        else:
-            for inst in self.instruments:
-                total_active_steps += sum(self.patterns[inst])
-        return total_active_steps / total_steps if total_steps > 0 else 0
+        return Pattern.from_dict(self.patterns, self.instruments, self.advanced_sequencer_mode,
+                                 self.rhythm_types).density()
 
     def matched_bpm(self, widget):
         density = self.calculate_pattern_density()
@@ -1069,7 +1077,6 @@ class DrumSamplerApp(Gtk.Window):
         try:
             percentages = [float(bpm.strip()) for bpm in bpm_string.split(',')]
             self.dynamic_bpm_list = [self.absolute_bpm * (p / 100) for p in percentages]
-            self.current_bpm_index = 0
         except ValueError:
             print("Invalid BPM input.")
 
@@ -1078,16 +1085,21 @@ class DrumSamplerApp(Gtk.Window):
             percentages = [float(bpm.strip()) for bpm in self.dynamic_bpm_entry.get_text().split(',')]
             self.dynamic_bpm_list = [self.absolute_bpm * (p / 100) for p in percentages]
 
-    def get_next_bpm(self):
-        if not self.dynamic_bpm_list:
-            return self.absolute_bpm
-        current_bpm = self.dynamic_bpm_list[self.current_bpm_index]
-        return current_bpm
-
-    def advance_bpm(self):
-        if self.dynamic_bpm_list:
-            self.current_bpm_index = (self.current_bpm_index + 1) % len(self.dynamic_bpm_list)
-
+    def current_tempo_map(self):
+        """TempoMap of the BPM and dynamic BPM settings, rebuilt only when they change."""
+        key = (self.absolute_bpm, tuple(self.dynamic_bpm_list), self.steps_per_bpm, self.ramp_bpm)
+        cached = self.tempo_map_cache
+        if cached is None or cached[0] != key:
+            bpms = [bpm for bpm in self.dynamic_bpm_list if bpm > 0] or [self.absolute_bpm]
+            # jedno przypisanie krotki, bo wątek audio czyta ją równolegle
+            cached = (key, TempoMap.from_list(bpms, self.steps_per_bpm, self.ramp_bpm))
+            self.tempo_map_cache = cached
+        return cached[1]
+
+    def on_ramp_bpm_toggled(self, button):
+        self.ramp_bpm = button.get_active()
+
+    @pattern_edit
     def generate_custom_pattern(self, widget):
         genre = self.custom_genre_entry.get_text() or "Generic"
         progression = self.progression_combo.get_active_text()
@@ -1174,6 +1186,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.update_buttons()
 
+    @pattern_edit
     def on_pattern_length_changed(self, spinbutton):
         new_length = int(spinbutton.get_value())
         current_length = len(self.patterns[self.instruments[0]])
@@ -1215,6 +1228,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.grid.show_all()
 
+    @pattern_edit
     def randomize_instruments(self, widget):
         probability = self.randomize_probability_spin.get_value() / 100
         pattern_length = int(self.length_spinbutton.get_value())
@@ -1226,6 +1240,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.update_buttons()
 
+    @pattern_edit
     def autofill_pattern(self):
         pattern_length = int(self.length_spinbutton.get_value())
         genre = self.custom_genre_entry.get_text() or self.preset_genre_combo.get_active_text() or "Generic"
@@ -1250,6 +1265,7 @@ class DrumSamplerApp(Gtk.Window):
 
         self.update_buttons()
 
+    @pattern_edit
     def apply_preset(self, widget):
         preset = self.preset_combo.get_active_text()
         if preset == "Basic Techno":
@@ -1317,6 +1333,7 @@ class DrumSamplerApp(Gtk.Window):
     def on_effect_changed(self, slider, instrument, effect):
         value = slider.get_value()
         self.effects[instrument][effect] = value
+        self.render_cache.invalidate(instrument)
         self.update_effect_colors()
 
     def reset_effect(self, button, slider, instrument, effect):
@@ -1341,115 +1358,14 @@ class DrumSamplerApp(Gtk.Window):
         self.update_effect_colors()
 
     def apply_effects(self, sound, instrument, export=False):
-        sound = self.apply_adsr_to_sound(sound, instrument)
-        effects = self.effects[instrument]
-        sound_array = pygame.sndarray.array(sound)
-        sample_width = sound_array.dtype.itemsize
-        channels = 2 if sound_array.ndim == 2 else 1
-
-        audio_segment = AudioSegment(
-            sound_array.tobytes(),
-            frame_rate=44100,
-            sample_width=sample_width,
-            channels=channels
-        )
-
-        if effects['volume'] != 0:
-            audio_segment = audio_segment + (effects['volume'] * 10)
-
-        if effects['pitch'] != 0:
-            new_rate = int(audio_segment.frame_rate * (2 ** (effects['pitch'] / 12)))
-            audio_segment = audio_segment._spawn(audio_segment.raw_data, overrides={'frame_rate': new_rate})
-            audio_segment = audio_segment.set_frame_rate(44100)
-
-        if effects['echo'] > 0:
-            delay_ms = int(200 * effects['echo'])
-            echo_segment = audio_segment - 10
-            audio_segment = audio_segment.overlay(echo_segment, position=delay_ms)
-
-        if effects['reverb'] > 0:
-            reverb_amount = effects['reverb'] * 300
-            reverb_segment = audio_segment.reverse().fade_in(int(reverb_amount)).reverse()
-            audio_segment = audio_segment.overlay(reverb_segment, position=0)
-
-        if effects['pan'] != 0:
-            audio_segment = audio_segment.pan(effects['pan'])
-
-        audio_segment = normalize(audio_segment)
-
-        samples = np.array(audio_segment.get_array_of_samples())
-        if channels == 2:
-            samples = samples.reshape((-1, 2))
-
-        return pygame.sndarray.make_sound(samples)
+        return array_to_sound(self.effects_array(sound, instrument))
 
-    def apply_adsr_to_sound(self, sound, instrument):
-        sound_array = pygame.sndarray.array(sound)
-        sample_rate = 44100
-        total_samples = len(sound_array)
-        adsr = self.current_adsr[instrument]
-        is_stereo = sound_array.ndim == 2
-        curve_type = self.sample_params[instrument]['attack_curve']
-
-        if is_stereo:
-            channels = sound_array.shape[1]
-        else:
-            channels = 1
-            sound_array = sound_array.reshape(-1, 1)
-
-        attack_samples = int(adsr['attack'] * sample_rate)
-        decay_samples = int(adsr['decay'] * sample_rate)
-        release_samples = int(adsr['release'] * sample_rate)
-        sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        if sustain_samples < 0:
-            excess = -sustain_samples
-            total_adsr = attack_samples + decay_samples + release_samples
-            scale_factor = (total_samples - excess) / total_adsr
-            attack_samples = int(attack_samples * scale_factor)
-            decay_samples = int(decay_samples * scale_factor)
-            release_samples = int(release_samples * scale_factor)
-            sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        envelope = np.zeros(total_samples, dtype=np.float32)
-
-        if attack_samples > 0:
-            if curve_type == 'exponential':
-                envelope[:attack_samples] = np.power(np.linspace(0, 1, attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[:attack_samples] = np.log1p(np.linspace(0, 9, attack_samples)) / np.log1p(9)
-            else:
-                envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
-
-        if decay_samples > 0 and attack_samples < total_samples:
-            decay_end = min(attack_samples + decay_samples, total_samples)
-            if curve_type == 'exponential':
-                envelope[attack_samples:decay_end] = np.power(np.linspace(1, adsr['sustain'], decay_end - attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[attack_samples:decay_end] = adsr['sustain'] + (1 - adsr['sustain']) * np.log1p(np.linspace(9, 0, decay_end - attack_samples)) / np.log1p(9)
-            else:
-                envelope[attack_samples:decay_end] = np.linspace(1, adsr['sustain'], decay_end - attack_samples)
-
-        if sustain_samples > 0 and attack_samples + decay_samples < total_samples:
-            sustain_end = min(attack_samples + decay_samples + sustain_samples, total_samples)
-            envelope[attack_samples + decay_samples:sustain_end] = adsr['sustain']
-
-        if release_samples > 0 and total_samples - release_samples > 0:
-            release_start = max(0, total_samples - release_samples)
-            if curve_type == 'exponential':
-                envelope[release_start:] = adsr['sustain'] * np.power(np.linspace(1, 0, total_samples - release_start), 2)
-            elif curve_type == 'logarithmic':
-                envelope[release_start:] = adsr['sustain'] * np.log1p(np.linspace(9, 0, total_samples - release_start)) / np.log1p(9)
-            else:
-                envelope[release_start:] = np.linspace(adsr['sustain'], 0, total_samples - release_start)
-
-        if is_stereo:
-            envelope = np.vstack((envelope, envelope)).T
-        else:
-            envelope = envelope.reshape(-1, 1)
-
-        processed_array = sound_array * envelope
-        return pygame.sndarray.make_sound(processed_array.astype(np.int16))
+    def effects_array(self, sound, instrument, sample_rate=None):
+        # Sound ma częstotliwość miksera, chyba że wywołujący poda inną
+        sample_rate = sample_rate or mixer_format()[0]
+        buffer = to_float32(pygame.sndarray.array(sound))
+        apply_adsr(buffer, self.current_adsr[instrument], sample_rate, self.sample_params[instrument]['attack_curve'])
+        return apply_effect_chain(buffer, self.effects[instrument], sample_rate, VARIANTS[VARIANT]['effect_style'])
 
     def load_samples_from_directory(self):
         sample_dir = self.current_directory
@@ -1459,9 +1375,9 @@ class DrumSamplerApp(Gtk.Window):
             sample_path = os.path.join(sample_dir, f"{inst.lower()}.wav")
             if os.path.exists(sample_path):
                 try:
-                    audio_segment = AudioSegment.from_file(sample_path)
+                    audio_segment = pydub.AudioSegment.from_file(sample_path)
                     audio_segment = audio_segment.set_channels(2)
-                    audio_segment = normalize(audio_segment)
+                    audio_segment = pydub_effects.normalize(audio_segment)
                     samples = np.array(audio_segment.get_array_of_samples()).reshape(-1, 2)
                     self.samples[inst] = pygame.sndarray.make_sound(samples.astype(np.int16))
                 except Exception as e:
@@ -1503,11 +1419,12 @@ class DrumSamplerApp(Gtk.Window):
         for inst in self.instruments:
             if self.swap_buttons[inst].get_state_flags() & Gtk.StateFlags.ACTIVE:
                 try:
-                    audio_segment = AudioSegment.from_file(sample_path)
+                    audio_segment = pydub.AudioSegment.from_file(sample_path)
                     audio_segment = audio_segment.set_channels(2)
-                    audio_segment = normalize(audio_segment)
+                    audio_segment = pydub_effects.normalize(audio_segment)
                     samples = np.array(audio_segment.get_array_of_samples()).reshape(-1, 2)
                     self.samples[inst] = pygame.sndarray.make_sound(samples.astype(np.int16))
+                    self.render_cache.invalidate(inst)
                     self.swap_buttons[inst].set_active(False)
                 except Exception as e:
                     print(f"Error loading sample {sample_path} for {inst}: {e}")
@@ -1525,47 +1442,43 @@ class DrumSamplerApp(Gtk.Window):
     def play_pattern(self, widget):
         if not self.loop_playing:
             self.loop_playing = True
-            self.play_thread = threading.Thread(target=self.play_loop)
-            self.play_thread.start()
+            self.start_engine()
 
     def stop_pattern(self, widget):
         self.loop_playing = False
+        self.stop_engine()
         if self.play_thread:
             self.play_thread.join()
             self.play_thread = None
 
-    def play_loop(self):
-        pattern_length = int(self.length_spinbutton.get_value())
-        step_duration = 60.0 / (self.get_next_bpm() * 4)
-        steps_played = 0
-
-        while self.loop_playing:
-            for step in range(pattern_length):
-                if not self.loop_playing:
-                    break
-                current_bpm = self.get_next_bpm()
-                step_duration = 60.0 / (current_bpm * 4)
-                for instrument in self.instruments:
-                    if self.advanced_sequencer_mode:
-                        step_data = self.patterns[instrument][step]
-                        if step_data['active']:
-                            rhythm = self.rhythm_types[step_data['rhythm_type']]
-                            sound = self.apply_effects(self.samples[instrument], instrument)
-                            for i in range(rhythm['notes']):
-                                swing_offset = rhythm['swing'] * step_duration * i
-                                sound.play()
-                                time.sleep(step_duration * rhythm['speed'] + swing_offset)
-                            GLib.idle_add(self.highlight_button, instrument, step)
-                    else:
-                        if self.patterns[instrument][step]:
-                            sound = self.apply_effects(self.samples[instrument], instrument)
-                            sound.play()
-                            GLib.idle_add(self.highlight_button, instrument, step)
-                time.sleep(step_duration)
-                steps_played += 1
-                if steps_played >= self.steps_per_bpm:
-                    self.advance_bpm()
-                    steps_played = 0
+    def start_engine(self):
+        self.stop_engine()
+        sample_rate, channels = mixer_format()
+        self.engine = PatternEngine(self.play_step_events, self.engine_sample, self.current_tempo_map,
+                                    pattern_length=int(self.length_spinbutton.get_value()),
+                                    sample_rate=sample_rate, channels=channels)
+        self.audio_output = PygameBlockOutput(self.engine)
+        self.audio_output.start()
+
+    def stop_engine(self):
+        output, self.audio_output = self.audio_output, None
+        if output is not None:
+            output.stop()
+
+    def engine_sample(self, instrument):
+        if instrument not in self.samples:
+            return None
+        sound = self.samples[instrument]
+        cache_key = render_key(instrument, sound, self.effects[instrument], self.current_adsr[instrument],
+                               self.sample_params[instrument]['attack_curve'])
+        return self.render_cache.get_or_render(
+            cache_key, lambda: match_channels(self.effects_array(sound, instrument, self.engine.sample_rate), self.engine.channels), keep=sound)
+
+    def play_step_events(self, step):
+        events = self.compiled_pattern().step_events(step)
+        for instrument in dict.fromkeys(event[1] for event in events):
+            GLib.idle_add(self.highlight_button, instrument, step)
+        return events
 
     def highlight_button(self, instrument, step):
         button = self.buttons[instrument][step]
@@ -1579,44 +1492,21 @@ class DrumSamplerApp(Gtk.Window):
         return False
 
     def virtual_drummer_loop(self):
-        pattern_length = int(self.length_spinbutton.get_value())
         improvisation_count = 0
         max_improvisations = 4  # Number of pattern changes before stopping
 
         while self.virtual_drummer_mode and improvisation_count < max_improvisations:
-            # Randomize pattern
-            self.randomize_pattern(None)
-            # Apply groove
-            self.apply_groove(None)
-            # Adjust BPM dynamically
-            self.perfect_tempo_bpm(None)
+            # wzorzec zmieniany w wątku GTK (przyciski, historia cofania)
+            improvised = threading.Event()
+            GLib.idle_add(self.improvise_pattern, improvised)
+            while self.virtual_drummer_mode and not improvised.wait(0.05):
+                pass
             # Play for a few loops
             loops = random.randint(2, 4)
-            for _ in range(loops):
-                if not self.virtual_drummer_mode:
-                    break
-                for step in range(pattern_length):
-                    if not self.virtual_drummer_mode:
-                        break
-                    current_bpm = self.get_next_bpm()
-                    step_duration = 60.0 / (current_bpm * 4)
-                    for instrument in self.instruments:
-                        if self.advanced_sequencer_mode:
-                            step_data = self.patterns[instrument][step]
-                            if step_data['active']:
-                                rhythm = self.rhythm_types[step_data['rhythm_type']]
-                                sound = self.apply_effects(self.samples[instrument], instrument)
-                                for i in range(rhythm['notes']):
-                                    swing_offset = rhythm['swing'] * step_duration * i
-                                    sound.play()
-                                    time.sleep(step_duration * rhythm['speed'] + swing_offset)
-                                GLib.idle_add(self.highlight_button, instrument, step)
-                        else:
-                            if self.patterns[instrument][step]:
-                                sound = self.apply_effects(self.samples[instrument], instrument)
-                                sound.play()
-                                GLib.idle_add(self.highlight_button, instrument, step)
-                    time.sleep(step_duration)
+            self.start_engine()
+            while self.virtual_drummer_mode and self.engine.loops_completed < loops:
+                time.sleep(0.05)
+            self.stop_engine()
             improvisation_count += 1
             # Randomly adjust effects
             for instrument in self.instruments:
@@ -1625,20 +1515,30 @@ class DrumSamplerApp(Gtk.Window):
                         self.effects[instrument][effect] = random.uniform(-2, 2)
                         if effect in self.effect_sliders[instrument]:
                             GLib.idle_add(self.effect_sliders[instrument][effect].set_value, self.effects[instrument][effect])
-            self.update_effect_colors()
+            GLib.idle_add(self.update_effect_colors)
             # Randomly adjust BPM percentages
             percentages = [random.randint(90, 110) for _ in range(4)]
-            self.dynamic_bpm_entry.set_text(','.join(map(str, percentages)))
+            # idle_add zachowuje kolejność: apply_dynamic_bpm czyta już nowy tekst
+            GLib.idle_add(self.dynamic_bpm_entry.set_text, ','.join(map(str, percentages)))
             GLib.idle_add(self.apply_dynamic_bpm, None)
         self.virtual_drummer_mode = False
         GLib.idle_add(self.update_drummer_button_label)
 
+    def improvise_pattern(self, done):
+        self.randomize_pattern(None)
+        self.apply_groove(None)
+        # tempo dopasowane do nowego wzorca, zanim wątek perkusisty uruchomi silnik
+        self.perfect_tempo_bpm(None)
+        done.set()
+        return False
+
     def update_drummer_button_label(self):
         for child in self.main_box.get_children():
             if isinstance(child, Gtk.Button) and child.get_tooltip_text() == "Toggle Virtual Drummer Mode":
                 child.set_label("Start Virtual Drummer")
         return False
 
+    @pattern_edit
     def randomize_pattern(self, widget):
         pattern_length = int(self.length_spinbutton.get_value())
         for instrument in self.instruments:
@@ -1651,6 +1551,7 @@ class DrumSamplerApp(Gtk.Window):
                     self.patterns[instrument][i] = 1 if random.random() < 0.3 else 0
         self.update_buttons()
 
+    @pattern_edit
     def apply_groove(self, widget):
         groove_type = self.groove_combo.get_active_text()
         pattern_length = int(self.length_spinbutton.get_value())
@@ -1763,6 +1664,7 @@ class DrumSamplerApp(Gtk.Window):
             self.current_adsr = project_data.get('adsr', self.current_adsr)
             self.sample_params = project_data.get('sample_params', self.sample_params)
             self.patterns = self.advanced_patterns if self.advanced_sequencer_mode else self.simple_patterns
+            self.history.clear()
             for inst in self.instruments:
                 for effect in self.effects[inst]:
                     if effect in self.effect_sliders[inst]:
@@ -1798,37 +1700,12 @@ class DrumSamplerApp(Gtk.Window):
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             filename = dialog.get_filename()
-            midi = MIDIFile(1)
-            track = 0
-            channel = 9
-            time = 0
-            midi.addTempo(track, time, self.absolute_bpm)
             pattern_length = int(self.length_spinbutton.get_value())
-            step_duration = 60.0 / (self.absolute_bpm * 4)
-
-            for step in range(pattern_length):
-                for instrument in self.instruments:
-                    if self.advanced_sequencer_mode:
-                        step_data = self.patterns[instrument][step]
-                        if step_data['active']:
-                            rhythm = self.rhythm_types[step_data['rhythm_type']]
-                            for i in range(rhythm['notes']):
-                                swing_offset = rhythm['swing'] * step_duration * i
-                                midi.addNote(
-                                    track, channel, self.midi_notes[instrument],
-                                    time + (step_duration * i * rhythm['speed']) + swing_offset,
-                                    step_duration * rhythm['speed'],
-                                    int(127 * (1 + self.effects[instrument]['volume'] / 5))
-                                )
-                    else:
-                        if self.patterns[instrument][step]:
-                            midi.addNote(
-                                track, channel, self.midi_notes[instrument], time,
-                                step_duration, int(127 * (1 + self.effects[instrument]['volume'] / 5))
-                            )
-                time += step_duration
-            with open(filename, "wb") as output_file:
-                midi.write(output_file)
+            velocity, accent_velocity = midi_velocities(VARIANT, self.effects, self.instruments)
+            midi = pattern_midi(self.patterns, self.instruments, self.midi_notes, pattern_length, self.current_tempo_map(),
+                                self.advanced_sequencer_mode, self.rhythm_types, VARIANTS[VARIANT]['spacing'],
+                                velocity, accent_velocity)
+            write_midi_file(midi, filename)
         dialog.destroy()
 
     def export_advanced_midi(self, widget):
@@ -1842,43 +1719,12 @@ class DrumSamplerApp(Gtk.Window):
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             filename = dialog.get_filename()
-            midi = MIDIFile(1)
-            track = 0
-            channel = 9
-            time = 0
-            midi.addTempo(track, time, self.absolute_bpm)
             pattern_length = int(self.length_spinbutton.get_value())
-            step_duration = 60.0 / (self.absolute_bpm * 4)
-
-            for step in range(pattern_length):
-                current_bpm = self.get_next_bpm()
-                step_duration = 60.0 / (current_bpm * 4)
-                for instrument in self.instruments:
-                    if self.advanced_sequencer_mode:
-                        step_data = self.patterns[instrument][step]
-                        if step_data['active']:
-                            rhythm = self.rhythm_types[step_data['rhythm_type']]
-                            for i in range(rhythm['notes']):
-                                swing_offset = rhythm['swing'] * step_duration * i
-                                velocity = int(127 * (1 + self.effects[instrument]['volume'] / 5))
-                                if step_data['rhythm_type'] == 'accent':
-                                    velocity = min(127, velocity + 20)
-                                midi.addNote(
-                                    track, channel, self.midi_notes[instrument],
-                                    time + (step_duration * i * rhythm['speed']) + swing_offset,
-                                    step_duration * rhythm['speed'], velocity
-                                )
-                    else:
-                        if self.patterns[instrument][step]:
-                            midi.addNote(
-                                track, channel, self.midi_notes[instrument], time,
-                                step_duration, int(127 * (1 + self.effects[instrument]['volume'] / 5))
-                            )
-                time += step_duration
-                if step % self.steps_per_bpm == self.steps_per_bpm - 1:
-                    self.advance_bpm()
-            with open(filename, "wb") as output_file:
-                midi.write(output_file)
+            velocity, accent_velocity = midi_velocities(VARIANT, self.effects, self.instruments)
+            midi = pattern_midi(self.patterns, self.instruments, self.midi_notes, pattern_length, self.current_tempo_map(),
+                                self.advanced_sequencer_mode, self.rhythm_types, VARIANTS[VARIANT]['spacing'],
+                                velocity, accent_velocity)
+            write_midi_file(midi, filename)
         dialog.destroy()
 
     def add_drummer_to_audio(self, widget):
@@ -1892,42 +1738,31 @@ class DrumSamplerApp(Gtk.Window):
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             filename = dialog.get_filename()
-            pattern_length = int(self.length_spinbutton.get_value())
-            step_duration = 60.0 / (self.absolute_bpm * 4)
-            total_duration = pattern_length * step_duration * 1000
-            combined = AudioSegment.silent(duration=total_duration)
-            sample_rate = 44100
-
-            for step in range(pattern_length):
-                for instrument in self.instruments:
-                    if self.advanced_sequencer_mode:
-                        step_data = self.patterns[instrument][step]
-                        if step_data['active']:
-                            rhythm = self.rhythm_types[step_data['rhythm_type']]
-                            sound = self.apply_effects(self.samples[instrument], instrument, export=True)
-                            for i in range(rhythm['notes']):
-                                swing_offset = rhythm['swing'] * step_duration * 1000
-                                position = (step * step_duration * 1000) + (i * step_duration * rhythm['speed'] * 1000) + swing_offset
-                                combined = combined.overlay(sound, position=position)
-                    else:
-                        if self.patterns[instrument][step]:
-                            sound = self.apply_effects(self.samples[instrument], instrument, export=True)
-                            position = step * step_duration * 1000
-                            combined = combined.overlay(sound, position=position)
-            combined = normalize(combined)
-            combined.export(filename, format="wav")
+            export_pattern(filename, self.offline_step_events, self.offline_sample, self.absolute_bpm,
+                           int(self.length_spinbutton.get_value()), tempo_map=self.current_tempo_map())
         dialog.destroy()
 
+    def compiled_pattern(self):
+        return self.event_compiler.compile(self.patterns, self.instruments, self.advanced_sequencer_mode)
+
+    def offline_step_events(self, step):
+        return self.compiled_pattern().step_events(step)
+
+    def offline_sample(self, instrument):
+        if instrument not in self.samples:
+            return None
+        return self.effects_array(self.samples[instrument], instrument)
+
     def autolevel_samples(self, widget):
         for instrument in self.instruments:
             sound_array = pygame.sndarray.array(self.samples[instrument])
-            audio_segment = AudioSegment(
+            audio_segment = pydub.AudioSegment(
                 sound_array.tobytes(),
                 frame_rate=44100,
                 sample_width=sound_array.dtype.itemsize,
                 channels=2 if sound_array.ndim == 2 else 1
             )
-            audio_segment = normalize(audio_segment)
+            audio_segment = pydub_effects.normalize(audio_segment)
             samples = np.array(audio_segment.get_array_of_samples())
             if sound_array.ndim == 2:
                 samples = samples.reshape(-1, 2)
@@ -1947,10 +1782,9 @@ class DrumSamplerApp(Gtk.Window):
         current_value = self.current_adsr[instrument][param]
         new_value = max(0.0, min(current_value + delta, 1.0))
         self.current_adsr[instrument][param] = new_value
+        self.render_cache.invalidate(instrument)
         self.adsr_entries[instrument][param].set_text(f"{new_value:.2f}")
-        self.generate_parametric_samples()
-        if self.preview_active[instrument]:
-            self.samples[instrument].play()
+        self.sample_renderer.mark(instrument)
 
     def on_adsr_entry_changed(self, entry, instrument, param):
         try:
@@ -1958,9 +1792,7 @@ class DrumSamplerApp(Gtk.Window):
             value = max(0.0, min(value, 1.0))
             self.current_adsr[instrument][param] = value
             entry.set_text(f"{value:.2f}")
-            self.generate_parametric_samples()
-            if self.preview_active[instrument]:
-                self.samples[instrument].play()
+            self.sample_renderer.mark(instrument)
         except ValueError:
             entry.set_text(f"{self.current_adsr[instrument][param]:.2f}")
 
@@ -1968,17 +1800,13 @@ class DrumSamplerApp(Gtk.Window):
         self.current_adsr[instrument] = self.nominal_adsr[instrument].copy()
         for param in ['attack', 'decay', 'sustain', 'release']:
             self.adsr_entries[instrument][param].set_text(f"{self.current_adsr[instrument][param]:.2f}")
-        self.generate_parametric_samples()
-        if self.preview_active[instrument]:
-            self.samples[instrument].play()
+        self.sample_renderer.mark(instrument)
 
     def randomize_adsr(self, button, instrument):
         for param in ['attack', 'decay', 'sustain', 'release']:
             self.current_adsr[instrument][param] = random.uniform(0.1, 0.8)
             self.adsr_entries[instrument][param].set_text(f"{self.current_adsr[instrument][param]:.2f}")
-        self.generate_parametric_samples()
-        if self.preview_active[instrument]:
-            self.samples[instrument].play()
+        self.sample_renderer.mark(instrument)
 
     def toggle_preview(self, button, instrument):
         self.preview_active[instrument] = button.get_active()
@@ -2010,7 +1838,7 @@ class DrumSamplerApp(Gtk.Window):
             export_dir = dialog.get_filename()
             for inst in self.instruments:
                 sound_array = pygame.sndarray.array(self.samples[inst])
-                audio_segment = AudioSegment(
+                audio_segment = pydub.AudioSegment(
                     sound_array.tobytes(),
                     frame_rate=44100,
                     sample_width=sound_array.dtype.itemsize,
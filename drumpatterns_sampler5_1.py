@@ -2,24 +2,52 @@ import gi
 import random
 import time
 import threading
+from drumpatterns_core.startup import STARTUP, lazy_import
 import pygame
+STARTUP.mark("import pygame")
 import platform
-import json
 import os
-from midiutil import MIDIFile
 from pydub import AudioSegment
 from pydub.effects import normalize
 import numpy as np
 import cairo
-from scipy.interpolate import interp1d
 import asyncio
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, GLib, Gdk
+STARTUP.mark("import pydub, cairo, Gtk")
 import warnings
 warnings.filterwarnings("ignore", category=SyntaxWarning)
-import sqlite3
-import librosa
 import soundfile as sf
+from drumpatterns_core import PatternEngine
+from drumpatterns_core.bank import load_bank, write_bank
+from drumpatterns_core.cache import PreviewCache, RenderCache, render_key
+from drumpatterns_core.dsp import apply_effect_chain, match_channels, normalize_peak, to_float32, to_int16
+from drumpatterns_core.events import EventCompiler
+from drumpatterns_core.history import EditHistory, pattern_edit, SampleEdit
+from drumpatterns_core.incremental import IncrementalRenderer
+from drumpatterns_core.library import DirectoryScanner, SampleLibrary, choose_kit
+from drumpatterns_core.midi import pattern_midi, write_midi_file
+from drumpatterns_core.offline import export_pattern
+from drumpatterns_core.output import PygameBlockOutput, array_to_sound, mixer_format
+from drumpatterns_core.peaks import PeakPyramid
+from drumpatterns_core.projectfile import load_project_file, save_project_file
+from drumpatterns_core.samples import decode_files
+from drumpatterns_core.synth import apply_adsr, oscillator, parametric_sample
+from drumpatterns_core.tempo import TempoMap
+from drumpatterns_core.variants import VARIANTS, midi_velocities
+STARTUP.mark("import soundfile, drumpatterns_core")
+
+# Ładowane dopiero przy pierwszym użyciu (edytor kształtu fali)
+interpolate = lazy_import('scipy.interpolate')
+
+VARIANT = 'sampler5_1'  # profil zgodności, patrz drumpatterns_core.variants
+BANK_COMPRESSION = 0.6  # poziom kompresji FLAC eksportowanych banków (0..1)
+PREVIEW_CACHE_MB = 64  # rozmiar cache zdekodowanych plików przeglądarki
+PREVIEW_PREFETCH = 4  # ile kolejnych wierszy dekodować z wyprzedzeniem
+WAVEFORM_POINT_SPACING = 35  # odstęp punktów kontrolnych edytora fali (piksele)
+WAVEFORM_MIN_VIEW = 16  # najmniejszy widok edytora fali (próbki)
+WAVEFORM_ZOOM_STEP = 1.25  # powiększenie na jeden ząbek kółka myszy
+HISTORY_BUDGET_MB = 16  # pamięć historii cofania (MB)
 
 class WaveformEditorWindow(Gtk.Window):
     def __init__(self, parent, instrument, sample_params, current_adsr, on_save_callback):
@@ -40,11 +68,20 @@ class WaveformEditorWindow(Gtk.Window):
         self.drawing_area.connect("button-press-event", self.on_button_press)
         self.drawing_area.connect("button-release-event", self.on_button_release)
         self.drawing_area.connect("motion-notify-event", self.on_motion)
+        self.drawing_area.connect("scroll-event", self.on_scroll)
+        self.drawing_area.connect("size-allocate", lambda widget, allocation: self.update_control_points())
+        self.connect("key-press-event", self.on_key_press)
         self.drawing_area.set_events(Gdk.EventMask.BUTTON_PRESS_MASK |
                                      Gdk.EventMask.BUTTON_RELEASE_MASK |
-                                     Gdk.EventMask.POINTER_MOTION_MASK)
+                                     Gdk.EventMask.POINTER_MOTION_MASK |
+                                     Gdk.EventMask.SCROLL_MASK)
         self.box.pack_start(self.drawing_area, True, True, 0)
 
+        self.scroll_adjustment = Gtk.Adjustment(value=0, lower=0, upper=1, step_increment=1, page_increment=1, page_size=1)
+        self.scroll_adjustment.connect("value-changed", self.on_view_scrolled)
+        self.box.pack_start(Gtk.Scrollbar(orientation=Gtk.Orientation.HORIZONTAL, adjustment=self.scroll_adjustment),
+                            False, False, 0)
+
         button_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=10)
         self.box.pack_start(button_box, False, False, 0)
 
@@ -52,6 +89,22 @@ class WaveformEditorWindow(Gtk.Window):
         self.edit_button.connect("toggled", self.on_tool_toggled)
         button_box.pack_start(self.edit_button, False, False, 0)
 
+        zoom_selection_button = Gtk.Button(label="Zoom to Selection")
+        zoom_selection_button.connect("clicked", self.on_zoom_selection)
+        button_box.pack_start(zoom_selection_button, False, False, 0)
+
+        zoom_out_button = Gtk.Button(label="Zoom Out")
+        zoom_out_button.connect("clicked", self.on_zoom_out)
+        button_box.pack_start(zoom_out_button, False, False, 0)
+
+        undo_button = Gtk.Button(label="Undo")
+        undo_button.connect("clicked", self.on_undo)
+        button_box.pack_start(undo_button, False, False, 0)
+
+        redo_button = Gtk.Button(label="Redo")
+        redo_button.connect("clicked", self.on_redo)
+        button_box.pack_start(redo_button, False, False, 0)
+
         play_button = Gtk.Button(label="Play")
         play_button.connect("clicked", self.on_play)
         button_box.pack_start(play_button, False, False, 0)
@@ -61,85 +114,77 @@ class WaveformEditorWindow(Gtk.Window):
         button_box.pack_start(save_button, False, False, 0)
 
         self.waveform = self.generate_waveform()
-        self.original_waveform = self.waveform.copy()
+        self.peaks = PeakPyramid(self.waveform)
+        # historia trzyma tylko nadpisane fragmenty próbek
+        self.history = EditHistory(HISTORY_BUDGET_MB * 1024 * 1024)
         self.control_points = []
+        self.control_indices = []
         self.dragging_point = None
         self.current_tool = None
+        self.selection = None
+        self.selecting_from = None
         self.view_start = 0
         self.view_end = len(self.waveform)
-        self.update_control_points()
+        self.set_view(0, len(self.waveform))
 
     def generate_waveform(self):
         params = self.sample_params[self.instrument]
-        duration = params['duration']
-        t = np.linspace(0, duration, int(self.sample_rate * duration), False)
-
-        if params['waveform'] == 'sine':
-            waveform = params['amplitude'] * np.sin(2 * np.pi * params['frequency'] * t)
-        elif params['waveform'] == 'square':
-            waveform = params['amplitude'] * np.sign(np.sin(2 * np.pi * params['frequency'] * t))
-        elif params['waveform'] == 'sawtooth':
-            waveform = params['amplitude'] * (2 * (t * params['frequency'] - np.floor(0.5 + t * params['frequency'])))
-        elif params['waveform'] == 'noise':
-            waveform = params['amplitude'] * np.random.normal(0, 1, len(t))
-        else:
-            waveform = np.zeros(len(t))
-
-        waveform = self.apply_adsr_to_signal(waveform)
+        waveform = oscillator(params['waveform'], params['frequency'], params['amplitude'], params['duration'],
+                              self.sample_rate)
+        apply_adsr(waveform, self.current_adsr[self.instrument], self.sample_rate, params['attack_curve'])
         waveform /= np.max(np.abs(waveform))
         return waveform
 
-    def apply_adsr_to_signal(self, signal):
-        adsr = self.current_adsr[self.instrument]
-        total_samples = len(signal)
-        attack_samples = int(adsr['attack'] * self.sample_rate)
-        decay_samples = int(adsr['decay'] * self.sample_rate)
-        release_samples = int(adsr['release'] * self.sample_rate)
-        sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        if sustain_samples < 0:
-            excess = -sustain_samples
-            total_adsr = attack_samples + decay_samples + release_samples
-            scale_factor = (total_samples - excess) / total_adsr
-            attack_samples = int(attack_samples * scale_factor)
-            decay_samples = int(decay_samples * scale_factor)
-            release_samples = int(release_samples * scale_factor)
-            sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        envelope = np.zeros(total_samples, dtype=np.float32)
-        curve_type = self.sample_params[self.instrument]['attack_curve']
-
-        if attack_samples > 0:
-            if curve_type == 'exponential':
-                envelope[:attack_samples] = np.power(np.linspace(0, 1, attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[:attack_samples] = np.log1p(np.linspace(0, 9, attack_samples)) / np.log1p(9)
-            else:
-                envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
-
-        if decay_samples > 0 and attack_samples < total_samples:
-            decay_end = min(attack_samples + decay_samples, total_samples)
-            if curve_type == 'exponential':
-                envelope[attack_samples:decay_end] = np.power(np.linspace(1, adsr['sustain'], decay_end - attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[attack_samples:decay_end] = adsr['sustain'] + (1 - adsr['sustain']) * np.log1p(np.linspace(9, 0, decay_end - attack_samples)) / np.log1p(9)
-            else:
-                envelope[attack_samples:decay_end] = np.linspace(1, adsr['sustain'], decay_end - attack_samples)
-
-        if sustain_samples > 0 and attack_samples + decay_samples < total_samples:
-            sustain_end = min(attack_samples + decay_samples + sustain_samples, total_samples)
-            envelope[attack_samples + decay_samples:sustain_end] = adsr['sustain']
-
-        if release_samples > 0 and total_samples - release_samples > 0:
-            release_start = max(0, total_samples - release_samples)
-            if curve_type == 'exponential':
-                envelope[release_start:] = adsr['sustain'] * np.power(np.linspace(1, 0, total_samples - release_start), 2)
-            elif curve_type == 'logarithmic':
-                envelope[release_start:] = adsr['sustain'] * np.log1p(np.linspace(9, 0, total_samples - release_start)) / np.log1p(9)
-            else:
-                envelope[release_start:] = np.linspace(adsr['sustain'], 0, total_samples - release_start)
+    def sample_at(self, x):
+        width = max(1, self.drawing_area.get_allocated_width())
+        index = int(self.view_start + (x / width) * (self.view_end - self.view_start))
+        return min(max(index, self.view_start), self.view_end - 1)
+
+    def x_at(self, index):
+        width = self.drawing_area.get_allocated_width()
+        return (index - self.view_start) * width / (self.view_end - self.view_start)
+
+    def set_view(self, start, end):
+        """Show samples start:end (clamped to the sample, at least WAVEFORM_MIN_VIEW long)."""
+        length = len(self.waveform)
+        span = int(round(min(max(end - start, min(WAVEFORM_MIN_VIEW, length)), length)))
+        start = int(round(min(max(start, 0), length - span)))
+        self.view_start, self.view_end = start, start + span
+        self.scroll_adjustment.configure(start, 0, length, max(1, span // 10), max(1, span), span)
+        self.update_control_points()
+        self.drawing_area.queue_draw()
 
-        return signal * envelope
+    def on_view_scrolled(self, adjustment):
+        start = int(round(adjustment.get_value()))
+        if start != self.view_start:
+            self.set_view(start, start + self.view_end - self.view_start)
+
+    def on_scroll(self, widget, event):
+        span = self.view_end - self.view_start
+        direction = event.direction
+        if event.state & Gdk.ModifierType.SHIFT_MASK:
+            direction = {Gdk.ScrollDirection.UP: Gdk.ScrollDirection.LEFT,
+                         Gdk.ScrollDirection.DOWN: Gdk.ScrollDirection.RIGHT}.get(direction, direction)
+        if direction in (Gdk.ScrollDirection.LEFT, Gdk.ScrollDirection.RIGHT):
+            shift = span // 10 or 1
+            if direction == Gdk.ScrollDirection.LEFT:
+                shift = -shift
+            self.set_view(self.view_start + shift, self.view_end + shift)
+        elif direction in (Gdk.ScrollDirection.UP, Gdk.ScrollDirection.DOWN):
+            # powiększenie wokół próbki pod kursorem
+            width = max(1, self.drawing_area.get_allocated_width())
+            anchor = self.view_start + (event.x / width) * span
+            new_span = span / WAVEFORM_ZOOM_STEP if direction == Gdk.ScrollDirection.UP else span * WAVEFORM_ZOOM_STEP
+            start = anchor - (event.x / width) * new_span
+            self.set_view(start, start + new_span)
+        return True
+
+    def on_zoom_selection(self, widget):
+        if self.selection is not None:
+            self.set_view(*self.selection)
+
+    def on_zoom_out(self, widget):
+        self.set_view(0, len(self.waveform))
 
     def on_draw(self, widget, cr):
         cr.set_source_rgb(1, 1, 1)
@@ -148,6 +193,12 @@ class WaveformEditorWindow(Gtk.Window):
         width = self.drawing_area.get_allocated_width()
         height = self.drawing_area.get_allocated_height()
 
+        if self.selection is not None:
+            left, right = self.x_at(self.selection[0]), self.x_at(self.selection[1])
+            cr.set_source_rgba(0.3, 0.5, 1.0, 0.25)
+            cr.rectangle(left, 0, right - left, height)
+            cr.fill()
+
         cr.set_source_rgb(0.7, 0.7, 0.7)
         cr.move_to(0, height / 2)
         cr.line_to(width, height / 2)
@@ -156,14 +207,19 @@ class WaveformEditorWindow(Gtk.Window):
         cr.set_source_rgb(0, 0, 0)
         cr.set_line_width(2)
 
-        if len(self.waveform) > 1:
-            cr.move_to(0, height / 2)
-            for i in range(width):
-                x = i
-                index = int(self.view_start + (i / width) * (self.view_end - self.view_start))
-                if index < len(self.waveform):
-                    y = height / 2 - (self.waveform[index] * height / 2)
-                    cr.line_to(x, y)
+        if len(self.waveform) > 1 and width > 0:
+            # obwiednia min/max kolumn z piramidy: górna krawędź w prawo, dolna z powrotem
+            mins, maxs = self.peaks.envelope(self.view_start, self.view_end, width)
+            top = (height / 2 - maxs * (height / 2)).tolist()
+            bottom = (height / 2 - mins * (height / 2)).tolist()
+            columns = range(len(top))
+            cr.move_to(0, top[0])
+            for x, y in zip(columns, top):
+                cr.line_to(x, y)
+            for x, y in zip(reversed(columns), reversed(bottom)):
+                cr.line_to(x, y)
+            cr.close_path()
+            cr.fill_preserve()
             cr.stroke()
 
         for x, y in self.control_points:
@@ -179,46 +235,48 @@ class WaveformEditorWindow(Gtk.Window):
         return nearest[0] if nearest[1] < 100 else None
 
     def update_waveform(self, edited_point_index):
+        """Redraw the samples between the neighbours of the edited point, and nothing else.
+
+        The curve runs through the control points around it, which sit on
+        the current samples, so it joins the untouched waveform at both
+        neighbours.  A selection limits the edit further.
+        """
         if len(self.control_points) < 2:
             return
 
-        width = self.drawing_area.get_allocated_width()
         height = self.drawing_area.get_allocated_height()
+        indices = self.control_indices
+        values = [(height / 2 - p[1]) / (height / 2) for p in self.control_points]
+
+        i = edited_point_index
+        first, last = max(i - 2, 0), min(i + 3, len(indices))
+        start = indices[max(i - 1, 0)]
+        end = indices[min(i + 1, len(indices) - 1)] + 1
+        if self.selection is not None:
+            start, end = max(start, self.selection[0]), min(end, self.selection[1])
+        if end <= start:
+            return
 
-        x_points = [int(self.view_start + (p[0] / width) * (self.view_end - self.view_start)) for p in self.control_points]
-        y_points = [(height / 2 - p[1]) / (height / 2) for p in self.control_points]
-
-        influence_range = 1000
-        start_index = max(0, x_points[edited_point_index] - influence_range)
-        end_index = min(len(self.waveform), x_points[edited_point_index] + influence_range)
-
-        local_x_points = [x for x in x_points if start_index <= x <= end_index]
-        local_y_points = [y_points[x_points.index(x)] for x in local_x_points]
-
-        if len(local_x_points) > 1:
-            f = interp1d(local_x_points, local_y_points, kind='cubic', fill_value='extrapolate')
-            local_indices = np.arange(start_index, end_index)
-            new_local_waveform = f(local_indices)
-
-            transition = np.linspace(0, 1, influence_range)
-            new_local_waveform[:influence_range] = (transition * new_local_waveform[:influence_range] +
-                                                    (1 - transition) * self.waveform[start_index:start_index + influence_range])
-            new_local_waveform[-influence_range:] = (transition[::-1] * new_local_waveform[-influence_range:] +
-                                                     (1 - transition[::-1]) * self.waveform[end_index - influence_range:end_index])
-
-            self.waveform[start_index:end_index] = new_local_waveform
+        kind = 'cubic' if last - first >= 4 else 'linear'
+        f = interpolate.interp1d(indices[first:last], values[first:last], kind=kind, fill_value='extrapolate')
+        edit = SampleEdit(self.waveform, start, end)
+        self.waveform[start:end] = f(np.arange(start, end))
+        self.history.push(edit)
+        self.peaks.update(start, end)
 
     def update_control_points(self):
+        """Control points evenly over the view, WAVEFORM_POINT_SPACING pixels apart.
+
+        Zooming in puts them closer in samples, down to one point per
+        sample, so transients can be edited at sample precision.
+        """
         width = self.drawing_area.get_allocated_width()
         height = self.drawing_area.get_allocated_height()
-        self.control_points = []
-        num_points = 20
-        for i in range(num_points):
-            x = int(i * width / (num_points - 1))
-            index = int(self.view_start + (x / width) * (self.view_end - self.view_start))
-            if index < len(self.waveform):
-                y = height / 2 - (self.waveform[index] * height / 2)
-                self.control_points.append((x, y))
+        count = min(max(2, width // WAVEFORM_POINT_SPACING + 1), self.view_end - self.view_start)
+        self.control_indices = np.unique(np.linspace(self.view_start, self.view_end - 1, count).round()
+                                         .astype(int)).tolist()
+        self.control_points = [(self.x_at(index), height / 2 - (self.waveform[index] * height / 2))
+                               for index in self.control_indices]
 
     def on_tool_toggled(self, button):
         self.current_tool = "edit" if button.get_active() else None
@@ -226,18 +284,60 @@ class WaveformEditorWindow(Gtk.Window):
     def on_button_press(self, widget, event):
         if self.current_tool == "edit":
             self.dragging_point = self.find_nearest_point(event.x, event.y)
+        elif event.button == 1:
+            self.selecting_from = self.sample_at(event.x)
+            self.selection = None
+            self.drawing_area.queue_draw()
 
     def on_button_release(self, widget, event):
         if self.current_tool == "edit" and self.dragging_point is not None:
             self.update_waveform(self.dragging_point)
             self.dragging_point = None
+        if self.selecting_from is not None:
+            self.selecting_from = None
+            if self.selection is not None and self.selection[1] - self.selection[0] < 2:
+                self.selection = None
         self.drawing_area.queue_draw()
 
     def on_motion(self, widget, event):
         if self.current_tool == "edit" and self.dragging_point is not None:
-            x, y = event.x, event.y
-            self.control_points[self.dragging_point] = (x, y)
+            # punkt zostaje między sąsiadami, żeby krzywa dało się wyznaczyć
+            i = self.dragging_point
+            lower = self.control_indices[i - 1] + 1 if i > 0 else self.view_start
+            upper = self.control_indices[i + 1] - 1 if i + 1 < len(self.control_indices) else self.view_end - 1
+            index = min(max(self.sample_at(event.x), lower), upper)
+            self.control_indices[i] = index
+            self.control_points[i] = (self.x_at(index), event.y)
             self.drawing_area.queue_draw()
+        elif self.selecting_from is not None:
+            current = self.sample_at(event.x)
+            self.selection = (min(self.selecting_from, current), max(self.selecting_from, current) + 1)
+            self.drawing_area.queue_draw()
+
+    def on_undo(self, widget):
+        self.show_edit(self.history.undo())
+
+    def on_redo(self, widget):
+        self.show_edit(self.history.redo())
+
+    def show_edit(self, edit):
+        if edit is None:
+            return
+        self.peaks.update(edit.start, edit.end)
+        self.update_control_points()
+        self.drawing_area.queue_draw()
+
+    def on_key_press(self, widget, event):
+        if not event.state & Gdk.ModifierType.CONTROL_MASK:
+            return False
+        key = Gdk.keyval_to_lower(event.keyval)
+        if key == Gdk.KEY_z and not event.state & Gdk.ModifierType.SHIFT_MASK:
+            self.on_undo(widget)
+        elif key in (Gdk.KEY_z, Gdk.KEY_y):
+            self.on_redo(widget)
+        else:
+            return False
+        return True
 
     def on_play(self, widget):
         sound = self.create_pygame_sound()
@@ -268,7 +368,14 @@ class DrumSamplerApp(Gtk.Window):
         self.is_fullscreen = False
         self.scale_factor = 1.0
 
-        pygame.mixer.init()
+        self.render_cache = RenderCache()
+        # edycja parametrów/ADSR renderuje ponownie tylko zmieniony instrument, w tle
+        self.sample_renderer = IncrementalRenderer(self.render_parametric_sample, self.publish_parametric_sample,
+                                                   GLib.idle_add)
+        self.library = SampleLibrary(fallback=self.decode_with_pydub, extensions=('.wav', '.mp3', '.ogg'))
+        self.directory_scanner = DirectoryScanner(extensions=('.wav', '.mp3', '.ogg'))
+        self.preview_cache = PreviewCache(self.decode_preview, PREVIEW_CACHE_MB * 1024 * 1024)
+        self.browser_scan = threading.Event()
 
         # Main container
         scroll_window = Gtk.ScrolledWindow()
@@ -292,6 +399,9 @@ class DrumSamplerApp(Gtk.Window):
             for inst in self.instruments
         }
         self.patterns = self.simple_patterns
+        self.history = EditHistory(HISTORY_BUDGET_MB * 1024 * 1024,
+                                   set_length=lambda length: self.length_spinbutton.set_value(length),
+                                   on_change=lambda: self.event_compiler.invalidate())
         self.base_colors = {'Talerz': '#FF5555', 'Stopa': '#55FF55', 'Werbel': '#5555FF', 'TomTom': '#FFAA00'}
         self.midi_notes = {'Talerz': 49, 'Stopa': 36, 'Werbel': 38, 'TomTom': 45}
         self.buttons = {}
@@ -306,6 +416,7 @@ class DrumSamplerApp(Gtk.Window):
             'swing': {'notes': 2, 'speed': 0.5, 'swing': 0.2},
             'accent': {'notes': 1, 'speed': 1.0, 'swing': 0.0}
         }
+        self.event_compiler = EventCompiler(self.rhythm_types, VARIANTS[VARIANT]['spacing'])
         self.sample_params = {
             'Talerz': {'waveform': 'noise', 'frequency': 8000, 'amplitude': 0.8, 'duration': 1.0, 'attack_curve': 'exponential'},
             'Stopa': {'waveform': 'sine', 'frequency': 100, 'amplitude': 1.0, 'duration': 0.3, 'attack_curve': 'linear'},
@@ -323,11 +434,6 @@ class DrumSamplerApp(Gtk.Window):
         self.swap_buttons = {}
         self.wave_editor_buttons = {}
 
-        # Load or generate samples
-        self.load_samples_from_directory()
-        if not self.samples:
-            self.generate_parametric_samples()
-
         # UI setup
         self.add_css()
         self.create_toolbar()
@@ -361,12 +467,16 @@ class DrumSamplerApp(Gtk.Window):
 
         self.loop_playing = False
         self.play_thread = None
+        self.engine = None
+        self.audio_output = None
         self.dynamic_bpm_list = []
-        self.current_bpm_index = 0
         self.steps_per_bpm = 4
+        self.ramp_bpm = False
+        self.tempo_map_cache = None
 
         # Connect scaling
         self.connect("size-allocate", self.scale_interface)
+        self.connect("key-press-event", self.on_key_press)
 
         self.effect_sliders = {}
         self.groove_type = 'simple'
@@ -386,87 +496,60 @@ class DrumSamplerApp(Gtk.Window):
         self.create_sample_manipulation_area()
         self.create_virtual_drummer_mode_button()
 
-    def generate_parametric_samples(self):
-        sample_rate = 44100
+        # Urządzenie audio (i sample) otwierane w tle dopiero po pokazaniu okna
+        self.main_box.set_sensitive(False)
+        GLib.idle_add(self.start_audio)
+        STARTUP.mark("build window")
+
+    def start_audio(self):
+        STARTUP.mark("show window")
+        threading.Thread(target=self.open_audio, daemon=True).start()
+        return False
+
+    def open_audio(self):
+        with STARTUP.phase("audio device (thread)"):
+            pygame.mixer.init()
+        with STARTUP.phase("load/generate samples (thread)"):
+            samples, waveforms = self.directory_kit(self.current_directory)
+            if not samples:
+                samples, waveforms = self.parametric_kit()
+        GLib.idle_add(self.on_audio_ready, samples, waveforms)
+        # indeks biblioteki (dekoduje nowe pliki) budujemy już po starcie
+        self.library.update(self.current_directory)
+
+    def on_audio_ready(self, samples, waveforms):
+        self.apply_kit(samples, waveforms)
+        self.main_box.set_sensitive(True)
+        STARTUP.mark("audio ready")
+        STARTUP.report()
+        return False
+
+    def parametric_kit(self):
+        samples, waveforms = {}, {}
         for inst in self.instruments:
-            params = self.sample_params[inst]
-            duration = params['duration']
-            t = np.linspace(0, duration, int(sample_rate * duration), False)
-
-            if params['waveform'] == 'sine':
-                signal = params['amplitude'] * np.sin(2 * np.pi * params['frequency'] * t)
-            elif params['waveform'] == 'square':
-                signal = params['amplitude'] * np.sign(np.sin(2 * np.pi * params['frequency'] * t))
-            elif params['waveform'] == 'sawtooth':
-                signal = params['amplitude'] * (2 * (t * params['frequency'] - np.floor(0.5 + t * params['frequency'])))
-            elif params['waveform'] == 'noise':
-                signal = params['amplitude'] * np.random.normal(0, 1, len(t))
-            else:
-                signal = np.zeros(len(t))
+            signal = parametric_sample(self.sample_params[inst], self.current_adsr[inst], 44100)
+            samples[inst] = array_to_sound(match_channels(signal.reshape(-1, 1), 2))
+            waveforms[inst] = signal
+        return samples, waveforms
+
+    def apply_kit(self, samples, waveforms):
+        """Podmienia cały zestaw sampli w wątku GTK; silnik audio widzi stary albo nowy słownik, nigdy pusty."""
+        self.samples = samples
+        self.waveforms.update(waveforms)
+        self.render_cache.invalidate()
+        return False
 
-            signal = self.apply_adsr_to_signal(signal, inst, sample_rate)
-            signal = normalize(AudioSegment(
-                (signal * 32767).astype(np.int16).tobytes(),
-                frame_rate=sample_rate,
-                sample_width=2,
-                channels=1
-            ))
-            signal = np.array(signal.get_array_of_samples()).reshape(-1, 1)
-            signal = np.hstack((signal, signal))
-            self.samples[inst] = pygame.sndarray.make_sound(signal.astype(np.int16))
-            self.waveforms[inst] = signal[:, 0] / 32767.0
-
-    def apply_adsr_to_signal(self, signal, instrument, sample_rate):
-        adsr = self.current_adsr[instrument]
-        total_samples = len(signal)
-        attack_samples = int(adsr['attack'] * sample_rate)
-        decay_samples = int(adsr['decay'] * sample_rate)
-        release_samples = int(adsr['release'] * sample_rate)
-        sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        if sustain_samples < 0:
-            excess = -sustain_samples
-            total_adsr = attack_samples + decay_samples + release_samples
-            scale_factor = (total_samples - excess) / total_adsr
-            attack_samples = int(attack_samples * scale_factor)
-            decay_samples = int(decay_samples * scale_factor)
-            release_samples = int(release_samples * scale_factor)
-            sustain_samples = total_samples - attack_samples - decay_samples - release_samples
-
-        envelope = np.zeros(total_samples, dtype=np.float32)
-        curve_type = self.sample_params[instrument]['attack_curve']
-
-        if attack_samples > 0:
-            if curve_type == 'exponential':
-                envelope[:attack_samples] = np.power(np.linspace(0, 1, attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[:attack_samples] = np.log1p(np.linspace(0, 9, attack_samples)) / np.log1p(9)
-            else:
-                envelope[:attack_samples] = np.linspace(0, 1, attack_samples)
-
-        if decay_samples > 0 and attack_samples < total_samples:
-            decay_end = min(attack_samples + decay_samples, total_samples)
-            if curve_type == 'exponential':
-                envelope[attack_samples:decay_end] = np.power(np.linspace(1, adsr['sustain'], decay_end - attack_samples), 2)
-            elif curve_type == 'logarithmic':
-                envelope[attack_samples:decay_end] = adsr['sustain'] + (1 - adsr['sustain']) * np.log1p(np.linspace(9, 0, decay_end - attack_samples)) / np.log1p(9)
-            else:
-                envelope[attack_samples:decay_end] = np.linspace(1, adsr['sustain'], decay_end - attack_samples)
-
-        if sustain_samples > 0 and attack_samples + decay_samples < total_samples:
-            sustain_end = min(attack_samples + decay_samples + sustain_samples, total_samples)
-            envelope[attack_samples + decay_samples:sustain_end] = adsr['sustain']
-
-        if release_samples > 0 and total_samples - release_samples > 0:
-            release_start = max(0, total_samples - release_samples)
-            if curve_type == 'exponential':
-                envelope[release_start:] = adsr['sustain'] * np.power(np.linspace(1, 0, total_samples - release_start), 2)
-            elif curve_type == 'logarithmic':
-                envelope[release_start:] = adsr['sustain'] * np.log1p(np.linspace(9, 0, total_samples - release_start)) / np.log1p(9)
-            else:
-                envelope[release_start:] = np.linspace(adsr['sustain'], 0, total_samples - release_start)
+    def render_parametric_sample(self, instrument):
+        signal = parametric_sample(self.sample_params[instrument], self.current_adsr[instrument], 44100)
+        return signal, array_to_sound(match_channels(signal.reshape(-1, 1), 2))
 
-        return signal * envelope
+    def publish_parametric_sample(self, instrument, rendered):
+        signal, sound = rendered
+        self.samples[instrument] = sound
+        self.waveforms[instrument] = signal
+        self.render_cache.invalidate(instrument)
+        if self.preview_active[instrument]:
+            sound.play()
 
     def create_sample_manipulation_area(self):
         sample_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=int(10 * self.scale_factor))
@@ -624,7 +707,7 @@ class DrumSamplerApp(Gtk.Window):
         self.current_dir_label = Gtk.Label(label=os.getcwd())
         browser_box.pack_start(self.current_dir_label, False, False, 0)
 
-        self.sample_store = Gtk.ListStore(str, str)
+        self.sample_store = Gtk.ListStore(str, str, bool)  # nazwa, ścieżka, katalog
         self.sample_tree = Gtk.TreeView(model=self.sample_store)
         self.sample_tree.set_headers_visible(True)
 
@@ -695,6 +778,7 @@ class DrumSamplerApp(Gtk.Window):
     def update_sample_from_waveform(self, instrument, waveform, sound):
         self.waveforms[instrument] = waveform
         self.samples[instrument] = sound
+        self.render_cache.invalidate(instrument)
         if self.preview_active[instrument]:
             self.samples[instrument].play()
 
@@ -710,9 +794,7 @@ class DrumSamplerApp(Gtk.Window):
                 self.sample_params[instrument][param] = float(widget.get_text())
             elif param == 'attack_curve':
                 self.sample_params[instrument][param] = widget.get_active_text()
-            self.generate_parametric_samples()
-            if self.preview_active[instrument]:
-                self.samples[instrument].play()
+            self.sample_renderer.mark(instrument)
         except ValueError:
             print(f"Invalid input for {param}")
 
@@ -729,6 +811,8 @@ class DrumSamplerApp(Gtk.Window):
             ("document-open", self.load_project, "Load Project"),
             ("document-export", self.export_to_midi, "Export MIDI"),
             ("document-export", self.export_advanced_midi, "Export Advanced MIDI"),
+            ("edit-undo", self.undo_edit, "Undo"),
+            ("edit-redo", self.redo_edit, "Redo"),
             ("view-fullscreen", self.toggle_fullscreen, "Toggle Fullscreen")
         ]
 
@@ -876,6 +960,10 @@ class DrumSamplerApp(Gtk.Window):
         self.dynamic_bpm_entry.set_text("100,100,100,100")
         self.dynamic_bpm_entry.connect("changed", self.apply_dynamic_bpm)
         dynamic_bpm_box.pack_start(self.dynamic_bpm_entry, False, False, 0)
+        ramp_check = Gtk.CheckButton(label="Ramp")
+        ramp_check.set_tooltip_text("Glide between the dynamic BPM values")
+        ramp_check.connect("toggled", self.on_ramp_bpm_toggled)
+        dynamic_bpm_box.pack_start(ramp_check, False, False, 0)
         self.main_box.pack_start(dynamic_bpm_box, False, False, 0)
 
     def create_pattern_controls(self):
@@ -969,11 +1057,11 @@ class DrumSamplerApp(Gtk.Window):
         try:
             percentages = [float(x.strip()) for x in self.dynamic_bpm_entry.get_text().split(',')]
             self.dynamic_bpm_list = [self.absolute_bpm * (p / 100) for p in percentages]
-            self.current_bpm_index = 0
         except ValueError:
             self.dynamic_bpm_list = [self.absolute_bpm]
             self.dynamic_bpm_entry.set_text("100")
 
+    @pattern_edit
     def on_pattern_length_changed(self, spinbutton):
         new_length = int(spinbutton.get_value())
         for inst in self.instruments:
@@ -989,6 +1077,8 @@ class DrumSamplerApp(Gtk.Window):
     def on_sequencer_mode_switch(self, switch, gparam):
         self.advanced_sequencer_mode = switch.get_active()
         self.patterns = self.advanced_patterns if self.advanced_sequencer_mode else self.simple_patterns
+        # zapisane zmiany dotyczą wzorca drugiego trybu - cofnięcie nadpisałoby nie ten wzorzec
+        self.history.clear()
         self.update_buttons()
 
     def on_performer_mode_switch(self, switch, gparam):
@@ -1001,12 +1091,14 @@ class DrumSamplerApp(Gtk.Window):
             self.play_thread = threading.Thread(target=self.virtual_drummer_loop)
             self.play_thread.start()
 
+    @pattern_edit
     def on_button_toggled(self, button, instrument, step):
         if self.advanced_sequencer_mode:
             self.patterns[instrument][step]['active'] = button.get_active()
         else:
             self.patterns[instrument][step] = 1 if button.get_active() else 0
 
+    @pattern_edit
     def on_scroll(self, button, event, instrument, step):
         if self.advanced_sequencer_mode:
             if event.direction == Gdk.ScrollDirection.UP:
@@ -1030,6 +1122,7 @@ class DrumSamplerApp(Gtk.Window):
 
     def on_effect_changed(self, scale, instrument, effect):
         self.effects[instrument][effect] = scale.get_value()
+        self.render_cache.invalidate(instrument)
         self.update_effect_colors()
 
     def update_effect_colors(self):
@@ -1050,74 +1143,113 @@ class DrumSamplerApp(Gtk.Window):
                         context.remove_class("negative-effect")
 
     def apply_effects(self, sound, instrument, export=False):
-        audio_segment = AudioSegment(
-            pygame.sndarray.array(sound).tobytes(),
-            frame_rate=44100,
-            sample_width=2,
-            channels=2
-        )
-        if not export:
-            audio_segment = audio_segment + self.effects[instrument]['volume']
-            audio_segment = audio_segment.pan(self.effects[instrument]['pan'])
-            if self.effects[instrument]['pitch'] != 0:
-                audio_segment = audio_segment._spawn(audio_segment.raw_data, overrides={
-                    "frame_rate": int(audio_segment.frame_rate * (2.0 ** (self.effects[instrument]['pitch'] / 12.0)))
-                })
-            if self.effects[instrument]['reverb'] > 0:
-                reverb_segment = audio_segment.fade(to_gain=-120, start=0, duration=1000)
-                reverb_gain = -20 * (1 - self.effects[instrument]['reverb'])
-                reverb_segment = reverb_segment + reverb_gain
-                audio_segment = audio_segment.overlay(reverb_segment, position=0)
-            if self.effects[instrument]['echo'] > 0:
-                echo_segment = audio_segment + self.effects[instrument]['echo']
-                audio_segment = audio_segment.overlay(echo_segment, position=100)
-        samples = np.array(audio_segment.get_array_of_samples()).reshape(-1, 2)
-        return pygame.sndarray.make_sound(samples.astype(np.int16))
-
-    def load_samples_from_directory(self):
-        self.samples.clear()
-        for root, _, files in os.walk(self.current_directory):
-            for file in files:
-                if file.lower().endswith(('.wav', '.mp3', '.ogg')):
-                    for inst in self.instruments:
-                        if inst.lower() in file.lower():
-                            try:
-                                audio_segment = AudioSegment.from_file(os.path.join(root, file))
-                                audio_segment = audio_segment.set_channels(2)
-                                audio_segment = normalize(audio_segment)
-                                samples = np.array(audio_segment.get_array_of_samples()).reshape(-1, 2)
-                                self.samples[inst] = pygame.sndarray.make_sound(samples.astype(np.int16))
-                                self.waveforms[inst] = samples[:, 0] / 32767.0
-                            except Exception as e:
-                                print(f"Error loading sample {file} for {inst}: {e}")
+        if export:
+            return sound
+        return array_to_sound(self.effects_array(sound, instrument))
+
+    def effects_array(self, sound, instrument, sample_rate=None):
+        # Sound ma częstotliwość miksera, chyba że wywołujący poda inną
+        sample_rate = sample_rate or mixer_format()[0]
+        buffer = to_float32(pygame.sndarray.array(sound))
+        return apply_effect_chain(buffer, self.effects[instrument], sample_rate, VARIANTS[VARIANT]['effect_style'])
+
+    def directory_kit(self, directory):
+        """(samples, waveforms) z katalogu, budowane lokalnie w wątku roboczym.
+
+        Pliki wybierane są po samych nazwach (listingi skanera), dekodowany
+        jest tylko plik wybrany dla każdego instrumentu, równolegle.
+        """
+        paths = [path for batch in self.directory_scanner.scan(directory) for _, path, is_dir in batch if not is_dir]
+        chosen = choose_kit(paths, self.instruments)
+        decoded = decode_files(chosen, self.decode_kit_sample, progress=self.sample_load_progress)
+        samples, waveforms = {}, {}
+        for inst, data in decoded.items():
+            if isinstance(data, Exception):
+                print(f"Error loading sample {os.path.basename(chosen[inst])} for {inst}: {data}")
+                continue
+            samples[inst] = pygame.sndarray.make_sound(data)
+            waveforms[inst] = data[:, 0] / 32767.0
+        return samples, waveforms
+
+    def decode_preview(self, path):
+        """Plik jako int16 stereo w formacie miksera (wpis cache odsłuchu)."""
+        audio_segment = AudioSegment.from_file(path)
+        audio_segment = audio_segment.set_channels(2).set_sample_width(2).set_frame_rate(mixer_format()[0])
+        return np.array(audio_segment.get_array_of_samples(), dtype=np.int16).reshape(-1, 2)
+
+    def decode_kit_sample(self, path):
+        return to_int16(normalize_peak(to_float32(self.preview_cache.get(path))))
+
+    def sample_load_progress(self, done, total, instrument):
+        directory = self.current_directory
+        text = directory if done == total else f"{directory} (loading samples {done}/{total})"
+        GLib.idle_add(self.current_dir_label.set_text, text)
+
+    def load_directory_kit(self):
+        directory = self.current_directory
+        GLib.idle_add(self.apply_kit, *self.directory_kit(directory))
+        self.library.update(directory)
+
+    def decode_with_pydub(self, path):
+        """Dla formatów, których nie czyta soundfile: (tablica, częstotliwość)."""
+        audio_segment = AudioSegment.from_file(path)
+        samples = np.array(audio_segment.get_array_of_samples()).reshape(-1, audio_segment.channels)
+        return samples, audio_segment.frame_rate
 
     def refresh_sample_browser(self, button):
+        # poprzednie skanowanie (np. katalogu, z którego właśnie wyszliśmy) jest przerywane
+        self.browser_scan.set()
+        self.browser_scan = threading.Event()
+        rescan = button is not None
+        if rescan:
+            self.directory_scanner.invalidate(self.current_directory)
         self.sample_store.clear()
-        for root, _, files in os.walk(self.current_directory):
-            for file in files:
-                if file.lower().endswith(('.wav', '.mp3', '.ogg')):
-                    self.sample_store.append([file, os.path.join(root, file)])
+        threading.Thread(target=self.scan_sample_browser,
+                         args=(self.current_directory, self.browser_scan, rescan), daemon=True).start()
+
+    def scan_sample_browser(self, directory, cancel, rescan):
+        for batch in self.directory_scanner.scan(directory, cancel.is_set):
+            GLib.idle_add(self.append_browser_rows, batch, cancel)
+        # przycisk odświeżania aktualizuje też indeks biblioteki
+        if rescan:
+            self.library.update(directory, cancel.is_set)
+
+    def append_browser_rows(self, rows, cancel):
+        if not cancel.is_set():
+            for name, path, is_dir in rows:
+                self.sample_store.append([name, path, is_dir])
+        return False
 
     def on_sample_selected(self, selection):
         model, treeiter = selection.get_selected()
-        if treeiter is not None:
+        if treeiter is not None and not model[treeiter][2]:
             sample_path = model[treeiter][1]
             try:
-                sound = pygame.mixer.Sound(sample_path)
-                sound.play()
+                pygame.sndarray.make_sound(self.preview_cache.get(sample_path)).play()
             except Exception as e:
                 print(f"Error playing sample {sample_path}: {e}")
+            # kolejne pliki na liście dekodujemy w tle, żeby odsłuch strzałkami był natychmiastowy
+            upcoming = []
+            treeiter = model.iter_next(treeiter)
+            while treeiter is not None and len(upcoming) < PREVIEW_PREFETCH:
+                if not model[treeiter][2]:
+                    upcoming.append(model[treeiter][1])
+                treeiter = model.iter_next(treeiter)
+            self.preview_cache.prefetch(upcoming)
 
     def on_sample_activated(self, treeview, path, column):
         sample_path = self.sample_store[path][1]
+        if self.sample_store[path][2]:
+            self.current_directory = sample_path
+            self.current_dir_label.set_text(self.current_directory)
+            self.refresh_sample_browser(None)
+            return
         for inst in self.instruments:
             if self.swap_buttons[inst].get_state_flags() & Gtk.StateFlags.ACTIVE:
                 try:
-                    audio_segment = AudioSegment.from_file(sample_path)
-                    audio_segment = audio_segment.set_channels(2)
-                    audio_segment = normalize(audio_segment)
-                    samples = np.array(audio_segment.get_array_of_samples()).reshape(-1, 2)
-                    self.samples[inst] = pygame.sndarray.make_sound(samples.astype(np.int16))
+                    samples = self.decode_kit_sample(sample_path)
+                    self.samples[inst] = pygame.sndarray.make_sound(samples)
+                    self.render_cache.invalidate(inst)
                     self.waveforms[inst] = samples[:, 0] / 32767.0
                     self.swap_buttons[inst].set_active(False)
                 except Exception as e:
@@ -1136,47 +1268,44 @@ class DrumSamplerApp(Gtk.Window):
     def play_pattern(self, widget):
         if not self.loop_playing:
             self.loop_playing = True
-            self.play_thread = threading.Thread(target=self.play_loop)
-            self.play_thread.start()
+            self.start_engine()
 
     def stop_pattern(self, widget):
         self.loop_playing = False
+        self.stop_engine()
         if self.play_thread:
             self.play_thread.join()
             self.play_thread = None
 
-    def play_loop(self):
-        pattern_length = int(self.length_spinbutton.get_value())
-        step_duration = 60.0 / (self.get_next_bpm() * 4)
-        steps_played = 0
-
-        while self.loop_playing:
-            for step in range(pattern_length):
-                if not self.loop_playing:
-                    break
-                current_bpm = self.get_next_bpm()
-                step_duration = 60.0 / (current_bpm * 4)
-                for instrument in self.instruments:
-                    if self.advanced_sequencer_mode:
-                        step_data = self.patterns[instrument][step]
-                        if step_data['active']:
-                            rhythm = self.rhythm_types[step_data['rhythm_type']]
-                            sound = self.apply_effects(self.samples[instrument], instrument)
-                            for i in range(rhythm['notes']):
-                                swing_offset = rhythm['swing'] * step_duration * i
-                                sound.play()
-                                time.sleep(step_duration * rhythm['speed'] + swing_offset)
-                            GLib.idle_add(self.highlight_button, instrument, step)
-                    else:
-                        if self.patterns[instrument][step]:
-                            sound = self.apply_effects(self.samples[instrument], instrument)
-                            sound.play()
-                            GLib.idle_add(self.highlight_button, instrument, step)
-                time.sleep(step_duration)
-                steps_played += 1
-                if steps_played >= self.steps_per_bpm:
-                    self.advance_bpm()
-                    steps_played = 0
+    def start_engine(self):
+        self.stop_engine()
+        sample_rate, channels = mixer_format()
+        self.engine = PatternEngine(self.play_step_events, self.engine_sample, self.current_tempo_map,
+                                    pattern_length=int(self.length_spinbutton.get_value()),
+                                    sample_rate=sample_rate, channels=channels)
+        self.audio_output = PygameBlockOutput(self.engine)
+        self.audio_output.start()
+
+    def stop_engine(self):
+        output, self.audio_output = self.audio_output, None
+        if output is not None:
+            output.stop()
+
+    def engine_sample(self, instrument):
+        # apply_kit podmienia cały słownik - czytamy go raz
+        sound = self.samples.get(instrument)
+        if sound is None:
+            return None
+        cache_key = render_key(instrument, sound, self.effects[instrument], self.current_adsr[instrument],
+                               self.sample_params[instrument]['attack_curve'])
+        return self.render_cache.get_or_render(
+            cache_key, lambda: match_channels(self.effects_array(sound, instrument, self.engine.sample_rate), self.engine.channels), keep=sound)
+
+    def play_step_events(self, step):
+        events = self.compiled_pattern().step_events(step)
+        for instrument in dict.fromkeys(event[1] for event in events):
+            GLib.idle_add(self.highlight_button, instrument, step)
+        return events
 
     def highlight_button(self, instrument, step):
         button = self.buttons[instrument][step]
@@ -1190,40 +1319,20 @@ class DrumSamplerApp(Gtk.Window):
         return False
 
     def virtual_drummer_loop(self):
-        pattern_length = int(self.length_spinbutton.get_value())
         improvisation_count = 0
         max_improvisations = 4
 
         while self.virtual_drummer_mode and improvisation_count < max_improvisations:
-            self.randomize_pattern(None)
-            self.apply_groove(None)
-            self.perfect_tempo_bpm(None)
+            # wzorzec zmieniany w wątku GTK (przyciski, historia cofania)
+            improvised = threading.Event()
+            GLib.idle_add(self.improvise_pattern, improvised)
+            while self.virtual_drummer_mode and not improvised.wait(0.05):
+                pass
             loops = random.randint(2, 4)
-            for _ in range(loops):
-                if not self.virtual_drummer_mode:
-                    break
-                for step in range(pattern_length):
-                    if not self.virtual_drummer_mode:
-                        break
-                    current_bpm = self.get_next_bpm()
-                    step_duration = 60.0 / (current_bpm * 4)
-                    for instrument in self.instruments:
-                        if self.advanced_sequencer_mode:
-                            step_data = self.patterns[instrument][step]
-                            if step_data['active']:
-                                rhythm = self.rhythm_types[step_data['rhythm_type']]
-                                sound = self.apply_effects(self.samples[instrument], instrument)
-                                for i in range(rhythm['notes']):
-                                    swing_offset = rhythm['swing'] * step_duration * i
-                                    sound.play()
-                                    time.sleep(step_duration * rhythm['speed'] + swing_offset)
-                                GLib.idle_add(self.highlight_button, instrument, step)
-                        else:
-                            if self.patterns[instrument][step]:
-                                sound = self.apply_effects(self.samples[instrument], instrument)
-                                sound.play()
-                                GLib.idle_add(self.highlight_button, instrument, step)
-                    time.sleep(step_duration)
+            self.start_engine()
+            while self.virtual_drummer_mode and self.engine.loops_completed < loops:
+                time.sleep(0.05)
+            self.stop_engine()
             improvisation_count += 1
             for instrument in self.instruments:
                 for effect in ['volume', 'pitch', 'echo', 'reverb', 'pan']:
@@ -1231,19 +1340,29 @@ class DrumSamplerApp(Gtk.Window):
                         self.effects[instrument][effect] = random.uniform(-2, 2)
                         if effect in self.effect_sliders[instrument]:
                             GLib.idle_add(self.effect_sliders[instrument][effect].set_value, self.effects[instrument][effect])
-            self.update_effect_colors()
+            GLib.idle_add(self.update_effect_colors)
             percentages = [random.randint(90, 110) for _ in range(4)]
-            self.dynamic_bpm_entry.set_text(','.join(map(str, percentages)))
+            # idle_add zachowuje kolejność: apply_dynamic_bpm czyta już nowy tekst
+            GLib.idle_add(self.dynamic_bpm_entry.set_text, ','.join(map(str, percentages)))
             GLib.idle_add(self.apply_dynamic_bpm, None)
         self.virtual_drummer_mode = False
         GLib.idle_add(self.update_drummer_button_label)
 
+    def improvise_pattern(self, done):
+        self.randomize_pattern(None)
+        self.apply_groove(None)
+        # tempo dopasowane do nowego wzorca, zanim wątek perkusisty uruchomi silnik
+        self.perfect_tempo_bpm(None)
+        done.set()
+        return False
+
     def update_drummer_button_label(self):
         for child in self.main_box.get_children():
             if isinstance(child, Gtk.Button) and child.get_tooltip_text() == "Toggle Virtual Drummer Mode":
                 child.set_label("Start Virtual Drummer")
         return False
 
+    @pattern_edit
     def randomize_pattern(self, widget):
         pattern_length = int(self.length_spinbutton.get_value())
         for instrument in self.instruments:
@@ -1256,6 +1375,7 @@ class DrumSamplerApp(Gtk.Window):
                     self.patterns[instrument][i] = 1 if random.random() < 0.3 else 0
         self.update_buttons()
 
+    @pattern_edit
     def apply_groove(self, widget):
         groove_type = self.groove_combo.get_active_text()
         pattern_length = int(self.length_spinbutton.get_value())
@@ -1327,7 +1447,8 @@ class DrumSamplerApp(Gtk.Window):
             buttons=("Save", Gtk.ResponseType.OK, "Cancel", Gtk.ResponseType.CANCEL)
         )
         dialog.set_do_overwrite_confirmation(True)
-        dialog.set_current_name("drum_pattern.json")
+        # .dpz: manifest + waveformy jako .npy (wybór nazwy .json zapisuje stary format)
+        dialog.set_current_name("drum_pattern.dpz")
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             filename = dialog.get_filename()
@@ -1341,10 +1462,8 @@ class DrumSamplerApp(Gtk.Window):
                 'advanced_sequencer_mode': self.advanced_sequencer_mode,
                 'adsr': self.current_adsr,
                 'sample_params': self.sample_params,
-                'waveforms': {inst: waveform.tolist() for inst, waveform in self.waveforms.items()}
             }
-            with open(filename, 'w') as f:
-                json.dump(project_data, f, indent=4)
+            save_project_file(filename, project_data, self.waveforms)
         dialog.destroy()
 
     def load_project(self, widget):
@@ -1356,8 +1475,7 @@ class DrumSamplerApp(Gtk.Window):
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             filename = dialog.get_filename()
-            with open(filename, 'r') as f:
-                project_data = json.load(f)
+            project_data = load_project_file(filename)
             self.patterns = project_data['patterns']
             self.effects = project_data['effects']
             self.absolute_bpm = project_data['bpm']
@@ -1368,8 +1486,10 @@ class DrumSamplerApp(Gtk.Window):
             self.sequencer_mode_switch.set_active(self.advanced_sequencer_mode)
             self.current_adsr = project_data.get('adsr', self.current_adsr)
             self.sample_params = project_data.get('sample_params', self.sample_params)
-            self.waveforms = {inst: np.array(data) for inst, data in project_data.get('waveforms', {}).items()}
+            # waveformy z kontenera są mapowane z pliku (tylko do odczytu)
+            self.waveforms = dict(project_data.get('waveforms', {}))
             self.patterns = self.advanced_patterns if self.advanced_sequencer_mode else self.simple_patterns
+            self.history.clear()
             for inst in self.instruments:
                 for effect in self.effects[inst]:
                     if effect in self.effect_sliders[inst]:
@@ -1388,16 +1508,9 @@ class DrumSamplerApp(Gtk.Window):
                     else:
                         self.sample_param_controls[inst][param].set_text(str(self.sample_params[inst][param]))
                 if inst in self.waveforms:
-                    audio_segment = AudioSegment(
-                        (self.waveforms[inst] * 32767).astype(np.int16).tobytes(),
-                        frame_rate=44100,
-                        sample_width=2,
-                        channels=1
-                    )
-                    audio_segment = normalize(audio_segment)
-                    samples = np.array(audio_segment.get_array_of_samples()).reshape(-1, 1)
-                    samples = np.hstack((samples, samples))
-                    self.samples[inst] = pygame.sndarray.make_sound(samples.astype(np.int16))
+                    signal = normalize_peak(np.array(self.waveforms[inst], dtype=np.float32).reshape(-1, 1))
+                    self.samples[inst] = array_to_sound(match_channels(signal, 2))
+                    self.render_cache.invalidate(inst)
             self.bpm_entry.set_text(str(self.absolute_bpm))
             self.apply_dynamic_bpm(None)
             self.update_buttons()
@@ -1415,34 +1528,12 @@ class DrumSamplerApp(Gtk.Window):
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             filename = dialog.get_filename()
-            midi = MIDIFile(1)
-            track = 0
-            channel = 9
-            time = 0
-            midi.addTempo(track, time, self.absolute_bpm)
             pattern_length = int(self.length_spinbutton.get_value())
-            step_duration = 60.0 / (self.absolute_bpm * 4)
-    
-            for instrument in self.instruments:
-                for step in range(pattern_length):
-                    if self.advanced_sequencer_mode:
-                        step_data = self.patterns[instrument][step]
-                        if step_data['active']:
-                            rhythm = self.rhythm_types[step_data['rhythm_type']]
-                            for i in range(rhythm['notes']):
-                                note_time = time + (step + i * rhythm['speed'] + rhythm['swing'] * i) * step_duration
-                                midi.addNote(
-                                    track, channel, self.midi_notes[instrument], note_time,
-                                    step_duration * rhythm['speed'], 100
-                                )
-                    else:
-                        if self.patterns[instrument][step]:
-                            midi.addNote(
-                                track, channel, self.midi_notes[instrument], time + step * step_duration,
-                                step_duration, 100
-                            )
-            with open(filename, "wb") as output_file:
-                midi.writeFile(output_file)
+            velocity, accent_velocity = midi_velocities(VARIANT, self.effects, self.instruments)
+            midi = pattern_midi(self.patterns, self.instruments, self.midi_notes, pattern_length, self.current_tempo_map(),
+                                self.advanced_sequencer_mode, self.rhythm_types, VARIANTS[VARIANT]['spacing'],
+                                velocity, accent_velocity)
+            write_midi_file(midi, filename)
         dialog.destroy()
     
     def export_advanced_midi(self, widget):
@@ -1456,37 +1547,12 @@ class DrumSamplerApp(Gtk.Window):
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             filename = dialog.get_filename()
-            midi = MIDIFile(1)
-            track = 0
-            channel = 9
-            time = 0
-            midi.addTempo(track, time, self.absolute_bpm)
             pattern_length = int(self.length_spinbutton.get_value())
-            step_duration = 60.0 / (self.absolute_bpm * 4)
-    
-            for instrument in self.instruments:
-                for step in range(pattern_length):
-                    if self.advanced_sequencer_mode:
-                        step_data = self.patterns[instrument][step]
-                        if step_data['active']:
-                            rhythm = self.rhythm_types[step_data['rhythm_type']]
-                            for i in range(rhythm['notes']):
-                                note_time = time + (step + i * rhythm['speed'] + rhythm['swing'] * i) * step_duration
-                                velocity = 100
-                                if step_data['rhythm_type'] == 'accent':
-                                    velocity = 127 if i == 0 else 80
-                                midi.addNote(
-                                    track, channel, self.midi_notes[instrument], note_time,
-                                    step_duration * rhythm['speed'], velocity
-                                )
-                    else:
-                        if self.patterns[instrument][step]:
-                            midi.addNote(
-                                track, channel, self.midi_notes[instrument], time + step * step_duration,
-                                step_duration, 100
-                            )
-            with open(filename, "wb") as output_file:
-                midi.writeFile(output_file)
+            velocity, accent_velocity = midi_velocities(VARIANT, self.effects, self.instruments)
+            midi = pattern_midi(self.patterns, self.instruments, self.midi_notes, pattern_length, self.current_tempo_map(),
+                                self.advanced_sequencer_mode, self.rhythm_types, VARIANTS[VARIANT]['spacing'],
+                                velocity, accent_velocity)
+            write_midi_file(midi, filename)
         dialog.destroy()
     
     def add_drummer_to_audio(self, widget):
@@ -1500,34 +1566,21 @@ class DrumSamplerApp(Gtk.Window):
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             filename = dialog.get_filename()
-            sample_rate = 44100
-            pattern_length = int(self.length_spinbutton.get_value())
-            step_duration = 60.0 / (self.absolute_bpm * 4)
-            total_duration_ms = pattern_length * step_duration * 1000
-            mixed_audio = AudioSegment.silent(duration=total_duration_ms)
-    
-            for instrument in self.instruments:
-                instrument_audio = AudioSegment.silent(duration=total_duration_ms)
-                for step in range(pattern_length):
-                    if self.advanced_sequencer_mode:
-                        step_data = self.patterns[instrument][step]
-                        if step_data['active']:
-                            rhythm = self.rhythm_types[step_data['rhythm_type']]
-                            for i in range(rhythm['notes']):
-                                position_ms = (step + i * rhythm['speed'] + rhythm['swing'] * i) * step_duration * 1000
-                                audio_segment = self.apply_effects(self.samples[instrument], instrument, export=True)
-                                instrument_audio = instrument_audio.overlay(audio_segment, position=position_ms)
-                    else:
-                        if self.patterns[instrument][step]:
-                            position_ms = step * step_duration * 1000
-                            audio_segment = self.apply_effects(self.samples[instrument], instrument, export=True)
-                            instrument_audio = instrument_audio.overlay(audio_segment, position=position_ms)
-                mixed_audio = mixed_audio.overlay(instrument_audio)
-    
-            mixed_audio = normalize(mixed_audio)
-            mixed_audio.export(filename, format="wav")
+            export_pattern(filename, self.offline_step_events, self.offline_sample, self.absolute_bpm,
+                           int(self.length_spinbutton.get_value()), tempo_map=self.current_tempo_map())
         dialog.destroy()
     
+    def compiled_pattern(self):
+        return self.event_compiler.compile(self.patterns, self.instruments, self.advanced_sequencer_mode)
+
+    def offline_step_events(self, step):
+        return self.compiled_pattern().step_events(step)
+
+    def offline_sample(self, instrument):
+        if instrument not in self.samples:
+            return None
+        return self.effects_array(self.samples[instrument], instrument)
+
     def load_samples(self, widget):
         dialog = Gtk.FileChooserDialog(
             title="Select Sample Directory",
@@ -1538,7 +1591,7 @@ class DrumSamplerApp(Gtk.Window):
         if response == Gtk.ResponseType.OK:
             self.current_directory = dialog.get_filename()
             self.current_dir_label.set_text(self.current_directory)
-            self.load_samples_from_directory()
+            threading.Thread(target=self.load_directory_kit, daemon=True).start()
             self.refresh_sample_browser(None)
         dialog.destroy()
     
@@ -1551,22 +1604,21 @@ class DrumSamplerApp(Gtk.Window):
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             filename = dialog.get_filename()
-            with open(filename, 'r') as f:
-                bank_data = json.load(f)
-            for inst in self.instruments:
-                if inst in bank_data:
-                    audio_segment = AudioSegment(
-                        np.array(bank_data[inst]['samples']).astype(np.int16).tobytes(),
-                        frame_rate=44100,
-                        sample_width=2,
-                        channels=2
-                    )
-                    audio_segment = normalize(audio_segment)
-                    samples = np.array(audio_segment.get_array_of_samples()).reshape(-1, 2)
-                    self.samples[inst] = pygame.sndarray.make_sound(samples.astype(np.int16))
-                    self.waveforms[inst] = samples[:, 0] / 32767.0
-                    self.sample_params[inst] = bank_data[inst].get('params', self.sample_params[inst])
-                    self.current_adsr[inst] = bank_data[inst].get('adsr', self.current_adsr[inst])
+            try:
+                bank = load_bank(filename, mixer_format()[0])
+            except (OSError, ValueError) as e:
+                print(f"Error loading bank: {e}")
+                bank = None
+            # zawsze podmieniamy sample - ponowne dekodowanie tego samego banku omija cache w load_bank
+            if bank is not None:
+                for inst in self.instruments:
+                    if inst in bank.samples:
+                        signal = normalize_peak(np.array(bank.samples[inst]))
+                        self.samples[inst] = array_to_sound(match_channels(signal, 2))
+                        self.waveforms[inst] = signal[:, 0]
+                        self.render_cache.invalidate(inst)
+                    self.sample_params[inst] = bank.sample_params.get(inst, self.sample_params[inst])
+                    self.current_adsr[inst] = bank.adsr.get(inst, self.current_adsr[inst])
                     for param in ['attack', 'decay', 'sustain', 'release']:
                         self.adsr_entries[inst][param].set_text(f"{self.current_adsr[inst][param]:.2f}")
                     for param in ['waveform', 'frequency', 'amplitude', 'duration', 'attack_curve']:
@@ -1589,20 +1641,13 @@ class DrumSamplerApp(Gtk.Window):
             buttons=("Save", Gtk.ResponseType.OK, "Cancel", Gtk.ResponseType.CANCEL)
         )
         dialog.set_do_overwrite_confirmation(True)
-        dialog.set_current_name("sample_bank.json")
+        dialog.set_current_name("sample_bank.zip")
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             filename = dialog.get_filename()
-            bank_data = {}
-            for inst in self.instruments:
-                samples = pygame.sndarray.array(self.samples[inst])
-                bank_data[inst] = {
-                    'samples': samples.tolist(),
-                    'params': self.sample_params[inst],
-                    'adsr': self.current_adsr[inst]
-                }
-            with open(filename, 'w') as f:
-                json.dump(bank_data, f, indent=4)
+            samples = {inst: pygame.sndarray.array(self.samples[inst]) for inst in self.instruments}
+            write_bank(filename, samples, mixer_format()[0], self.current_adsr, self.sample_params,
+                       compression_level=BANK_COMPRESSION)
         dialog.destroy()
     
     def autolevel_samples(self, widget):
@@ -1625,19 +1670,16 @@ class DrumSamplerApp(Gtk.Window):
     
     def adjust_adsr(self, button, instrument, param, delta):
         self.current_adsr[instrument][param] = max(0.0, min(1.0, self.current_adsr[instrument][param] + delta))
+        self.render_cache.invalidate(instrument)
         self.adsr_entries[instrument][param].set_text(f"{self.current_adsr[instrument][param]:.2f}")
-        self.generate_parametric_samples()
-        if self.preview_active[instrument]:
-            self.samples[instrument].play()
+        self.sample_renderer.mark(instrument)
     
     def on_adsr_entry_changed(self, entry, instrument, param):
         try:
             value = float(entry.get_text())
             if 0.0 <= value <= 1.0:
                 self.current_adsr[instrument][param] = value
-                self.generate_parametric_samples()
-                if self.preview_active[instrument]:
-                    self.samples[instrument].play()
+                self.sample_renderer.mark(instrument)
             else:
                 entry.set_text(f"{self.current_adsr[instrument][param]:.2f}")
         except ValueError:
@@ -1647,18 +1689,15 @@ class DrumSamplerApp(Gtk.Window):
         self.current_adsr[instrument] = self.nominal_adsr[instrument].copy()
         for param in ['attack', 'decay', 'sustain', 'release']:
             self.adsr_entries[instrument][param].set_text(f"{self.current_adsr[instrument][param]:.2f}")
-        self.generate_parametric_samples()
-        if self.preview_active[instrument]:
-            self.samples[instrument].play()
+        self.sample_renderer.mark(instrument)
     
     def randomize_adsr(self, button, instrument):
         for param in ['attack', 'decay', 'sustain', 'release']:
             self.current_adsr[instrument][param] = random.uniform(0.0, 1.0)
             self.adsr_entries[instrument][param].set_text(f"{self.current_adsr[instrument][param]:.2f}")
-        self.generate_parametric_samples()
-        if self.preview_active[instrument]:
-            self.samples[instrument].play()
+        self.sample_renderer.mark(instrument)
     
+    @pattern_edit
     def randomize_instrument(self, button, instrument):
         pattern_length = int(self.length_spinbutton.get_value())
         for i in range(pattern_length):
@@ -1672,26 +1711,24 @@ class DrumSamplerApp(Gtk.Window):
     
     def perfect_tempo_bpm(self, widget):
         pattern_length = int(self.length_spinbutton.get_value())
-        total_duration = 0.0
-        for step in range(pattern_length):
-            current_bpm = self.get_next_bpm()
-            step_duration = 60.0 / (current_bpm * 4)
-            total_duration += step_duration
-        if total_duration > 0:
-            target_bpm = (pattern_length / total_duration) * 60
-            self.absolute_bpm = target_bpm
-            self.bpm_entry.set_text(str(round(target_bpm, 2)))
-            self.dynamic_bpm_list = [self.absolute_bpm]
-    
-    def get_next_bpm(self):
-        if not self.dynamic_bpm_list:
-            return self.absolute_bpm
-        bpm = self.dynamic_bpm_list[self.current_bpm_index]
-        return bpm
+        target_bpm = self.current_tempo_map().average_bpm(pattern_length)
+        self.absolute_bpm = target_bpm
+        self.bpm_entry.set_text(str(round(target_bpm, 2)))
+        self.dynamic_bpm_list = [self.absolute_bpm]
     
-    def advance_bpm(self):
-        if self.dynamic_bpm_list:
-            self.current_bpm_index = (self.current_bpm_index + 1) % len(self.dynamic_bpm_list)
+    def current_tempo_map(self):
+        """TempoMap of the BPM and dynamic BPM settings, rebuilt only when they change."""
+        key = (self.absolute_bpm, tuple(self.dynamic_bpm_list), self.steps_per_bpm, self.ramp_bpm)
+        cached = self.tempo_map_cache
+        if cached is None or cached[0] != key:
+            bpms = [bpm for bpm in self.dynamic_bpm_list if bpm > 0] or [self.absolute_bpm]
+            # jedno przypisanie krotki, bo wątek audio czyta ją równolegle
+            cached = (key, TempoMap.from_list(bpms, self.steps_per_bpm, self.ramp_bpm))
+            self.tempo_map_cache = cached
+        return cached[1]
+
+    def on_ramp_bpm_toggled(self, button):
+        self.ramp_bpm = button.get_active()
     
     def toggle_fullscreen(self, widget):
         if not self.is_fullscreen:
@@ -1726,7 +1763,29 @@ class DrumSamplerApp(Gtk.Window):
             for effect in ['volume', 'pitch', 'echo', 'reverb', 'pan']:
                 self.effect_sliders[inst][effect].set_size_request(int(100 * self.scale_factor), -1)
     
+    def undo_edit(self, widget):
+        if self.history.undo() is not None:
+            self.update_buttons()
+
+    def redo_edit(self, widget):
+        if self.history.redo() is not None:
+            self.update_buttons()
+
+    def on_key_press(self, widget, event):
+        # Ctrl+Z cofa, Ctrl+Shift+Z / Ctrl+Y ponawia; pola tekstowe zostają przy swoich skrótach
+        if not event.state & Gdk.ModifierType.CONTROL_MASK or isinstance(self.get_focus(), Gtk.Editable):
+            return False
+        key = Gdk.keyval_to_lower(event.keyval)
+        if key == Gdk.KEY_z and not event.state & Gdk.ModifierType.SHIFT_MASK:
+            self.undo_edit(widget)
+        elif key in (Gdk.KEY_z, Gdk.KEY_y):
+            self.redo_edit(widget)
+        else:
+            return False
+        return True
+
     def update_buttons(self):
+        self.event_compiler.invalidate()
         pattern_length = int(self.length_spinbutton.get_value())
         for inst in self.instruments:
             for i, button in enumerate(self.buttons[inst]):
@@ -0,0 +1,89 @@
+import zipfile
+
+import numpy as np
+import pytest
+
+from drumpatterns_core import bank
+from drumpatterns_core.bank import BankError, is_bank, load_bank, read_manifest, write_bank
+
+ADSR = {'Stopa': {'attack': 0.01, 'decay': 0.2, 'sustain': 0.3, 'release': 0.1}}
+PARAMS = {'Stopa': {'waveform': 'sine', 'frequency': 100}}
+
+
+@pytest.fixture
+def samples():
+    rng = np.random.default_rng(0)
+    stopa = (rng.uniform(-1, 1, 2000) * 32767).astype(np.int16)
+    return {'Stopa': stopa, 'Werbel': rng.uniform(-0.5, 0.5, (1500, 2)).astype(np.float32)}
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    bank._decoded.clear()
+    yield
+    bank._decoded.clear()
+
+
+@pytest.mark.parametrize('audio_format', ['FLAC', 'WAV'])
+def test_round_trip(tmp_path, samples, audio_format):
+    path = str(tmp_path / 'bank.zip')
+    bank_hash = write_bank(path, samples, 22050, ADSR, PARAMS, audio_format=audio_format, compression_level=0.5)
+    assert is_bank(path)
+    loaded = load_bank(path)
+    assert loaded.hash == bank_hash == read_manifest(path)['hash']
+    assert loaded.sample_rate == 22050
+    assert loaded.adsr == ADSR and loaded.sample_params == PARAMS
+    np.testing.assert_allclose(loaded.samples['Stopa'][:, 0], samples['Stopa'] / 32768.0, atol=1e-6)
+    # float zapisany jako PCM_24
+    np.testing.assert_allclose(loaded.samples['Werbel'], samples['Werbel'], atol=1e-6)
+    assert not loaded.samples['Stopa'].flags.writeable
+
+
+def test_same_hash_is_decoded_once(tmp_path, samples):
+    first, second = str(tmp_path / 'a.zip'), str(tmp_path / 'b.zip')
+    assert write_bank(first, samples) == write_bank(second, samples)
+    assert load_bank(first) is load_bank(second)
+    assert load_bank(first, sample_rate=22050) is not load_bank(first)
+
+
+def test_resampled_on_load(tmp_path, samples):
+    path = str(tmp_path / 'bank.zip')
+    write_bank(path, samples, 44100)
+    loaded = load_bank(path, sample_rate=22050)
+    assert loaded.sample_rate == 22050
+    assert len(loaded.samples['Stopa']) == 1000
+
+
+def test_corrupted_member(tmp_path, samples):
+    path, broken = str(tmp_path / 'bank.zip'), str(tmp_path / 'broken.zip')
+    write_bank(path, samples, audio_format='WAV')
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(broken, 'w') as target:
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename == 'Stopa.wav':
+                data = data[:-2] + b'\x00\x01'
+            target.writestr(info, data)
+    with pytest.raises(BankError, match='corrupted'):
+        load_bank(broken)
+
+
+def test_not_a_bank(tmp_path):
+    path = str(tmp_path / 'legacy.zip')
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('Stopa.wav', b'')
+    assert not is_bank(path)
+    assert not is_bank(str(tmp_path / 'missing.zip'))
+    with pytest.raises(BankError):
+        read_manifest(path)
+
+
+def test_bank_samples_play_from_memory(tmp_path, samples):
+    from drumpatterns_core.samples import SamplePool
+
+    path = str(tmp_path / 'bank.zip')
+    write_bank(path, samples, 22050)
+    loaded = load_bank(path)
+    pool = SamplePool(22050, fallback=lambda sample: (sample, loaded.sample_rate))
+    note = pool.note(loaded.samples['Werbel'], 100)
+    np.testing.assert_allclose(note, loaded.samples['Werbel'][:100].mean(axis=1), atol=1e-6)
+    assert pool.note(loaded.samples['Werbel'], 100) is note
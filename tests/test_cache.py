@@ -0,0 +1,154 @@
+import gc
+import os
+import time
+import weakref
+
+import numpy as np
+import pytest
+
+from drumpatterns_core.cache import PreviewCache, RenderCache, freeze, render_key
+
+EFFECTS = {'volume': 0.3, 'pitch': 2.0, 'echo': 0.0}
+
+
+def block(value=0.0):
+    return np.full(25, value, dtype=np.float32)  # 100 bajtów
+
+
+def test_lru_evicts_least_recently_used_by_bytes():
+    cache = RenderCache(max_bytes=300)
+    for key in 'abc':
+        cache.put(key, block())
+    assert cache.nbytes == 300
+    cache.get('a')
+    cache.put('d', block())
+    # 'b' był najdawniej używany
+    assert cache.get('b') is None
+    assert [cache.get(key) is not None for key in 'acd'] == [True, True, True]
+    assert cache.nbytes == 300 and len(cache) == 3
+
+
+def test_oversized_value_is_returned_but_not_kept():
+    cache = RenderCache(max_bytes=300)
+    cache.put('a', block())
+    big = np.zeros(1000, dtype=np.float32)
+    assert cache.put('big', big) is big
+    assert cache.get('big') is None
+    assert cache.get('a') is not None
+
+
+def test_replacing_a_key_keeps_byte_count():
+    cache = RenderCache(max_bytes=1000)
+    cache.put('a', block())
+    cache.put('a', np.zeros(50, dtype=np.float32))
+    assert cache.nbytes == 200 and len(cache) == 1
+
+
+def test_get_or_render_counts_hits_and_misses():
+    cache = RenderCache()
+    calls = []
+    render = lambda: calls.append(1) or block(1.0)
+    first = cache.get_or_render('a', render)
+    assert cache.get_or_render('a', render) is first
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_render_key_uses_sample_identity():
+    sample = block(0.5)
+    twin = sample.copy()
+    assert render_key('Stopa', sample, EFFECTS) == render_key('Stopa', sample, dict(EFFECTS))
+    # równe, ale inne tablice to inne sample
+    assert render_key('Stopa', sample, EFFECTS) != render_key('Stopa', twin, EFFECTS)
+    assert render_key('Stopa', 'a.wav', EFFECTS) == render_key('Stopa', 'a.wav', EFFECTS)
+    assert render_key('Stopa', sample, EFFECTS) != render_key('Werbel', sample, EFFECTS)
+
+
+def test_entry_keeps_its_sample_alive():
+    cache = RenderCache()
+    sample = block(0.5)
+    alive = weakref.ref(sample)
+    key = render_key('Stopa', sample, EFFECTS)
+    cache.put(key, block(1.0), keep=sample)
+    del sample
+    gc.collect()
+    # id nie może zostać użyte ponownie przez nową tablicę, dopóki wpis istnieje
+    assert alive() is not None
+    cache.invalidate('Stopa')
+    gc.collect()
+    assert alive() is None
+
+
+def test_effect_and_adsr_changes_change_the_key():
+    sample = block()
+    key = render_key('Stopa', sample, EFFECTS, {'attack': 0.01, 'decay': 0.1})
+    assert key == render_key('Stopa', sample, dict(reversed(list(EFFECTS.items()))), {'decay': 0.1, 'attack': 0.01})
+    assert key != render_key('Stopa', sample, dict(EFFECTS, echo=0.5), {'attack': 0.01, 'decay': 0.1})
+    assert key != render_key('Stopa', sample, EFFECTS, {'attack': 0.02, 'decay': 0.1})
+    assert key != render_key('Stopa', sample, EFFECTS, {'attack': 0.01, 'decay': 0.1}, variant='dry')
+    assert freeze({'a': [1, {'b': 2}]}) == (('a', (1, (('b', 2),))),)
+
+
+def test_invalidate_drops_only_that_instrument():
+    cache = RenderCache()
+    sample = block()
+    stopa = render_key('Stopa', sample, EFFECTS)
+    werbel = render_key('Werbel', sample, EFFECTS)
+    cache.put(stopa, block())
+    cache.put(render_key('Stopa', sample, EFFECTS, variant='dry'), block())
+    cache.put(werbel, block())
+    cache.invalidate('Stopa')
+    assert cache.get(stopa) is None and cache.get(werbel) is not None
+    assert cache.nbytes == 100
+    cache.invalidate()
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+@pytest.fixture
+def sample_file(tmp_path):
+    path = tmp_path / 'hit.raw'
+    path.write_bytes(np.arange(10, dtype=np.float32).tobytes())
+    return str(path)
+
+
+def counting_decoder():
+    calls = []
+
+    def decode(path):
+        calls.append(path)
+        with open(path, 'rb') as handle:
+            return np.frombuffer(handle.read(), dtype=np.float32).copy()
+    return decode, calls
+
+
+def test_preview_cache_decodes_once_and_read_only(sample_file):
+    decode, calls = counting_decoder()
+    previews = PreviewCache(decode)
+    first = previews.get(sample_file)
+    assert previews.get(sample_file) is first
+    assert calls == [sample_file]
+    assert not first.flags.writeable
+
+
+def test_preview_cache_decodes_edited_file_again(sample_file):
+    decode, calls = counting_decoder()
+    previews = PreviewCache(decode)
+    previews.get(sample_file)
+    with open(sample_file, 'wb') as handle:
+        handle.write(np.ones(12, dtype=np.float32).tobytes())
+    stat = os.stat(sample_file)
+    os.utime(sample_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+    assert previews.get(sample_file).tolist() == [1.0] * 12
+    assert len(calls) == 2
+
+
+def test_prefetch_fills_the_cache(sample_file, tmp_path):
+    decode, calls = counting_decoder()
+    previews = PreviewCache(decode)
+    # plik, którego nie ma, nie zatrzymuje wątku
+    previews.prefetch([str(tmp_path / 'missing.raw'), sample_file])
+    deadline = time.time() + 5
+    while not len(previews.cache) and time.time() < deadline:
+        time.sleep(0.01)
+    previews.get(sample_file)
+    assert calls == [sample_file]
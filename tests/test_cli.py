@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+import soundfile as sf
+
+from drumpatterns_core.cli import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT = {'bpm': 120, 'patterns': {'Stopa': [1, 0, 0, 0] * 4, 'Werbel': [0, 0, 1, 0] * 4}}
+SAMPLE_RATE = 8000
+
+
+def write_project(path, data=PROJECT):
+    with open(path, 'w') as handle:
+        json.dump(data, handle)
+    return str(path)
+
+
+def test_render_single_file(tmp_path, capsys):
+    project = write_project(tmp_path / 'beat.json')
+    output = str(tmp_path / 'out.wav')
+    assert main(['render', project, '-o', output, '--midi', '--loops', '2', '--sample-rate', str(SAMPLE_RATE)]) == 0
+    info = sf.info(output)
+    # 2 x 16 kroków przy 120 BPM = 4 s
+    assert (info.samplerate, info.frames) == (SAMPLE_RATE, 4 * SAMPLE_RATE)
+    assert os.path.getsize(str(tmp_path / 'out.mid')) > 0
+    assert 'beat.json' in capsys.readouterr().out
+
+
+def test_render_single_file_default_output(tmp_path):
+    project = write_project(tmp_path / 'beat.json')
+    assert main(['render', project, '--sample-rate', str(SAMPLE_RATE)]) == 0
+    assert os.path.exists(str(tmp_path / 'beat.wav'))
+    assert not os.path.exists(str(tmp_path / 'beat.mid'))
+
+
+def test_render_directory_in_parallel(tmp_path):
+    projects = tmp_path / 'projects'
+    projects.mkdir()
+    write_project(projects / 'a.json')
+    write_project(projects / 'b.json', dict(PROJECT, bpm=90))
+    (projects / 'notes.txt').write_text('not a project')
+    out = tmp_path / 'out'
+    assert main(['render', str(projects), '-o', str(out), '-j', '2', '--midi',
+                 '--sample-rate', str(SAMPLE_RATE)]) == 0
+    assert sorted(os.listdir(str(out))) == ['a.mid', 'a.wav', 'b.mid', 'b.wav']
+    assert sf.info(str(out / 'b.wav')).frames == round(16 * SAMPLE_RATE * 60 / (90 * 4))
+
+
+def test_directory_with_a_broken_project_fails(tmp_path, capsys):
+    write_project(tmp_path / 'good.json')
+    (tmp_path / 'broken.json').write_text('{"bpm": ')
+    out = tmp_path / 'out'
+    assert main(['render', str(tmp_path), '-o', str(out), '-j', '2', '--sample-rate', str(SAMPLE_RATE)]) == 1
+    # błąd jednego projektu nie zatrzymuje pozostałych
+    assert os.listdir(str(out)) == ['good.wav']
+    assert 'broken.json' in capsys.readouterr().err
+
+
+def test_broken_single_file_fails(tmp_path, capsys):
+    broken = tmp_path / 'broken.json'
+    broken.write_text('{"bpm": ')
+    assert main(['render', str(broken), '--sample-rate', str(SAMPLE_RATE)]) == 1
+    assert 'broken.json' in capsys.readouterr().err
+    assert not os.path.exists(str(tmp_path / 'broken.wav'))
+
+
+def test_bad_arguments_exit_with_usage_error(capsys):
+    with pytest.raises(SystemExit) as error:
+        main(['render'])
+    assert error.value.code == 2
+    assert 'usage' in capsys.readouterr().err
+
+
+def test_module_entry_point_exit_codes(tmp_path):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    command = [sys.executable, '-m', 'drumpatterns_core', 'render']
+    project = write_project(tmp_path / 'beat.json')
+    ok = subprocess.run(command + [project, '--sample-rate', str(SAMPLE_RATE)], env=env, capture_output=True, text=True)
+    assert ok.returncode == 0, ok.stderr
+    assert os.path.exists(str(tmp_path / 'beat.wav'))
+    missing = subprocess.run(command + [str(tmp_path / 'missing.json')], env=env, capture_output=True, text=True)
+    assert missing.returncode == 1
+    assert 'missing.json' in missing.stderr and 'Traceback' not in missing.stderr
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from drumpatterns_core.dsp import apply_effect_chain, is_dual_mono, pan_gains
+
+EFFECTS = {'volume': 0.3, 'pitch': 2.0, 'echo': 0.5, 'reverb': 0.6}
+
+
+@pytest.fixture
+def mono():
+    rng = np.random.default_rng(0)
+    return rng.uniform(-0.5, 0.5, (4000, 1)).astype(np.float32)
+
+
+def test_is_dual_mono(mono):
+    assert is_dual_mono(np.repeat(mono, 2, axis=1))
+    stereo = np.repeat(mono, 2, axis=1)
+    stereo[-1, 1] += 0.1
+    assert not is_dual_mono(stereo)
+    assert not is_dual_mono(mono)
+
+
+@pytest.mark.parametrize('style', ['classic', 'direct'])
+def test_dual_mono_matches_single_channel(mono, style):
+    # zdublowany mono liczony raz na jednym kanale = ten sam wynik w obu kanałach
+    expected = apply_effect_chain(mono.copy(), EFFECTS, 44100, style)
+    out = apply_effect_chain(np.repeat(mono, 2, axis=1), EFFECTS, 44100, style)
+    assert out.shape == (len(expected), 2)
+    np.testing.assert_allclose(out[:, 0], expected[:, 0], rtol=1e-6, atol=1e-7)
+    np.testing.assert_array_equal(out[:, 0], out[:, 1])
+
+
+@pytest.mark.parametrize('style', ['classic', 'direct'])
+def test_dual_mono_pan_matches_stereo(mono, style):
+    effects = dict(EFFECTS, pan=-0.6)
+    stereo = np.repeat(mono, 2, axis=1)
+    out = apply_effect_chain(stereo.copy(), effects, 44100, style)
+    # prawdziwe stereo (minimalnie różny prawy kanał na końcu) idzie starą ścieżką
+    reference = stereo.copy()
+    reference[-1, 1] = 0.0
+    expected = apply_effect_chain(reference, effects, 44100, style)
+    np.testing.assert_allclose(out[:-50], expected[:-50], rtol=1e-5, atol=1e-6)
+    left, right = pan_gains(-0.6)
+    np.testing.assert_allclose(out[100:, 1] * left, out[100:, 0] * right, rtol=1e-5, atol=1e-7)
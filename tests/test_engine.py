@@ -0,0 +1,117 @@
+import numpy as np
+
+from drumpatterns_core import Pattern, PatternEngine, rhythm_offsets
+from drumpatterns_core.engine import RHYTHM_TYPES
+
+SAMPLE_RATE = 8000
+INSTRUMENTS = ['Talerz', 'Stopa']
+
+
+def impulse_engine(steps, bpm=120, block_size=64, length=4, sample=None):
+    """Engine playing a one-frame impulse (or ``sample``) on the given {step: [offsets]}."""
+    sample = np.ones((1, 2), dtype=np.float32) if sample is None else sample
+    events = lambda step: [(offset, 'Stopa', 1.0) for offset in steps.get(step, [])]
+    return PatternEngine(events, lambda key: sample, lambda: bpm, pattern_length=length,
+                         sample_rate=SAMPLE_RATE, block_size=block_size)
+
+
+def render(engine, frames):
+    blocks = [engine.render_block() for _ in range(-(-frames // engine.block_size))]
+    return np.concatenate(blocks)[:frames]
+
+
+def test_hits_land_on_their_frames():
+    engine = impulse_engine({0: [0.0], 1: [0.0, 0.5], 3: [0.25]})
+    step = engine.step_frames(120)
+    assert step == 1000
+    out = render(engine, 4 * 1000)
+    assert np.flatnonzero(out[:, 0]).tolist() == [0, 1000, 1500, 3250]
+
+
+def test_block_size_does_not_change_the_output():
+    sample = np.linspace(1, 0, 700, dtype=np.float32)[:, None].repeat(2, axis=1)
+    steps = {0: [0.0], 1: [0.3], 2: [0.9]}
+    whole = render(impulse_engine(steps, block_size=8000, sample=sample), 8000)
+    for block_size in (1, 37, 256):
+        np.testing.assert_array_equal(render(impulse_engine(steps, block_size=block_size, sample=sample), 8000), whole)
+
+
+def test_voice_spans_block_boundary():
+    sample = np.full((100, 2), 0.5, dtype=np.float32)
+    engine = impulse_engine({0: [0.0]}, block_size=64, sample=sample)
+    first, second = engine.render_block(), engine.render_block()
+    assert np.all(first == 0.5)
+    assert np.all(second[:36] == 0.5) and np.all(second[36:] == 0)
+
+
+def test_hits_on_both_sides_of_block_edge():
+    # 50-klatkowe bloki: klatka 49 to koniec pierwszego, 50 początek drugiego
+    engine = impulse_engine({0: [0.049, 0.05], 1: [0.0]}, block_size=50)
+    first, second = engine.render_block(), engine.render_block()
+    assert np.flatnonzero(first[:, 0]).tolist() == [49]
+    assert np.flatnonzero(second[:, 0]).tolist() == [0]
+    # krok 1 zaczyna się dokładnie na granicy bloku 20
+    out = render(engine, 1000)
+    assert np.flatnonzero(out[:, 0]).tolist() == [900]
+
+
+def test_tempo_change_between_blocks():
+    bpm = [120]
+    engine = impulse_engine({step: [0.0, 0.5] for step in range(4)}, block_size=64)
+    engine.tempo = lambda: bpm[0]
+    first = render(engine, 512)
+    bpm[0] = 240
+    rest = render(engine, 2048)
+    out = np.concatenate([first, rest])
+    # krok 0 zaplanowany jeszcze w 120 BPM, kolejne w 240 BPM (500 klatek)
+    assert np.flatnonzero(out[:, 0]).tolist() == [0, 500, 1000, 1250, 1500, 1750, 2000, 2250, 2500]
+    assert engine.step_seconds == 500 / SAMPLE_RATE
+
+
+def test_reset_restarts_from_the_first_step():
+    sample = np.full((3000, 2), 0.25, dtype=np.float32)
+    steps = {0: [0.0], 2: [0.5]}
+    fresh = render(impulse_engine(steps, sample=sample), 4000)
+    engine = impulse_engine(steps, sample=sample)
+    render(engine, 2500)
+    engine.reset()
+    assert (engine.frame, engine.step, engine.loops_completed) == (0, 0, 0)
+    # grające głosy sprzed zatrzymania nie przechodzą do nowego startu
+    np.testing.assert_array_equal(render(engine, 4000), fresh)
+
+
+def test_pattern_loops_and_counts():
+    engine = impulse_engine({0: [0.0]}, length=4)
+    out = render(engine, 8 * 1000 + 1)
+    assert np.flatnonzero(out[:, 0]).tolist() == [0, 4000, 8000]
+    assert engine.loops_completed == 2
+
+
+def test_rhythm_offsets_spacings():
+    double = RHYTHM_TYPES['double']
+    assert rhythm_offsets(double, 'subdivided') == [0.0, 0.5]
+    assert rhythm_offsets(double, 'split') == [0.0, 0.25]
+    assert rhythm_offsets(RHYTHM_TYPES['swing'], 'subdivided') == [0.0, 0.7]
+    assert rhythm_offsets(RHYTHM_TYPES['swing'], 'stretched') == [0.0, 0.5]
+
+
+def test_pattern_dict_round_trip():
+    patterns = {'Talerz': [{'active': True, 'rhythm_type': 'burst'}, {'active': False, 'rhythm_type': 'single'}],
+                'Stopa': [{'active': True, 'rhythm_type': 'accent'}]}
+    pattern = Pattern.from_dict(patterns, INSTRUMENTS)
+    assert len(pattern) == 2
+    assert pattern.to_dict()['Talerz'] == patterns['Talerz']
+    # krótszy wiersz dopełniony nieaktywnymi krokami
+    assert pattern.to_dict()['Stopa'][1] == {'active': False, 'rhythm_type': 'single'}
+    assert pattern.note_counts().tolist() == [[3, 0], [1, 0]]
+
+
+def test_pattern_set_hits_and_resize():
+    pattern = Pattern(INSTRUMENTS, 8)
+    pattern.set_hits('Stopa', [0, 4, 9])
+    pattern.set_hits('Stopa', [0, 2], rhythm_type='double', only_empty=True)
+    assert pattern.to_dict(advanced=False)['Stopa'] == [1, 0, 1, 0, 1, 0, 0, 0]
+    assert pattern.row('Stopa')['rhythm'][0] == pattern.rhythm_code('single')
+    resized = pattern.resized(3)
+    assert resized.to_dict(advanced=False)['Stopa'] == [1, 0, 1]
+    assert len(pattern) == 8
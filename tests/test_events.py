@@ -0,0 +1,65 @@
+import numpy as np
+
+from drumpatterns_core.engine import pattern_step_events
+from drumpatterns_core.events import EventCompiler, compile_pattern
+from drumpatterns_core.history import EditHistory
+
+INSTRUMENTS = ['Talerz', 'Stopa']
+
+
+def advanced(*rows):
+    return {inst: [{'active': rhythm is not None, 'rhythm_type': rhythm or 'single'} for rhythm in row]
+            for inst, row in zip(INSTRUMENTS, rows)}
+
+
+def test_compiled_steps_match_pattern_step_events():
+    patterns = advanced(['double', None, 'accent', 'swing'], [None, 'burst', 'single', None])
+    compiled = compile_pattern(patterns, INSTRUMENTS, spacing='split', accent_gain=1.2)
+    for step in range(4):
+        expected = pattern_step_events(patterns, INSTRUMENTS, step, True, spacing='split', accent_gain=1.2)
+        assert sorted(compiled.step_events(step)) == sorted(expected)
+    assert np.all(np.diff(compiled.events['position']) >= 0)
+
+
+def test_simple_patterns_and_length():
+    compiled = compile_pattern({'Talerz': [1, 0, 1], 'Stopa': [0, 1]}, INSTRUMENTS, advanced=False, length=4)
+    assert compiled.length == 4
+    assert compiled.positions(loops=2).tolist() == [0.0, 1.0, 2.0, 4.0, 5.0, 6.0]
+    assert compiled.frames(120, 8000).tolist() == [0, 1000, 2000]
+
+
+def test_compiler_reuses_until_invalidated():
+    patterns = advanced(['single', None], [None, None])
+    compiler = EventCompiler()
+    first = compiler.compile(patterns, INSTRUMENTS, True)
+    assert compiler.compile(patterns, INSTRUMENTS, True) is first
+
+    patterns['Stopa'][1]['active'] = True
+    # bez invalidate zostaje stara kompilacja
+    assert compiler.compile(patterns, INSTRUMENTS, True) is first
+    compiler.invalidate()
+    second = compiler.compile(patterns, INSTRUMENTS, True)
+    assert second is not first
+    assert second.step_events(1) == [(0.0, 'Stopa', 1.0)]
+
+
+def test_compiler_recompiles_for_other_settings():
+    patterns = advanced(['single', 'single'], [None, None])
+    compiler = EventCompiler()
+    first = compiler.compile(patterns, INSTRUMENTS, True)
+    assert compiler.compile(patterns, INSTRUMENTS, True, length=1) is not first
+    assert compiler.compile(dict(patterns), INSTRUMENTS, True) is not first
+
+
+def test_history_edit_invalidates_compiler():
+    patterns = advanced(['single', None], [None, None])
+    compiler = EventCompiler()
+    history = EditHistory(on_change=compiler.invalidate)
+    compiler.compile(patterns, INSTRUMENTS, True)
+    with history.edit(patterns):
+        patterns['Talerz'][1]['active'] = True
+    assert len(compiler.compile(patterns, INSTRUMENTS, True)) == 2
+    history.undo()
+    assert len(compiler.compile(patterns, INSTRUMENTS, True)) == 1
+    history.redo()
+    assert len(compiler.compile(patterns, INSTRUMENTS, True)) == 2
@@ -0,0 +1,130 @@
+import numpy as np
+
+from drumpatterns_core.history import EditHistory, SampleEdit, pattern_edit
+
+
+def step(active=False, rhythm='single'):
+    return {'active': active, 'rhythm_type': rhythm}
+
+
+class FakeFrontEnd:
+    """Length setting and pattern rows like the GUIs: rows follow the length spin button."""
+
+    def __init__(self, length=4):
+        self.length = length
+        self.patterns = {'Stopa': [step() for _ in range(length)], 'Werbel': [step() for _ in range(length)]}
+        self.history = EditHistory(set_length=self.set_length)
+
+    def set_length(self, length):
+        # jak length_spinbutton.set_value: value-changed wywołuje handler
+        self.on_pattern_length_changed(length)
+
+    @pattern_edit
+    def on_pattern_length_changed(self, length):
+        self.length = length
+        for row in self.patterns.values():
+            del row[length:]
+            row.extend(step() for _ in range(length - len(row)))
+
+    @pattern_edit
+    def toggle(self, instrument, index):
+        cell = self.patterns[instrument][index]
+        cell['active'] = not cell['active']
+
+    @pattern_edit
+    def generate(self):
+        for row in self.patterns.values():
+            row[:] = [step(i % 2 == 0, 'double') for i in range(len(row))]
+        # zagnieżdżone zmiany należą do jednej edycji
+        self.toggle('Stopa', 1)
+
+
+def active(front_end):
+    return {inst: [cell['active'] for cell in row] for inst, row in front_end.patterns.items()}
+
+
+def test_undo_redo_toggle():
+    front_end = FakeFrontEnd()
+    front_end.toggle('Stopa', 2)
+    assert front_end.history.can_undo() and not front_end.history.can_redo()
+    front_end.history.undo()
+    assert not any(active(front_end)['Stopa'])
+    front_end.history.redo()
+    assert active(front_end)['Stopa'] == [False, False, True, False]
+
+
+def test_nested_edits_are_one_edit():
+    front_end = FakeFrontEnd()
+    front_end.generate()
+    assert len(front_end.history._undo) == 1
+    assert active(front_end)['Stopa'] == [True, True, True, False]
+    front_end.history.undo()
+    assert front_end.patterns['Stopa'] == [step() for _ in range(4)]
+    assert not front_end.history.can_undo()
+
+
+def test_unchanged_edit_is_not_recorded():
+    front_end = FakeFrontEnd()
+    with front_end.history.edit(front_end.patterns):
+        pass
+    assert not front_end.history.can_undo()
+
+
+def test_undo_after_length_change():
+    front_end = FakeFrontEnd(length=4)
+    front_end.toggle('Stopa', 3)
+    front_end.on_pattern_length_changed(2)
+    front_end.toggle('Werbel', 1)
+    assert front_end.length == 2
+
+    front_end.history.undo()
+    assert front_end.length == 2 and not any(active(front_end)['Werbel'])
+    front_end.history.undo()
+    # długość i obcięte kroki wracają razem
+    assert front_end.length == 4
+    assert active(front_end)['Stopa'] == [False, False, False, True]
+    # przywrócenie długości nie jest nową edycją i nie czyści redo
+    assert front_end.history.can_redo() and len(front_end.history._undo) == 1
+
+    front_end.history.redo()
+    assert front_end.length == 2 and len(front_end.patterns['Stopa']) == 2
+    front_end.history.redo()
+    assert active(front_end)['Werbel'] == [False, True]
+
+
+def test_new_edit_clears_redo():
+    front_end = FakeFrontEnd()
+    front_end.toggle('Stopa', 0)
+    front_end.history.undo()
+    front_end.toggle('Stopa', 1)
+    assert not front_end.history.can_redo()
+    assert front_end.history.redo() is None
+
+
+def test_sample_edit_and_budget():
+    data = np.zeros(1000, dtype=np.float32)
+    history = EditHistory(budget=2 * 100 * data.itemsize)
+    for start in (0, 400, 800):
+        edit = SampleEdit(data, start, start + 100)
+        data[start:start + 100] = 1.0
+        history.push(edit)
+    # najstarsza zmiana wypadła z budżetu
+    assert len(history._undo) == 2
+    history.undo()
+    history.undo()
+    assert history.undo() is None
+    assert data[:100].sum() == 100 and data[400:].sum() == 0
+    history.redo()
+    assert data[400:500].sum() == 100
+
+
+def test_on_change_is_called():
+    calls = []
+    history = EditHistory(on_change=lambda: calls.append(True))
+    patterns = {'Stopa': [0, 0]}
+    with history.edit(patterns):
+        patterns['Stopa'][0] = 1
+    history.undo()
+    history.redo()
+    history.clear()
+    assert len(calls) == 4
@@ -0,0 +1,104 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from drumpatterns_core.incremental import IncrementalRenderer
+from drumpatterns_core.synth import DEFAULT_ADSR, DEFAULT_SAMPLE_PARAMS, parametric_sample
+
+SAMPLE_RATE = 8000
+# bez szumu, żeby pełny render był powtarzalny
+PARAMS = {inst: dict(params, waveform='sine' if params['waveform'] == 'noise' else params['waveform'])
+          for inst, params in DEFAULT_SAMPLE_PARAMS.items()}
+
+
+class Kit:
+    """Minimalny front-end: ustawienia, opublikowane sample i kolejka zamiast GLib.idle_add."""
+
+    def __init__(self):
+        self.params = {inst: dict(params) for inst, params in PARAMS.items()}
+        self.adsr = {inst: dict(adsr) for inst, adsr in DEFAULT_ADSR.items()}
+        self.samples = self.full_render()
+        self.rendered = []
+        self.published = []
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.renderer = IncrementalRenderer(self.render, self.publish, lambda *args: self.idle.put(args), frame=0.02)
+
+    def full_render(self):
+        return {inst: parametric_sample(self.params[inst], self.adsr[inst], SAMPLE_RATE) for inst in self.params}
+
+    def render(self, instrument):
+        with self.lock:
+            self.rendered.append(instrument)
+        return parametric_sample(self.params[instrument], self.adsr[instrument], SAMPLE_RATE)
+
+    def publish(self, instrument, result):
+        self.published.append(instrument)
+        self.samples[instrument] = result
+
+    def run_idle(self, count, timeout=5.0):
+        """Wątek GUI: wykonuje ``count`` zaplanowanych publikacji."""
+        for _ in range(count):
+            func, *args = self.idle.get(timeout=timeout)
+            func(*args)
+
+
+def test_one_edit_renders_only_that_instrument():
+    kit = Kit()
+    before = dict(kit.samples)
+    kit.params['Stopa']['frequency'] = 150
+    kit.renderer.mark('Stopa')
+    kit.run_idle(1)
+    assert kit.rendered == ['Stopa'] and kit.published == ['Stopa']
+    # pozostałe instrumenty to te same, nieprzeliczane tablice
+    for inst in ('Talerz', 'Werbel', 'TomTom'):
+        assert kit.samples[inst] is before[inst]
+    full = kit.full_render()
+    for inst in full:
+        np.testing.assert_array_equal(kit.samples[inst], full[inst])
+
+
+def test_burst_of_edits_renders_once_with_the_last_settings():
+    kit = Kit()
+    for attack in (0.02, 0.03, 0.04, 0.05):
+        kit.adsr['TomTom']['attack'] = attack
+        kit.renderer.mark('TomTom')
+    kit.params['Talerz']['amplitude'] = 0.5
+    kit.renderer.mark('Talerz')
+    kit.run_idle(2)
+    assert sorted(kit.rendered) == ['Talerz', 'TomTom']
+    full = kit.full_render()
+    for inst in full:
+        np.testing.assert_array_equal(kit.samples[inst], full[inst])
+    assert kit.idle.empty()
+
+
+def test_result_overtaken_by_newer_edit_is_dropped():
+    kit = Kit()
+    kit.params['Werbel']['frequency'] = 3000
+    kit.renderer.mark('Werbel')
+    stale = kit.idle.get(timeout=5.0)
+    # kolejna zmiana, zanim GUI opublikowało poprzedni wynik
+    kit.params['Werbel']['frequency'] = 2000
+    kit.renderer.mark('Werbel')
+    stale[0](*stale[1:])
+    assert kit.published == []
+    kit.run_idle(1)
+    assert kit.published == ['Werbel']
+    np.testing.assert_array_equal(kit.samples['Werbel'], kit.full_render()['Werbel'])
+
+
+def test_render_error_does_not_stop_the_worker(capsys):
+    kit = Kit()
+    kit.params['Stopa']['duration'] = None
+    kit.renderer.mark('Stopa')
+    deadline = time.time() + 5.0
+    while 'Stopa' not in kit.rendered and time.time() < deadline:
+        time.sleep(0.005)
+    kit.params['Talerz']['frequency'] = 6000
+    kit.renderer.mark('Talerz')
+    kit.run_idle(1)
+    assert kit.published == ['Talerz']
+    assert 'Error rendering Stopa' in capsys.readouterr().out
@@ -0,0 +1,53 @@
+import numpy as np
+
+from drumpatterns_core import Pattern
+from drumpatterns_core.engine import RHYTHM_TYPES
+from drumpatterns_core.percussion import mix_percussion_track
+
+INSTRUMENTS = ['Talerz', 'Stopa', 'Werbel']
+STEP = 100
+
+
+def naive_mix(patterns, samples, note_lengths, length):
+    """Każda nuta jako osobna ścieżka pełnej długości, zsumowane na końcu."""
+    tracks = [np.zeros(length * STEP, dtype=np.float32)]
+    for inst, steps in patterns.items():
+        for step, data in enumerate(steps):
+            if not data['active']:
+                continue
+            frames = note_lengths[data['rhythm_type']]
+            note = np.zeros(frames, dtype=np.float32)
+            note[:min(frames, len(samples[inst]))] = samples[inst][:frames]
+            for i in range(RHYTHM_TYPES[data['rhythm_type']]['notes']):
+                track = np.zeros(length * STEP + 10 * frames, dtype=np.float32)
+                start = step * STEP + i * frames
+                track[start:start + frames] = note * 0.5
+                tracks.append(track[:length * STEP])
+    return np.sum(tracks, axis=0, dtype=np.float32)
+
+
+def test_mixdown_matches_naive_overlay():
+    rng = np.random.default_rng(0)
+    samples = {inst: rng.uniform(-1, 1, size).astype(np.float32) for inst, size in zip(INSTRUMENTS, (80, 250, 40))}
+    # długości nut krótsze i dłuższe od sampli, nuty na siebie nachodzą
+    note_lengths = {'single': 150, 'double': 60, 'burst': 30, 'swing': 90, 'accent': 200}
+    patterns = {
+        'Talerz': [{'active': s % 2 == 0, 'rhythm_type': 'burst'} for s in range(8)],
+        'Stopa': [{'active': s in (0, 3, 7), 'rhythm_type': 'accent' if s == 7 else 'single'} for s in range(8)],
+        'Werbel': [{'active': s in (1, 2, 6), 'rhythm_type': 'double' if s == 6 else 'swing'} for s in range(8)],
+    }
+    track = Pattern.from_dict(patterns, INSTRUMENTS)
+    note = lambda inst, frames: np.pad(samples[inst], (0, max(0, frames - len(samples[inst]))))[:frames]
+    audio = mix_percussion_track(track, note, RHYTHM_TYPES, note_lengths, STEP)
+    expected = naive_mix(patterns, samples, note_lengths, len(track))
+    assert audio.dtype == np.float32 and len(audio) == 8 * STEP
+    np.testing.assert_allclose(audio, expected, rtol=1e-6, atol=1e-6)
+    # ostatnia nuta (accent na kroku 7) obcięta do końca ścieżki
+    assert audio[-1] != 0
+
+
+def test_empty_track_is_silent():
+    track = Pattern(INSTRUMENTS, 4)
+    audio = mix_percussion_track(track, lambda inst, frames: np.ones(frames, np.float32), RHYTHM_TYPES,
+                                 dict.fromkeys(RHYTHM_TYPES, 50), STEP)
+    assert len(audio) == 4 * STEP and not audio.any()
@@ -0,0 +1,87 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from drumpatterns_core.projectfile import atomic_write, is_project_file, load_project_file, save_project_file
+
+DATA = {'bpm': 128, 'patterns': {'Stopa': [1, 0, 1, 0]}, 'sample_params': {'Stopa': {'frequency': 100}}}
+
+
+@pytest.fixture
+def waveforms():
+    rng = np.random.default_rng(0)
+    return {'Stopa': rng.uniform(-1, 1, 1000).astype(np.float32), 'Talerz': np.zeros(0, dtype=np.float32)}
+
+
+def check(loaded, waveforms):
+    assert {key: loaded[key] for key in DATA} == DATA
+    assert set(loaded['waveforms']) == set(waveforms)
+    for name, wave in waveforms.items():
+        np.testing.assert_array_equal(loaded['waveforms'][name], wave)
+
+
+def test_container_round_trip(tmp_path, waveforms):
+    path = str(tmp_path / 'project.dpz')
+    save_project_file(path, DATA, waveforms)
+    loaded = load_project_file(path)
+    check(loaded, waveforms)
+    assert isinstance(loaded['waveforms']['Stopa'], np.memmap)
+    assert not loaded['waveforms']['Stopa'].flags.writeable
+    check(load_project_file(path, mmap=False), waveforms)
+
+
+def test_directory_round_trip(tmp_path, waveforms):
+    path = str(tmp_path / 'project')
+    os.mkdir(path)
+    save_project_file(path, DATA, waveforms)
+    assert os.path.exists(os.path.join(path, 'waveforms', 'Stopa.npy'))
+    check(load_project_file(path), waveforms)
+
+
+def test_legacy_json_round_trip(tmp_path, waveforms):
+    path = str(tmp_path / 'project.json')
+    save_project_file(path, DATA, waveforms)
+    with open(path) as f:
+        assert isinstance(json.load(f)['waveforms']['Stopa'], list)
+    check(load_project_file(path), waveforms)
+
+
+def test_save_over_mapped_project(tmp_path, waveforms):
+    path = str(tmp_path / 'project.dpz')
+    save_project_file(path, DATA, waveforms)
+    mapped = load_project_file(path)['waveforms']['Stopa']
+    save_project_file(path, DATA, {'Stopa': np.ones(10, dtype=np.float32)})
+    # stara mapa wskazuje na zastąpiony plik, więc nadal czyta stare dane
+    np.testing.assert_array_equal(mapped, waveforms['Stopa'])
+    np.testing.assert_array_equal(load_project_file(path)['waveforms']['Stopa'], np.ones(10))
+
+
+def test_atomic_write_keeps_old_file_on_error(tmp_path):
+    path = str(tmp_path / 'file.bin')
+    atomic_write(path, lambda f: f.write(b'old'))
+
+    def fail(f):
+        f.write(b'half')
+        raise RuntimeError('disk full')
+    with pytest.raises(RuntimeError):
+        atomic_write(path, fail)
+    with open(path, 'rb') as f:
+        assert f.read() == b'old'
+    assert os.listdir(str(tmp_path)) == ['file.bin']
+
+
+def test_atomic_write_permissions_without_touching_umask(tmp_path, monkeypatch):
+    umask = os.umask(0)
+    os.umask(umask)
+    # umask procesu nie może być przestawiany w trakcie zapisu
+    monkeypatch.setattr(os, 'umask', lambda mask: pytest.fail('atomic_write changed the umask'))
+    path = str(tmp_path / 'file.bin')
+    atomic_write(path, lambda f: f.write(b'data'))
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+
+
+def test_is_project_file():
+    assert is_project_file('a.DPZ') and is_project_file('a.drsmp') and is_project_file('a.json')
+    assert not is_project_file('a.zip')
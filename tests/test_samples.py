@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from drumpatterns_core.samples import SamplePool, decode_files, load_mono, resample_mono
+
+
+def test_resample_mono_int_and_float_give_the_same_signal():
+    rng = np.random.default_rng(0)
+    pcm = (rng.uniform(-0.5, 0.5, (1000, 2)) * 32768).astype(np.int16)
+    as_float = pcm.astype(np.float32) / 32768
+    from_int = resample_mono(pcm, 44100, 44100)
+    assert from_int.dtype == np.float32 and from_int.shape == (1000,)
+    np.testing.assert_allclose(from_int, as_float.mean(axis=1), atol=1e-7)
+    np.testing.assert_allclose(resample_mono(pcm, 44100, 22050), resample_mono(as_float, 44100, 22050), atol=1e-6)
+    # int32 skalowane własnym zakresem, nie zakresem int16
+    np.testing.assert_allclose(resample_mono(pcm.astype(np.int32) << 16, 44100, 44100), from_int, atol=1e-7)
+
+
+def test_resample_mono_rate_and_shapes():
+    tone = np.sin(np.arange(4410) * 2 * np.pi * 441 / 44100).astype(np.float32)
+    half = resample_mono(tone, 44100, 22050)
+    assert len(half) == 2205
+    assert resample_mono(tone[:, None], 44100, 44100).shape == (4410,)
+    assert len(resample_mono(np.zeros(0, np.int16), 44100, 22050)) == 0
+    # wejście nie jest modyfikowane
+    before = tone.copy()
+    resample_mono(tone, 44100, 44100)[:] = 0
+    resample_mono(tone[:, None], 44100, 44100)[:] = 0
+    np.testing.assert_array_equal(tone, before)
+
+
+@pytest.fixture
+def wav(tmp_path):
+    path = str(tmp_path / 'hit.wav')
+    sf.write(path, np.linspace(1, 0, 441, dtype=np.float32), 44100, subtype='FLOAT')
+    return path
+
+
+def test_pool_decodes_once_and_shares_read_only_notes(wav, monkeypatch):
+    from drumpatterns_core import samples
+    calls = []
+    monkeypatch.setattr(samples, 'load_mono', lambda path, rate: calls.append(path) or load_mono(path, rate))
+    pool = SamplePool(22050)
+    long_note = pool.note(wav, 400)
+    assert pool.note(wav, 400) is long_note
+    short_note = pool.note(wav, 100)
+    assert calls == [wav]
+    assert len(long_note) == 400 and not long_note[221:].any()
+    np.testing.assert_array_equal(short_note, pool.sample(wav)[:100])
+    for array in (long_note, short_note, pool.sample(wav)):
+        assert not array.flags.writeable
+        with pytest.raises(ValueError):
+            array[0] = 1.0
+
+
+def test_pool_arrays_use_the_fallback_and_identity(wav):
+    seen = []
+    bank_sample = np.full((200, 2), 16384, dtype=np.int16)
+
+    def fallback(sample):
+        seen.append(sample)
+        return (np.zeros(10, np.int16) if isinstance(sample, str) else sample), 22050
+    pool = SamplePool(22050, fallback=fallback)
+    note = pool.note(bank_sample, 50)
+    np.testing.assert_allclose(note, 0.5, atol=1e-3)
+    pool.note(bank_sample, 80)
+    assert len(seen) == 1
+    assert bank_sample.flags.writeable
+    # mono float32 w tej samej częstotliwości nie jest zamrażany ani współdzielony
+    float_sample = np.full(100, 0.25, dtype=np.float32)
+    assert not np.shares_memory(pool.sample(float_sample), float_sample)
+    assert float_sample.flags.writeable
+    # równa, ale inna tablica to inny sample
+    pool.sample(bank_sample.copy())
+    assert len(seen) == 3
+    # plik, którego soundfile nie czyta, idzie do fallbacku
+    broken = wav + '.mp3'
+    with open(broken, 'wb') as handle:
+        handle.write(b'not audio')
+    assert len(pool.sample(broken)) == 10
+    assert seen[-1] == broken
+
+
+def test_pool_without_fallback_raises(tmp_path):
+    broken = str(tmp_path / 'broken.wav')
+    with open(broken, 'wb') as handle:
+        handle.write(b'not audio')
+    with pytest.raises(RuntimeError):
+        SamplePool(22050).sample(broken)
+
+
+def test_decode_files_collects_results_and_errors():
+    def decode(path):
+        if path == 'bad':
+            raise ValueError(path)
+        return path.upper()
+    progress = []
+    results = decode_files({'a': 'x', 'b': 'bad', 'c': 'y'}, decode,
+                           progress=lambda done, total, key: progress.append((done, total)))
+    assert results['a'] == 'X' and results['c'] == 'Y'
+    assert isinstance(results['b'], ValueError)
+    assert sorted(progress) == [(1, 3), (2, 3), (3, 3)]
+    assert decode_files({}, decode) == {}
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+from drumpatterns_core.offline import render_timeline
+from drumpatterns_core.streaming import ANALYSIS_SAMPLE_RATE, StreamingAnalyzer, analyze_file, write_enhanced_tracks
+
+SAMPLE_RATE = ANALYSIS_SAMPLE_RATE
+BPM = 120.0
+STEPS = 16
+LSB = 1.0 / 32768
+KICK = np.linspace(1.0, 0.0, 3000, dtype=np.float32)
+
+
+def step_events(step):
+    return [(0.0, 'Stopa', 1.0)] if step % 4 == 0 else [(0.5, 'Stopa', 0.5)]
+
+
+@pytest.fixture
+def audio_path(tmp_path):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path / 'in.wav')
+    sf.write(path, rng.uniform(-0.3, 0.3, SAMPLE_RATE * 2).astype(np.float32), SAMPLE_RATE, subtype='FLOAT')
+    return path
+
+
+def stream(path, tmp_path, block_frames, events=step_events, total_steps=STEPS):
+    analyzer = analyze_file(path, block_frames=block_frames)
+    percussion_path = str(tmp_path / f'perc{block_frames}.wav')
+    combined_path = str(tmp_path / f'mix{block_frames}.wav')
+    write_enhanced_tracks(path, percussion_path, combined_path, analyzer, events, lambda key: KICK,
+                          BPM, total_steps, block_frames=block_frames)
+    return sf.read(percussion_path, dtype='float32')[0], sf.read(combined_path, dtype='float32')[0]
+
+
+def test_analyzer_features_do_not_depend_on_block_size(audio_path):
+    whole = analyze_file(audio_path, block_frames=1 << 20)
+    for block_frames in (777, 4096):
+        chunked = analyze_file(audio_path, block_frames=block_frames)
+        assert chunked.total_samples == whole.total_samples
+        np.testing.assert_allclose(chunked.frame_rms, whole.frame_rms, rtol=1e-5, atol=1e-7)
+        np.testing.assert_allclose(chunked.band_energy, whole.band_energy, rtol=1e-4, atol=1e-6)
+        np.testing.assert_allclose(chunked.onset_envelope, whole.onset_envelope, rtol=1e-4, atol=1e-5)
+
+
+def test_streamed_percussion_matches_offline_render(audio_path, tmp_path):
+    percussion, combined = stream(audio_path, tmp_path, 1 << 20)
+    # 1000 klatek nie dzieli kroku (5512.5 klatki), więc trafienia i głosy przechodzą przez granice bloków
+    chunked_percussion, chunked_combined = stream(audio_path, tmp_path, 1000)
+    np.testing.assert_array_equal(chunked_percussion, percussion)
+    # wzmocnienie liczone z sum po blokach może się różnić o zaokrąglenie: najwyżej 1 LSB w pliku 16-bit
+    np.testing.assert_allclose(chunked_combined, combined, rtol=0, atol=LSB)
+
+    events = lambda step: step_events(step) if step < STEPS else []
+    offline = render_timeline(events, lambda key: KICK[:, None], BPM, len(percussion), STEPS + 1,
+                              SAMPLE_RATE, channels=1, source_rate=SAMPLE_RATE)[:, 0]
+    # strumień różni się od renderu offline tylko wzmocnieniem dobranym do RMS wejścia
+    gain = percussion.max() / offline.max()
+    np.testing.assert_allclose(percussion, offline * gain, rtol=0, atol=LSB)
+
+
+def test_empty_pattern_writes_silent_percussion(audio_path, tmp_path):
+    percussion, combined = stream(audio_path, tmp_path, 1000, events=lambda step: [], total_steps=0)
+    audio = sf.read(audio_path, dtype='float32')[0]
+    assert len(percussion) == len(combined) == len(audio)
+    assert not percussion.any()
+    np.testing.assert_allclose(combined, audio / np.abs(audio).max(), rtol=0, atol=LSB)
+
+
+def test_short_pattern_stops_after_its_steps(audio_path, tmp_path):
+    percussion, _ = stream(audio_path, tmp_path, 1000, total_steps=1)
+    # jeden krok: tylko uderzenie na klatce 0, reszta pliku cicha
+    assert np.flatnonzero(percussion).max() < len(KICK)
+    assert percussion[0] > 0
+
+
+def test_input_shorter_than_one_frame(tmp_path):
+    analyzer = StreamingAnalyzer()
+    analyzer.feed(np.full(100, 0.1, dtype=np.float32))
+    analyzer.finish()
+    assert analyzer.total_samples == 100
+    assert len(analyzer.frame_rms) == len(analyzer.onset_envelope) == len(analyzer.band_energy) == 1
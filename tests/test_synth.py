@@ -0,0 +1,133 @@
+import math
+
+import numpy as np
+import pytest
+
+from drumpatterns_core.synth import (WAVETABLE_BASE_FREQUENCY, WAVETABLE_SIZE, adsr_envelope, apply_adsr,
+                                     oscillator, wavetable)
+
+ADSR = {'attack': 0.01, 'decay': 0.02, 'sustain': 0.4, 'release': 0.03}
+SAMPLE_RATE = 8000
+
+
+def per_sample_envelope(total, adsr, sample_rate, curve):
+    """Obwiednia liczona próbka po próbce, jak apply_adsr_to_signal w starych front-endach."""
+    attack = int(adsr['attack'] * sample_rate)
+    decay = int(adsr['decay'] * sample_rate)
+    release = int(adsr['release'] * sample_rate)
+    excess = attack + decay + release - total
+    if excess > 0:
+        scale = (total - excess) / float(attack + decay + release)
+        attack, decay, release = int(attack * scale), int(decay * scale), int(release * scale)
+    level = adsr['sustain']
+
+    def shape(x, lo, hi, falling):
+        # x w [0, 1] wzdłuż segmentu od lo do hi
+        if curve == 'exponential':
+            return (lo + (hi - lo) * x) ** 2
+        if curve == 'logarithmic':
+            return math.log1p(9 * (1 - x if falling else x)) / math.log1p(9)
+        return lo + (hi - lo) * x
+
+    envelope = []
+    for n in range(total):
+        if n < attack:
+            x = n / (attack - 1) if attack > 1 else 0.0
+            value = shape(x, 0.0, 1.0, False)
+        elif n < attack + decay:
+            x = (n - attack) / (decay - 1) if decay > 1 else 0.0
+            value = shape(x, 1.0, level, True)
+            if curve == 'logarithmic':
+                value = level + (1 - level) * value
+        else:
+            value = level
+        if release and n >= total - release:
+            x = (n - (total - release)) / (release - 1) if release > 1 else 0.0
+            if curve == 'linear':
+                value = level * (1 - x)
+            else:
+                value = level * shape(x, 1.0, 0.0, True)
+        envelope.append(value)
+    return np.array(envelope)
+
+
+@pytest.mark.parametrize('curve', ['linear', 'exponential', 'logarithmic'])
+@pytest.mark.parametrize('total', [800, 300, 1])
+def test_envelope_matches_per_sample_formula(curve, total):
+    # 300 klatek: attack+decay+release (480) skalowane w dół, 1 klatka: wszystkie odcinki puste
+    envelope = adsr_envelope(total, ADSR, SAMPLE_RATE, curve)
+    assert envelope.dtype == np.float32 and envelope.shape == (total,)
+    np.testing.assert_allclose(envelope, per_sample_envelope(total, ADSR, SAMPLE_RATE, curve), atol=1e-6)
+
+
+def test_envelope_is_cached_and_read_only():
+    envelope = adsr_envelope(800, ADSR, SAMPLE_RATE)
+    assert adsr_envelope(800, dict(ADSR), SAMPLE_RATE) is envelope
+    assert adsr_envelope(800, dict(ADSR, sustain=0.5), SAMPLE_RATE) is not envelope
+    with pytest.raises(ValueError):
+        envelope[0] = 1.0
+
+
+def test_apply_adsr_to_int16_in_place_without_overflow():
+    pcm = np.empty((800, 2), dtype=np.int16)
+    pcm[:, 0] = 32767
+    pcm[:, 1] = -32768
+    original = pcm.copy()
+    out = apply_adsr(pcm, ADSR, SAMPLE_RATE)
+    assert out is pcm and out.dtype == np.int16
+    envelope = adsr_envelope(800, ADSR, SAMPLE_RATE)
+    expected = np.trunc(original * envelope[:, None].astype(np.float64)).astype(np.int16)
+    np.testing.assert_array_equal(out, expected)
+    # pełna głośność w szczycie ataku, bez przekręcenia znaku
+    assert out[:, 0].max() == 32767 and out[:, 1].min() == -32768
+    assert (out[:, 0] >= 0).all() and (out[:, 1] <= 0).all()
+
+
+def test_apply_adsr_to_float_mono_and_stereo():
+    envelope = adsr_envelope(800, ADSR, SAMPLE_RATE)
+    mono = np.ones(800, dtype=np.float32)
+    np.testing.assert_array_equal(apply_adsr(mono, ADSR, SAMPLE_RATE), envelope)
+    stereo = np.full((800, 2), 0.5, dtype=np.float32)
+    apply_adsr(stereo, ADSR, SAMPLE_RATE)
+    np.testing.assert_array_equal(stereo[:, 1], envelope * np.float32(0.5))
+    # zbuforowana obwiednia nie została zmieniona przez mnożenie w miejscu
+    assert adsr_envelope(800, ADSR, SAMPLE_RATE).max() == 1.0
+
+
+@pytest.mark.parametrize('waveform', ['square', 'sawtooth'])
+def test_wavetables_hold_only_harmonics_below_nyquist(waveform):
+    sample_rate = 44100
+    for frequency in (WAVETABLE_BASE_FREQUENCY * 1.5, 440.0, 3000.0, 9000.0):
+        spectrum = np.abs(np.fft.rfft(wavetable(waveform, frequency, sample_rate)[:-1]))
+        harmonics = np.flatnonzero(spectrum > 1e-3 * spectrum.max())
+        assert harmonics.max() * frequency < sample_rate / 2
+        if waveform == 'square':
+            assert (harmonics % 2 == 1).all()
+
+
+def test_wavetable_shapes():
+    phase = np.arange(WAVETABLE_SIZE + 1) * (2 * np.pi / WAVETABLE_SIZE)
+    np.testing.assert_allclose(wavetable('sine', 440), np.sin(phase), atol=1e-6)
+    square = wavetable('square', 30)
+    # z dala od skoków tablica jest bliska sign(sin)
+    away = np.abs(np.sin(phase)) > 0.2
+    np.testing.assert_allclose(square[away], np.sign(np.sin(phase))[away], atol=0.1)
+    table = wavetable('sawtooth', 30)
+    assert table[0] == pytest.approx(table[-1], abs=1e-6)  # punkt zawinięcia
+
+
+def test_oscillator_does_not_alias():
+    # 5 kHz piła przy 44.1 kHz: energia tylko na 5, 10, 15, 20 kHz
+    signal = oscillator('sawtooth', 5000, 1.0, 1.0, 44100)
+    spectrum = np.abs(np.fft.rfft(signal))
+    peaks = np.flatnonzero(spectrum > 1e-3 * spectrum.max())
+    assert set(peaks.tolist()) <= {5000, 10000, 15000, 20000}
+
+
+def test_oscillator_fractional_frequency_follows_sine():
+    t = np.arange(4410) / 44100.0
+    np.testing.assert_allclose(oscillator('sine', 440.5, 0.5, 0.1, 44100), 0.5 * np.sin(2 * np.pi * 440.5 * t),
+                               atol=1e-5)
+    # całkowita częstotliwość: jedna sekunda powtarzana dalej bez skoku fazy
+    t = np.arange(44100 * 2) / 44100.0
+    np.testing.assert_allclose(oscillator('sine', 441, 1.0, 2.0, 44100), np.sin(2 * np.pi * 441 * t), atol=1e-5)
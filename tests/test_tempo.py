@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from drumpatterns_core import PatternEngine
+from drumpatterns_core.tempo import TempoMap
+
+
+def test_constant_tempo():
+    tempo = TempoMap([(4, 120, 120)])
+    assert tempo.step_duration(0) == pytest.approx(0.125)
+    assert tempo.time_at(6) == pytest.approx(0.75)
+    assert tempo.frames(16, 44100) == 88200
+    assert tempo.step_at(0.75) == pytest.approx(6)
+
+
+def test_from_list_holds_each_bpm():
+    tempo = TempoMap.from_list([120, 60], steps_per_bpm=2)
+    assert tempo.steps == 4
+    assert [tempo.step_duration(step) for step in range(4)] == pytest.approx([0.125, 0.125, 0.25, 0.25])
+    assert tempo.cycle_seconds == pytest.approx(0.75)
+    assert tempo.time_at(5) == pytest.approx(0.75 + 0.125)
+
+
+def test_ramp_is_continuous_and_invertible():
+    tempo = TempoMap.from_list([60, 180], steps_per_bpm=4, ramp=True)
+    # rampa 60 -> 180 BPM przez 4 kroki: krok trwa 15/slope * ln(1 + slope/bpm)
+    slope = (180 - 60) / 4.0
+    assert tempo.step_duration(0) == pytest.approx(15 / slope * np.log1p(slope / 60))
+    positions = np.linspace(0, 24, 97)
+    times = tempo.time_at(positions)
+    assert np.all(np.diff(times) > 0)
+    np.testing.assert_allclose(tempo.step_at(times), positions, atol=1e-9)
+    assert tempo.time_at(2.5) == pytest.approx(float(tempo.time_at(np.array([2.5]))[0]))
+    assert tempo.average_bpm() == pytest.approx(15 * 8 / tempo.cycle_seconds)
+
+
+def test_invalid_tempo():
+    with pytest.raises(ValueError):
+        TempoMap([(0, 120, 120)])
+    with pytest.raises(ValueError):
+        TempoMap.from_list([120, 0])
+
+
+def test_engine_places_steps_by_tempo_map():
+    tempo = TempoMap.from_list([120, 60], steps_per_bpm=2)
+    engine = PatternEngine(lambda step: [(0.0, 'Stopa', 1.0)], lambda key: np.ones((1, 2), dtype=np.float32),
+                           lambda: tempo, pattern_length=4, sample_rate=8000, block_size=100)
+    out = np.concatenate([engine.render_block() for _ in range(120)])
+    expected = [tempo.frames(step, 8000) for step in range(8)]
+    assert np.flatnonzero(out[:, 0]).tolist() == expected
+    assert expected[:5] == [0, 1000, 2000, 4000, 6000]
+
+
+def test_project_dynamic_bpm():
+    from drumpatterns_core.project import dynamic_bpms
+
+    assert dynamic_bpms({'dynamic_bpm_list': [140, 70]}, 'sampler', 120) == [140.0, 70.0]
+    assert dynamic_bpms({'dynamic_bpm': '100, 50'}, 'sampler5_1', 120) == [120.0, 60.0]
+    assert dynamic_bpms({'dynamic_bpm': 'abc'}, 'sampler4', 120) == []
+    assert dynamic_bpms({}, 'sampler4', 120) == []